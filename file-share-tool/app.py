@@ -1,49 +1,365 @@
-from flask import Flask, request, render_template, send_file, jsonify, url_for
+"""
+局域网文件分享服务
+
+应用通过 create_app() 创建；模块属性 app 在首次访问时才创建应用
+（gunicorn app:app、from app import app），导入本模块本身不创建数据库、不启动线程。
+二维码、系统资源检查、定时任务调度等可选子系统在首次使用时才导入。
+"""
+from flask import Flask, request, render_template, send_file, jsonify, url_for, current_app
 from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.datastructures import ContentRange
 import os
 import socket
-import qrcode
-from io import BytesIO
 import base64
+import threading
+from io import BytesIO, TextIOWrapper
+from functools import lru_cache
+from datetime import datetime
 from config import Config
 from utils.file_manager import FileManager
-from utils.cleanup import start_cleanup_scheduler
-from utils.logging_config import setup_logging
-from utils.middleware import setup_error_handlers, require_operation_log
-from utils.health_check import create_health_routes
+from utils.archive import ArchiveBuilder, TempFileReader
+from utils.storage_codec import StorageCodec, CODEC_GZIP, open_blob
+from utils.storage_backend import create_storage_backend
+from utils.archive_cache import ArchiveCache
+from utils.storage_reconcile import StorageReconciler
+from utils.archive_extract import ArchiveExtractor, archive_format
+from utils.job_queue import JobQueue, JOB_COMPLETED, PRIORITY_HIGH
+from utils.response_cache import JsonResponseCache
+from utils.query_stats import QueryStats
+from utils.timing import span, timed, FS
+from utils.delta import choose_block_size, block_signatures
+from utils.exceptions import FileUploadException, StorageException
+from utils.logging_config import setup_logging, reopen_log_files, get_logger
+from utils.middleware import setup_error_handlers, require_operation_log, get_client_ip
+from utils.rate_limit import TokenBucketStore, RateLimiter, setup_rate_limiting
+from utils.upload_stream import parse_upload_stream, get_multipart_boundary, PREPARSED_UPLOAD_KEY
 from utils.logging_config import Operations
 
-# 创建Flask应用
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# 初始化配置
-Config.init_app(app)
-
-# 设置日志系统
-logger = setup_logging(app)
-logger.info("文件分享服务启动中...")
-
-# 创建文件管理器
-file_manager = FileManager(
-    upload_folder=app.config['UPLOAD_FOLDER'],
-    allowed_extensions=app.config['ALLOWED_EXTENSIONS'],
-    expire_hours=app.config['FILE_EXPIRE_HOURS']
-)
-
-# 设置错误处理
-setup_error_handlers(app)
-
-# 创建健康检查路由
-create_health_routes(app, file_manager)
-
-# 启动文件清理调度器
-cleanup_scheduler = start_cleanup_scheduler(
-    file_manager, 
-    app.config['CLEANUP_INTERVAL_MINUTES']
-)
+logger = get_logger()
+
+# 以下服务由 create_app() 创建，每个进程一个应用
+_app_config = None
+file_manager = None
+rate_limiter = None
+response_cache = None
+storage_reconciler = None
+archive_extractor = None
+job_queue = None
+cleanup_scheduler = None
+search_indexer = None
+
+# 视图和错误处理函数先登记，在 create_app() 中注册到应用上，端点名与函数名相同
+_routes = []
+_error_handlers = []
+
+def route(rule, **options):
+    """登记视图路由"""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+def errorhandler(code):
+    """登记错误处理函数"""
+    def decorator(handler):
+        _error_handlers.append((code, handler))
+        return handler
+    return decorator
+
+def create_app(config_overrides=None):
+    """创建Flask应用
+
+    config_overrides 中的配置项覆盖 Config 中的同名配置。
+    DEFER_BACKGROUND_TASKS 为True时不在这里启动后台线程，由服务器启动后调用
+    start_background_tasks()（gunicorn post_fork、ASGI lifespan、start.py），
+    否则在第一个请求到来时启动。
+    """
+    global _app, _app_config, file_manager, rate_limiter, response_cache, storage_reconciler, archive_extractor
+    global job_queue
+
+    # 创建Flask应用
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if config_overrides:
+        app.config.update(config_overrides)
+    _app_config = app.config
+
+    # 初始化配置
+    Config.init_app(app)
+
+    # 设置日志系统
+    setup_logging(app)
+    logger.info("文件分享服务启动中...")
+
+    # 创建文件管理器
+    file_manager = FileManager(
+        upload_folder=app.config['UPLOAD_FOLDER'],
+        allowed_extensions=app.config['ALLOWED_EXTENSIONS'],
+        expire_hours=app.config['FILE_EXPIRE_HOURS'],
+        archive_builder=ArchiveBuilder(
+            compress_level=app.config['ZIP_COMPRESS_LEVEL'],
+            max_workers=app.config['ZIP_MAX_WORKERS']
+        ),
+        archive_cache=ArchiveCache(
+            app.config['ARCHIVE_CACHE_FOLDER'],
+            app.config['ARCHIVE_CACHE_MAX_BYTES']
+        ) if app.config['ARCHIVE_CACHE_FOLDER'] else None,
+        shard_depth=app.config['UPLOAD_SHARD_DEPTH'],
+        shard_width=app.config['UPLOAD_SHARD_WIDTH'],
+        metadata_cache_size=app.config['METADATA_CACHE_SIZE'],
+        metadata_cache_ttl=app.config['METADATA_CACHE_TTL'],
+        storage_codec=StorageCodec(
+            level=app.config['STORAGE_COMPRESSION_LEVEL'],
+            min_size=app.config['STORAGE_COMPRESSION_MIN_SIZE'],
+            extensions=app.config['PREVIEWABLE_EXTENSIONS']
+        ) if app.config['STORAGE_COMPRESSION'] else None,
+        storage=create_storage_backend(app.config),
+        query_stats=QueryStats(
+            slow_query_ms=app.config['DB_SLOW_QUERY_MS'],
+            slow_log_size=app.config['DB_SLOW_QUERY_LOG_SIZE'],
+            check_full_scan=app.config['DB_ASSERT_NO_FULL_SCAN'] or app.testing
+        ) if app.config['DB_QUERY_STATS_ENABLED'] else None,
+        schema_migration_batch_size=app.config['SCHEMA_MIGRATION_BATCH_SIZE']
+    )
+
+    # 旧版JSON元数据迁移（gunicorn --preload 时在master中完成，worker启动前数据已就绪）
+    if app.config['JSON_MIGRATION_MODE'] == 'startup':
+        file_manager.migrate_from_json(app.config['JSON_MIGRATION_BATCH_SIZE'])
+
+    # 文件列表等JSON响应按元数据代数缓存，压缩后的响应体按需生成
+    response_cache = JsonResponseCache(
+        file_manager.database.cache,
+        compress_level=app.config['JSON_RESPONSE_COMPRESS_LEVEL'],
+        brotli_quality=app.config['JSON_RESPONSE_BROTLI_QUALITY'],
+        min_size=app.config['JSON_RESPONSE_MIN_COMPRESS_SIZE']
+    )
+
+    # 存储对账（上传目录与元数据），由定时任务或管理接口触发；只用于本地存储
+    storage_reconciler = None if not file_manager.storage.local else StorageReconciler(
+        file_manager,
+        orphan_action=app.config['STORAGE_RECONCILE_ORPHAN_ACTION'],
+        grace_seconds=app.config['STORAGE_RECONCILE_GRACE_SECONDS'],
+        quarantine_retention_days=app.config['STORAGE_QUARANTINE_RETENTION_DAYS'],
+        temp_max_age_seconds=app.config['STORAGE_RECONCILE_TEMP_MAX_AGE_SECONDS'],
+        scan_workers=app.config['STORAGE_RECONCILE_SCAN_WORKERS'],
+        scan_rate=app.config['STORAGE_RECONCILE_SCAN_RATE'],
+        action_rate=app.config['STORAGE_RECONCILE_ACTION_RATE']
+    )
+
+    # 服务端解压，作为后台任务执行
+    archive_extractor = ArchiveExtractor(
+        file_manager,
+        max_members=app.config['ARCHIVE_EXTRACT_MAX_MEMBERS'],
+        max_total_size=app.config['ARCHIVE_EXTRACT_MAX_TOTAL_SIZE'],
+        max_ratio=app.config['ARCHIVE_EXTRACT_MAX_RATIO'],
+        batch_size=app.config['ARCHIVE_EXTRACT_BATCH_SIZE'],
+        on_commit=notify_search_indexer
+    )
+
+    # 后台任务队列（工作线程随后台任务启动）
+    job_queue = JobQueue(
+        app.config['JOB_QUEUE_DB'],
+        app.config['JOB_RESULT_FOLDER'],
+        workers=app.config['JOB_WORKERS'],
+        poll_interval=app.config['JOB_POLL_INTERVAL'],
+        retention_hours=app.config['JOB_RETENTION_HOURS'],
+        stale_seconds=app.config['JOB_STALE_SECONDS']
+    )
+    register_job_handlers(job_queue)
+
+    # 设置错误处理
+    setup_error_handlers(app)
+
+    # 设置请求频率限制和带宽整形
+    rate_limiter = None
+    if app.config['RATE_LIMIT_ENABLED']:
+        rate_limiter = RateLimiter(
+            TokenBucketStore(app.config['RATE_LIMIT_DB']),
+            app.config['RATE_LIMITS'],
+            download_bandwidth=app.config['DOWNLOAD_BANDWIDTH_PER_CLIENT'],
+            upload_bandwidth=app.config['UPLOAD_BANDWIDTH_PER_CLIENT']
+        )
+        setup_rate_limiting(app, rate_limiter)
+
+    # 创建健康检查路由（系统资源检查在请求时才导入psutil）
+    from utils.health_check import create_health_routes
+    create_health_routes(app, file_manager)
+
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    for code, handler in _error_handlers:
+        app.register_error_handler(code, handler)
+
+    if app.config['DEFER_BACKGROUND_TASKS']:
+        app.before_request(start_background_tasks)
+    else:
+        start_background_tasks()
+
+    # 第一个创建的应用作为模块属性 app，与 create_app() 创建的服务保持一致
+    if _app is None:
+        _app = app
+
+    logger.info("文件分享服务初始化完成")
+    return app
+
+_app = None
+_app_lock = threading.Lock()
+
+def get_app():
+    """返回本进程的应用，首次调用时创建"""
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+    return _app
+
+def __getattr__(name):
+    """模块属性 app 在首次访问时创建应用"""
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# 后台任务：清理调度器、分片迁移、内容索引
+_background_started = False
+_background_lock = threading.Lock()
+
+def start_background_tasks():
+    """启动后台任务线程，重复调用不会重复启动
+
+    gunicorn --preload 时由 reinit_after_fork() 在每个worker中调用：
+    线程不会随fork进入子进程，父进程中线程持有的锁在子进程里也永远不会释放。
+    """
+    global cleanup_scheduler, search_indexer, _background_started
+    if _background_started:
+        return
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+
+        # 定时任务调度依赖APScheduler，启动时才导入
+        from utils.cleanup import start_cleanup_scheduler
+        from utils.shard_migration import start_shard_migration
+        from utils.search_indexer import start_search_indexer
+        from utils.json_migration import start_json_migration
+        if file_manager is None:
+            get_app()
+        config = _app_config
+
+        # 启动后台任务队列的工作线程
+        job_queue.start()
+
+        # 启动文件清理调度器（清理和对账提交到任务队列执行）
+        cleanup_scheduler = start_cleanup_scheduler(
+            file_manager, 
+            config['CLEANUP_INTERVAL_MINUTES'],
+            config['STATS_RECONCILE_INTERVAL_MINUTES'],
+            storage_reconciler=storage_reconciler,
+            reconcile_interval_minutes=config['STORAGE_RECONCILE_INTERVAL_MINUTES'],
+            job_queue=job_queue
+        )
 
-logger.info("文件分享服务初始化完成")
+        # 后台迁移旧版JSON元数据
+        if config['JSON_MIGRATION_MODE'] == 'background':
+            start_json_migration(file_manager, config['JSON_MIGRATION_BATCH_SIZE'])
+
+        # 后台把旧的平铺文件迁移到分片目录
+        if file_manager.storage.local:
+            start_shard_migration(file_manager, config['SHARD_MIGRATION_BATCH_SIZE'])
+
+        # 后台索引文本文件内容，供全文搜索使用
+        if config['SEARCH_CONTENT_INDEXING']:
+            search_indexer = start_search_indexer(
+                file_manager,
+                config['PREVIEWABLE_EXTENSIONS'],
+                max_file_size=config['SEARCH_CONTENT_MAX_FILE_SIZE'],
+                max_bytes=config['SEARCH_CONTENT_MAX_BYTES'],
+                batch_size=config['SEARCH_INDEX_BATCH_SIZE'],
+                interval_seconds=config['SEARCH_INDEX_INTERVAL_SECONDS']
+            )
+
+def stop_background_tasks():
+    """停止后台任务线程（ASGI lifespan关闭、测试中重建应用时调用），之后可以重新启动"""
+    global cleanup_scheduler, search_indexer, _background_started
+    with _background_lock:
+        if not _background_started:
+            return
+        from utils.cleanup import stop_cleanup_scheduler
+        from utils.shard_migration import stop_shard_migration
+        from utils.search_indexer import stop_search_indexer
+        from utils.json_migration import stop_json_migration
+
+        job_queue.stop()
+        stop_cleanup_scheduler()
+        stop_json_migration()
+        stop_shard_migration()
+        stop_search_indexer()
+        cleanup_scheduler = None
+        search_indexer = None
+        _background_started = False
+
+def reinit_after_fork():
+    """在fork出的worker进程中重新初始化进程级资源（gunicorn post_fork钩子调用）"""
+    if file_manager is None:
+        # 未预加载应用时直接在worker中创建
+        get_app()
+    else:
+        reopen_log_files()
+        file_manager.database.reinit_after_fork()
+    start_background_tasks()
+    logger.info(f"worker进程 {os.getpid()} 初始化完成")
+
+# 后台任务处理函数
+def run_batch_download_job(context):
+    """把选中的文件打包为ZIP，保存为任务结果文件"""
+    def progress(done, total):
+        context.progress(done / total * 100, f'已打包 {done}/{total} 个文件')
+
+    zip_path, added_files = file_manager.create_files_zip(
+        context.payload['file_ids'], context.result_path('.zip'), progress
+    )
+    if added_files == 0:
+        raise FileUploadException('没有可下载的文件')
+    return {
+        'file_count': added_files,
+        'size': os.path.getsize(zip_path),
+        'download_url': f'/api/jobs/{context.id}/download'
+    }
+
+def run_batch_delete_job(context):
+    """分批删除文件，每批之间报告进度"""
+    file_ids = context.payload['file_ids']
+    batch_size = _app_config['JOB_DELETE_BATCH_SIZE']
+    deleted_count = 0
+    failed_files = []
+    for start in range(0, len(file_ids), batch_size):
+        deleted_ids, failed = file_manager.delete_many(file_ids[start:start + batch_size])
+        deleted_count += len(deleted_ids)
+        failed_files.extend(failed)
+        done = min(start + batch_size, len(file_ids))
+        context.progress(done / len(file_ids) * 100, f'已删除 {deleted_count} 个文件', force=True)
+    return {'success_count': deleted_count, 'failed_count': len(failed_files), 'failed_files': failed_files}
+
+def run_cleanup_job(context):
+    """清理过期文件"""
+    return {'expired_count': file_manager.cleanup_expired_files()}
+
+def run_storage_reconcile_job(context):
+    """存储对账"""
+    report = storage_reconciler.run(dry_run=bool((context.payload or {}).get('dry_run', False)))
+    if report is None:
+        raise StorageException('存储对账失败或正在进行中')
+    return report
+
+def register_job_handlers(queue):
+    """注册后台任务类型"""
+    queue.register('batch_download', run_batch_download_job, max_attempts=2)
+    queue.register('batch_delete', run_batch_delete_job, max_attempts=3)
+    queue.register('cleanup', run_cleanup_job)
+    queue.register('extract_archive', archive_extractor)
+    if storage_reconciler is not None:
+        queue.register('storage_reconcile', run_storage_reconcile_job)
 
 def get_local_ip():
     """获取本机IP地址"""
@@ -56,8 +372,11 @@ def get_local_ip():
     except:
         return "127.0.0.1"
 
+@lru_cache(maxsize=8)
 def generate_qr_code(url):
-    """生成二维码"""
+    """生成二维码（服务地址不变时复用生成结果）"""
+    import qrcode
+
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(url)
     qr.make(fit=True)
@@ -80,11 +399,146 @@ def format_file_size(size_bytes):
         i += 1
     return f"{size_bytes:.1f} {size_names[i]}"
 
-@app.route('/')
+def format_file_info(file_info):
+    """文件列表中的单个文件信息"""
+    return {
+        'id': file_info['id'],
+        'name': file_info['original_name'],
+        'size': format_file_size(file_info['file_size']),
+        'size_bytes': file_info['file_size'],
+        'type': file_info['file_type'],
+        'extension': file_info['file_extension'],
+        'upload_time': file_info['upload_time'],
+        'expire_time': file_info['expire_time'],
+        'is_text': file_info['file_extension'] in current_app.config['PREVIEWABLE_EXTENSIONS'],
+        'is_image': file_info['file_extension'] in current_app.config['IMAGE_EXTENSIONS'],
+        'is_text_file': file_info.get('is_text_file', False),
+        'is_archive': archive_format(file_info['original_name']) is not None,
+        'relative_path': file_info.get('relative_path') or file_info['original_name']
+    }
+
+@timed(FS)
+def send_remote_file(metadata, as_attachment=False):
+    """从远程存储流式发送文件
+
+    只向存储后端请求需要的范围（单个Range），压缩存储的文件与本地文件的处理方式一致。
+    对象不存在时返回404。
+    """
+    codec = metadata.get('storage_codec')
+    encoded = codec == CODEC_GZIP and request.accept_encodings['gzip']
+    length = metadata['stored_size'] if encoded else metadata['file_size']
+    etag = f"{metadata['id']}-{length}" + ('-gzip' if encoded else '')
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        return response
+
+    # 边读边解压发送时不能只读取存储的一部分，Range在解压后的数据上处理
+    byte_range = None
+    if (codec is None or encoded) and request.range:
+        byte_range = request.range.range_for_length(length)
+
+    try:
+        if byte_range:
+            start, stop = byte_range
+            stream = file_manager.storage.open(metadata['stored_name'], start, stop - start)
+        else:
+            stream = file_manager.storage.open(metadata['stored_name'])
+    except FileNotFoundError:
+        return jsonify({'success': False, 'message': f"文件不存在: {metadata['file_path']}"}), 404
+    if not encoded:
+        stream = open_blob(stream, codec)
+
+    response = send_file(
+        stream,
+        mimetype=metadata['file_type'],
+        as_attachment=as_attachment,
+        download_name=metadata['original_name'],
+        etag=etag,
+        conditional=False
+    )
+    if encoded:
+        response.content_encoding = 'gzip'
+    if byte_range:
+        response.status_code = 206
+        response.content_range = ContentRange('bytes', start, stop, length)
+        response.content_length = stop - start
+    else:
+        response.content_length = length
+    response.accept_ranges = 'bytes'
+    if codec is not None and not encoded:
+        response.make_conditional(request.environ, accept_ranges=True, complete_length=length)
+    response.vary.add('Accept-Encoding')
+    return response
+
+@timed(FS)
+def send_stored_file(metadata, file_path, as_attachment=False):
+    """发送存储的文件，file_path 为None时从远程存储发送
+
+    压缩存储的文件：客户端接受gzip时直接发送磁盘上的数据并设置 Content-Encoding，
+    不做任何解压；否则边读边解压发送，Range请求需要解压并丢弃范围之前的数据，
+    断点续传的开销与已下载的大小成正比。
+    """
+    if file_path is None:
+        return send_remote_file(metadata, as_attachment)
+
+    file_path = os.path.abspath(file_path)
+    codec = metadata.get('storage_codec')
+    if codec is None:
+        return send_file(file_path, as_attachment=as_attachment, download_name=metadata['original_name'])
+
+    stat = os.stat(file_path)
+    etag = f"{stat.st_mtime}-{metadata['file_size']}-{metadata['id']}"
+    if codec == CODEC_GZIP and request.accept_encodings['gzip']:
+        response = send_file(
+            file_path,
+            mimetype=metadata['file_type'],
+            as_attachment=as_attachment,
+            download_name=metadata['original_name'],
+            etag=f"{etag}-gzip"
+        )
+        response.content_encoding = 'gzip'
+    else:
+        response = send_file(
+            open_blob(file_path, codec),
+            mimetype=metadata['file_type'],
+            as_attachment=as_attachment,
+            download_name=metadata['original_name'],
+            etag=etag,
+            last_modified=stat.st_mtime,
+            conditional=False
+        )
+        response.content_length = metadata['file_size']
+        response.accept_ranges = 'bytes'
+        response.make_conditional(request.environ, accept_ranges=True, complete_length=metadata['file_size'])
+    response.vary.add('Accept-Encoding')
+    return response
+
+@timed(FS)
+def send_temp_file(zip_path, download_name):
+    """发送临时ZIP文件，响应关闭（发送完成或客户端断开）时删除该文件"""
+    reader = TempFileReader(zip_path)
+    response = send_file(
+        reader,
+        as_attachment=True,
+        download_name=download_name,
+        mimetype='application/zip'
+    )
+    # 传入文件对象时send_file不设置长度
+    response.content_length = os.fstat(reader.fileno()).st_size
+    return response
+
+def notify_search_indexer():
+    """新文件保存后唤醒内容索引"""
+    if search_indexer:
+        search_indexer.notify()
+
+@route('/')
 def index():
     """主页面"""
     local_ip = get_local_ip()
-    server_url = f"http://{local_ip}:{app.config['PORT']}"
+    server_url = f"http://{local_ip}:{current_app.config['PORT']}"
     qr_code = generate_qr_code(server_url)
     
     return render_template('index.html', 
@@ -92,39 +546,95 @@ def index():
                          qr_code=qr_code,
                          local_ip=local_ip)
 
-@app.route('/api/upload', methods=['POST'])
-@require_operation_log(Operations.FILE_UPLOAD)
-def upload_file():
-    """文件上传API"""
-    try:
-        if 'files' not in request.files:
-            return jsonify({'success': False, 'message': '没有选择文件'}), 400
-
-        files = request.files.getlist('files')
-        paths = request.form.getlist('paths')  # 获取文件路径信息
-
-        if not files or all(file.filename == '' for file in files):
-            return jsonify({'success': False, 'message': '没有选择文件'}), 400
+def format_uploaded_file(metadata):
+    """上传结果中的文件信息"""
+    return {
+        'id': metadata['id'],
+        'name': metadata['original_name'],
+        'size': format_file_size(metadata['file_size'])
+    }
 
-        uploaded_files = []
-        failed_files = []
+def save_uploaded_files(files, paths):
+    """保存Werkzeug解析后的上传文件，元数据在一个事务中批量提交"""
+    uploaded_files = []
+    failed_files = []
 
+    with file_manager.upload_transaction() as txn:
         for i, file in enumerate(files):
             if file and file.filename != '':
                 # 获取对应的路径信息
                 relative_path = paths[i] if i < len(paths) else None
 
-                file_id, metadata = file_manager.save_file(file, relative_path)
-                if file_id:
-                    uploaded_files.append({
-                        'id': file_id,
-                        'name': metadata['original_name'],
-                        'size': format_file_size(metadata['file_size'])
-                    })
+                metadata = txn.add_file(file, relative_path)
+                if metadata:
+                    uploaded_files.append(format_uploaded_file(metadata))
                 else:
                     failed_files.append(relative_path or file.filename)
 
+    return uploaded_files, failed_files
+
+def stream_upload_files():
+    """流式解析上传请求，文件分片直接写入存储目录，元数据在一个事务中批量提交"""
+    # ASGI模式下请求体已在事件循环上解析完成
+    parser = request.environ.get(PREPARSED_UPLOAD_KEY)
+    if isinstance(parser, Exception):
+        raise parser
+    if parser is not None:
+        parser.claimed = True
+    else:
+        read = request.stream.read
+        if rate_limiter:
+            read = rate_limiter.throttle_read(read, get_client_ip())
+
+        parser = parse_upload_stream(
+            read,
+            request.content_type,
+            file_manager.open_upload,
+            current_app.config['UPLOAD_CHUNK_SIZE']
+        )
+    paths = parser.fields.get('paths', [])
+    uploaded_files = []
+    failed_files = []
+
+    with file_manager.upload_transaction() as txn:
+        try:
+            for index, writer in parser.parts:
+                relative_path = paths[index] if index < len(paths) else None
+                uploaded_files.append(format_uploaded_file(txn.add(writer, relative_path)))
+        except BaseException:
+            # 尚未加入事务的文件不会被回滚删除
+            for _, writer in parser.parts:
+                if writer not in txn.writers:
+                    writer.abort()
+            raise
+
+    for index, filename in parser.skipped:
+        failed_files.append(paths[index] if index < len(paths) else filename)
+
+    return uploaded_files, failed_files
+
+@route('/api/upload', methods=['POST'])
+@require_operation_log(Operations.FILE_UPLOAD)
+def upload_file():
+    """文件上传API"""
+    try:
+        if current_app.config['STREAMING_UPLOAD'] and get_multipart_boundary(request.content_type):
+            uploaded_files, failed_files = stream_upload_files()
+        else:
+            if 'files' not in request.files:
+                return jsonify({'success': False, 'message': '没有选择文件'}), 400
+
+            files = request.files.getlist('files')
+            if not files or all(file.filename == '' for file in files):
+                return jsonify({'success': False, 'message': '没有选择文件'}), 400
+
+            uploaded_files, failed_files = save_uploaded_files(files, request.form.getlist('paths'))
+
+        if not uploaded_files and not failed_files:
+            return jsonify({'success': False, 'message': '没有选择文件'}), 400
+
         if uploaded_files:
+            notify_search_indexer()
             message = f"成功上传 {len(uploaded_files)} 个文件"
             if failed_files:
                 message += f"，{len(failed_files)} 个文件上传失败"
@@ -142,86 +652,122 @@ def upload_file():
     except Exception as e:
         return jsonify({'success': False, 'message': f'上传失败: {str(e)}'}), 500
 
-@app.route('/api/files')
-def list_files():
-    """获取文件列表API - 返回根目录文件和文件夹"""
+@route('/api/upload/manifest', methods=['POST'])
+@require_operation_log(Operations.FILE_UPLOAD)
+def upload_manifest():
+    """上传前的清单检查
+
+    请求体为 {"files": [{"path", "size", "hash"}, ...]}（hash为SHA-256），服务器上已有相同内容的
+    文件直接创建记录，返回其余需要上传的条目序号 missing。
+    """
     try:
-        files = file_manager.get_file_list()
-        folders = file_manager.get_folder_structure()
-        storage_info = file_manager.get_storage_info()
+        data = request.get_json(silent=True) or {}
+        entries = data.get('files')
+        if not isinstance(entries, list) or not entries:
+            return jsonify({'success': False, 'message': '清单为空'}), 400
+        max_entries = current_app.config['UPLOAD_MANIFEST_MAX_ENTRIES']
+        if len(entries) > max_entries:
+            return jsonify({'success': False, 'message': f'清单条目不能超过 {max_entries} 个'}), 400
+
+        saved, missing = file_manager.save_known_files(entries)
+        if saved:
+            notify_search_indexer()
 
-        # 格式化文件信息，包括根目录文件和文件夹
-        formatted_files = []
+        return jsonify({
+            'success': True,
+            'message': f'{len(saved)} 个文件已存在，无需上传',
+            'uploaded_files': [format_uploaded_file(metadata) for metadata in saved],
+            'missing': missing
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'清单检查失败: {str(e)}'}), 500
 
-        # 首先添加所有文件夹
-        for folder_name, folder_files in folders.items():
-            if folder_files:  # 确保文件夹不为空
-                total_size = sum(f['file_size'] for f in folder_files)
-                file_count = len(folder_files)
-
-                # 获取文件夹的最早上传时间
-                upload_times = [f['upload_time'] for f in folder_files]
-                earliest_time = min(upload_times) if upload_times else folder_files[0]['upload_time']
-
-                # 获取过期时间（使用最晚的过期时间）
-                expire_times = [f['expire_time'] for f in folder_files]
-                latest_expire_time = max(expire_times) if expire_times else folder_files[0]['expire_time']
-
-                formatted_files.append({
-                    'id': f'folder_{folder_name}',
-                    'name': folder_name,
-                    'size': format_file_size(total_size),
-                    'size_bytes': total_size,
-                    'type': 'folder',
-                    'extension': 'folder',
-                    'upload_time': earliest_time,
-                    'expire_time': latest_expire_time,
-                    'is_text': False,
-                    'is_image': False,
-                    'is_text_file': False,
-                    'is_folder': True,
-                    'file_count': file_count,
-                    'folder_path': folder_name,
-                    'relative_path': folder_name
-                })
+def build_file_list():
+    """文件列表接口的响应数据"""
+    files = file_manager.get_file_list()
+    folders = file_manager.get_folder_structure()
+    storage_info = file_manager.get_storage_info()
 
-        # 然后添加根目录文件
-        for file_info in files:
-            relative_path = file_info.get('relative_path', file_info['original_name'])
-
-            # 只处理根目录文件（不在文件夹中的文件）
-            if not ('/' in relative_path or '\\' in relative_path):
-                formatted_files.append({
-                    'id': file_info['id'],
-                    'name': file_info['original_name'],
-                    'size': format_file_size(file_info['file_size']),
-                    'size_bytes': file_info['file_size'],
-                    'type': file_info['file_type'],
-                    'extension': file_info['file_extension'],
-                    'upload_time': file_info['upload_time'],
-                    'expire_time': file_info['expire_time'],
-                    'is_text': file_info['file_extension'] in app.config['PREVIEWABLE_EXTENSIONS'],
-                    'is_image': file_info['file_extension'] in app.config['IMAGE_EXTENSIONS'],
-                    'is_text_file': file_info.get('is_text_file', False),
-                    'is_folder': False,
-                    'relative_path': relative_path
-                })
+    # 格式化文件信息，包括根目录文件和文件夹
+    formatted_files = []
 
-        # 按上传时间排序
-        formatted_files.sort(key=lambda x: x['upload_time'], reverse=True)
+    # 首先添加所有文件夹
+    for folder_name, folder_files in folders.items():
+        if folder_files:  # 确保文件夹不为空
+            total_size = sum(f['file_size'] for f in folder_files)
+            file_count = len(folder_files)
 
-        return jsonify({
-            'success': True,
-            'files': formatted_files,
-            'storage_info': {
-                'total_files': storage_info['total_files'],
-                'total_size': format_file_size(storage_info['total_size'])
-            }
-        })
+            # 获取文件夹的最早上传时间
+            upload_times = [f['upload_time'] for f in folder_files]
+            earliest_time = min(upload_times) if upload_times else folder_files[0]['upload_time']
+
+            # 获取过期时间（使用最晚的过期时间）
+            expire_times = [f['expire_time'] for f in folder_files]
+            latest_expire_time = max(expire_times) if expire_times else folder_files[0]['expire_time']
+
+            formatted_files.append({
+                'id': f'folder_{folder_name}',
+                'name': folder_name,
+                'size': format_file_size(total_size),
+                'size_bytes': total_size,
+                'type': 'folder',
+                'extension': 'folder',
+                'upload_time': earliest_time,
+                'expire_time': latest_expire_time,
+                'is_text': False,
+                'is_image': False,
+                'is_text_file': False,
+                'is_folder': True,
+                'file_count': file_count,
+                'folder_path': folder_name,
+                'relative_path': folder_name
+            })
+
+    # 然后添加根目录文件
+    for file_info in files:
+        relative_path = file_info.get('relative_path') or file_info['original_name']
+
+        # 只处理根目录文件（不在文件夹中的文件）
+        if not ('/' in relative_path or '\\' in relative_path):
+            formatted_files.append({
+                'id': file_info['id'],
+                'name': file_info['original_name'],
+                'size': format_file_size(file_info['file_size']),
+                'size_bytes': file_info['file_size'],
+                'type': file_info['file_type'],
+                'extension': file_info['file_extension'],
+                'upload_time': file_info['upload_time'],
+                'expire_time': file_info['expire_time'],
+                'is_text': file_info['file_extension'] in current_app.config['PREVIEWABLE_EXTENSIONS'],
+                'is_image': file_info['file_extension'] in current_app.config['IMAGE_EXTENSIONS'],
+                'is_text_file': file_info.get('is_text_file', False),
+                'is_archive': archive_format(file_info['original_name']) is not None,
+                'is_folder': False,
+                'relative_path': relative_path
+            })
+
+    # 按上传时间排序
+    formatted_files.sort(key=lambda x: x['upload_time'], reverse=True)
+
+    return {
+        'success': True,
+        'files': formatted_files,
+        'storage_info': {
+            'total_files': storage_info['total_files'],
+            'total_size': format_file_size(storage_info['total_size']),
+            'stored_size': format_file_size(storage_info['stored_size'])
+        }
+    }
+
+@route('/api/files')
+def list_files():
+    """获取文件列表API - 返回根目录文件和文件夹（按元数据代数缓存）"""
+    try:
+        return response_cache.respond(('files',), build_file_list)
     except Exception as e:
         return jsonify({'success': False, 'message': f'获取文件列表失败: {str(e)}'}), 500
 
-@app.route('/api/folders')
+@route('/api/folders')
 def get_folders():
     """获取文件夹列表API"""
     try:
@@ -248,9 +794,9 @@ def get_folders():
     except Exception as e:
         return jsonify({'success': False, 'message': f'获取文件夹列表失败: {str(e)}'}), 500
 
-@app.route('/api/folder-files/<path:folder_path>')
+@route('/api/folder-files/<path:folder_path>')
 def get_folder_files(folder_path):
-    """获取指定文件夹内的文件列表API"""
+    """获取指定文件夹内的文件列表API（按元数据代数缓存）"""
     try:
         # URL解码文件夹路径
         from urllib.parse import unquote
@@ -261,37 +807,58 @@ def get_folder_files(folder_path):
         if folder_path not in folders:
             return jsonify({'success': False, 'message': '文件夹不存在'}), 404
 
-        # 格式化文件夹内的文件信息
-        formatted_files = []
-        for file_info in folders[folder_path]:
-            formatted_files.append({
-                'id': file_info['id'],
-                'name': file_info['original_name'],
-                'size': format_file_size(file_info['file_size']),
-                'size_bytes': file_info['file_size'],
-                'type': file_info['file_type'],
-                'extension': file_info['file_extension'],
-                'upload_time': file_info['upload_time'],
-                'expire_time': file_info['expire_time'],
-                'is_text': file_info['file_extension'] in app.config['PREVIEWABLE_EXTENSIONS'],
-                'is_image': file_info['file_extension'] in app.config['IMAGE_EXTENSIONS'],
-                'is_text_file': file_info.get('is_text_file', False),
-                'relative_path': file_info.get('relative_path', file_info['original_name'])
-            })
+        def build():
+            # 格式化文件夹内的文件信息
+            formatted_files = [format_file_info(file_info) for file_info in folders[folder_path]]
 
-        # 按文件名排序
-        formatted_files.sort(key=lambda x: x['name'])
+            # 按文件名排序
+            formatted_files.sort(key=lambda x: x['name'])
 
+            return {
+                'success': True,
+                'files': formatted_files,
+                'folder_path': folder_path,
+                'folder_name': folder_path.split('/')[-1] if '/' in folder_path else folder_path
+            }
+
+        return response_cache.respond(('folder-files', folder_path), build)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'获取文件夹文件失败: {str(e)}'}), 500
+
+@route('/api/search')
+def search_files():
+    """文件搜索API：按文件名、路径和文本内容搜索，支持前缀匹配和分页"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'success': False, 'message': '请输入搜索关键词'}), 400
+        
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+        if page < 1 or per_page < 1:
+            return jsonify({'success': False, 'message': '分页参数无效'}), 400
+        per_page = min(per_page, current_app.config['SEARCH_MAX_PER_PAGE'])
+        
+        total, results = file_manager.search_files(query, per_page, (page - 1) * per_page)
+        
+        formatted_files = []
+        for file_info in results:
+            formatted = format_file_info(file_info)
+            formatted['snippet'] = file_info.get('snippet') or ''
+            formatted_files.append(formatted)
+        
         return jsonify({
             'success': True,
-            'files': formatted_files,
-            'folder_path': folder_path,
-            'folder_name': folder_path.split('/')[-1] if '/' in folder_path else folder_path
+            'query': query,
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'files': formatted_files
         })
     except Exception as e:
-        return jsonify({'success': False, 'message': f'获取文件夹文件失败: {str(e)}'}), 500
+        return jsonify({'success': False, 'message': f'搜索失败: {str(e)}'}), 500
 
-@app.route('/api/download/<file_id>')
+@route('/api/download/<file_id>')
 def download_file(file_id):
     """文件下载API"""
     try:
@@ -299,29 +866,125 @@ def download_file(file_id):
         if not metadata:
             return jsonify({'success': False, 'message': '文件不存在'}), 404
 
-        file_path = metadata['file_path']
-        # 确保使用绝对路径
-        if not os.path.isabs(file_path):
-            file_path = os.path.abspath(file_path)
+        # 分片迁移期间文件可能已移动到新位置；远程存储时为None
+        file_path = file_manager.resolve_file_path(metadata)
+        if not file_path and file_manager.storage.local:
+            return jsonify({'success': False, 'message': f"文件不存在: {metadata['file_path']}"}), 404
 
-        # 调试信息
-        print(f"Debug - 当前工作目录: {os.getcwd()}")
-        print(f"Debug - 原始路径: {metadata['file_path']}")
-        print(f"Debug - 绝对路径: {file_path}")
-        print(f"Debug - 文件存在: {os.path.exists(file_path)}")
+        return send_stored_file(metadata, file_path, as_attachment=True)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'下载失败: {str(e)}'}), 500
 
-        if not os.path.exists(file_path):
-            return jsonify({'success': False, 'message': f'文件不存在: {file_path}'}), 404
+@route('/api/signature/<file_id>')
+def file_signature(file_id):
+    """增量上传：已有文件的块签名（Adler-32弱校验和MD5强校验），客户端据此只上传变化的数据"""
+    try:
+        metadata = file_manager.get_file_metadata(file_id)
+        if not metadata:
+            return jsonify({'success': False, 'message': '文件不存在'}), 404
 
-        return send_file(
-            file_path,
-            as_attachment=True,
-            download_name=metadata['original_name']
-        )
+        min_block_size = current_app.config['DELTA_MIN_BLOCK_SIZE']
+        max_block_size = current_app.config['DELTA_MAX_BLOCK_SIZE']
+        block_size = request.args.get('block_size', type=int)
+        if block_size is None:
+            block_size = choose_block_size(metadata['file_size'], min_block_size, max_block_size)
+        elif not min_block_size <= block_size <= max_block_size:
+            return jsonify({
+                'success': False,
+                'message': f'分块大小应在 {min_block_size} 到 {max_block_size} 字节之间'
+            }), 400
+
+        src = file_manager.open_stored(metadata)
+        if src is None:
+            return jsonify({'success': False, 'message': f"文件不存在: {metadata['file_path']}"}), 404
+
+        header = current_app.json.dumps({
+            'success': True,
+            'file_id': file_id,
+            'file_size': metadata['file_size'],
+            'block_size': block_size
+        })
+
+        def generate():
+            # 大文件的签名边读边输出，不在内存中拼出完整列表
+            yield header[:-1] + ',"blocks":['
+            with src:
+                batch = []
+                separator = ''
+                for weak, strong in block_signatures(src, block_size):
+                    batch.append(f'[{weak},"{strong}"]')
+                    if len(batch) >= 1024:
+                        yield separator + ','.join(batch)
+                        separator = ','
+                        batch = []
+                if batch:
+                    yield separator + ','.join(batch)
+            yield ']}'
+
+        return current_app.response_class(generate(), mimetype='application/json')
     except Exception as e:
-        return jsonify({'success': False, 'message': f'下载失败: {str(e)}'}), 500
+        return jsonify({'success': False, 'message': f'计算文件签名失败: {str(e)}'}), 500
+
+@route('/api/delta/<file_id>', methods=['POST'])
+@require_operation_log(Operations.FILE_UPLOAD)
+def upload_delta(file_id):
+    """增量上传API：以已有文件为基础保存新文件
+
+    表单字段 recipe 为重建方案（JSON，见 utils.delta），文件字段 data 为新增数据，
+    可选字段 path 为新文件的相对路径。
+    """
+    try:
+        recipe = current_app.json.loads(request.form.get('recipe') or 'null')
+        if not isinstance(recipe, dict):
+            return jsonify({'success': False, 'message': '缺少重建方案'}), 400
+
+        data = request.files.get('data')
+        literal = data.stream if data else BytesIO()
+        metadata = file_manager.save_delta_file(file_id, recipe, literal, request.form.get('path') or None)
+        if not metadata:
+            return jsonify({'success': False, 'message': '基础文件不存在'}), 404
+
+        notify_search_indexer()
+        return jsonify({
+            'success': True,
+            'message': '增量上传成功',
+            'uploaded_files': [format_uploaded_file(metadata)]
+        })
+    except FileUploadException as e:
+        return jsonify({'success': False, 'message': e.message}), 400
+    except RequestEntityTooLarge:
+        return jsonify({'success': False, 'message': '文件太大，请检查服务器配置'}), 413
+    except ValueError:
+        return jsonify({'success': False, 'message': '重建方案不是有效的JSON'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'增量上传失败: {str(e)}'}), 500
+
+@route('/api/extract/<file_id>', methods=['POST'])
+@require_operation_log(Operations.FILE_UPLOAD)
+def extract_archive(file_id):
+    """服务端解压API：在后台把压缩包解压到文件夹，返回任务（进度见 /api/jobs/<id>）
+
+    请求体可选 {"folder": "目标文件夹"}，默认为去掉扩展名的压缩包文件名。
+    """
+    try:
+        metadata = file_manager.get_file_metadata(file_id)
+        if not metadata:
+            return jsonify({'success': False, 'message': '文件不存在'}), 404
 
-@app.route('/api/download-folder/<path:folder_path>')
+        data = request.get_json(silent=True) or {}
+        payload = archive_extractor.prepare(metadata, data.get('folder'))
+        job = job_queue.submit('extract_archive', payload)
+        return jsonify({
+            'success': True,
+            'message': f"已开始解压到文件夹 {payload['folder']}",
+            'job': job
+        }), 202
+    except FileUploadException as e:
+        return jsonify({'success': False, 'message': e.message}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'解压失败: {str(e)}'}), 500
+
+@route('/api/download-folder/<path:folder_path>')
 def download_folder(folder_path):
     """文件夹下载API"""
     try:
@@ -329,8 +992,8 @@ def download_folder(folder_path):
         from urllib.parse import unquote
         folder_path = unquote(folder_path)
 
-        # 创建ZIP文件
-        zip_path = file_manager.create_folder_zip(folder_path)
+        # 获取ZIP文件（同一内容版本的文件夹只打包一次）
+        zip_path, cached = file_manager.get_folder_zip(folder_path)
         if not zip_path:
             return jsonify({'success': False, 'message': '文件夹不存在或为空'}), 404
 
@@ -338,30 +1001,21 @@ def download_folder(folder_path):
         folder_name = folder_path.split('/')[-1] if '/' in folder_path else folder_path
         download_name = f"{folder_name}.zip"
 
-        def remove_file():
-            """下载完成后删除临时文件"""
-            try:
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-            except:
-                pass
-
-        # 发送文件并在完成后删除
-        response = send_file(
-            zip_path,
-            as_attachment=True,
-            download_name=download_name,
-            mimetype='application/zip'
-        )
+        if cached:
+            return send_file(
+                zip_path,
+                as_attachment=True,
+                download_name=download_name,
+                mimetype='application/zip'
+            )
 
-        # 注册清理函数
-        response.call_on_close(remove_file)
-        return response
+        # 未使用缓存时下载完成后删除临时文件
+        return send_temp_file(zip_path, download_name)
 
     except Exception as e:
         return jsonify({'success': False, 'message': f'下载失败: {str(e)}'}), 500
 
-@app.route('/api/delete/<file_id>', methods=['DELETE'])
+@route('/api/delete/<file_id>', methods=['DELETE'])
 def delete_file(file_id):
     """文件删除API"""
     try:
@@ -372,7 +1026,7 @@ def delete_file(file_id):
     except Exception as e:
         return jsonify({'success': False, 'message': f'删除失败: {str(e)}'}), 500
 
-@app.route('/api/delete-folder/<path:folder_path>', methods=['DELETE'])
+@route('/api/delete-folder/<path:folder_path>', methods=['DELETE'])
 def delete_folder(folder_path):
     """文件夹删除API"""
     try:
@@ -380,26 +1034,14 @@ def delete_folder(folder_path):
         from urllib.parse import unquote
         folder_path = unquote(folder_path)
 
-        folders = file_manager.get_folder_structure()
-
-        # 调试信息：打印可用的文件夹
-        print(f"尝试删除文件夹: {folder_path}")
-        print(f"可用的文件夹: {list(folders.keys())}")
+        result = file_manager.delete_folder(folder_path)
+        if result is None:
+            return jsonify({'success': False, 'message': '文件夹不存在'}), 404
 
-        if folder_path not in folders:
-            return jsonify({
-                'success': False,
-                'message': f'文件夹不存在。可用文件夹: {list(folders.keys())}'
-            }), 404
-
-        # 删除文件夹中的所有文件
-        deleted_count = 0
-        failed_count = 0
-        for file_info in folders[folder_path]:
-            if file_manager.delete_file(file_info['id']):
-                deleted_count += 1
-            else:
-                failed_count += 1
+        # 删除文件夹中的所有文件（单个事务删除元数据，并行删除物理文件）
+        deleted_ids, failed_ids = result
+        deleted_count = len(deleted_ids)
+        failed_count = len(failed_ids)
 
         if deleted_count > 0:
             message = f'文件夹删除成功，共删除 {deleted_count} 个文件'
@@ -414,7 +1056,7 @@ def delete_folder(folder_path):
         print(f"删除文件夹异常: {traceback.format_exc()}")
         return jsonify({'success': False, 'message': f'删除文件夹失败: {str(e)}'}), 500
 
-@app.route('/api/preview/<file_id>')
+@route('/api/preview/<file_id>')
 def preview_file(file_id):
     """文件预览API"""
     try:
@@ -422,14 +1064,17 @@ def preview_file(file_id):
         if not metadata:
             return jsonify({'success': False, 'message': '文件不存在'}), 404
         
-        file_path = metadata['file_path']
-        if not os.path.exists(file_path):
+        file_path = file_manager.resolve_file_path(metadata)
+        if not file_path and file_manager.storage.local:
             return jsonify({'success': False, 'message': '文件不存在'}), 404
         
         # 检查是否为可预览的文本文件
-        if metadata['file_extension'] in app.config['PREVIEWABLE_EXTENSIONS']:
+        if metadata['file_extension'] in current_app.config['PREVIEWABLE_EXTENSIONS']:
+            src = file_manager.open_stored(metadata)
+            if src is None:
+                return jsonify({'success': False, 'message': '文件不存在'}), 404
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
+                with span(FS), TextIOWrapper(src, encoding='utf-8') as f:
                     content = f.read()
                 return jsonify({
                     'success': True,
@@ -441,8 +1086,8 @@ def preview_file(file_id):
                 return jsonify({'success': False, 'message': '文件编码不支持预览'}), 400
         
         # 检查是否为图片文件
-        elif metadata['file_extension'] in app.config['IMAGE_EXTENSIONS']:
-            return send_file(file_path)
+        elif metadata['file_extension'] in current_app.config['IMAGE_EXTENSIONS']:
+            return send_stored_file(metadata, file_path)
         
         else:
             return jsonify({'success': False, 'message': '文件类型不支持预览'}), 400
@@ -450,7 +1095,7 @@ def preview_file(file_id):
     except Exception as e:
         return jsonify({'success': False, 'message': f'预览失败: {str(e)}'}), 500
 
-@app.route('/api/text/save', methods=['POST'])
+@route('/api/text/save', methods=['POST'])
 def save_text():
     """保存文本文件API"""
     try:
@@ -463,6 +1108,7 @@ def save_text():
         
         file_id, metadata = file_manager.save_text_file(filename, content)
         if file_id:
+            notify_search_indexer()
             return jsonify({
                 'success': True,
                 'message': '文本文件保存成功',
@@ -476,19 +1122,56 @@ def save_text():
     except Exception as e:
         return jsonify({'success': False, 'message': f'保存失败: {str(e)}'}), 500
 
-@app.route('/api/cleanup', methods=['POST'])
+@route('/api/cleanup', methods=['POST'])
 def manual_cleanup():
-    """手动清理过期文件API"""
+    """手动清理过期文件API：提交清理任务，进度和结果见 /api/jobs/<id>"""
     try:
-        expired_count = file_manager.cleanup_expired_files()
-        return jsonify({
-            'success': True,
-            'message': f'清理完成，删除了 {expired_count} 个过期文件'
-        })
+        job = job_queue.submit('cleanup', unique=True)
+        return jsonify({'success': True, 'message': '已开始清理过期文件', 'job': job}), 202
     except Exception as e:
         return jsonify({'success': False, 'message': f'清理失败: {str(e)}'}), 500
 
-@app.route('/api/batch/delete', methods=['POST'])
+@route('/api/storage/reconcile')
+def get_storage_reconcile_report():
+    """最近一次存储对账报告API"""
+    if storage_reconciler is None:
+        return jsonify({'success': False, 'message': '存储对账只支持本地存储'}), 400
+    report = storage_reconciler.get_last_report()
+    if report is None:
+        return jsonify({'success': False, 'message': '尚未执行过存储对账'}), 404
+    return jsonify({'success': True, 'report': report})
+
+@route('/api/storage/reconcile', methods=['POST'])
+def reconcile_storage():
+    """手动执行存储对账API，dry_run为true时只统计不处理；报告为任务结果，见 /api/jobs/<id>"""
+    if storage_reconciler is None:
+        return jsonify({'success': False, 'message': '存储对账只支持本地存储'}), 400
+    data = request.get_json(silent=True) or {}
+    job = job_queue.submit('storage_reconcile', {'dry_run': bool(data.get('dry_run', False))}, unique=True)
+    return jsonify({'success': True, 'message': '已开始存储对账', 'job': job}), 202
+
+@route('/api/db/stats')
+def get_db_stats():
+    """SQL执行统计和最近的慢查询API（当前worker进程），sort 为排序字段"""
+    query_stats = file_manager.database.query_stats
+    if query_stats is None:
+        return jsonify({'success': False, 'message': '未开启SQL执行统计'}), 400
+    sort_by = request.args.get('sort', 'total_ms')
+    if sort_by not in ('total_ms', 'avg_ms', 'max_ms', 'count', 'rows'):
+        return jsonify({'success': False, 'message': '排序字段无效'}), 400
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'success': True, 'stats': query_stats.to_dict(sort_by, limit)})
+
+@route('/api/db/stats', methods=['DELETE'])
+def reset_db_stats():
+    """清空当前worker进程的SQL执行统计API"""
+    query_stats = file_manager.database.query_stats
+    if query_stats is None:
+        return jsonify({'success': False, 'message': '未开启SQL执行统计'}), 400
+    query_stats.reset()
+    return jsonify({'success': True, 'message': 'SQL执行统计已清空'})
+
+@route('/api/batch/delete', methods=['POST'])
 @require_operation_log(Operations.FILE_DELETE)
 def batch_delete_files():
     """批量删除文件API"""
@@ -501,24 +1184,18 @@ def batch_delete_files():
         if not isinstance(file_ids, list) or len(file_ids) == 0:
             return jsonify({'success': False, 'message': '文件ID列表格式错误或为空'}), 400
         
-        if len(file_ids) > 100:  # 限制批量操作数量
-            return jsonify({'success': False, 'message': '批量删除数量不能超过100个'}), 400
+        # 大批量删除作为后台任务执行
+        if len(file_ids) > current_app.config['JOB_INLINE_DELETE_LIMIT']:
+            job = job_queue.submit('batch_delete', {'file_ids': file_ids})
+            return jsonify({
+                'success': True,
+                'message': f'已开始删除 {len(file_ids)} 个文件',
+                'job': job
+            }), 202
         
-        success_count = 0
-        failed_count = 0
-        failed_files = []
-        
-        for file_id in file_ids:
-            try:
-                if file_manager.delete_file(file_id):
-                    success_count += 1
-                else:
-                    failed_count += 1
-                    failed_files.append(file_id)
-            except Exception as e:
-                failed_count += 1
-                failed_files.append(file_id)
-                logger.error(f"删除文件失败 {file_id}: {str(e)}")
+        deleted_ids, failed_files = file_manager.delete_many(file_ids)
+        success_count = len(deleted_ids)
+        failed_count = len(failed_files)
         
         return jsonify({
             'success': True,
@@ -532,7 +1209,7 @@ def batch_delete_files():
         logger.error(f"批量删除失败: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'message': f'批量删除失败: {str(e)}'}), 500
 
-@app.route('/api/batch/download', methods=['POST'])
+@route('/api/batch/download', methods=['POST'])
 @require_operation_log(Operations.FILE_DOWNLOAD)
 def batch_download_files():
     """批量下载文件API（创建ZIP包）"""
@@ -545,81 +1222,98 @@ def batch_download_files():
         if not isinstance(file_ids, list) or len(file_ids) == 0:
             return jsonify({'success': False, 'message': '文件ID列表格式错误或为空'}), 400
         
-        if len(file_ids) > 50:  # 限制批量下载数量
-            return jsonify({'success': False, 'message': '批量下载数量不能超过50个'}), 400
-        
-        # 创建临时ZIP文件
-        temp_zip = tempfile.NamedTemporaryFile(suffix='.zip', delete=False)
-        temp_zip.close()
-        
-        added_files = 0
-        with zipfile.ZipFile(temp_zip.name, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_id in file_ids:
-                try:
-                    metadata = file_manager.get_file_metadata(file_id)
-                    if metadata and os.path.exists(metadata['file_path']):
-                        # 使用原始文件名，如果重名则添加数字后缀
-                        zip_name = metadata['original_name']
-                        counter = 1
-                        original_zip_name = zip_name
-                        
-                        # 检查ZIP中是否已存在同名文件
-                        while zip_name in zipf.namelist():
-                            name, ext = os.path.splitext(original_zip_name)
-                            zip_name = f"{name}_{counter}{ext}"
-                            counter += 1
-                        
-                        zipf.write(metadata['file_path'], zip_name)
-                        added_files += 1
-                except Exception as e:
-                    logger.error(f"添加文件到ZIP失败 {file_id}: {str(e)}")
-                    continue
+        zip_path, added_files = file_manager.create_files_zip(file_ids)
         
         if added_files == 0:
-            os.remove(temp_zip.name)
             return jsonify({'success': False, 'message': '没有可下载的文件'}), 404
         
         # 生成下载文件名
         download_name = f"batch_download_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
         
-        def remove_file():
-            """下载完成后删除临时文件"""
-            try:
-                if os.path.exists(temp_zip.name):
-                    os.remove(temp_zip.name)
-            except:
-                pass
-        
         # 发送文件并在完成后删除
-        response = send_file(
-            temp_zip.name,
-            as_attachment=True,
-            download_name=download_name,
-            mimetype='application/zip'
-        )
-        
-        # 注册清理函数
-        response.call_on_close(remove_file)
-        return response
+        return send_temp_file(zip_path, download_name)
         
     except Exception as e:
         logger.error(f"批量下载失败: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'message': f'批量下载失败: {str(e)}'}), 500
 
-@app.errorhandler(413)
+@route('/api/batch/download/prepare', methods=['POST'])
+@require_operation_log(Operations.FILE_DOWNLOAD)
+def prepare_batch_download():
+    """批量下载：在后台打包ZIP，完成后从任务结果中的 download_url 下载"""
+    try:
+        data = request.get_json(silent=True)
+        if not data or 'file_ids' not in data:
+            return jsonify({'success': False, 'message': '缺少文件ID列表'}), 400
+        
+        file_ids = data['file_ids']
+        if not isinstance(file_ids, list) or len(file_ids) == 0:
+            return jsonify({'success': False, 'message': '文件ID列表格式错误或为空'}), 400
+        
+        # 用户在等待下载，优先于清理等任务执行
+        job = job_queue.submit('batch_download', {'file_ids': file_ids}, priority=PRIORITY_HIGH)
+        return jsonify({'success': True, 'message': '正在打包文件', 'job': job}), 202
+    except Exception as e:
+        logger.error(f"提交批量下载任务失败: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'message': f'批量下载失败: {str(e)}'}), 500
+
+@route('/api/jobs')
+def list_jobs():
+    """最近的后台任务API，可按 status 过滤"""
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify({'success': True, 'jobs': job_queue.list(request.args.get('status'), limit)})
+
+@route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """后台任务状态和进度API"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消后台任务API：排队中的任务立即取消，运行中的任务在下一次报告进度时停止"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    return jsonify({'success': True, 'message': '已请求取消任务', 'job': job})
+
+@route('/api/jobs/<job_id>/download')
+def download_job_result(job_id):
+    """下载批量下载任务打包好的ZIP"""
+    job = job_queue.get(job_id)
+    if job is None or job['type'] != 'batch_download':
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    if job['status'] != JOB_COMPLETED:
+        return jsonify({'success': False, 'message': '文件尚未打包完成', 'job': job}), 409
+    
+    zip_path = os.path.abspath(os.path.join(job_queue.result_folder, f'{job_id}.zip'))
+    if not os.path.exists(zip_path):
+        return jsonify({'success': False, 'message': '打包的文件已过期'}), 410
+    created = datetime.fromtimestamp(job['created_at']).strftime('%Y%m%d_%H%M%S')
+    return send_file(
+        zip_path,
+        as_attachment=True,
+        download_name=f'batch_download_{created}.zip',
+        mimetype='application/zip'
+    )
+
+@errorhandler(413)
 def too_large(e):
     """文件过大错误处理"""
     return jsonify({'success': False, 'message': '文件太大，请检查服务器配置'}), 413
 
-@app.errorhandler(404)
+@errorhandler(404)
 def not_found(e):
     """404错误处理"""
     return jsonify({'success': False, 'message': '页面不存在'}), 404
 
-@app.errorhandler(500)
+@errorhandler(500)
 def internal_error(e):
     """500错误处理"""
     return jsonify({'success': False, 'message': '服务器内部错误'}), 500
 
 if __name__ == '__main__':
+    app = create_app()
     app.run(host=app.config['HOST'], port=app.config['PORT'], debug=app.config['DEBUG'])
@@ -0,0 +1,351 @@
+"""
+ASGI入口
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 4
+    hypercorn asgi:application --bind 0.0.0.0:5000 --workers 4
+
+Flask视图仍在线程池中同步执行，路由、错误处理和 FileManager 的行为与WSGI部署完全相同；
+区别在于长时间的数据传输放到了事件循环上：
+
+- 下载：视图返回后，文件内容在线程中按块读取、在事件循环上发送。慢速客户端只占用
+  一个协程和一个数据块的内存，不占用线程，数千个并发下载的内存占用保持平稳；
+- 上传：multipart请求体在事件循环上接收，交给 StreamingUploadParser 写入存储目录
+  （写盘在线程中执行），视图直接使用解析结果；
+- 带宽整形：在事件循环上用 asyncio.sleep 等待，不在线程中sleep。
+"""
+import io
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from flask import request
+from werkzeug.wsgi import FileWrapper
+import app as file_share
+from utils.exceptions import FileShareException, RateLimitException
+from utils.logging_config import get_logger
+from utils.middleware import get_client_ip
+from utils.rate_limit import ENVIRON_RATE_CHECKED, ENVIRON_ASYNC_SHAPING, ENVIRON_SHAPE_CLIENT
+from utils.upload_stream import StreamingUploadParser, get_multipart_boundary, PREPARSED_UPLOAD_KEY
+
+
+class ClientDisconnected(Exception):
+    """客户端在请求体传输完成前断开连接"""
+
+
+class AsyncFileWrapper(FileWrapper):
+    """wsgi.file_wrapper 实现
+
+    send_file 返回的文件对象被包装为该类型，服务器识别后在事件循环上发送文件内容。
+    同步迭代时行为与Werkzeug的FileWrapper相同。
+    """
+
+
+class RequestBodyReader(io.RawIOBase):
+    """wsgi.input 实现：在工作线程中阻塞读取，由事件循环接收ASGI请求体消息"""
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = bytearray()
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message['type'] == 'http.disconnect':
+            self._done = True
+            return
+        self._buffer += message.get('body', b'')
+        if not message.get('more_body', False):
+            self._done = True
+
+    def read(self, size=-1):
+        while not self._done and (size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readline(self, size=-1):
+        while not self._done and b'\n' not in self._buffer and (size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return data
+
+
+class FileShareASGI:
+    """把Flask应用包装为ASGI应用"""
+
+    def __init__(self, flask_app, file_manager, chunk_size=64 * 1024, max_threads=32, limiter=None,
+                 on_startup=None):
+        self.flask_app = flask_app
+        self.file_manager = file_manager
+        self.chunk_size = chunk_size
+        self.rate_limiter = limiter
+        # lifespan启动时在线程中调用，用于启动后台任务
+        self.on_startup = on_startup
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='asgi')
+        self.logger = get_logger()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._handle_http(scope, receive, send)
+        else:
+            raise RuntimeError(f"不支持的ASGI连接类型: {scope['type']}")
+
+    def _run(self, func, *args):
+        """在线程池中执行阻塞操作"""
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.on_startup is not None:
+                    await self._run(self.on_startup)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _build_environ(self, scope, body):
+        """根据ASGI scope构建WSGI environ"""
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        root_path = scope.get('root_path', '')
+        path = scope['path']
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1] or 80),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': AsyncFileWrapper,
+            ENVIRON_ASYNC_SHAPING: True,
+        }
+
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1')
+            value = value.decode('latin-1')
+            if name == 'content-type':
+                key = 'CONTENT_TYPE'
+            elif name == 'content-length':
+                key = 'CONTENT_LENGTH'
+            else:
+                key = 'HTTP_' + name.upper().replace('-', '_')
+            if key in environ:
+                separator = '; ' if key == 'HTTP_COOKIE' else ','
+                environ[key] = environ[key] + separator + value
+            else:
+                environ[key] = value
+        return environ
+
+    def _upload_preflight(self, environ):
+        """判断请求是否为可在事件循环上预解析的流式上传，是则返回 (multipart边界, 客户端IP)
+
+        请求频率在接收请求体之前检查；超限时返回None，由视图按原流程返回429。
+        """
+        with self.flask_app.request_context(environ):
+            if request.endpoint != 'upload_file' or not self.flask_app.config['STREAMING_UPLOAD']:
+                return None
+            boundary = get_multipart_boundary(request.content_type)
+            if not boundary:
+                return None
+
+            client_ip = get_client_ip()
+            if self.rate_limiter:
+                try:
+                    self.rate_limiter.check_request(request.endpoint, client_ip)
+                except RateLimitException:
+                    return None
+            return boundary, client_ip
+
+    async def _preparse_upload(self, environ, receive):
+        """在事件循环上接收上传请求体并写入存储目录，返回解析器；不适用时返回None"""
+        target = await self._run(self._upload_preflight, environ)
+        if target is None:
+            return None
+
+        boundary, client_ip = target
+        parser = StreamingUploadParser(boundary, self.file_manager.open_upload)
+        buffer = bytearray()
+        try:
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    raise ClientDisconnected()
+                buffer += message.get('body', b'')
+                more_body = message.get('more_body', False)
+
+                if len(buffer) >= self.chunk_size or (buffer and not more_body):
+                    if self.rate_limiter and self.rate_limiter.upload_bandwidth:
+                        wait = await self._run(self.rate_limiter.reserve_upload, client_ip, len(buffer))
+                        if wait > 0:
+                            await asyncio.sleep(wait)
+                    data = bytes(buffer)
+                    buffer.clear()
+                    await self._run(parser.feed, data)
+
+            await self._run(parser.finish)
+            environ[PREPARSED_UPLOAD_KEY] = parser
+        except FileShareException as e:
+            # 与同步解析一致：丢弃已写入的文件，由视图抛出异常返回错误响应
+            await self._run(parser.abort)
+            environ[PREPARSED_UPLOAD_KEY] = e
+        except BaseException:
+            await self._run(parser.abort)
+            raise
+
+        environ['wsgi.input'] = io.BytesIO()
+        environ[ENVIRON_RATE_CHECKED] = True
+        return parser
+
+    @staticmethod
+    def _file_source(body):
+        """响应体为文件时返回 (文件对象, 起始偏移, 长度)，否则返回None"""
+        if isinstance(body, AsyncFileWrapper):
+            return body.file, None, None
+        # Range响应由Werkzeug的私有类 _RangeWrapper 包装（iterable、start_byte、byte_range），
+        # 按属性识别而不导入该类；以后的版本改名或改结构时退回在线程中迭代
+        iterable = getattr(body, 'iterable', None)
+        start = getattr(body, 'start_byte', None)
+        length = getattr(body, 'byte_range', None)
+        if isinstance(iterable, AsyncFileWrapper) and isinstance(start, int) \
+                and (length is None or isinstance(length, int)):
+            return iterable.file, start, length
+        return None
+
+    async def _iter_body(self, body):
+        """异步迭代响应体，阻塞读取在线程中执行"""
+        source = self._file_source(body)
+        if source is not None:
+            file, start, remaining = source
+            if start is not None:
+                await self._run(file.seek, start)
+            while remaining is None or remaining > 0:
+                size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+                chunk = await self._run(file.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+            return
+
+        iterator = iter(body)
+        end = object()
+        while True:
+            chunk = await self._run(next, iterator, end)
+            if chunk is end:
+                break
+            if chunk:
+                yield chunk
+
+    @staticmethod
+    async def _watch_disconnect(receive, disconnected):
+        """响应发送期间监听客户端断开"""
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    async def _send_body(self, body, environ, receive, send):
+        """发送响应体，客户端断开时停止读取文件"""
+        shape_client = environ.get(ENVIRON_SHAPE_CLIENT)
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+        try:
+            async for chunk in self._iter_body(body):
+                if disconnected.is_set():
+                    return
+                if shape_client and self.rate_limiter:
+                    wait = await self._run(self.rate_limiter.reserve_download, shape_client, len(chunk))
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            watcher.cancel()
+
+    async def _handle_http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = self._build_environ(scope, RequestBodyReader(receive, loop))
+
+        try:
+            parser = await self._preparse_upload(environ, receive)
+        except ClientDisconnected:
+            return
+
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            response_start['status'] = int(status.split(' ', 1)[0])
+            response_start['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+            ]
+
+        try:
+            body = await self._run(self.flask_app, environ, start_response)
+        except Exception as e:
+            self.logger.error(f"ASGI请求处理失败: {str(e)}", exc_info=True)
+            body = [b'Internal Server Error']
+            start_response('500 Internal Server Error', [('Content-Type', 'text/plain; charset=utf-8')])
+        finally:
+            # 视图未接管预解析的上传（如请求被拒绝）时删除已写入的文件
+            if parser is not None and not parser.claimed:
+                await self._run(parser.abort)
+
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': response_start['status'],
+                'headers': response_start['headers']
+            })
+            await self._send_body(body, environ, receive, send)
+        finally:
+            close = getattr(body, 'close', None)
+            if close is not None:
+                await self._run(close)
+
+
+flask_app = file_share.get_app()
+application = FileShareASGI(
+    flask_app,
+    file_share.file_manager,
+    chunk_size=flask_app.config['ASGI_CHUNK_SIZE'],
+    max_threads=flask_app.config['ASGI_THREADS'],
+    limiter=file_share.rate_limiter,
+    on_startup=file_share.start_background_tasks
+)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+冷启动耗时检查
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --import-budget-ms 300 --create-budget-ms 500
+
+用 `python -X importtime` 测量 `import app` 的耗时，检查导入时没有加载
+二维码、psutil、APScheduler 等可选子系统；再在临时目录中测量 create_app() 的耗时。
+每项测量多次取中位数，超出预算时以非0状态码退出，可用于CI。
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导入 app 模块时不应加载的模块（只在使用对应功能时导入）
+LAZY_MODULES = ['qrcode', 'PIL', 'psutil', 'apscheduler']
+
+# 在子进程中创建应用并输出耗时，后台任务推迟启动，不计入
+CREATE_APP_SCRIPT = '''
+import sys, json, time
+sys.path.insert(0, {project_dir!r})
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app({{'DEFER_BACKGROUND_TASKS': True}})
+created = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - start) * 1000, 'create_ms': (created - imported) * 1000}}))
+'''
+
+
+def parse_importtime(output):
+    """解析 -X importtime 的输出，返回 {模块名: (自身耗时us, 累计耗时us)}"""
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure_import():
+    """在新进程中导入 app 模块，返回 (各模块耗时, 已加载的可选模块)"""
+    code = (
+        f"import sys; sys.path.insert(0, {PROJECT_DIR!r}); import app; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=workdir, capture_output=True, text=True, check=True
+        )
+    loaded = [name for name in result.stdout.strip().split(',') if name]
+    return parse_importtime(result.stderr), loaded
+
+
+def measure_create_app():
+    """在临时目录中创建应用，返回 {'import_ms', 'create_ms'}"""
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, '-c', CREATE_APP_SCRIPT.format(project_dir=PROJECT_DIR)],
+            cwd=workdir, capture_output=True, text=True, check=True
+        )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检查 import app 和 create_app() 的耗时预算')
+    parser.add_argument('--runs', type=int, default=5, help='每项测量的次数，取中位数')
+    parser.add_argument('--import-budget-ms', type=float, default=400, help='import app 的耗时预算')
+    parser.add_argument('--create-budget-ms', type=float, default=500, help='create_app() 的耗时预算')
+    parser.add_argument('--top', type=int, default=10, help='输出自身耗时最长的模块数')
+    args = parser.parse_args()
+
+    import_times = []
+    modules = {}
+    loaded = []
+    for _ in range(args.runs):
+        modules, loaded = measure_import()
+        import_times.append(modules['app'][1] / 1000)
+    create_times = [measure_create_app()['create_ms'] for _ in range(args.runs)]
+
+    import_ms = statistics.median(import_times)
+    create_ms = statistics.median(create_times)
+
+    print(f"import app:   {import_ms:.1f} ms（预算 {args.import_budget_ms:.0f} ms）")
+    print(f"create_app(): {create_ms:.1f} ms（预算 {args.create_budget_ms:.0f} ms）")
+    print(f"自身耗时最长的 {args.top} 个模块（最后一次测量）:")
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"  {self_us / 1000:8.1f} ms  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if import_ms > args.import_budget_ms:
+        failures.append(f"import app 耗时 {import_ms:.1f} ms 超出预算")
+    if create_ms > args.create_budget_ms:
+        failures.append(f"create_app() 耗时 {create_ms:.1f} ms 超出预算")
+    if loaded:
+        failures.append(f"import app 时加载了应延迟导入的模块: {', '.join(loaded)}")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ 冷启动耗时在预算内")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+元数据表结构 v1 / v2 对比
+
+    python benchmarks/metadata_schema.py
+    python benchmarks/metadata_schema.py --rows 500000 --runs 7
+
+在临时目录中生成 v1 结构（file_metadata，ISO文本时间、重复的路径和类型字符串）的数据库，
+复制一份后用 DatabaseManager 在线迁移到 v2（files），比较：
+- VACUUM 后元数据表及其索引占用的空间（dbstat），以及数据库文件大小；
+- 列表分页、完整列表、过期查询、过期计数和按扩展名汇总的耗时（多次取中位数）。
+  返回文件记录的查询计入转换为元数据字典的时间：v1 为 dict(row)，v2 为 DatabaseManager
+  还原查找表取值、路径和时间的 _to_metadata，与应用中的读取方式相同。
+v2 的数据库文件还包含迁移时建立的全文索引，元数据表本身的大小以 dbstat 的结果为准。
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import statistics
+import tempfile
+from datetime import datetime, timedelta
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from utils.database import DatabaseManager  # noqa: E402
+from utils.metadata_schema import FILE_SELECT, to_epoch_ms  # noqa: E402
+from utils.storage_backend import LocalStorageBackend  # noqa: E402
+
+# 迁移前的 file_metadata 表结构和索引
+V1_SCHEMA = '''
+    CREATE TABLE file_metadata (
+        id TEXT PRIMARY KEY,
+        original_name TEXT NOT NULL,
+        stored_name TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        file_size INTEGER NOT NULL,
+        file_type TEXT,
+        file_extension TEXT,
+        upload_time TIMESTAMP NOT NULL,
+        expire_time TIMESTAMP NOT NULL,
+        relative_path TEXT,
+        is_text_file BOOLEAN DEFAULT 0,
+        content_hash TEXT,
+        storage_codec TEXT,
+        stored_size INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_expire_time ON file_metadata(expire_time);
+    CREATE INDEX idx_upload_time ON file_metadata(upload_time);
+    CREATE INDEX idx_file_extension ON file_metadata(file_extension);
+    CREATE INDEX idx_content_hash ON file_metadata(content_hash);
+    CREATE INDEX idx_relative_path ON file_metadata(relative_path);
+'''
+
+V1_TABLES = ('file_metadata',)
+V2_TABLES = ('files', 'file_types', 'file_extensions', 'blob_dirs')
+
+FILE_KINDS = [
+    ('txt', 'text/plain'), ('pdf', 'application/pdf'), ('png', 'image/png'), ('jpg', 'image/jpeg'),
+    ('py', 'text/x-python'), ('zip', 'application/zip'), ('docx', None), ('bin', None),
+]
+
+
+def generate_v1(path, rows, seed=0):
+    """生成 v1 数据库：约三分之一的文件在文件夹中，约一成已过期"""
+    rng = random.Random(seed)
+    storage = LocalStorageBackend(os.path.join('static', 'uploads'))
+    now = datetime.now()
+    conn = sqlite3.connect(path)
+    conn.executescript(V1_SCHEMA)
+    batch = []
+    for i in range(rows):
+        file_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        extension, mime = rng.choice(FILE_KINDS)
+        name = f"file_{i}.{extension}"
+        relative_path = f"project_{i % 50}/src/{name}" if i % 3 == 0 else name
+        stored_name = f"{file_id}.{extension}"
+        upload_time = now - timedelta(seconds=rng.randrange(24 * 3600))
+        expire_time = upload_time + timedelta(hours=24) - timedelta(hours=rng.random() * 2.6)
+        batch.append((
+            file_id, relative_path, stored_name, storage.uri(stored_name), rng.randrange(1, 10 ** 8), mime,
+            extension, upload_time.isoformat(), expire_time.isoformat(), relative_path,
+            extension == 'txt', hashlib.sha256(file_id.encode()).hexdigest(), None, None
+        ))
+        if len(batch) >= 10000:
+            _insert_v1(conn, batch)
+            batch = []
+    _insert_v1(conn, batch)
+    conn.commit()
+    conn.close()
+
+
+def _insert_v1(conn, batch):
+    conn.executemany('''
+        INSERT INTO file_metadata
+        (id, original_name, stored_name, file_path, file_size, file_type, file_extension, upload_time,
+         expire_time, relative_path, is_text_file, content_hash, storage_codec, stored_size)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', batch)
+
+
+def table_bytes(conn, tables):
+    """表及其索引占用的字节数（需要SQLite启用dbstat），不可用时返回None"""
+    placeholders = ','.join('?' * len(tables))
+    try:
+        return conn.execute(f'''
+            SELECT SUM(s.pgsize) FROM dbstat s JOIN sqlite_master m ON m.name = s.name
+            WHERE m.tbl_name IN ({placeholders})
+        ''', tables).fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def median_ms(conn, sql, params, runs, decode=None):
+    """语句执行、取回全部结果并用decode转换的耗时中位数（先执行一次预热）"""
+    times = []
+    for i in range(runs + 1):
+        start = time.perf_counter()
+        rows = conn.execute(sql, params).fetchall()
+        if decode:
+            decode(conn, rows)
+        if i:
+            times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def legacy_metadata(conn, rows):
+    return [dict(row) for row in rows]
+
+
+def queries(rows):
+    """(名称, v1 语句, v1 参数, v2 语句, v2 参数, 是否返回文件记录)，与 DatabaseManager 中对应的查询相同"""
+    now = datetime.now()
+    offset = rows // 2
+    return [
+        (
+            f'列表分页（50 条，OFFSET {offset}）',
+            'SELECT * FROM file_metadata ORDER BY upload_time DESC LIMIT ? OFFSET ?', (50, offset),
+            f'''SELECT {FILE_SELECT} FROM files f
+                WHERE f.rowid IN (SELECT rowid FROM files ORDER BY upload_time DESC LIMIT ? OFFSET ?)
+                ORDER BY f.upload_time DESC''', (50, offset), True,
+        ),
+        (
+            '完整列表',
+            'SELECT * FROM file_metadata ORDER BY upload_time DESC', (),
+            f'SELECT {FILE_SELECT} FROM files f ORDER BY f.upload_time DESC', (), True,
+        ),
+        (
+            '过期文件查询',
+            'SELECT * FROM file_metadata WHERE expire_time < ? ORDER BY expire_time ASC', (now.isoformat(),),
+            f'SELECT {FILE_SELECT} FROM files f WHERE f.expire_time < ? ORDER BY f.expire_time ASC',
+            (to_epoch_ms(now),), True,
+        ),
+        (
+            '过期文件计数',
+            'SELECT COUNT(*) FROM file_metadata WHERE expire_time < ?', (now.isoformat(),),
+            'SELECT COUNT(*) FROM files WHERE expire_time < ?', (to_epoch_ms(now),), False,
+        ),
+        (
+            '按扩展名汇总（全表扫描）',
+            'SELECT ifnull(file_extension, \'\'), COUNT(*), SUM(file_size) FROM file_metadata '
+            'GROUP BY ifnull(file_extension, \'\')', (),
+            'SELECT ifnull(extension_id, 0), COUNT(*), SUM(file_size) FROM files GROUP BY ifnull(extension_id, 0)', (),
+            False,
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较 v1 / v2 元数据表结构的大小和查询耗时')
+    parser.add_argument('--rows', type=int, default=100000, help='生成的文件记录数')
+    parser.add_argument('--runs', type=int, default=5, help='每个查询的执行次数，取中位数')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='schema_bench_')
+    try:
+        v1_path = os.path.join(workdir, 'v1.db')
+        v2_path = os.path.join(workdir, 'v2.db')
+
+        start = time.perf_counter()
+        generate_v1(v1_path, args.rows)
+        print(f"生成 {args.rows} 条 v1 记录: {time.perf_counter() - start:.1f} s")
+
+        shutil.copyfile(v1_path, v2_path)
+        start = time.perf_counter()
+        manager = DatabaseManager(v2_path, cache_size=0)
+        print(f"在线迁移到 v2（含建立全文索引和统计）: {time.perf_counter() - start:.1f} s")
+
+        v1 = sqlite3.connect(v1_path)
+        v2 = sqlite3.connect(v2_path)
+        for conn in (v1, v2):
+            conn.execute('PRAGMA journal_mode=DELETE')
+            conn.execute('VACUUM')
+            conn.row_factory = sqlite3.Row
+
+        print()
+        print(f"{'项目':<28}{'v1':>14}{'v2':>14}{'v2/v1':>9}")
+        v1_bytes, v2_bytes = table_bytes(v1, V1_TABLES), table_bytes(v2, V2_TABLES)
+        if v1_bytes and v2_bytes:
+            print(f"{'元数据表及索引 (MB)':<28}{v1_bytes / 2 ** 20:>14.2f}{v2_bytes / 2 ** 20:>14.2f}"
+                  f"{v2_bytes / v1_bytes:>9.2f}")
+            print(f"{'每条记录 (B)':<28}{v1_bytes / args.rows:>14.0f}{v2_bytes / args.rows:>14.0f}")
+        else:
+            print("（SQLite未启用dbstat，只比较数据库文件大小）")
+        v1_file, v2_file = os.path.getsize(v1_path), os.path.getsize(v2_path)
+        print(f"{'数据库文件 (MB)':<28}{v1_file / 2 ** 20:>14.2f}{v2_file / 2 ** 20:>14.2f}{v2_file / v1_file:>9.2f}")
+
+        for name, v1_sql, v1_params, v2_sql, v2_params, returns_files in queries(args.rows):
+            v1_ms = median_ms(v1, v1_sql, v1_params, args.runs, legacy_metadata if returns_files else None)
+            v2_ms = median_ms(v2, v2_sql, v2_params, args.runs, manager._to_metadata if returns_files else None)
+            print(f"{name + ' (ms)':<28}{v1_ms:>14.2f}{v2_ms:>14.2f}{v2_ms / v1_ms:>9.2f}")
+        v1.close()
+        v2.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,82 @@ class Config:
     UPLOAD_FOLDER = os.path.join('static', 'uploads')
     MAX_CONTENT_LENGTH = None  # 无文件大小限制
     
+    # 上传目录分片：文件存放在 <哈希前缀>/<哈希前缀>/<uuid>.<ext> 子目录中
+    UPLOAD_SHARD_DEPTH = 2  # 分片目录层级，0表示平铺存放
+    UPLOAD_SHARD_WIDTH = 2  # 每级目录名长度（十六进制字符数）
+    SHARD_MIGRATION_BATCH_SIZE = 500  # 后台迁移旧文件时每批更新的记录数
+    
+    # 文件数据的存储后端：local（上传目录）或 s3（S3兼容的对象存储，需要安装boto3）
+    # 使用s3时数据库和ZIP缓存仍在本地；存储对账和分片迁移只用于local
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    S3_BUCKET = os.environ.get('S3_BUCKET', '')
+    S3_PREFIX = os.environ.get('S3_PREFIX', '')  # 对象键前缀，如 fileshare/
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # MinIO等自建服务的地址，AWS S3留空
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ACCESS_KEY = os.environ.get('S3_ACCESS_KEY')  # 留空时使用boto3默认的凭证来源
+    S3_SECRET_KEY = os.environ.get('S3_SECRET_KEY')
+    S3_MAX_POOL_CONNECTIONS = 32  # 每个进程的连接池大小
+    S3_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024  # 分片大小（至少5MB），不超过一个分片的文件用单个请求上传
+    S3_MAX_CONCURRENCY = 4  # 每个文件并行上传的分片数，每个上传最多缓存 该值+1 个分片
+    
+    # 旧版 metadata.json 迁移到SQLite（流式解析、分批提交，中断后从上次提交处继续）
+    # startup：create_app() 中完成迁移后才接受请求；background：由后台任务迁移，期间服务正常可用
+    JSON_MIGRATION_MODE = 'startup'
+    JSON_MIGRATION_BATCH_SIZE = 5000  # 每个事务写入的记录数
+    
+    # 旧版元数据表（file_metadata）启动时在线迁移到 v2 结构（files），旧版本进程可以继续读写
+    SCHEMA_MIGRATION_BATCH_SIZE = 5000  # 每个事务复制的记录数
+    
+    # 元数据缓存（进程内LRU，多worker之间通过共享代数计数器失效）
+    METADATA_CACHE_SIZE = 10000  # 最多缓存的条目数，0表示关闭
+    METADATA_CACHE_TTL = 300  # 缓存有效期（秒）
+    
+    # SQL执行统计：每条语句的执行次数、耗时和行数（GET /api/db/stats，每个worker进程单独统计）
+    DB_QUERY_STATS_ENABLED = True
+    DB_SLOW_QUERY_MS = 100  # 超过该耗时的语句连同查询计划写入慢查询日志
+    DB_SLOW_QUERY_LOG_SIZE = 100  # 保留最近的慢查询条数
+    # 语句第一次执行前检查查询计划，全表扫描时抛出异常；测试模式（TESTING）下自动开启
+    DB_ASSERT_NO_FULL_SCAN = False
+    
+    # 文件列表JSON响应：按元数据代数缓存，支持gzip/brotli（需安装brotli）和ETag/304
+    JSON_RESPONSE_COMPRESS_LEVEL = 6  # gzip压缩级别
+    JSON_RESPONSE_BROTLI_QUALITY = 5  # brotli压缩质量
+    JSON_RESPONSE_MIN_COMPRESS_SIZE = 1024  # 小于该大小的响应不压缩
+    
+    # 上传清单（上传前按SHA-256跳过服务器已有的文件）每次请求的最大条目数
+    UPLOAD_MANIFEST_MAX_ENTRIES = 1000
+    
+    # 增量上传：已有文件的分块大小范围（默认按文件大小的平方根选择）
+    DELTA_MIN_BLOCK_SIZE = 4 * 1024
+    DELTA_MAX_BLOCK_SIZE = 1024 * 1024
+    
+    # 服务端解压：防压缩炸弹限制、每批提交的文件数
+    ARCHIVE_EXTRACT_MAX_MEMBERS = 10000
+    ARCHIVE_EXTRACT_MAX_TOTAL_SIZE = 10 * 1024 * 1024 * 1024  # 10GB
+    ARCHIVE_EXTRACT_MAX_RATIO = 200  # 解压后大小/压缩包大小
+    ARCHIVE_EXTRACT_BATCH_SIZE = 500
+    
+    # 后台任务队列（ZIP打包、大批量删除、解压、清理、对账），多个worker共享
+    JOB_QUEUE_DB = os.path.join('cache', 'jobs.db')
+    JOB_RESULT_FOLDER = os.path.join('cache', 'jobs')  # 任务结果文件（打包好的ZIP）
+    JOB_WORKERS = 2  # 每个进程的工作线程数
+    JOB_POLL_INTERVAL = 1.0  # 轮询其他进程提交的任务的间隔（秒）
+    JOB_RETENTION_HOURS = 24  # 已结束任务及其结果文件的保留时间
+    JOB_STALE_SECONDS = 120  # 心跳超时后，执行进程已退出的任务重新排队
+    JOB_INLINE_DELETE_LIMIT = 200  # 批量删除超过该数量时作为后台任务执行
+    JOB_DELETE_BATCH_SIZE = 500
+    
+    # 流式上传：直接把multipart分片写入最终位置，避免临时文件二次写盘
+    STREAMING_UPLOAD = True
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # 每次从请求体读取1MB
+    
+    # 存储压缩：可预览的文本类文件及抽样压缩率高的文件写入时以gzip存储，
+    # 下载时向支持gzip的客户端直接发送（Content-Encoding: gzip），其他客户端边读边解压。
+    # 默认关闭：不接受gzip的客户端断点续传时需要从头解压，大文本文件的续传开销较大
+    STORAGE_COMPRESSION = False
+    STORAGE_COMPRESSION_LEVEL = 6  # gzip压缩级别
+    STORAGE_COMPRESSION_MIN_SIZE = 4096  # 小于该大小的文件不压缩
+    
     # 文件过期时间（小时）
     FILE_EXPIRE_HOURS = 24
     
@@ -49,13 +125,87 @@ class Config:
         'png', 'jpg', 'jpeg', 'gif', 'bmp', 'svg', 'webp'
     }
     
+    # 文件搜索：文件名和路径实时索引，可预览文件的内容由后台索引器异步索引
+    SEARCH_CONTENT_INDEXING = True
+    SEARCH_CONTENT_MAX_FILE_SIZE = 10 * 1024 * 1024  # 超过10MB的文件不索引内容
+    SEARCH_CONTENT_MAX_BYTES = 1024 * 1024  # 每个文件最多索引前1MB
+    SEARCH_INDEX_BATCH_SIZE = 50
+    SEARCH_INDEX_INTERVAL_SECONDS = 30  # 空闲时轮询待索引文件的间隔
+    SEARCH_MAX_PER_PAGE = 100
+    
+    # ZIP打包配置
+    ZIP_COMPRESS_LEVEL = 6  # deflate压缩级别，0表示全部使用STORE
+    ZIP_MAX_WORKERS = None  # 并行压缩的进程数，None表示使用CPU核心数
+    
+    # 文件夹ZIP缓存（设为None关闭缓存）
+    ARCHIVE_CACHE_FOLDER = os.path.join('cache', 'archives')
+    ARCHIVE_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2GB
+    
+    # 请求频率限制（按客户端IP，令牌桶状态在多个worker之间共享）
+    RATE_LIMIT_ENABLED = True
+    # 应用前的反向代理层数（如Nginx为1）：大于0时客户端IP取自代理写入的 X-Forwarded-For，
+    # 0表示直接对外服务，只使用连接的对端地址，客户端伪造的转发请求头不影响限流
+    TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', '0'))
+    RATE_LIMIT_DB = os.path.join('cache', 'ratelimit.db')
+    # {端点名: (每秒请求数, 突发容量)}，default作用于未单独配置的端点
+    RATE_LIMITS = {
+        'default': (20, 60),
+        'list_files': (5, 20),
+        'get_folder_files': (5, 20),
+        'upload_file': (5, 20),
+        'upload_manifest': (5, 20),
+        'delete_folder': (20, 100),  # 前端“清空全部”逐个删除文件夹（根目录文件一次批量删除）
+        'batch_download_files': (1, 5),
+        'prepare_batch_download': (1, 5),
+        'download_folder': (2, 10),
+        'search_files': (5, 20),
+        'reconcile_storage': (0.1, 2),
+        'file_signature': (1, 5),
+        'upload_delta': (5, 20),
+        'extract_archive': (1, 5),
+    }
+    # 每个客户端的带宽上限（字节/秒），0表示不限制
+    DOWNLOAD_BANDWIDTH_PER_CLIENT = 0
+    UPLOAD_BANDWIDTH_PER_CLIENT = 0
+    
+    # 请求各阶段耗时（db、fs、compress、serialize）始终写入请求日志，
+    # 开启时同时通过 Server-Timing 响应头返回（浏览器开发者工具的Timing面板可直接查看）
+    SERVER_TIMING_ENABLED = True
+    
+    # ASGI模式（uvicorn/hypercorn asgi:application）
+    ASGI_CHUNK_SIZE = 64 * 1024  # 每次收发的数据块大小，每个慢速连接约占用2~3个数据块的内存
+    ASGI_THREADS = 32  # 执行Flask视图和文件读写的线程数
+    
     # 服务器配置
     HOST = '0.0.0.0'  # 允许局域网访问
     PORT = 5000
     DEBUG = True
     
+    # 生产模式（python start.py --production）
+    PRODUCTION_SERVER = 'auto'  # auto / gunicorn / waitress，auto优先使用gunicorn，Windows上使用waitress
+    PRODUCTION_WORKERS = None  # worker进程数，None表示按CPU核数和内存上限计算
+    PRODUCTION_THREADS = None  # 每个worker的线程数，None表示自动计算
+    PRODUCTION_WORKER_MEMORY_MB = 128  # 估算的单个worker内存占用，用于按内存上限限制worker数
+    PRODUCTION_TIMEOUT = 300  # 请求超时（秒），大文件传输需要较长时间
+    PRODUCTION_KEEPALIVE = 2
+    PRODUCTION_MAX_REQUESTS = 1000  # worker处理该数量的请求后重启，0表示不重启
+    # 后台任务（清理调度器、分片迁移、内容索引）不在 create_app() 中启动，由服务器启动后调用
+    # start_background_tasks()（gunicorn post_fork、ASGI lifespan、start.py），或在第一个请求时启动
+    DEFER_BACKGROUND_TASKS = True
+    
     # 清理任务配置
     CLEANUP_INTERVAL_MINUTES = 60  # 每60分钟执行一次清理
+    STATS_RECONCILE_INTERVAL_MINUTES = 360  # 存储统计计数器校对间隔，None表示不校对
+    
+    # 存储对账：上传目录中没有元数据的孤儿文件、找不到文件的悬空记录、泄漏的临时ZIP
+    STORAGE_RECONCILE_INTERVAL_MINUTES = 1440  # 对账间隔，None表示不定时对账
+    STORAGE_RECONCILE_ORPHAN_ACTION = 'quarantine'  # quarantine 移入 uploads/.quarantine，delete 直接删除
+    STORAGE_RECONCILE_GRACE_SECONDS = 3600  # 修改时间在该时间内的文件可能仍在上传，不视为孤儿
+    STORAGE_QUARANTINE_RETENTION_DAYS = 7  # 隔离目录保留天数
+    STORAGE_RECONCILE_TEMP_MAX_AGE_SECONDS = 6 * 3600  # 临时ZIP超过该时间未修改才删除
+    STORAGE_RECONCILE_SCAN_WORKERS = 8  # 并行扫描目录的线程数
+    STORAGE_RECONCILE_SCAN_RATE = 0  # 每秒扫描的目录项数，0表示不限制
+    STORAGE_RECONCILE_ACTION_RATE = 200  # 每秒移动/删除的文件和记录数，0表示不限制
     
     @staticmethod
     def init_app(app):
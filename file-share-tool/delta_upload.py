@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+增量上传客户端
+
+    python delta_upload.py http://192.168.1.10:5000 <已有文件ID> 新文件路径 [--name 文件名]
+
+从服务器取得已有文件（通常是同一文件的上一个版本）的块签名，在本地比对新文件，
+只上传变化的数据和重建方案，由服务器以已有文件为基础重建出新文件，输出新文件的ID。
+只使用标准库。
+"""
+import os
+import sys
+import json
+import uuid
+import argparse
+import tempfile
+import urllib.request
+import urllib.error
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.delta import generate_delta
+
+# 上传时每次读取的数据块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def fetch_signature(server, file_id):
+    """获取已有文件的块签名"""
+    with urllib.request.urlopen(f"{server}/api/signature/{file_id}") as response:
+        return json.load(response)
+
+
+def multipart_body(fields, file_field, file_obj, file_size, boundary):
+    """生成multipart请求体的各部分，文件部分分块读取；返回 (生成器, 总长度)"""
+    head = b''
+    for name, value in fields.items():
+        head += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        ).encode('utf-8')
+    head += (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="delta.bin"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode('utf-8')
+    tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+    def generate():
+        yield head
+        file_obj.seek(0)
+        while True:
+            chunk = file_obj.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        yield tail
+
+    return generate(), len(head) + file_size + len(tail)
+
+
+def upload_delta(server, file_id, path, name=None, relative_path=None):
+    """增量上传 path，返回服务器的响应"""
+    signature = fetch_signature(server, file_id)
+    if not signature.get('success'):
+        raise RuntimeError(signature.get('message') or '获取文件签名失败')
+
+    with tempfile.TemporaryFile() as literal, open(path, 'rb') as src:
+        ops, file_size, sha256 = generate_delta(
+            src, signature['blocks'], signature['block_size'], signature['file_size'], literal
+        )
+        literal_size = literal.tell()
+        print(f"文件大小 {file_size} 字节，需上传 {literal_size} 字节新增数据（{len(ops)} 个操作）")
+
+        recipe = {
+            'block_size': signature['block_size'],
+            'ops': ops,
+            'file_size': file_size,
+            'sha256': sha256,
+            'name': name or os.path.basename(path)
+        }
+        fields = {'recipe': json.dumps(recipe, separators=(',', ':'))}
+        if relative_path:
+            fields['path'] = relative_path
+
+        boundary = uuid.uuid4().hex
+        body, length = multipart_body(fields, 'data', literal, literal_size, boundary)
+        request = urllib.request.Request(
+            f"{server}/api/delta/{file_id}",
+            data=body,
+            method='POST',
+            headers={
+                'Content-Type': f'multipart/form-data; boundary={boundary}',
+                'Content-Length': str(length)
+            }
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            return json.load(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='增量上传修改过的文件')
+    parser.add_argument('server', help='服务器地址，如 http://192.168.1.10:5000')
+    parser.add_argument('file_id', help='服务器上已有文件（旧版本）的ID')
+    parser.add_argument('path', help='要上传的新文件')
+    parser.add_argument('--name', help='新文件名，默认为本地文件名')
+    parser.add_argument('--relative-path', help='新文件的相对路径（放入文件夹时使用）')
+    args = parser.parse_args()
+
+    result = upload_delta(args.server.rstrip('/'), args.file_id, args.path, args.name, args.relative_path)
+    if not result.get('success'):
+        print(f"❌ {result.get('message')}")
+        sys.exit(1)
+    uploaded = result['uploaded_files'][0]
+    print(f"✅ {result['message']}: {uploaded['name']}（ID: {uploaded['id']}）")
+
+
+if __name__ == '__main__':
+    main()
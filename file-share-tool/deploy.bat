@@ -83,7 +83,7 @@ echo ✅ 部署完成！
 echo.
 echo 🎯 启动命令：
 echo    开发模式: python start.py
-echo    生产模式: waitress-serve --host=0.0.0.0 --port=5000 app:app
+echo    生产模式: python start.py --production
 echo.
 
 REM 获取本机IP
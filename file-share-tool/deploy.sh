@@ -70,7 +70,7 @@ echo "✅ 部署完成！"
 echo ""
 echo "🎯 启动命令："
 echo "   开发模式: python start.py"
-echo "   生产模式: gunicorn -w 4 -b 0.0.0.0:5000 app:app"
+echo "   生产模式: python start.py --production"
 echo ""
 echo "🌐 访问地址："
 echo "   本地: http://localhost:5000"
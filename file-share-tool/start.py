@@ -5,7 +5,10 @@
 
 import os
 import sys
+import json
+import math
 import socket
+import argparse
 import qrcode
 from io import BytesIO
 import base64
@@ -71,8 +74,227 @@ def open_browser(url, delay=2):
     except Exception:
         pass
 
+def read_cgroup_file(path):
+    """读取cgroup文件内容，不存在时返回None"""
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def detect_cpu_limit():
+    """可用CPU核数，考虑CPU亲和性和cgroup配额（容器的 --cpus 限制）"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    # cgroup v2: "<配额> <周期>" 或 "max <周期>"
+    cpu_max = read_cgroup_file('/sys/fs/cgroup/cpu.max')
+    if cpu_max:
+        limit, _, period = cpu_max.partition(' ')
+        if limit != 'max' and period:
+            quota = int(limit) / int(period)
+    else:
+        # cgroup v1: 配额为-1表示不限制
+        limit = read_cgroup_file('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+        period = read_cgroup_file('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+        if limit and period and int(limit) > 0:
+            quota = int(limit) / int(period)
+
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+def detect_memory_limit():
+    """可用内存上限（字节），取物理内存和cgroup内存限制中较小的值，无法获取时返回None"""
+    limits = []
+    try:
+        limits.append(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES'))
+    except (AttributeError, ValueError, OSError):
+        try:
+            import psutil
+            limits.append(psutil.virtual_memory().total)
+        except ImportError:
+            pass
+
+    # cgroup v2为"max"表示不限制；v1不限制时是一个接近2^63的数，由min()自然忽略
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        value = read_cgroup_file(path)
+        if value and value.isdigit():
+            limits.append(int(value))
+            break
+
+    return min(limits) if limits else None
+
+def plan_workers(cpus, memory_limit, worker_memory_mb, workers=None, threads=None):
+    """根据CPU核数和内存上限计算worker进程数和每个worker的线程数
+
+    worker数按 2*CPU+1 计算，再按内存上限（预留20%）除以单个worker的内存占用封顶。
+    文件传输以等待网络和磁盘IO为主，每个worker再用多个线程提供并发，
+    worker数被内存压低时用更多线程补足。
+    """
+    by_cpu = 2 * cpus + 1
+    by_memory = by_cpu
+    if memory_limit:
+        by_memory = max(1, int(memory_limit * 0.8) // (worker_memory_mb * 1024 * 1024))
+
+    if not workers:
+        workers = max(1, min(by_cpu, by_memory))
+    if not threads:
+        threads = min(32, max(4, math.ceil(8 * cpus / workers)))
+
+    return {
+        'cpus': cpus,
+        'memory_limit_mb': memory_limit // (1024 * 1024) if memory_limit else None,
+        'workers_by_cpu': by_cpu,
+        'workers_by_memory': by_memory,
+        'workers': workers,
+        'threads': threads
+    }
+
+def choose_server(preferred):
+    """选择WSGI服务器：gunicorn（仅类Unix系统）或waitress，都不可用时返回None"""
+    candidates = ['gunicorn', 'waitress'] if preferred == 'auto' else [preferred]
+    for name in candidates:
+        if name == 'gunicorn' and os.name == 'nt':
+            continue
+        try:
+            __import__(name)
+            return name
+        except ImportError:
+            continue
+    return None
+
+def build_production_config(args):
+    """汇总生产模式的启动配置"""
+    from config import Config
+
+    plan = plan_workers(
+        detect_cpu_limit(),
+        detect_memory_limit(),
+        Config.PRODUCTION_WORKER_MEMORY_MB,
+        workers=args.workers or Config.PRODUCTION_WORKERS,
+        threads=args.threads or Config.PRODUCTION_THREADS
+    )
+    server = choose_server(args.server or Config.PRODUCTION_SERVER)
+    plan.update({
+        'server': server,
+        'host': args.host or Config.HOST,
+        'port': args.port or Config.PORT,
+        'timeout': Config.PRODUCTION_TIMEOUT,
+        'keepalive': Config.PRODUCTION_KEEPALIVE,
+        'max_requests': Config.PRODUCTION_MAX_REQUESTS,
+        # gunicorn预加载应用，worker共享只读内存页；waitress是单进程多线程
+        'preload': server == 'gunicorn'
+    })
+    if server == 'waitress':
+        # waitress只有一个进程，用线程数承担全部并发
+        plan['threads'] = plan['workers'] * plan['threads']
+        plan['workers'] = 1
+    return plan
+
+def print_production_config(plan):
+    """输出生产模式的启动配置"""
+    memory = f"{plan['memory_limit_mb']} MB" if plan['memory_limit_mb'] else '未知'
+    print("🚀 局域网文件分享工具（生产模式）")
+    print(f"   服务器: {plan['server']}")
+    print(f"   监听地址: {plan['host']}:{plan['port']}")
+    print(f"   CPU: {plan['cpus']} 核，内存上限: {memory}")
+    print(f"   worker进程: {plan['workers']}（按CPU {plan['workers_by_cpu']}，按内存 {plan['workers_by_memory']}）")
+    print(f"   每个worker线程数: {plan['threads']}")
+    print(f"   请求超时: {plan['timeout']} 秒，预加载应用: {'是' if plan['preload'] else '否'}")
+
+def post_fork(server, worker):
+    """gunicorn钩子：worker进程fork后重新初始化日志、数据库锁并启动后台任务"""
+    import app as app_module
+    app_module.reinit_after_fork()
+
+def run_gunicorn(plan):
+    """以gunicorn gthread worker运行应用，master中预加载后fork出worker"""
+    from gunicorn.app.base import BaseApplication
+
+    options = {
+        'bind': f"{plan['host']}:{plan['port']}",
+        'workers': plan['workers'],
+        'worker_class': 'gthread',
+        'threads': plan['threads'],
+        'timeout': plan['timeout'],
+        'keepalive': plan['keepalive'],
+        'max_requests': plan['max_requests'],
+        'max_requests_jitter': plan['max_requests'] // 10,
+        'preload_app': plan['preload'],
+        'post_fork': post_fork,
+    }
+
+    class FileShareServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import app
+            app.config['DEBUG'] = False
+            return app
+
+    FileShareServer().run()
+
+def run_waitress(plan):
+    """以waitress运行应用（单进程多线程，Windows可用）"""
+    from waitress import serve
+    from app import app, start_background_tasks
+
+    app.config['DEBUG'] = False
+    start_background_tasks()
+    serve(
+        app,
+        host=plan['host'],
+        port=plan['port'],
+        threads=plan['threads'],
+        channel_timeout=plan['timeout']
+    )
+
+def run_production(args):
+    """生产模式：选择WSGI服务器并按CPU和内存自动确定worker与线程数"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    plan = build_production_config(args)
+
+    if args.print_config:
+        print(json.dumps(plan, ensure_ascii=False, indent=2))
+        return
+
+    if plan['server'] is None:
+        print("❌ 未找到可用的WSGI服务器，请安装 gunicorn 或 waitress")
+        sys.exit(1)
+
+    print_production_config(plan)
+    if plan['server'] == 'gunicorn':
+        run_gunicorn(plan)
+    else:
+        run_waitress(plan)
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='局域网文件分享工具')
+    parser.add_argument('--production', action='store_true',
+                        help='生产模式：使用gunicorn/waitress运行，按CPU和内存自动确定worker数')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'waitress'],
+                        help='生产模式使用的WSGI服务器（默认见 Config.PRODUCTION_SERVER）')
+    parser.add_argument('--host', help='监听地址')
+    parser.add_argument('--port', type=int, help='监听端口')
+    parser.add_argument('--workers', type=int, help='worker进程数，默认自动计算')
+    parser.add_argument('--threads', type=int, help='每个worker的线程数，默认自动计算')
+    parser.add_argument('--print-config', action='store_true',
+                        help='只输出生产模式的启动配置（JSON），不启动服务')
+    return parser.parse_args()
+
 def main():
     """主函数"""
+    args = parse_args()
+    if args.production or args.print_config:
+        run_production(args)
+        return
     
     # 检查依赖
     if not check_dependencies():
@@ -119,10 +341,11 @@ def main():
         # 添加当前目录到Python路径
         sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-        from app import app
+        from app import app, start_background_tasks
 
         # 更新配置
         app.config['PORT'] = port
+        start_background_tasks()
 
         # 启动Flask应用
         app.run(
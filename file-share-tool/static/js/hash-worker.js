@@ -0,0 +1,132 @@
+// 计算文件SHA-256的Web Worker
+// crypto.subtle.digest 只能一次性处理整个文件，这里分块读取、增量计算，大文件不会整体读入内存
+
+const HASH_CHUNK_SIZE = 4 * 1024 * 1024; // 每次读取4MB
+
+// 按有符号32位整数保存，计算全部在int32范围内进行，避免引擎转为浮点数
+const K = new Int32Array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+]);
+
+class Sha256 {
+    constructor() {
+        this.state = new Int32Array([
+            0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+        ]);
+        this.buffer = new Uint8Array(64);
+        this.bufferLength = 0;
+        this.length = 0;
+        this.w = new Int32Array(64);
+    }
+
+    update(data) {
+        let offset = 0;
+        this.length += data.length;
+
+        // 先补满上次剩下的不完整块
+        if (this.bufferLength > 0) {
+            const n = Math.min(64 - this.bufferLength, data.length);
+            this.buffer.set(data.subarray(0, n), this.bufferLength);
+            this.bufferLength += n;
+            offset = n;
+            if (this.bufferLength < 64) return;
+            this.compress(this.buffer, 0);
+            this.bufferLength = 0;
+        }
+
+        for (; offset + 64 <= data.length; offset += 64) {
+            this.compress(data, offset);
+        }
+
+        if (offset < data.length) {
+            this.buffer.set(data.subarray(offset));
+            this.bufferLength = data.length - offset;
+        }
+    }
+
+    compress(data, offset) {
+        const w = this.w;
+        for (let t = 0; t < 16; t++) {
+            const i = offset + t * 4;
+            w[t] = (data[i] << 24) | (data[i + 1] << 16) | (data[i + 2] << 8) | data[i + 3];
+        }
+        for (let t = 16; t < 64; t++) {
+            const x = w[t - 15];
+            const y = w[t - 2];
+            const s0 = ((x >>> 7) | (x << 25)) ^ ((x >>> 18) | (x << 14)) ^ (x >>> 3);
+            const s1 = ((y >>> 17) | (y << 15)) ^ ((y >>> 19) | (y << 13)) ^ (y >>> 10);
+            w[t] = (w[t - 16] + s0 + w[t - 7] + s1) | 0;
+        }
+
+        const s = this.state;
+        let a = s[0], b = s[1], c = s[2], d = s[3], e = s[4], f = s[5], g = s[6], h = s[7];
+        for (let t = 0; t < 64; t++) {
+            const S1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+            const ch = (e & f) ^ (~e & g);
+            const t1 = (h + S1 + ch + K[t] + w[t]) | 0;
+            const S0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+            const maj = (a & b) ^ (a & c) ^ (b & c);
+            const t2 = (S0 + maj) | 0;
+            h = g;
+            g = f;
+            f = e;
+            e = (d + t1) | 0;
+            d = c;
+            c = b;
+            b = a;
+            a = (t1 + t2) | 0;
+        }
+        s[0] = (s[0] + a) | 0;
+        s[1] = (s[1] + b) | 0;
+        s[2] = (s[2] + c) | 0;
+        s[3] = (s[3] + d) | 0;
+        s[4] = (s[4] + e) | 0;
+        s[5] = (s[5] + f) | 0;
+        s[6] = (s[6] + g) | 0;
+        s[7] = (s[7] + h) | 0;
+    }
+
+    hexdigest() {
+        // 补位：0x80，若干个0，最后8字节为以位计的长度（大端）
+        const length = this.length;
+        const padLength = (this.bufferLength < 56 ? 56 : 120) - this.bufferLength;
+        const padding = new Uint8Array(padLength + 8);
+        padding[0] = 0x80;
+        const view = new DataView(padding.buffer);
+        view.setUint32(padLength, Math.floor(length / 0x20000000));
+        view.setUint32(padLength + 4, (length * 8) >>> 0);
+        this.update(padding);
+
+        let hex = '';
+        for (const word of this.state) {
+            hex += (word >>> 0).toString(16).padStart(8, '0');
+        }
+        return hex;
+    }
+}
+
+async function hashFile(file) {
+    const hash = new Sha256();
+    for (let start = 0; start < file.size; start += HASH_CHUNK_SIZE) {
+        const chunk = await file.slice(start, start + HASH_CHUNK_SIZE).arrayBuffer();
+        hash.update(new Uint8Array(chunk));
+    }
+    return hash.hexdigest();
+}
+
+// 消息：{ index, file }，回复：{ index, hash }，出错时 hash 为null
+self.onmessage = async (e) => {
+    const { index, file } = e.data;
+    try {
+        self.postMessage({ index, hash: await hashFile(file) });
+    } catch (error) {
+        self.postMessage({ index, hash: null, error: error.message });
+    }
+};
@@ -2,11 +2,22 @@
 let isUploading = false;
 let selectedFiles = new Set(); // 存储选中的文件ID
 let batchMode = false; // 批量操作模式
+let searchQuery = ''; // 当前搜索关键词
+let searchTimer = null;
+
+// 上传前计算SHA-256的Web Worker
+const HASH_WORKER_URL = '/static/js/hash-worker.js';
+const HASH_WORKER_COUNT = Math.min(navigator.hardwareConcurrency || 2, 4);
+// 每次提交的上传清单条目数（与服务器 UPLOAD_MANIFEST_MAX_ENTRIES 一致）
+const MANIFEST_BATCH_SIZE = 1000;
+// 查询后台任务进度的间隔（毫秒）
+const JOB_POLL_INTERVAL = 1000;
 
 // 初始化应用
 function initializeApp() {
     setupFileUpload();
     setupTextEditor();
+    setupSearch();
     refreshFileList();
     
     // 定期刷新文件列表
@@ -194,6 +205,96 @@ function handleFolderSelect(e) {
     }
 }
 
+// 上传时使用的相对路径：从文件夹选择的文件有webkitRelativePath属性
+function getUploadPath(file) {
+    return file.webkitRelativePath || file.name;
+}
+
+// 在Web Worker中计算文件的SHA-256，返回与files顺序一致的哈希列表（失败的为null）
+function hashFiles(files, onProgress) {
+    return new Promise((resolve) => {
+        const hashes = new Array(files.length).fill(null);
+        if (!window.Worker || files.length === 0) {
+            resolve(hashes);
+            return;
+        }
+
+        const workerCount = Math.min(HASH_WORKER_COUNT, files.length);
+        let next = 0;
+        let done = 0;
+        let active = workerCount;
+
+        for (let i = 0; i < workerCount; i++) {
+            const worker = new Worker(HASH_WORKER_URL);
+            const dispatch = () => {
+                if (next < files.length) {
+                    const index = next++;
+                    worker.postMessage({ index, file: files[index] });
+                } else {
+                    worker.terminate();
+                    if (--active === 0) resolve(hashes);
+                }
+            };
+            worker.onmessage = (e) => {
+                hashes[e.data.index] = e.data.hash;
+                onProgress(++done, files.length);
+                dispatch();
+            };
+            worker.onerror = () => {
+                // Worker无法运行时全部按普通方式上传
+                worker.terminate();
+                next = files.length;
+                if (--active === 0) resolve(hashes);
+            };
+            dispatch();
+        }
+    });
+}
+
+// 上传清单：服务器已有相同内容的文件直接创建记录，返回仍需上传的文件和跳过的数量
+async function skipExistingFiles(files) {
+    try {
+        const hashes = await hashFiles(files, (done, total) => {
+            updateUploadProgress((done / total) * 10, `正在校验文件 ${done}/${total}...`);
+        });
+
+        const remaining = [];
+        let skipped = 0;
+        for (let start = 0; start < files.length; start += MANIFEST_BATCH_SIZE) {
+            const batch = files.slice(start, start + MANIFEST_BATCH_SIZE);
+            const entries = [];
+            const indexes = [];
+            batch.forEach((file, i) => {
+                if (hashes[start + i]) {
+                    entries.push({ path: getUploadPath(file), size: file.size, hash: hashes[start + i] });
+                    indexes.push(i);
+                } else {
+                    remaining.push(file);
+                }
+            });
+            if (entries.length === 0) continue;
+
+            const response = await fetch('/api/upload/manifest', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ files: entries }),
+            });
+            const result = await response.json();
+            if (!result.success) throw new Error(result.message);
+
+            for (const index of result.missing) {
+                remaining.push(batch[indexes[index]]);
+            }
+            skipped += entries.length - result.missing.length;
+        }
+        return { remaining, skipped };
+    } catch (error) {
+        // 清单检查失败不影响上传，全部文件按普通方式上传
+        console.error('上传清单检查失败:', error);
+        return { remaining: files, skipped: 0 };
+    }
+}
+
 // 上传文件
 async function uploadFiles(files) {
     if (isUploading) {
@@ -205,6 +306,19 @@ async function uploadFiles(files) {
     showUploadProgress(true);
 
     try {
+        // 服务器上已有相同内容的文件不再上传
+        const { remaining, skipped } = await skipExistingFiles(Array.from(files));
+        const skippedMessage = skipped > 0 ? `，${skipped} 个文件已存在，无需上传` : '';
+        if (remaining.length === 0) {
+            updateUploadProgress(100, '上传完成！');
+            showToast(`${files.length} 个文件已存在，无需上传`, 'success');
+            refreshFileList();
+            document.getElementById('file-input').value = '';
+            document.getElementById('folder-input').value = '';
+            return;
+        }
+        files = remaining;
+
         const formData = new FormData();
         let totalSize = 0;
 
@@ -212,12 +326,7 @@ async function uploadFiles(files) {
         for (let file of files) {
             formData.append('files', file);
             totalSize += file.size;
-            // 如果文件有webkitRelativePath属性，说明是从文件夹选择的
-            if (file.webkitRelativePath) {
-                formData.append('paths', file.webkitRelativePath);
-            } else {
-                formData.append('paths', file.name);
-            }
+            formData.append('paths', getUploadPath(file));
         }
 
         updateUploadProgress(10, `准备上传 ${files.length} 个文件 (${formatFileSize(totalSize)})...`);
@@ -260,7 +369,7 @@ async function uploadFiles(files) {
 
         if (result.success) {
             updateUploadProgress(100, '上传完成！');
-            showToast(result.message, 'success');
+            showToast(result.message + skippedMessage, 'success');
             refreshFileList();
 
             // 清空文件选择
@@ -389,8 +498,47 @@ function clearEditor() {
     }
 }
 
+// 设置文件搜索
+function setupSearch() {
+    const searchInput = document.getElementById('search-input');
+    if (!searchInput) return;
+
+    searchInput.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            searchQuery = searchInput.value.trim();
+            refreshFileList();
+        }, 300);
+    });
+}
+
+// 搜索文件
+async function searchFiles(query) {
+    try {
+        const response = await fetch(`/api/search?q=${encodeURIComponent(query)}&per_page=100`);
+        const result = await response.json();
+
+        // 等待响应期间搜索词已变化，丢弃过时的结果
+        if (query !== searchQuery) return;
+
+        if (result.success) {
+            displayFolderList([]);
+            displayFileList(result.files);
+            document.getElementById('storage-info').textContent = `找到 ${result.total} 个结果`;
+        } else {
+            showToast('搜索失败: ' + result.message, 'error');
+        }
+    } catch (error) {
+        showToast('搜索失败: ' + error.message, 'error');
+    }
+}
+
 // 刷新文件列表
 async function refreshFileList() {
+    if (searchQuery) {
+        return searchFiles(searchQuery);
+    }
+
     try {
         const filesResponse = await fetch('/api/files');
         const filesResult = await filesResponse.json();
@@ -451,7 +599,7 @@ function displayFileList(files) {
     const fileList = document.getElementById('file-list');
 
     if (files.length === 0) {
-        fileList.innerHTML = '<div class="empty-message">暂无文件</div>';
+        fileList.innerHTML = `<div class="empty-message">${searchQuery ? '没有匹配的文件' : '暂无文件'}</div>`;
         updateBatchControls();
         return;
     }
@@ -504,10 +652,12 @@ function displayFileList(files) {
                             <span>上传: ${uploadTime}</span>
                             <span>过期: ${expireTime}</span>
                         </div>
+                        ${file.snippet ? `<div class="file-snippet">${escapeHtml(file.snippet)}</div>` : ''}
                     </div>
                     <div class="file-actions">
                         ${file.is_text ? `<button class="btn btn-secondary" onclick="previewFile('${file.id}')">👁️ 预览</button>` : ''}
                         ${file.is_image ? `<button class="btn btn-secondary" onclick="previewFile('${file.id}')">🖼️ 预览</button>` : ''}
+                        ${file.is_archive ? `<button class="btn btn-secondary" onclick="extractArchive('${file.id}')">🗜️ 解压</button>` : ''}
                         <button class="btn btn-success" onclick="downloadFile('${file.id}')">⬇️ 下载</button>
                         <button class="btn btn-danger" onclick="deleteFile('${file.id}')">🗑️ 删除</button>
                     </div>
@@ -710,6 +860,53 @@ async function deleteFolder(folderPath) {
     }
 }
 
+// 轮询后台任务直到结束，返回最终的任务信息；onProgress 在每次查询到运行中的任务时调用
+async function waitForJob(jobId, onProgress) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        const result = await response.json();
+        if (!result.success) {
+            throw new Error(result.message);
+        }
+
+        const job = result.job;
+        if (['completed', 'failed', 'cancelled'].includes(job.status)) {
+            return job;
+        }
+        if (onProgress) {
+            onProgress(job);
+        }
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+    }
+}
+
+// 在服务器上解压压缩包到文件夹
+async function extractArchive(fileId) {
+    try {
+        const response = await fetch(`/api/extract/${fileId}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: '{}'
+        });
+        const result = await response.json();
+        if (!result.success) {
+            showToast(result.message, 'error');
+            return;
+        }
+        showToast(result.message, 'info');
+
+        const job = await waitForJob(result.job.id);
+        if (job.status === 'completed') {
+            showToast(`解压完成：${job.result.extracted_files} 个文件已放入文件夹 ${job.result.folder}`, 'success');
+            refreshFileList();
+        } else {
+            showToast(`解压失败: ${job.error || '任务已取消'}`, 'error');
+        }
+    } catch (error) {
+        showToast('解压失败: ' + error.message, 'error');
+    }
+}
+
 // 预览文件
 async function previewFile(fileId) {
     showLoading(true);
@@ -766,24 +963,31 @@ async function clearAllFiles() {
         
         if (result.success && result.files.length > 0) {
             let deletedCount = 0;
-            
-            for (const file of result.files) {
+            const rootFileIds = result.files.filter(file => !file.is_folder).map(file => file.id);
+            const folders = result.files.filter(file => file.is_folder);
+
+            // 根目录文件一次批量删除（数量较多时在后台执行，等待任务完成）
+            if (rootFileIds.length > 0) {
                 try {
-                    let deleteResponse;
-                    
-                    if (file.is_folder) {
-                        // 删除文件夹
-                        const encodedPath = encodeURIComponent(file.folder_path);
-                        deleteResponse = await fetch(`/api/delete-folder/${encodedPath}`, {
-                            method: 'DELETE'
-                        });
+                    const deleteResult = await requestBatchDelete(rootFileIds);
+                    if (deleteResult.success) {
+                        deletedCount += deleteResult.success_count;
                     } else {
-                        // 删除文件
-                        deleteResponse = await fetch(`/api/delete/${file.id}`, {
-                            method: 'DELETE'
-                        });
+                        console.error('批量删除文件失败:', deleteResult.message);
                     }
-                    
+                } catch (error) {
+                    console.error('批量删除文件失败:', error);
+                }
+            }
+
+            // 文件夹逐个删除
+            for (const folder of folders) {
+                try {
+                    const encodedPath = encodeURIComponent(folder.folder_path);
+                    const deleteResponse = await fetch(`/api/delete-folder/${encodedPath}`, {
+                        method: 'DELETE'
+                    });
+
                     if (deleteResponse.ok) {
                         const deleteResult = await deleteResponse.json();
                         if (deleteResult.success) {
@@ -823,8 +1027,13 @@ async function manualCleanup() {
         const result = await response.json();
         
         if (result.success) {
-            showToast(result.message, 'success');
-            refreshFileList();
+            const job = await waitForJob(result.job.id);
+            if (job.status === 'completed') {
+                showToast(`清理完成，删除了 ${job.result.expired_count} 个过期文件`, 'success');
+                refreshFileList();
+            } else {
+                showToast(`清理失败: ${job.error || '任务已取消'}`, 'error');
+            }
         } else {
             showToast(result.message, 'error');
         }
@@ -999,15 +1208,11 @@ async function batchDownloadFiles() {
         return;
     }
     
-    if (selectedFiles.size > 50) {
-        showToast('单次批量下载不能超过50个文件', 'warning');
-        return;
-    }
-    
     showLoading(true);
     
     try {
-        const response = await fetch('/api/batch/download', {
+        // 服务器在后台打包，完成后由浏览器直接下载，不在内存中缓存整个ZIP
+        const response = await fetch('/api/batch/download/prepare', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -1017,23 +1222,24 @@ async function batchDownloadFiles() {
             })
         });
         
-        if (response.ok) {
-            // 处理文件下载
-            const blob = await response.blob();
-            const url = window.URL.createObjectURL(blob);
+        const result = await response.json();
+        if (!result.success) {
+            showToast(result.message || '批量下载失败', 'error');
+            return;
+        }
+        
+        const job = await waitForJob(result.job.id);
+        if (job.status === 'completed') {
             const a = document.createElement('a');
             a.style.display = 'none';
-            a.href = url;
-            a.download = `batch_download_${new Date().getTime()}.zip`;
+            a.href = job.result.download_url;
             document.body.appendChild(a);
             a.click();
-            window.URL.revokeObjectURL(url);
             document.body.removeChild(a);
             
-            showToast(`成功下载 ${selectedFiles.size} 个文件`, 'success');
+            showToast(`成功下载 ${job.result.file_count} 个文件`, 'success');
         } else {
-            const result = await response.json();
-            showToast(result.message || '批量下载失败', 'error');
+            showToast(`批量下载失败: ${job.error || '任务已取消'}`, 'error');
         }
     } catch (error) {
         showToast('批量下载失败: ' + error.message, 'error');
@@ -1043,6 +1249,32 @@ async function batchDownloadFiles() {
 }
 
 // 批量删除文件
+// 批量删除请求：大批量删除在后台执行（202），等待任务完成后返回与同步删除相同格式的结果
+async function requestBatchDelete(fileIds) {
+    const response = await fetch('/api/batch/delete', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ file_ids: fileIds })
+    });
+    const result = await response.json();
+    if (!result.success || !result.job) {
+        return result;
+    }
+
+    const job = await waitForJob(result.job.id);
+    if (job.status !== 'completed') {
+        return { success: false, message: `批量删除失败: ${job.error || '任务已取消'}` };
+    }
+    return {
+        success: true,
+        message: `批量删除完成：成功 ${job.result.success_count} 个，失败 ${job.result.failed_count} 个`,
+        success_count: job.result.success_count,
+        failed_count: job.result.failed_count
+    };
+}
+
 async function batchDeleteFiles() {
     if (selectedFiles.size === 0) {
         showToast('请先选择要删除的文件', 'warning');
@@ -1056,17 +1288,7 @@ async function batchDeleteFiles() {
     showLoading(true);
     
     try {
-        const response = await fetch('/api/batch/delete', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                file_ids: Array.from(selectedFiles)
-            })
-        });
-        
-        const result = await response.json();
+        const result = await requestBatchDelete(Array.from(selectedFiles));
         
         if (result.success) {
             showToast(result.message, 'success');
@@ -182,6 +182,28 @@ describe('API请求', () => {
         expect(data.files).toHaveLength(1);
     });
 
+    test('批量删除返回后台任务时应该等待任务完成', async () => {
+        fetch
+            .mockResolvedValueOnce({
+                ok: true,
+                status: 202,
+                json: async () => ({ success: true, message: '已开始删除 250 个文件', job: { id: 'job1' } })
+            })
+            .mockResolvedValueOnce({
+                ok: true,
+                json: async () => ({
+                    success: true,
+                    job: { id: 'job1', status: 'completed', result: { success_count: 250, failed_count: 0 } }
+                })
+            });
+
+        const result = await requestBatchDelete(['1', '2']);
+
+        expect(fetch).toHaveBeenCalledWith('/api/jobs/job1');
+        expect(result.success).toBe(true);
+        expect(result.success_count).toBe(250);
+    });
+
     test('应该处理API错误', async () => {
         fetch.mockRejectedValueOnce(new Error('Network error'));
 
@@ -0,0 +1,88 @@
+"""
+测试公共夹具
+
+每个测试在独立的临时目录中创建应用：上传目录、缓存目录和数据库都位于 tmp_path 下，
+测试结束后停止后台任务线程，下一个测试可以重新创建应用。
+"""
+import os
+import sys
+import io
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+
+def make_config(root, **overrides):
+    """测试用的配置：所有目录位于 root 下，关闭频率限制和内容索引"""
+    config = {
+        'TESTING': True,
+        'UPLOAD_FOLDER': os.path.join(root, 'uploads'),
+        'ARCHIVE_CACHE_FOLDER': os.path.join(root, 'cache', 'archives'),
+        'RATE_LIMIT_ENABLED': False,
+        'RATE_LIMIT_DB': os.path.join(root, 'cache', 'ratelimit.db'),
+        'JOB_QUEUE_DB': os.path.join(root, 'cache', 'jobs.db'),
+        'JOB_RESULT_FOLDER': os.path.join(root, 'cache', 'jobs'),
+        'JOB_POLL_INTERVAL': 0.1,
+        'SEARCH_CONTENT_INDEXING': False,
+        'STORAGE_BACKEND': 'local',
+        'STORAGE_COMPRESSION': False,
+    }
+    config.update(overrides)
+    return config
+
+
+@pytest.fixture
+def app_factory(tmp_path):
+    """按配置覆盖项创建应用，测试结束后停止后台任务"""
+    import app as app_module
+
+    def factory(**overrides):
+        return app_module.create_app(make_config(str(tmp_path), **overrides))
+
+    yield factory
+    app_module.stop_background_tasks()
+
+
+@pytest.fixture
+def app(app_factory):
+    return app_factory()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def file_manager(app):
+    import app as app_module
+    return app_module.file_manager
+
+
+def upload(client, files, paths=None, **kwargs):
+    """上传 [(文件名, 内容)]，返回响应"""
+    data = {'files': [(io.BytesIO(content), name) for name, content in files]}
+    if paths is not None:
+        data['paths'] = paths
+    return client.post('/api/upload', data=data, content_type='multipart/form-data', **kwargs)
+
+
+MULTIPART_BOUNDARY = 'test-boundary'
+
+
+def multipart_body(files, fields=()):
+    """手工构造 multipart/form-data 请求体，边界为 MULTIPART_BOUNDARY"""
+    parts = []
+    for name, value in fields:
+        parts.append(
+            f'--{MULTIPART_BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for filename, content in files:
+        parts.append(
+            f'--{MULTIPART_BOUNDARY}\r\nContent-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    return b''.join(parts) + f'--{MULTIPART_BOUNDARY}--\r\n'.encode()
@@ -0,0 +1,43 @@
+"""应用工厂：导入模块不创建应用、不加载可选子系统，后台任务可推迟到第一个请求"""
+import json
+import subprocess
+import sys
+
+from conftest import PROJECT_DIR
+
+IMPORT_SCRIPT = '''
+import os, sys, json, threading
+sys.path.insert(0, {project_dir!r})
+import app
+print(json.dumps({{
+    'lazy_loaded': [m for m in ('qrcode', 'PIL', 'psutil', 'apscheduler') if m in sys.modules],
+    'threads': threading.active_count(),
+    'app_created': app._app is not None,
+    'files': os.listdir('.'),
+}}))
+'''
+
+
+def test_import_has_no_side_effects(tmp_path):
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT.format(project_dir=PROJECT_DIR)],
+        cwd=tmp_path, capture_output=True, text=True, timeout=60, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    assert result == {'lazy_loaded': [], 'threads': 1, 'app_created': False, 'files': []}
+
+
+def test_background_tasks_start_on_first_request(app_factory):
+    import app as app_module
+    app = app_factory(DEFER_BACKGROUND_TASKS=True)
+    assert not app_module._background_started
+    assert app.test_client().get('/api/files').status_code == 200
+    assert app_module._background_started
+    assert app_module.cleanup_scheduler is not None
+
+
+def test_each_app_has_its_own_storage(app_factory, tmp_path):
+    import app as app_module
+    app = app_factory(UPLOAD_FOLDER=str(tmp_path / 'other'))
+    assert app_module.file_manager.upload_folder == str(tmp_path / 'other')
+    assert app.config['UPLOAD_FOLDER'] == str(tmp_path / 'other')
@@ -0,0 +1,69 @@
+"""ZIP构建：已压缩格式直接STORE、大文件在进程池中deflate、gzip存储的文件复制deflate数据"""
+import gzip
+import zipfile
+
+import pytest
+
+from utils import archive
+from utils.archive import ArchiveBuilder, ArchiveEntry, PARALLEL_MIN_FILE_SIZE
+
+TEXT = b''.join(b'row %07d,some,csv,values\n' % i for i in range(60000))
+
+
+@pytest.fixture
+def entries(tmp_path):
+    (tmp_path / 'big.csv').write_bytes(TEXT)
+    (tmp_path / 'photo.jpg').write_bytes(b'\xff\xd8' + bytes(range(256)) * 10)
+    (tmp_path / 'notes.log.gz').write_bytes(gzip.compress(TEXT[:50000], mtime=0))
+    assert len(TEXT) >= PARALLEL_MIN_FILE_SIZE
+    return [
+        ArchiveEntry(str(tmp_path / 'big.csv'), 'data/big.csv', 'csv'),
+        ArchiveEntry(str(tmp_path / 'photo.jpg'), 'photo.jpg', 'jpg'),
+        ArchiveEntry(str(tmp_path / 'notes.log.gz'), 'notes.log', 'log', 'gzip', 50000),
+    ]
+
+
+@pytest.fixture
+def builder():
+    builder = ArchiveBuilder(compress_level=6, max_workers=2)
+    yield builder
+    builder.shutdown()
+
+
+def check_archive(zip_path):
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.testzip() is None
+        infos = {info.filename: info for info in zipf.infolist()}
+        assert list(infos) == ['data/big.csv', 'photo.jpg', 'notes.log']
+        assert infos['photo.jpg'].compress_type == zipfile.ZIP_STORED
+        assert infos['data/big.csv'].compress_type == zipfile.ZIP_DEFLATED
+        assert zipf.read('data/big.csv') == TEXT
+        assert zipf.read('notes.log') == TEXT[:50000]
+
+
+def test_build_archive(builder, entries, tmp_path):
+    zip_path, count = builder.build(entries, str(tmp_path / 'out.zip'))
+    assert count == 3
+    check_archive(zip_path)
+
+
+def test_pool_does_not_fork(builder):
+    assert builder._get_pool()._mp_context.get_start_method() != 'fork'
+
+
+def test_fallback_without_zipfile_internals(builder, entries, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, 'RAW_MEMBER_SUPPORTED', False)
+    monkeypatch.setattr(archive, 'write_raw_member', None)
+    zip_path, _ = builder.build(entries, str(tmp_path / 'out.zip'))
+    check_archive(zip_path)
+    assert builder._pool is None
+
+
+def test_failed_build_removes_output(builder, entries, tmp_path):
+    def cancel(done, total):
+        raise RuntimeError('cancelled')
+
+    with pytest.raises(RuntimeError):
+        builder.build(entries, str(tmp_path / 'out.zip'), progress=cancel)
+    assert not (tmp_path / 'out.zip').exists()
+    assert not [path for path in tmp_path.iterdir() if path.name.startswith(archive.TEMP_ZIP_PREFIX)]
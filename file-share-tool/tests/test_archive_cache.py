@@ -0,0 +1,72 @@
+"""文件夹ZIP缓存：按内容版本缓存，文件删除后失效，锁文件随缓存一起清理"""
+import io
+import os
+import time
+import zipfile
+
+import pytest
+
+from conftest import upload
+from utils import archive_cache
+from utils.archive_cache import ArchiveCache
+
+
+def cache_files(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if not name.endswith('.tmp'))
+
+
+def download_folder(client, folder):
+    response = client.get(f'/api/download-folder/{folder}')
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zipf:
+        return sorted(zipf.namelist())
+
+
+@pytest.fixture
+def folder(client):
+    files = [('a.txt', b'a'), ('b.txt', b'b'), ('c.txt', b'c')]
+    response = upload(client, files, paths=[f'docs/{name}' for name, _ in files])
+    return {item['name'].split('/')[-1]: item['id'] for item in response.json['uploaded_files']}
+
+
+def test_version_changes_with_content():
+    files = [{'id': '1', 'relative_path': 'docs/a.txt', 'file_size': 3, 'content_hash': 'x'}]
+    version = ArchiveCache.folder_version(files)
+    assert ArchiveCache.folder_version([dict(files[0], content_hash='y')]) != version
+    assert ArchiveCache.folder_version([dict(files[0], relative_path='docs/b.txt')]) != version
+
+
+@pytest.mark.parametrize('delete', ['single', 'batch', 'expired'])
+def test_file_delete_invalidates_folder_zip(app, client, file_manager, folder, delete):
+    cache_dir = file_manager.archive_cache.cache_dir
+    assert download_folder(client, 'docs') == ['a.txt', 'b.txt', 'c.txt']
+    assert any(name.endswith('.zip') for name in cache_files(cache_dir))
+
+    if delete == 'single':
+        assert client.delete(f"/api/delete/{folder['a.txt']}").status_code == 200
+    elif delete == 'batch':
+        assert client.post('/api/batch/delete', json={'file_ids': [folder['a.txt']]}).status_code == 200
+    else:
+        file_manager.database.get_expired_files = lambda: [file_manager.get_file_metadata(folder['a.txt'])]
+        assert file_manager.cleanup_expired_files() == 1
+
+    # ZIP和锁文件都已删除，再次下载时重新打包
+    assert cache_files(cache_dir) == []
+    assert download_folder(client, 'docs') == ['b.txt', 'c.txt']
+
+
+def test_evict_removes_locks_of_evicted_folders(tmp_path):
+    cache = ArchiveCache(str(tmp_path), max_bytes=10)
+
+    def build(dest_path):
+        with open(dest_path, 'wb') as f:
+            f.write(b'x' * 8)
+        return True
+
+    first = cache.get_or_build('one', [{'id': '1', 'file_size': 1}], build)
+    old = time.time() - archive_cache.EVICT_GRACE_SECONDS - 10
+    os.utime(first, (old, old))
+    second = cache.get_or_build('two', [{'id': '2', 'file_size': 1}], build)
+
+    assert not os.path.exists(first)
+    assert cache_files(str(tmp_path)) == sorted([os.path.basename(second), f"{cache.folder_key('two')}.lock"])
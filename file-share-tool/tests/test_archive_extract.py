@@ -0,0 +1,90 @@
+"""服务端解压：zip/tar后台解压到文件夹，过滤不安全的成员路径，压缩炸弹被拒绝并删除已解压的文件"""
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from conftest import upload
+from test_job_queue import wait_for_job
+from utils.archive_extract import member_path, default_folder_name
+from utils.job_queue import JOB_COMPLETED, JOB_FAILED
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for name, data in members:
+            zipf.writestr(name, data)
+    return buffer.getvalue()
+
+
+def make_tar(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def extract(client, filename, data, body=None):
+    file_id = upload(client, [(filename, data)]).json['uploaded_files'][0]['id']
+    response = client.post(f'/api/extract/{file_id}', json=body or {})
+    assert response.status_code == 202, response.json
+    return wait_for_job(lambda job_id: client.get(f'/api/jobs/{job_id}').json['job'], response.json['job']['id'])
+
+
+def folder_contents(client, file_manager, folder):
+    return {f['relative_path']: client.get(f"/api/download/{f['id']}").data
+            for f in file_manager.get_file_list()
+            if (f.get('relative_path') or '').startswith(folder + '/')}
+
+
+def test_member_path_is_sanitized():
+    assert member_path('../../etc/passwd') == 'etc/passwd'
+    assert member_path('/abs/./a.txt') == 'abs/a.txt'
+    assert member_path('dir\\file.txt') == 'dir/file.txt'
+    assert member_path('__MACOSX/a.txt') is None
+    assert member_path('dir/.hidden') is None
+    assert default_folder_name('photos.tar.gz') == 'photos'
+
+
+def test_zip_is_extracted_into_folder(client, file_manager):
+    job = extract(client, 'pkg.zip', make_zip([
+        ('pkg/a.txt', b'aaa'),
+        ('pkg/sub/b.txt', b'bbb'),
+        ('../evil.txt', b'evil'),
+        ('pkg/.hidden', b'x'),
+        ('__MACOSX/pkg/._a.txt', b'x'),
+    ]))
+    assert job['status'] == JOB_COMPLETED
+    assert (job['result']['extracted_files'], job['result']['skipped_members']) == (3, 2)
+    # 压缩包自带的同名顶层目录不重复嵌套，../ 不能跳出目标文件夹
+    assert folder_contents(client, file_manager, 'pkg') == {
+        'pkg/a.txt': b'aaa', 'pkg/sub/b.txt': b'bbb', 'pkg/evil.txt': b'evil'}
+
+
+def test_tar_is_extracted_into_requested_folder(client, file_manager):
+    job = extract(client, 'data.tar.gz', make_tar([('one.txt', b'1'), ('dir/two.txt', b'2')]),
+                  {'folder': 'target'})
+    assert job['status'] == JOB_COMPLETED
+    assert folder_contents(client, file_manager, 'target') == {'target/one.txt': b'1', 'target/dir/two.txt': b'2'}
+
+
+def test_archive_bomb_is_rolled_back(app_factory):
+    app = app_factory(ARCHIVE_EXTRACT_MAX_TOTAL_SIZE=1024 * 1024, ARCHIVE_EXTRACT_BATCH_SIZE=1)
+    client = app.test_client()
+    from app import file_manager
+    # tar不声明总大小，前两个文件已提交后才发现超限
+    job = extract(client, 'bomb.tar.gz', make_tar([
+        ('a.txt', b'a'), ('b.txt', b'b'), ('big.txt', b'\0' * (2 * 1024 * 1024))]))
+    assert job['status'] == JOB_FAILED
+    assert [f['original_name'] for f in file_manager.get_file_list()] == ['bomb.tar.gz']
+
+
+@pytest.mark.parametrize('filename, status', [('notes.txt', 400), (None, 404)])
+def test_extract_rejects_invalid_requests(client, filename, status):
+    file_id = upload(client, [(filename, b'x')]).json['uploaded_files'][0]['id'] if filename else 'missing'
+    assert client.post(f'/api/extract/{file_id}', json={}).status_code == status
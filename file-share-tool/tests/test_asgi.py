@@ -0,0 +1,128 @@
+"""ASGI入口：上传请求体在事件循环上解析，文件下载在事件循环上分块发送"""
+import asyncio
+import io
+import os
+
+import pytest
+
+from conftest import upload, multipart_body, MULTIPART_BOUNDARY
+
+
+@pytest.fixture
+def asgi_app(app):
+    import app as app_module
+    from asgi import FileShareASGI
+    application = FileShareASGI(app, app_module.file_manager, chunk_size=1024, max_threads=4)
+    yield application
+    application.executor.shutdown(wait=True)
+
+
+def call(application, method, path, body=b'', headers=(), message_size=4096, disconnect_after=None):
+    """发送一个ASGI HTTP请求，返回 (状态码, 响应头, 响应体)"""
+    messages = [
+        {'type': 'http.request', 'body': body[start:start + message_size],
+         'more_body': start + message_size < len(body)}
+        for start in range(0, max(len(body), 1), message_size)
+    ]
+    if disconnect_after is not None:
+        messages = messages[:disconnect_after] + [{'type': 'http.disconnect'}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        # 请求体已发送完毕，直到响应结束都不会断开
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'root_path': '',
+        'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+    asyncio.run(application(scope, receive, send))
+    if not sent:
+        return None, {}, b''
+    start = sent[0]
+    return (
+        start['status'],
+        {name.decode(): value.decode() for name, value in start['headers']},
+        b''.join(message.get('body', b'') for message in sent[1:])
+    )
+
+
+def upload_headers(body):
+    return [('Content-Type', f'multipart/form-data; boundary={MULTIPART_BOUNDARY}'),
+            ('Content-Length', str(len(body)))]
+
+
+def test_upload_is_parsed_on_event_loop(asgi_app, file_manager):
+    content = os.urandom(50000)
+    body = multipart_body([('a.bin', content), ('b.txt', b'hello')], fields=[('paths', 'd/a.bin'), ('paths', 'd/b.txt')])
+    status, _, _ = call(asgi_app, 'POST', '/api/upload', body, upload_headers(body), message_size=1000)
+    assert status == 200
+
+    files = {f['original_name']: f for f in file_manager.get_file_list()}
+    assert sorted(files) == ['d/a.bin', 'd/b.txt']
+    with file_manager.open_stored(files['d/a.bin']) as f:
+        assert f.read() == content
+
+
+def test_disconnect_during_upload_leaves_no_files(asgi_app, file_manager):
+    body = multipart_body([('a.bin', os.urandom(50000))])
+    status, _, _ = call(asgi_app, 'POST', '/api/upload', body, upload_headers(body), message_size=1000,
+                        disconnect_after=10)
+    assert status is None
+    assert file_manager.get_file_list() == []
+    assert not [name for _, _, names in os.walk(file_manager.upload_folder)
+                for name in names if not name.startswith(('metadata.db', '.'))]
+
+
+def test_download_and_range_are_streamed(asgi_app, client):
+    content = os.urandom(10000)
+    file_id = upload(client, [('a.bin', content)]).json['uploaded_files'][0]['id']
+
+    status, headers, body = call(asgi_app, 'GET', f'/api/download/{file_id}')
+    assert status == 200 and body == content
+    assert int(headers['content-length']) == len(content)
+
+    status, headers, body = call(asgi_app, 'GET', f'/api/download/{file_id}', headers=[('Range', 'bytes=100-2099')])
+    assert status == 206 and body == content[100:2100]
+
+
+def test_range_body_is_sent_from_file():
+    from werkzeug.test import EnvironBuilder
+    from werkzeug.wrappers import Response
+    from asgi import AsyncFileWrapper, FileShareASGI
+
+    wrapper = AsyncFileWrapper(io.BytesIO(b'0123456789'))
+    assert FileShareASGI._file_source(wrapper) == (wrapper.file, None, None)
+
+    environ = EnvironBuilder(headers={'Range': 'bytes=2-5'}).get_environ()
+    response = Response(AsyncFileWrapper(io.BytesIO(b'0123456789')), direct_passthrough=True)
+    response.make_conditional(environ, accept_ranges=True, complete_length=10)
+    assert response.status_code == 206
+    file, start, length = FileShareASGI._file_source(response.response)
+    assert (start, length) == (2, 4)
+
+    # 不认识的包装对象退回在线程中迭代
+    assert FileShareASGI._file_source(iter([b'x'])) is None
+
+
+def test_json_api_and_lifespan(asgi_app):
+    status, headers, body = call(asgi_app, 'GET', '/api/files')
+    assert status == 200 and headers['content-type'].startswith('application/json')
+
+    sent = []
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(asgi_app({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
@@ -0,0 +1,53 @@
+"""批量操作：批量删除、批量下载和文件夹删除按集合一次查询和删除"""
+import io
+import os
+import zipfile
+
+from conftest import upload
+from utils import database
+
+
+def upload_ids(client, files, paths=None):
+    response = upload(client, files, paths=paths)
+    return [item['id'] for item in response.json['uploaded_files']]
+
+
+def test_get_many_spans_sql_batches(client, file_manager, monkeypatch):
+    monkeypatch.setattr(database, 'SQL_BATCH_SIZE', 2)
+    file_ids = upload_ids(client, [(f'{i}.txt', b'x') for i in range(5)])
+    result = file_manager.get_many(file_ids + ['missing', file_ids[0]])
+    assert set(result) == set(file_ids)
+
+
+def test_batch_delete_reports_missing_ids(client, file_manager):
+    file_ids = upload_ids(client, [('a.txt', b'a'), ('b.txt', b'b')])
+    paths = [file_manager.get_file_metadata(file_id)['file_path'] for file_id in file_ids]
+
+    response = client.post('/api/batch/delete', json={'file_ids': file_ids + ['missing']})
+    assert response.json['success_count'] == 2
+    assert response.json['failed_files'] == ['missing']
+    assert not any(os.path.exists(path) for path in paths)
+    assert client.get('/api/files').json['files'] == []
+
+
+def test_batch_download(client):
+    file_ids = upload_ids(client, [('a.txt', b'aaa'), ('b.txt', b'bbb')])
+    response = client.post('/api/batch/download', json={'file_ids': file_ids + ['missing']})
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zipf:
+        assert sorted(zipf.namelist()) == ['a.txt', 'b.txt']
+        assert zipf.read('a.txt') == b'aaa'
+
+    response = client.post('/api/batch/download', json={'file_ids': ['missing']})
+    assert response.status_code == 404
+
+
+def test_delete_folder(client, file_manager):
+    upload_ids(client, [('a.txt', b'a'), ('b.txt', b'b')], paths=['docs/a.txt', 'docs/sub/b.txt'])
+    keep = upload_ids(client, [('c.txt', b'c')], paths=['docs2/c.txt'])
+
+    response = client.delete('/api/delete-folder/docs')
+    assert response.status_code == 200
+    assert '2' in response.json['message']
+    assert [f['id'] for f in file_manager.get_file_list()] == keep
+    assert client.delete('/api/delete-folder/docs').status_code == 404
@@ -0,0 +1,85 @@
+"""增量上传：按已有文件的块签名只上传变化的数据，服务器据此重建新文件"""
+import io
+import json
+import random
+
+import pytest
+
+from conftest import upload
+from utils.delta import block_signatures, generate_delta, apply_delta
+
+BLOCK_SIZE = 4096
+
+
+def make_versions(seed=1):
+    rng = random.Random(seed)
+    base = bytes(rng.getrandbits(8) for _ in range(BLOCK_SIZE * 20 + 123))
+    # 中间插入、删除和修改各一处，长度不再按块对齐
+    new = base[:5000] + b'inserted' * 10 + base[5000:30000] + base[34000:60000] + b'X' + base[60001:]
+    return base, new
+
+
+def make_delta(base, new, block_size=BLOCK_SIZE):
+    blocks = list(block_signatures(io.BytesIO(base), block_size))
+    literal = io.BytesIO()
+    ops, size, sha256 = generate_delta(io.BytesIO(new), blocks, block_size, len(base), literal)
+    return ops, size, sha256, literal.getvalue()
+
+
+def test_roundtrip_only_sends_changes():
+    base, new = make_versions()
+    ops, size, _, literal = make_delta(base, new)
+    assert size == len(new)
+    assert len(literal) < 4 * BLOCK_SIZE
+
+    out = bytearray()
+    assert apply_delta(io.BytesIO(base), len(base), BLOCK_SIZE, ops, io.BytesIO(literal), out.extend) == len(new)
+    assert bytes(out) == new
+
+
+@pytest.mark.parametrize('ops', [
+    [['copy', 0, 999]],
+    [['copy', -1, 1]],
+    [['data', 0]],
+    [['move', 1]],
+    [['data', 100]],
+])
+def test_invalid_recipe_is_rejected(ops):
+    base = b'x' * BLOCK_SIZE * 2
+    with pytest.raises(ValueError):
+        apply_delta(io.BytesIO(base), len(base), BLOCK_SIZE, ops, io.BytesIO(b'short'), lambda chunk: None)
+
+
+def post_delta(client, base_id, recipe, literal):
+    return client.post(f'/api/delta/{base_id}', data={
+        'recipe': json.dumps(recipe),
+        'data': (io.BytesIO(literal), 'delta.bin'),
+        'path': 'docs/v2.bin',
+    }, content_type='multipart/form-data')
+
+
+def test_delta_upload_through_api(client):
+    base, new = make_versions()
+    base_id = upload(client, [('v1.bin', base)]).json['uploaded_files'][0]['id']
+
+    signature = client.get(f'/api/signature/{base_id}', query_string={'block_size': BLOCK_SIZE}).json
+    assert signature['file_size'] == len(base) and len(signature['blocks']) == 21
+
+    ops, size, sha256, literal = make_delta(base, new, signature['block_size'])
+    recipe = {'block_size': BLOCK_SIZE, 'ops': ops, 'file_size': size, 'sha256': sha256, 'name': 'v2.bin'}
+    response = post_delta(client, base_id, recipe, literal)
+    assert response.status_code == 200, response.json
+    new_id = response.json['uploaded_files'][0]['id']
+    assert client.get(f'/api/download/{new_id}').data == new
+    # 基础文件不受影响
+    assert client.get(f'/api/download/{base_id}').data == base
+
+
+def test_delta_with_wrong_hash_is_rejected(client, file_manager):
+    base, new = make_versions()
+    base_id = upload(client, [('v1.bin', base)]).json['uploaded_files'][0]['id']
+    ops, size, _, literal = make_delta(base, new)
+    recipe = {'block_size': BLOCK_SIZE, 'ops': ops, 'file_size': size, 'sha256': '0' * 64, 'name': 'v2.bin'}
+    assert post_delta(client, base_id, recipe, literal).status_code == 400
+    assert [f['id'] for f in file_manager.get_file_list()] == [base_id]
+    assert post_delta(client, 'missing', recipe, literal).status_code == 404
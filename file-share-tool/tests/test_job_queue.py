@@ -0,0 +1,89 @@
+"""后台任务队列：执行、重试、取消，以及批量删除超过内联上限时转为后台任务"""
+import time
+import threading
+
+import pytest
+
+from conftest import upload
+from utils.job_queue import JobQueue, JOB_COMPLETED, JOB_CANCELLED, JOB_FAILED
+
+
+def wait_for_job(get, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = get(job_id)
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f'任务 {job_id} 未在 {timeout} 秒内结束')
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), str(tmp_path / 'results'), workers=1, poll_interval=0.05)
+    yield queue
+    queue.stop()
+
+
+def test_job_runs_and_reports_result(queue):
+    queue.register('echo', lambda context: {'payload': context.payload, 'attempt': context.attempt})
+    queue.start()
+    job = wait_for_job(queue.get, queue.submit('echo', {'x': 1})['id'])
+    assert job['status'] == JOB_COMPLETED
+    assert job['result'] == {'payload': {'x': 1}, 'attempt': 1}
+
+
+def test_failed_job_is_retried(queue):
+    def flaky(context):
+        if context.attempt == 1:
+            raise RuntimeError('temporary')
+        return 'ok'
+
+    queue.register('flaky', flaky, max_attempts=2, retry_delay=0)
+    queue.register('broken', lambda context: 1 / 0)
+    queue.start()
+    assert wait_for_job(queue.get, queue.submit('flaky')['id'])['result'] == 'ok'
+    job = wait_for_job(queue.get, queue.submit('broken')['id'])
+    assert job['status'] == JOB_FAILED and job['attempts'] == 1
+
+
+def test_cancel_queued_and_running_jobs(queue):
+    started = threading.Event()
+
+    def long_running(context):
+        started.set()
+        while True:
+            context.progress(50, force=True)
+            time.sleep(0.01)
+
+    queue.register('long', long_running)
+    queued = queue.submit('long')
+    assert queue.cancel(queued['id'])['status'] == JOB_CANCELLED
+
+    queue.start()
+    running = queue.submit('long')
+    assert started.wait(5)
+    queue.cancel(running['id'])
+    assert wait_for_job(queue.get, running['id'])['status'] == JOB_CANCELLED
+
+
+def test_unique_submit_returns_pending_job(queue):
+    queue.register('cleanup', lambda context: None)
+    first = queue.submit('cleanup', unique=True)
+    assert queue.submit('cleanup', unique=True)['id'] == first['id']
+
+
+def test_large_batch_delete_runs_as_job(app_factory):
+    app = app_factory(JOB_INLINE_DELETE_LIMIT=2)
+    client = app.test_client()
+    response = upload(client, [(f'f{i}.txt', b'x') for i in range(3)])
+    file_ids = [item['id'] for item in response.json['uploaded_files']]
+
+    response = client.post('/api/batch/delete', json={'file_ids': file_ids})
+    assert response.status_code == 202
+    assert 'success_count' not in response.json
+
+    job = wait_for_job(lambda job_id: client.get(f'/api/jobs/{job_id}').json['job'], response.json['job']['id'])
+    assert job['status'] == JOB_COMPLETED
+    assert job['result']['success_count'] == 3
+    assert client.get('/api/files').json['files'] == []
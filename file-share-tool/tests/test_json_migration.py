@@ -0,0 +1,85 @@
+"""旧版JSON元数据迁移：流式解析、分批事务写入，中断后从已提交的偏移继续"""
+import io
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.file_manager import FileManager
+from utils.json_migration import JsonObjectReader, JsonMetadataMigrator
+
+
+def legacy_record(file_id, name):
+    now = datetime.now()
+    return {
+        'id': file_id,
+        'original_name': name,
+        'stored_name': f'{file_id}.txt',
+        'file_path': f'/old/uploads/{file_id}.txt',
+        'file_size': 3,
+        'file_type': 'text',
+        'file_extension': 'txt',
+        'upload_time': now.isoformat(),
+        'expire_time': (now + timedelta(hours=24)).isoformat(),
+    }
+
+
+@pytest.fixture
+def manager(tmp_path):
+    (tmp_path / 'uploads').mkdir()
+    return FileManager(str(tmp_path / 'uploads'), {'txt'})
+
+
+def write_legacy_json(manager, records):
+    path = os.path.join(manager.upload_folder, 'metadata.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def test_reader_streams_small_chunks():
+    data = {'a': {'name': '中文名称' * 10}, 'b': [1, 2, {'c': None}], 'd': 'x'}
+    raw = json.dumps(data, ensure_ascii=False, indent=1).encode()
+    items = list(JsonObjectReader(io.BytesIO(raw), chunk_size=5))
+    assert {key: value for key, value, _ in items} == data
+
+    # 从第一条记录结束处继续
+    resumed = list(JsonObjectReader(io.BytesIO(raw), start_offset=items[0][2], chunk_size=5))
+    assert [key for key, _, _ in resumed] == ['b', 'd']
+
+
+def test_reader_reports_malformed_json():
+    with pytest.raises(ValueError):
+        list(JsonObjectReader(io.BytesIO(b'{"a": {"x": 1} "b": 2}')))
+
+
+def test_migration_imports_valid_records(manager):
+    records = {f'id-{i}': legacy_record(f'id-{i}', f'文件{i}.txt') for i in range(5)}
+    records['broken'] = {'original_name': 'missing fields'}
+    records['bad-time'] = dict(legacy_record('bad-time', 'x.txt'), upload_time='yesterday')
+    json_path = write_legacy_json(manager, records)
+
+    migrator = JsonMetadataMigrator(manager, batch_size=2)
+    assert migrator.run()
+    assert (migrator.migrated_count, migrator.skipped_count) == (5, 2)
+    assert not os.path.exists(json_path)
+    assert [name for name in os.listdir(manager.upload_folder) if name.startswith('metadata.json.backup.')]
+    assert sorted(f['id'] for f in manager.get_file_list()) == [f'id-{i}' for i in range(5)]
+    assert manager.get_file_metadata('id-3')['original_name'] == '文件3.txt'
+
+
+def test_interrupted_migration_resumes(manager):
+    records = {f'id-{i}': legacy_record(f'id-{i}', f'{i}.txt') for i in range(7)}
+    write_legacy_json(manager, records)
+
+    first = JsonMetadataMigrator(manager, batch_size=3)
+    first.stop()
+    assert first.run() is False
+    assert first.migrated_count == 3
+    assert len(manager.get_file_list()) == 3
+
+    second = JsonMetadataMigrator(manager, batch_size=3)
+    assert second.run()
+    assert second.migrated_count == 7
+    assert sorted(f['id'] for f in manager.get_file_list()) == sorted(records)
@@ -0,0 +1,76 @@
+"""生产模式启动器：按CPU核数、cgroup配额和内存上限确定worker与线程数"""
+import argparse
+import json
+import subprocess
+import sys
+
+import start
+
+MB = 1024 * 1024
+
+
+def fake_cgroup(monkeypatch, files):
+    monkeypatch.setattr(start, 'read_cgroup_file', lambda path: files.get(path))
+
+
+def test_plan_by_cpu():
+    plan = start.plan_workers(4, 64 * 1024 * MB, worker_memory_mb=200)
+    assert plan['workers'] == 9 and plan['workers_by_cpu'] == 9
+    assert plan['threads'] == 4
+
+
+def test_plan_is_capped_by_memory():
+    # 1GB的80%只够4个200MB的worker，线程数补足并发
+    plan = start.plan_workers(8, 1024 * MB, worker_memory_mb=200)
+    assert plan['workers_by_memory'] == 4 and plan['workers'] == 4
+    assert plan['threads'] == 16
+    assert start.plan_workers(8, 100 * MB, worker_memory_mb=200)['workers'] == 1
+
+
+def test_explicit_values_win():
+    plan = start.plan_workers(8, None, worker_memory_mb=200, workers=2, threads=3)
+    assert (plan['workers'], plan['threads']) == (2, 3)
+
+
+def test_cgroup_v2_cpu_quota(monkeypatch):
+    monkeypatch.setattr(start.os, 'sched_getaffinity', lambda pid: set(range(16)))
+    fake_cgroup(monkeypatch, {'/sys/fs/cgroup/cpu.max': '150000 100000'})
+    assert start.detect_cpu_limit() == 2
+    fake_cgroup(monkeypatch, {'/sys/fs/cgroup/cpu.max': 'max 100000'})
+    assert start.detect_cpu_limit() == 16
+
+
+def test_cgroup_v1_cpu_quota(monkeypatch):
+    monkeypatch.setattr(start.os, 'sched_getaffinity', lambda pid: set(range(16)))
+    fake_cgroup(monkeypatch, {
+        '/sys/fs/cgroup/cpu/cpu.cfs_quota_us': '300000',
+        '/sys/fs/cgroup/cpu/cpu.cfs_period_us': '100000',
+    })
+    assert start.detect_cpu_limit() == 3
+
+
+def test_cgroup_memory_limit(monkeypatch):
+    fake_cgroup(monkeypatch, {'/sys/fs/cgroup/memory.max': str(512 * MB)})
+    assert start.detect_memory_limit() == 512 * MB
+    fake_cgroup(monkeypatch, {'/sys/fs/cgroup/memory.max': 'max'})
+    assert start.detect_memory_limit() > 512 * MB
+
+
+def test_waitress_runs_all_threads_in_one_process(monkeypatch):
+    monkeypatch.setattr(start, 'choose_server', lambda preferred: 'waitress')
+    monkeypatch.setattr(start, 'detect_cpu_limit', lambda: 2)
+    monkeypatch.setattr(start, 'detect_memory_limit', lambda: None)
+    args = argparse.Namespace(workers=None, threads=None, server=None, host=None, port=None)
+    plan = start.build_production_config(args)
+    assert plan['workers'] == 1 and plan['threads'] == 5 * 4
+    assert plan['preload'] is False
+
+
+def test_print_config_does_not_start_server():
+    output = subprocess.run(
+        [sys.executable, start.__file__, '--print-config', '--workers', '3'],
+        capture_output=True, text=True, timeout=60, check=True
+    ).stdout
+    plan = json.loads(output)
+    assert plan['workers'] in (1, 3)
+    assert {'server', 'threads', 'host', 'port'} <= set(plan)
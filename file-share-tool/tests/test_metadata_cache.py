@@ -0,0 +1,59 @@
+"""元数据缓存：LRU/TTL缓存，写入后通过共享的代数计数器让其他进程的缓存失效"""
+import pytest
+
+from utils.file_manager import FileManager
+from utils.metadata_cache import GenerationCounter, MetadataCache
+
+
+@pytest.fixture
+def counter_path(tmp_path):
+    return str(tmp_path / 'metadata.db.gen')
+
+
+def test_lru_and_ttl(counter_path):
+    cache = MetadataCache(GenerationCounter(counter_path), max_entries=2, ttl=300)
+    generation = cache.current_generation()
+    for key in 'abc':
+        cache.put(key, key.upper(), generation)
+    assert cache.get('a') is None
+    assert cache.get('c') == 'C'
+    assert cache.get_stats()['evictions'] == 1
+
+    expired = MetadataCache(GenerationCounter(counter_path), ttl=-1)
+    expired.put('a', 'A', expired.current_generation())
+    assert expired.get('a') is None
+
+
+def test_bump_from_other_process_clears_cache(counter_path):
+    cache = MetadataCache(GenerationCounter(counter_path))
+    cache.put('a', 'A', cache.current_generation())
+    # 另一个worker映射同一个计数器文件
+    GenerationCounter(counter_path).bump()
+    assert cache.get('a') is None
+    assert cache.get_stats()['invalidations'] == 1
+
+
+def test_put_is_skipped_after_concurrent_write(counter_path):
+    cache = MetadataCache(GenerationCounter(counter_path))
+    generation = cache.current_generation()
+    cache.invalidate()
+    cache.put('a', 'stale', generation)
+    assert cache.get('a') is None
+
+
+def test_workers_see_each_others_writes(tmp_path):
+    (tmp_path / 'uploads').mkdir()
+    workers = [FileManager(str(tmp_path / 'uploads'), {'txt'}) for _ in range(2)]
+    with workers[0].upload_transaction() as txn:
+        writer = workers[0].open_upload('a.txt')
+        writer.write(b'a')
+        file_id = txn.add(writer)['id']
+
+    assert [f['id'] for f in workers[1].get_file_list()] == [file_id]
+    assert workers[1].get_file_metadata(file_id)['file_size'] == 1
+    # 命中缓存，不再查询数据库
+    assert workers[1].get_file_list() and workers[1].database.cache.get_stats()['hits'] >= 1
+
+    assert workers[0].delete_file(file_id)
+    assert workers[1].get_file_list() == []
+    assert workers[1].get_file_metadata(file_id) is None
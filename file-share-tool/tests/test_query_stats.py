@@ -0,0 +1,100 @@
+"""SQL执行统计：按语句归并的次数和行数、慢查询日志、测试模式下的全表扫描检查"""
+import sqlite3
+
+import pytest
+
+from conftest import upload
+from utils.query_stats import (
+    QueryStats, InstrumentedConnection, FullTableScanError, FULL_SCAN_MARK, normalize_sql
+)
+
+
+@pytest.fixture
+def connect():
+    connections = []
+
+    def connect(**kwargs):
+        conn = sqlite3.connect(':memory:', factory=InstrumentedConnection)
+        conn.query_stats = QueryStats(**kwargs)
+        conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.executemany('INSERT INTO items (name) VALUES (?)', [(f'n{i}',) for i in range(5)])
+        connections.append(conn)
+        return conn
+
+    yield connect
+    for conn in connections:
+        conn.close()
+
+
+def stats_by_sql(query_stats):
+    return {item['sql']: item for item in query_stats.snapshot()}
+
+
+def test_normalize_sql_merges_in_lists():
+    assert normalize_sql('SELECT *\n  FROM t WHERE id IN (?, ?,?)') == 'SELECT * FROM t WHERE id IN (?, ...)'
+
+
+def test_statements_are_counted_with_rows(connect):
+    conn = connect()
+    for ids in ([1, 2], [3, 4, 5]):
+        conn.execute(f"SELECT name FROM items WHERE id IN ({','.join('?' * len(ids))})", ids).fetchall()
+    # 只读一行的游标在释放时结束语句
+    conn.execute('SELECT name FROM items WHERE id = ?', (1,)).fetchone()
+    conn.execute('UPDATE items SET name = ? WHERE id > ?', ('x', 2))
+
+    stats = stats_by_sql(conn.query_stats)
+    assert stats['SELECT name FROM items WHERE id IN (?, ...)']['count'] == 2
+    assert stats['SELECT name FROM items WHERE id IN (?, ...)']['rows'] == 5
+    assert stats['SELECT name FROM items WHERE id = ?']['rows'] == 1
+    assert stats['UPDATE items SET name = ? WHERE id > ?']['rows'] == 3
+    assert stats['INSERT INTO items (name) VALUES (?)']['rows'] == 5
+
+
+def test_slow_queries_are_logged_with_plan(connect):
+    conn = connect(slow_query_ms=0, slow_log_size=2)
+    for i in range(3):
+        conn.execute('SELECT name FROM items WHERE id = ?', (i,)).fetchall()
+    slow = conn.query_stats.slow_queries()
+    assert len(slow) == 2
+    assert slow[0]['sql'] == 'SELECT name FROM items WHERE id = ?'
+    assert slow[0]['plan'] and 'items' in slow[0]['plan'][0]
+
+
+def test_full_table_scan_is_rejected(connect):
+    conn = connect(check_full_scan=True)
+    with pytest.raises(FullTableScanError, match='items'):
+        conn.execute('SELECT id FROM items WHERE name = ?', ('n1',))
+    # 按主键查询、标记为允许全表扫描的语句和小表不受影响
+    conn.execute('SELECT name FROM items WHERE id = ?', (1,)).fetchall()
+    conn.execute(f'SELECT COUNT(*) FROM items {FULL_SCAN_MARK}').fetchall()
+    conn.execute('CREATE TABLE schema_version (version INTEGER)')
+    conn.execute('SELECT version FROM schema_version').fetchall()
+
+    assert not connect().query_stats.check_full_scan
+
+
+def test_app_checks_full_scans_in_testing(client, file_manager):
+    query_stats = file_manager.database.query_stats
+    assert query_stats.check_full_scan
+    # 常用接口的语句都走索引，否则检查会让请求失败
+    file_id = upload(client, [('a.txt', b'a')], paths=['docs/a.txt']).json['uploaded_files'][0]['id']
+    for url in ('/api/files', '/api/folders', '/api/folder-files/docs', f'/api/download/{file_id}', '/api/search?q=a'):
+        assert client.get(url).status_code == 200, url
+    assert client.delete(f'/api/delete/{file_id}').status_code == 200
+
+
+def test_stats_api(client):
+    upload(client, [('a.txt', b'a')])
+    stats = client.get('/api/db/stats', query_string={'sort': 'count'}).json['stats']
+    counts = [item['count'] for item in stats['statements']]
+    assert counts and counts == sorted(counts, reverse=True)
+    assert client.get('/api/db/stats', query_string={'sort': 'sql'}).status_code == 400
+
+    assert client.delete('/api/db/stats').status_code == 200
+    stats = client.get('/api/db/stats').json['stats']
+    assert stats['statements'] == [] and stats['slow_queries'] == []
+
+
+def test_stats_api_when_disabled(app_factory):
+    client = app_factory(DB_QUERY_STATS_ENABLED=False).test_client()
+    assert client.get('/api/db/stats').status_code == 400
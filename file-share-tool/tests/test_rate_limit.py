@@ -0,0 +1,44 @@
+"""请求频率限制：按客户端IP的令牌桶，转发请求头只在配置了可信代理时使用"""
+import pytest
+
+from utils.rate_limit import TokenBucketStore
+
+LIMITS = {'default': (0.001, 2), 'list_files': (0.001, 2)}
+
+
+@pytest.fixture
+def limited_app(app_factory):
+    def factory(**overrides):
+        return app_factory(RATE_LIMIT_ENABLED=True, RATE_LIMITS=LIMITS, **overrides)
+    return factory
+
+
+def list_files(client, forwarded_for=None, remote_addr='10.0.0.1'):
+    headers = {'X-Forwarded-For': forwarded_for} if forwarded_for else {}
+    return client.get('/api/files', headers=headers, environ_base={'REMOTE_ADDR': remote_addr})
+
+
+def test_token_bucket_refuses_when_empty(tmp_path):
+    store = TokenBucketStore(str(tmp_path / 'ratelimit.db'))
+    assert store.take('k', rate=0.001, capacity=2) == 0
+    assert store.take('k', rate=0.001, capacity=2) == 0
+    assert store.take('k', rate=0.001, capacity=2) > 0
+    # 预约模式照常扣减，返回需要等待的时间
+    assert store.take('bw', rate=100, capacity=100, amount=300, allow_debt=True) == pytest.approx(2, rel=0.01)
+
+
+def test_spoofed_forwarded_header_does_not_bypass_limit(limited_app):
+    client = limited_app().test_client()
+    statuses = [list_files(client, forwarded_for=f'203.0.113.{i}').status_code for i in range(3)]
+    assert statuses == [200, 200, 429]
+    # 其他客户端不受影响
+    assert list_files(client, remote_addr='10.0.0.2').status_code == 200
+
+
+def test_trusted_proxy_uses_forwarded_address(limited_app):
+    client = limited_app(TRUSTED_PROXY_COUNT=1).test_client()
+    # 代理追加的最右侧地址才是客户端地址，客户端自己写入的地址被忽略
+    for i in range(2):
+        assert list_files(client, forwarded_for=f'198.51.100.{i}, 203.0.113.7').status_code == 200
+    assert list_files(client, forwarded_for='203.0.113.7').status_code == 429
+    assert list_files(client, forwarded_for='203.0.113.8').status_code == 200
@@ -0,0 +1,51 @@
+"""JSON响应缓存：按Accept-Encoding压缩、ETag/304，元数据变化后缓存失效"""
+import gzip
+import json
+
+from conftest import upload
+
+
+def upload_many(client, count):
+    # 足够多的文件让列表响应超过压缩下限
+    return upload(client, [(f'file_{i:03d}.txt', b'x') for i in range(count)])
+
+
+def test_list_is_gzipped_for_accepting_clients(client):
+    upload_many(client, 30)
+    plain = client.get('/api/files')
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+
+    compressed = client.get('/api/files', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(compressed.data)) == plain.json
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+
+
+def test_small_responses_are_not_compressed(client):
+    response = client.get('/api/files', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_unchanged_list_returns_304(client):
+    upload_many(client, 2)
+    first = client.get('/api/files')
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    second = client.get('/api/files', headers={'If-None-Match': etag})
+    assert second.status_code == 304 and second.data == b''
+
+    # 元数据变化后ETag改变
+    upload_many(client, 1)
+    third = client.get('/api/files', headers={'If-None-Match': etag})
+    assert third.status_code == 200 and third.headers['ETag'] != etag
+    assert len(third.json['files']) == len(first.json['files']) + 1
+
+
+def test_cached_body_is_reused(client, file_manager):
+    upload_many(client, 2)
+    client.get('/api/files')
+    hits = file_manager.database.cache.get_stats()['hits']
+    client.get('/api/files')
+    assert file_manager.database.cache.get_stats()['hits'] == hits + 1
@@ -0,0 +1,149 @@
+"""元数据表在线迁移：v1 file_metadata 分批回填到 v2 files，旧版本进程的写入在迁移中和迁移后都不丢失"""
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from benchmarks.metadata_schema import V1_SCHEMA
+from utils.file_manager import FileManager
+from utils.metadata_schema import SCHEMA_VERSION, to_epoch_ms
+from utils.schema_migration import SchemaMigrator
+
+V1_COLUMNS = ('id', 'original_name', 'stored_name', 'file_path', 'file_size', 'file_type', 'file_extension',
+              'upload_time', 'expire_time', 'relative_path', 'is_text_file', 'content_hash')
+# 增加 content_hash 等列之前的 v1 表
+EARLY_V1_SCHEMA = '''
+    CREATE TABLE file_metadata (
+        id TEXT PRIMARY KEY, original_name TEXT NOT NULL, stored_name TEXT NOT NULL, file_path TEXT NOT NULL,
+        file_size INTEGER NOT NULL, file_type TEXT, file_extension TEXT, upload_time TIMESTAMP NOT NULL,
+        expire_time TIMESTAMP NOT NULL, relative_path TEXT, is_text_file BOOLEAN DEFAULT 0
+    )
+'''
+
+
+def v1_record(upload_folder, index, **overrides):
+    file_id = f'{index:08x}-0000-4000-8000-000000000000'
+    upload_time = datetime.now().replace(microsecond=123000) - timedelta(minutes=index)
+    name = f'文件{index}.txt'
+    record = {
+        'id': file_id,
+        'original_name': name,
+        'stored_name': f'{file_id}.txt',
+        'file_path': os.path.join(upload_folder, f'{file_id}.txt'),
+        'file_size': 100 + index,
+        'file_type': 'text/plain',
+        'file_extension': 'txt',
+        'upload_time': upload_time.isoformat(),
+        'expire_time': (upload_time + timedelta(hours=24)).isoformat(),
+        'relative_path': name,
+        'is_text_file': 1,
+        'content_hash': f'{index:064x}',
+    }
+    record.update(overrides)
+    return record
+
+
+def insert_v1(conn, records, columns=V1_COLUMNS):
+    conn.executemany(
+        f"INSERT INTO file_metadata ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+        [tuple(record[column] for column in columns) for record in records]
+    )
+
+
+@pytest.fixture
+def upload_folder(tmp_path):
+    folder = tmp_path / 'uploads'
+    folder.mkdir()
+    return str(folder)
+
+
+def create_v1_database(upload_folder, records, schema=V1_SCHEMA, columns=V1_COLUMNS):
+    conn = sqlite3.connect(os.path.join(upload_folder, 'metadata.db'), isolation_level=None)
+    conn.executescript(schema)
+    insert_v1(conn, records, columns)
+    return conn
+
+
+def assert_migrated(manager, record):
+    metadata = manager.get_file_metadata(record['id'])
+    assert metadata is not None, record['id']
+    for column in ('original_name', 'stored_name', 'file_path', 'file_size', 'file_type', 'file_extension',
+                   'relative_path', 'content_hash'):
+        assert metadata[column] == record.get(column), column
+    for column in ('upload_time', 'expire_time'):
+        assert to_epoch_ms(metadata[column]) == to_epoch_ms(record[column]), column
+
+
+def test_v1_database_is_migrated(upload_folder):
+    records = [v1_record(upload_folder, i) for i in range(4)]
+    # 文件夹中的文件，以及存放在其他位置、不能由ID推导路径的文件
+    records.append(v1_record(upload_folder, 4, relative_path='项目/src/main.py', original_name='项目/src/main.py',
+                             file_extension='py', stored_name='legacy-name.py', file_path='/old/data/legacy-name.py'))
+    create_v1_database(upload_folder, records).close()
+
+    # 旧版本进程的写入不更新缓存代数，这里不使用元数据缓存
+    manager = FileManager(upload_folder, {'txt', 'py'}, metadata_cache_size=0, schema_migration_batch_size=2)
+    for record in records:
+        assert_migrated(manager, record)
+    assert len(manager.get_file_list()) == 5
+
+    conn = sqlite3.connect(manager.db_path)
+    try:
+        assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'file_metadata'").fetchone() == ('view',)
+        assert conn.execute('SELECT version FROM schema_version').fetchall() == [(SCHEMA_VERSION,)]
+        assert conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'schema_migration_state'").fetchone() is None
+        # 未升级的进程继续通过兼容视图写入
+        late = v1_record(upload_folder, 5)
+        insert_v1(conn, [late])
+        conn.execute('DELETE FROM file_metadata WHERE id = ?', (records[0]['id'],))
+        conn.commit()
+    finally:
+        conn.close()
+    assert_migrated(manager, late)
+    assert manager.get_file_metadata(records[0]['id']) is None
+
+    # 再次启动不重复迁移
+    manager = FileManager(upload_folder, {'txt', 'py'})
+    assert len(manager.get_file_list()) == 5
+
+
+def test_writes_during_backfill_are_mirrored(upload_folder):
+    records = [v1_record(upload_folder, i) for i in range(5)]
+    conn = create_v1_database(upload_folder, records)
+    try:
+        # 第一个进程完成扩展和一批回填后中断
+        migrator = SchemaMigrator(conn, batch_size=2)
+        assert migrator.expand()
+        conn.execute('BEGIN IMMEDIATE')
+        assert migrator._copy_batch(2) == 2
+        conn.execute('COMMIT')
+
+        # 旧版本进程对已回填和未回填的记录继续读写
+        added = v1_record(upload_folder, 9)
+        insert_v1(conn, [added])
+        conn.execute("UPDATE file_metadata SET original_name = 'renamed.txt', relative_path = 'renamed.txt' "
+                     "WHERE id = ?", (records[0]['id'],))
+        conn.execute('DELETE FROM file_metadata WHERE id IN (?, ?)', (records[1]['id'], records[4]['id']))
+    finally:
+        conn.close()
+
+    manager = FileManager(upload_folder, {'txt'}, schema_migration_batch_size=2)
+    records[0].update(original_name='renamed.txt', relative_path='renamed.txt')
+    for record in (records[0], records[2], records[3], added):
+        assert_migrated(manager, record)
+    assert manager.get_file_metadata(records[1]['id']) is None
+    assert manager.get_file_metadata(records[4]['id']) is None
+    assert len(manager.get_file_list()) == 4
+
+
+def test_early_v1_table_without_added_columns(upload_folder):
+    columns = V1_COLUMNS[:-1]
+    records = [v1_record(upload_folder, i, content_hash=None) for i in range(3)]
+    create_v1_database(upload_folder, records, EARLY_V1_SCHEMA, columns).close()
+
+    manager = FileManager(upload_folder, {'txt'})
+    for record in records:
+        assert_migrated(manager, record)
+    assert manager.get_file_metadata(records[0]['id'])['storage_codec'] is None
@@ -0,0 +1,62 @@
+"""全文搜索：文件名和路径前缀匹配，文本内容由后台索引器写入，没有全文结果时退化为子串匹配"""
+import pytest
+
+from conftest import upload
+from utils.search_indexer import SearchIndexer
+
+
+@pytest.fixture
+def files(client):
+    upload(client, [
+        ('quarterly_report.txt', b'revenue grew in the northern region'),
+        ('notes.md', b'meeting notes about the budget'),
+        ('photo.txt', b'\0\0binary'),
+    ], paths=['finance/quarterly_report.txt', 'misc/notes.md', 'misc/photo.txt'])
+
+
+def search(client, query, **params):
+    response = client.get('/api/search', query_string={'q': query, **params})
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def names(result):
+    return sorted(item['name'].split('/')[-1] for item in result['files'])
+
+
+def test_name_and_path_prefix_search(client, files, file_manager):
+    assert file_manager.database.fts_enabled
+    assert names(search(client, 'quart')) == ['quarterly_report.txt']
+    assert names(search(client, 'misc')) == ['notes.md', 'photo.txt']
+    # 多个词之间为AND
+    assert names(search(client, 'misc notes')) == ['notes.md']
+    assert search(client, 'nothing')['total'] == 0
+    assert client.get('/api/search').status_code == 400
+
+
+def test_content_search_after_indexing(client, files, file_manager):
+    assert search(client, 'revenue')['total'] == 0
+
+    indexer = SearchIndexer(file_manager, {'txt', 'md'})
+    assert indexer.run_once() == 3
+    assert indexer.indexed_count == 2 and indexer.skipped_count == 1
+
+    result = search(client, 'revenue north')
+    assert names(result) == ['quarterly_report.txt']
+    assert 'revenue' in result['files'][0]['snippet']
+    assert search(client, 'binary')['total'] == 0
+
+
+def test_substring_fallback_and_paging(client, file_manager):
+    # secure_filename 会去掉中文，中文名称通过相对路径保留
+    upload(client, [(f'{i}.txt', b'x') for i in range(3)], paths=[f'logs/日志记录{i}.txt' for i in range(3)])
+    # “记录”位于词中间，全文索引前缀匹配不到，退化为子串匹配
+    result = search(client, '记录', per_page=2)
+    assert result['total'] == 3 and len(result['files']) == 2
+    assert len(search(client, '记录', per_page=2, page=2)['files']) == 1
+
+
+def test_deleted_files_leave_the_index(client, files, file_manager):
+    file_id = search(client, 'quarterly')['files'][0]['id']
+    assert client.delete(f'/api/delete/{file_id}').status_code == 200
+    assert search(client, 'quarterly')['total'] == 0
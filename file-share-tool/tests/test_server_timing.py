@@ -0,0 +1,52 @@
+"""请求耗时分段：嵌套阶段只计自身耗时，Server-Timing 响应头和请求日志带各阶段耗时"""
+import time
+
+from conftest import upload
+from utils.timing import RequestTimings, DB, FS, COMPRESS, SERIALIZE
+
+
+def parse_server_timing(value):
+    metrics = {}
+    for item in value.split(','):
+        name, dur = item.strip().split(';dur=')
+        metrics[name] = float(dur)
+    return metrics
+
+
+def test_nested_phases_count_self_time_only():
+    timings = RequestTimings()
+    timings.enter(FS)
+    time.sleep(0.02)
+    timings.enter(DB)
+    time.sleep(0.05)
+    timings.exit()
+    timings.exit()
+
+    breakdown = timings.breakdown()
+    assert breakdown[DB]['ms'] >= 50
+    assert 20 <= breakdown[FS]['ms'] < 50
+    assert breakdown[FS]['count'] == breakdown[DB]['count'] == 1
+    # 未发生的阶段不出现在响应头中
+    metrics = parse_server_timing(timings.header(timings.total_ms()))
+    assert set(metrics) == {FS, DB, 'total'}
+    assert metrics[FS] + metrics[DB] <= metrics['total']
+
+
+def test_api_responses_carry_server_timing(client, caplog):
+    upload(client, [('a.txt', b'a' * 1000)], paths=['docs/a.txt'])
+
+    metrics = parse_server_timing(client.get('/api/files').headers['Server-Timing'])
+    assert {DB, SERIALIZE, 'total'} <= set(metrics)
+
+    caplog.clear()
+    response = client.get('/api/download-folder/docs')
+    assert response.status_code == 200
+    metrics = parse_server_timing(response.headers['Server-Timing'])
+    assert {COMPRESS, 'total'} <= set(metrics)
+    [record] = [r for r in caplog.records if getattr(r, 'path', None) == '/api/download-folder/docs']
+    assert record.timings[COMPRESS]['count'] >= 1
+
+
+def test_header_can_be_disabled(app_factory):
+    client = app_factory(SERVER_TIMING_ENABLED=False).test_client()
+    assert 'Server-Timing' not in client.get('/api/files').headers
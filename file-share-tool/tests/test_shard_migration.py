@@ -0,0 +1,70 @@
+"""上传目录分片：新文件写入分片子目录，旧的平铺文件由后台迁移移动并更新数据库"""
+import os
+import hashlib
+
+import pytest
+
+from conftest import upload
+from utils.file_manager import FileManager
+from utils.shard_migration import ShardMigrator
+
+
+@pytest.fixture
+def manager(tmp_path):
+    (tmp_path / 'uploads').mkdir()
+    return FileManager(str(tmp_path / 'uploads'), {'txt'}, shard_depth=2, shard_width=2)
+
+
+def add_flat_file(manager, file_id, content=b'legacy'):
+    """模拟分片之前的旧文件：直接位于上传目录下"""
+    stored_name = f'{file_id}.txt'
+    flat_path = os.path.join(manager.upload_folder, stored_name)
+    with open(flat_path, 'wb') as f:
+        f.write(content)
+    metadata = manager._build_metadata(file_id, stored_name, flat_path, len(content), 'old.txt', 'old.txt')
+    assert manager.database.save_file_metadata(metadata)
+    return flat_path
+
+
+def shard_dirs(stored_name):
+    digest = hashlib.md5(stored_name.split('.', 1)[0].encode()).hexdigest()
+    return [digest[:2], digest[2:4]]
+
+
+def test_blob_path_is_sharded(manager):
+    path = manager.blob_path('abcdef12-0000.txt')
+    assert os.path.relpath(path, manager.upload_folder) == os.path.join(*shard_dirs('abcdef12-0000'), 'abcdef12-0000.txt')
+
+
+def test_upload_writes_into_shard(client, file_manager):
+    response = upload(client, [('a.txt', b'data')])
+    metadata = file_manager.get_file_metadata(response.json['uploaded_files'][0]['id'])
+    relative = os.path.relpath(metadata['file_path'], file_manager.upload_folder)
+    assert relative.split(os.sep) == shard_dirs(metadata['stored_name']) + [metadata['stored_name']]
+
+
+def test_migration_moves_flat_files(manager):
+    flat_paths = [add_flat_file(manager, f'{index:02d}aa0000-{index}') for index in range(3)]
+    migrator = ShardMigrator(manager, batch_size=2, pause_seconds=0)
+    migrator.run()
+
+    assert migrator.scanned_count == 3 and migrator.moved_count == 3
+    for flat_path in flat_paths:
+        assert not os.path.exists(flat_path)
+    for metadata in manager.get_file_list():
+        assert metadata['file_path'] == manager.blob_path(metadata['stored_name'])
+        with manager.open_stored(metadata) as f:
+            assert f.read() == b'legacy'
+
+    # 再次运行没有需要移动的文件
+    migrator = ShardMigrator(manager, pause_seconds=0)
+    migrator.run()
+    assert migrator.moved_count == 0
+
+
+def test_moved_file_is_found_before_database_update(manager):
+    flat_path = add_flat_file(manager, 'ffee0000-1')
+    metadata = manager.get_file_metadata('ffee0000-1')
+    # 文件已移动、数据库尚未更新
+    os.replace(flat_path, manager.blob_path(metadata['stored_name'], create_dirs=True))
+    assert manager.resolve_file_path(metadata) == manager.blob_path(metadata['stored_name'])
@@ -0,0 +1,211 @@
+"""存储后端：本地目录，以及通过 client_factory 使用进程内S3模拟客户端的对象存储"""
+import io
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from utils.file_manager import FileManager
+from utils.storage_backend import LocalStorageBackend, S3StorageBackend, S3_MIN_PART_SIZE
+
+
+class FakeClientError(Exception):
+    """与botocore ClientError相同的 response 结构"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3Client:
+    """进程内的S3模拟客户端，实现存储后端用到的接口"""
+
+    def __init__(self, fail_part=None):
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+        self.calls = []
+        self.fail_part = fail_part
+        self._lock = threading.Lock()
+        self._next_upload = 0
+
+    def _record(self, name):
+        with self._lock:
+            self.calls.append(name)
+
+    def put_object(self, Bucket, Key, Body):
+        self._record('put_object')
+        self.objects[Key] = bytes(Body)
+
+    def create_multipart_upload(self, Bucket, Key):
+        self._record('create_multipart_upload')
+        with self._lock:
+            self._next_upload += 1
+            upload_id = f'upload-{self._next_upload}'
+            self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._record('upload_part')
+        if PartNumber == self.fail_part:
+            raise FakeClientError('InternalError')
+        self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {'ETag': f'"{UploadId}-{PartNumber}"'}
+
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource, CopySourceRange):
+        self._record('upload_part_copy')
+        start, end = (int(x) for x in CopySourceRange[len('bytes='):].split('-'))
+        self.uploads[UploadId][PartNumber] = self.objects[CopySource['Key']][start:end + 1]
+        return {'CopyPartResult': {'ETag': f'"{UploadId}-{PartNumber}"'}}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._record('complete_multipart_upload')
+        parts = self.uploads.pop(UploadId)
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        assert numbers == sorted(parts)
+        self.objects[Key] = b''.join(parts[number] for number in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._record('abort_multipart_upload')
+        self.uploads.pop(UploadId, None)
+        self.aborted.append(UploadId)
+
+    def get_object(self, Bucket, Key, Range=None):
+        if Key not in self.objects:
+            raise FakeClientError('NoSuchKey')
+        data = self.objects[Key]
+        if Range:
+            start, _, end = Range[len('bytes='):].partition('-')
+            data = data[int(start):int(end) + 1 if end else None]
+        return {'Body': io.BytesIO(data)}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise FakeClientError('404')
+        return {'ContentLength': len(self.objects[Key]), 'LastModified': datetime.now(timezone.utc)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self._record('copy_object')
+        self.objects[Key] = self.objects[CopySource['Key']]
+
+
+@pytest.fixture
+def s3_client():
+    return FakeS3Client()
+
+
+@pytest.fixture
+def s3(s3_client):
+    return S3StorageBackend('bucket', prefix='files', multipart_chunksize=S3_MIN_PART_SIZE,
+                            max_concurrency=2, client_factory=lambda: s3_client)
+
+
+def test_small_object_uses_single_put(s3, s3_client):
+    assert s3.put('a.txt', io.BytesIO(b'hello')) == 5
+    assert s3_client.objects['files/a.txt'] == b'hello'
+    assert 'create_multipart_upload' not in s3_client.calls
+    assert s3.stat('a.txt').size == 5
+    assert s3.open('a.txt', 1, 3).read() == b'ell'
+    assert s3.stat('missing') is None
+    with pytest.raises(FileNotFoundError):
+        s3.open('missing')
+
+
+def test_writer_streams_parts_without_local_files(s3_client, tmp_path):
+    s3 = S3StorageBackend('bucket', prefix='files', multipart_chunksize=S3_MIN_PART_SIZE,
+                          max_concurrency=1, client_factory=lambda: s3_client)
+    content = bytes(range(256)) * (S3_MIN_PART_SIZE * 5 // 2 // 256)
+    writer = s3.open_writer('big.bin')
+    for start in range(0, len(content), 1024 * 1024):
+        writer.write(content[start:start + 1024 * 1024])
+    # 写入过程中已满的分片已经上传（同时只上传一个分片，提交第二个分片前第一个已完成）
+    assert s3_client.calls.count('upload_part') >= 1
+    writer.close()
+
+    assert writer.tell() == len(content)
+    assert s3_client.objects['files/big.bin'] == content
+    assert s3_client.calls.count('upload_part') == 3
+    assert s3_client.uploads == {}
+    assert not any(tmp_path.iterdir())
+
+
+def test_failed_part_aborts_multipart_upload(s3_client):
+    s3_client.fail_part = 2
+    s3 = S3StorageBackend('bucket', multipart_chunksize=S3_MIN_PART_SIZE, max_concurrency=1,
+                          client_factory=lambda: s3_client)
+    writer = s3.open_writer('big.bin')
+    with pytest.raises(Exception):
+        for _ in range(4):
+            writer.write(b'x' * S3_MIN_PART_SIZE)
+        writer.close()
+    assert s3_client.aborted == ['upload-1']
+    assert s3_client.uploads == {}
+    assert 'big.bin' not in s3_client.objects
+
+
+def test_abort_discards_pending_upload(s3, s3_client):
+    writer = s3.open_writer('big.bin')
+    writer.write(b'x' * (S3_MIN_PART_SIZE + 10))
+    writer.abort()
+    assert s3_client.aborted == ['upload-1']
+    assert s3_client.objects == {}
+
+
+def test_copy(s3, s3_client):
+    s3.put('a.txt', io.BytesIO(b'data'))
+    s3.copy('a.txt', 'b.txt')
+    assert s3_client.objects['files/b.txt'] == b'data'
+    with pytest.raises(FileNotFoundError):
+        s3.copy('missing', 'c.txt')
+
+
+def test_file_manager_uploads_to_s3(tmp_path, s3, s3_client):
+    (tmp_path / 'uploads').mkdir()
+    manager = FileManager(str(tmp_path / 'uploads'), {'txt', 'bin'}, storage=s3)
+    content = b'0123456789' * (S3_MIN_PART_SIZE // 5)
+    with manager.upload_transaction() as txn:
+        writer = manager.open_upload('big.bin')
+        for start in range(0, len(content), 65536):
+            writer.write(content[start:start + 65536])
+        metadata = txn.add(writer)
+
+    assert metadata['file_path'] == f"s3://bucket/files/{metadata['stored_name']}"
+    assert metadata['content_hash'] == hashlib.sha256(content).hexdigest()
+    assert s3_client.objects[f"files/{metadata['stored_name']}"] == content
+    # 上传目录中只有数据库，没有暂存文件
+    assert all(path.name.startswith('metadata.db') for path in (tmp_path / 'uploads').iterdir())
+
+
+def test_file_manager_rollback_aborts_s3_upload(tmp_path, s3, s3_client):
+    (tmp_path / 'uploads').mkdir()
+    manager = FileManager(str(tmp_path / 'uploads'), {'txt', 'bin'}, storage=s3)
+    with pytest.raises(RuntimeError):
+        with manager.upload_transaction() as txn:
+            done = manager.open_upload('done.txt')
+            done.write(b'small')
+            txn.add(done)
+            partial = manager.open_upload('partial.bin')
+            partial.write(b'y' * (S3_MIN_PART_SIZE + 1))
+            raise RuntimeError('client disconnected')
+    partial.abort()
+    assert s3_client.objects == {}
+    assert s3_client.uploads == {}
+
+
+def test_local_writer_renames_on_close(tmp_path):
+    storage = LocalStorageBackend(str(tmp_path))
+    writer = storage.open_writer('abc.txt')
+    writer.write(b'data')
+    assert storage.stat('abc.txt') is None
+    writer.close()
+    assert storage.open('abc.txt').read() == b'data'
+
+    writer = storage.open_writer('def.txt')
+    writer.write(b'data')
+    writer.abort()
+    assert storage.stat('def.txt') is None
+    assert [blob.key for blob in storage.list()] == ['abc.txt']
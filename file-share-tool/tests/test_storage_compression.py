@@ -0,0 +1,68 @@
+"""存储压缩：文本类文件以gzip存储，按客户端是否接受gzip发送，解压发送时仍支持Range"""
+import gzip
+
+import pytest
+
+from config import Config
+from conftest import upload
+
+CONTENT = b''.join(b'line %06d: some log output\n' % i for i in range(5000))
+
+
+def test_compression_is_disabled_by_default():
+    assert Config.STORAGE_COMPRESSION is False
+
+
+@pytest.fixture
+def compressed(app_factory):
+    app = app_factory(STORAGE_COMPRESSION=True)
+    client = app.test_client()
+    response = upload(client, [('app.log', CONTENT)])
+    file_id = response.json['uploaded_files'][0]['id']
+    import app as app_module
+    metadata = app_module.file_manager.get_file_metadata(file_id)
+    assert metadata['storage_codec'] == 'gzip'
+    assert metadata['stored_size'] < len(CONTENT)
+    return client, file_id
+
+
+def download(client, file_id, **headers):
+    return client.get(f'/api/download/{file_id}', headers=headers)
+
+
+def test_gzip_client_receives_stored_data(compressed):
+    client, file_id = compressed
+    response = download(client, file_id, **{'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == CONTENT
+
+
+def test_plain_client_receives_decompressed_data(compressed):
+    client, file_id = compressed
+    response = download(client, file_id)
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert int(response.headers['Content-Length']) == len(CONTENT)
+    assert response.data == CONTENT
+
+
+def test_plain_client_can_resume_download(compressed):
+    client, file_id = compressed
+    response = download(client, file_id, Range='bytes=100000-')
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100000-{len(CONTENT) - 1}/{len(CONTENT)}'
+    assert response.data == CONTENT[100000:]
+
+    response = download(client, file_id, Range='bytes=10-19')
+    assert response.data == CONTENT[10:20]
+
+
+def test_uncompressed_file_supports_range(client):
+    response = upload(client, [('app.log', CONTENT)])
+    file_id = response.json['uploaded_files'][0]['id']
+    response = download(client, file_id, Range='bytes=5-9', **{'Accept-Encoding': 'gzip'})
+    assert response.status_code == 206
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == CONTENT[5:10]
@@ -0,0 +1,89 @@
+"""存储对账：孤儿文件隔离、悬空记录删除、泄漏的临时ZIP清理"""
+import os
+import time
+import tempfile
+
+import pytest
+
+from utils.archive import TEMP_ZIP_PREFIX
+from utils.file_manager import FileManager
+from utils.storage_reconcile import StorageReconciler, QUARANTINE_DIR
+
+OLD = time.time() - 2 * 86400
+
+
+def age(path):
+    os.utime(path, (OLD, OLD))
+    return path
+
+
+@pytest.fixture
+def layout(tmp_path, monkeypatch):
+    """两个正常文件、一个悬空记录、一个旧孤儿、一个刚写入的孤儿和一个泄漏的临时ZIP"""
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path / 'tmp'))
+    (tmp_path / 'tmp').mkdir()
+    (tmp_path / 'uploads').mkdir()
+    manager = FileManager(str(tmp_path / 'uploads'), {'txt'})
+
+    ids = []
+    with manager.upload_transaction() as txn:
+        for name in ('a.txt', 'b.txt', 'gone.txt'):
+            writer = manager.open_upload(name)
+            writer.write(name.encode())
+            ids.append(txn.add(writer)['id'])
+    os.remove(manager.get_file_metadata(ids[2])['file_path'])
+
+    def orphan(file_id, old):
+        path = manager.blob_path(f'{file_id}.txt', create_dirs=True)
+        with open(path, 'wb') as f:
+            f.write(b'orphan')
+        return age(path) if old else path
+
+    temp_zip = tmp_path / 'tmp' / f'{TEMP_ZIP_PREFIX}leak.zip'
+    temp_zip.write_bytes(b'zip')
+    return {
+        'manager': manager,
+        'ids': ids,
+        'old_orphan': orphan('0123abcd-old', True),
+        'new_orphan': orphan('4567abcd-new', False),
+        'temp_zip': age(str(temp_zip)),
+    }
+
+
+def test_dry_run_only_reports(layout):
+    reconciler = StorageReconciler(layout['manager'], scan_workers=2)
+    report = reconciler.run(dry_run=True)
+    assert (report['db_records'], report['disk_files']) == (3, 4)
+    assert (report['orphans_found'], report['orphans_recent'], report['dangling_found']) == (1, 1, 1)
+    assert report['orphans_handled'] == report['dangling_deleted'] == 0
+    assert report['temp_files_removed'] == 1
+    assert os.path.exists(layout['old_orphan']) and os.path.exists(layout['temp_zip'])
+    assert len(layout['manager'].get_file_list()) == 3
+
+
+def test_run_quarantines_orphans_and_deletes_dangling(layout):
+    manager = layout['manager']
+    reconciler = StorageReconciler(manager, scan_workers=2)
+    report = reconciler.run()
+    assert (report['orphans_handled'], report['dangling_deleted'], report['temp_files_removed']) == (1, 1, 1)
+
+    assert not os.path.exists(layout['old_orphan'])
+    quarantined = [name for _, _, names in os.walk(os.path.join(manager.upload_folder, QUARANTINE_DIR))
+                   for name in names]
+    assert quarantined == ['0123abcd-old.txt']
+    # 宽限期内的文件可能仍在上传中，保留
+    assert os.path.exists(layout['new_orphan'])
+    assert not os.path.exists(layout['temp_zip'])
+    assert sorted(f['id'] for f in manager.get_file_list()) == sorted(layout['ids'][:2])
+    assert reconciler.get_last_report() == report
+
+    # 再次对账没有差异
+    report = reconciler.run()
+    assert report['orphans_found'] == report['dangling_found'] == 0
+
+
+def test_delete_action(layout):
+    report = StorageReconciler(layout['manager'], orphan_action='delete').run()
+    assert report['orphans_handled'] == 1
+    assert not os.path.exists(layout['old_orphan'])
+    assert not os.path.exists(os.path.join(layout['manager'].upload_folder, QUARANTINE_DIR))
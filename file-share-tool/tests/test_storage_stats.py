@@ -0,0 +1,49 @@
+"""存储统计：由触发器维护的计数器提供，不做聚合扫描，可按元数据表重新校对"""
+from datetime import datetime
+
+from conftest import upload
+from utils.metadata_schema import to_epoch_ms
+
+
+def upload_ids(client, files):
+    response = upload(client, files)
+    return [item['id'] for item in response.json['uploaded_files']]
+
+
+def test_counters_follow_inserts_and_deletes(client, file_manager):
+    file_ids = upload_ids(client, [('a.txt', b'aaa'), ('b.txt', b'bb'), ('c.log', b'c')])
+    stats = file_manager.get_storage_info()
+    assert (stats['total_files'], stats['total_size'], stats['stored_size']) == (3, 6, 6)
+    by_extension = {item['extension']: (item['count'], item['total_size']) for item in stats['type_statistics']}
+    assert by_extension == {'txt': (2, 5), 'log': (1, 1)}
+
+    file_manager.delete_file(file_ids[0])
+    file_manager.delete_many(file_ids[1:2])
+    stats = file_manager.get_storage_info()
+    assert (stats['total_files'], stats['total_size']) == (1, 1)
+    assert {item['extension'] for item in stats['type_statistics'] if item['count']} == {'log'}
+
+
+def test_expired_files_are_counted(client, file_manager):
+    file_ids = upload_ids(client, [('a.txt', b'a'), ('b.txt', b'b')])
+    with file_manager.database.get_connection() as conn:
+        # 一个在早于当前小时的分桶中，一个在当前小时内刚刚过期
+        conn.execute('UPDATE files SET expire_time = expire_time - 2 * 86400000 WHERE id = ?', (file_ids[0],))
+        conn.execute('UPDATE files SET expire_time = ? WHERE id = ?', (to_epoch_ms(datetime.now()) - 1, file_ids[1]))
+        conn.commit()
+    assert file_manager.get_storage_info()['expired_files'] == 2
+
+
+def test_reconcile_fixes_drift(client, file_manager):
+    upload_ids(client, [('a.txt', b'aaa')])
+    result = file_manager.reconcile_storage_stats()
+    assert result['drifted'] is False
+
+    with file_manager.database.get_connection() as conn:
+        conn.execute('UPDATE storage_stats SET total_files = 10, total_size = 99 WHERE id = 1')
+        conn.commit()
+    result = file_manager.reconcile_storage_stats()
+    assert result['drifted'] is True
+    assert (result['previous_total_files'], result['total_files'], result['total_size']) == (10, 1, 3)
+    stats = file_manager.get_storage_info()
+    assert (stats['total_files'], stats['total_size']) == (1, 3)
@@ -0,0 +1,44 @@
+"""上传清单：服务器已有相同内容的文件直接创建记录，只上传缺少的文件"""
+import hashlib
+import os
+
+from conftest import upload
+
+
+def entry(path, content):
+    return {'path': path, 'size': len(content), 'hash': hashlib.sha256(content).hexdigest()}
+
+
+def test_known_content_is_not_uploaded_again(client, file_manager):
+    known = b'already on the server'
+    source_id = upload(client, [('known.txt', known)]).json['uploaded_files'][0]['id']
+
+    response = client.post('/api/upload/manifest', json={'files': [
+        entry('docs/copy.txt', known),
+        entry('docs/new.txt', b'not uploaded yet'),
+        dict(entry('docs/size.txt', known), size=len(known) + 1),
+        entry('docs/.hidden', known),
+        {'path': 'docs/bad.txt', 'size': 1, 'hash': 'xyz'},
+    ]})
+    assert response.status_code == 200
+    assert response.json['missing'] == [1, 2, 3, 4]
+    [saved] = response.json['uploaded_files']
+    assert saved['name'] == 'docs/copy.txt'
+
+    copy = file_manager.get_file_metadata(saved['id'])
+    source = file_manager.get_file_metadata(source_id)
+    assert copy['content_hash'] == source['content_hash']
+    assert copy['stored_name'] != source['stored_name']
+    assert client.get(f"/api/download/{saved['id']}").data == known
+
+    # 两个文件的数据相互独立，删除源文件不影响副本
+    assert client.delete(f'/api/delete/{source_id}').status_code == 200
+    assert client.get(f"/api/download/{saved['id']}").data == known
+    assert os.path.exists(copy['file_path'])
+
+
+def test_manifest_validation(client, app):
+    assert client.post('/api/upload/manifest', json={'files': []}).status_code == 400
+    app.config['UPLOAD_MANIFEST_MAX_ENTRIES'] = 1
+    files = [entry('a.txt', b'a'), entry('b.txt', b'b')]
+    assert client.post('/api/upload/manifest', json={'files': files}).status_code == 400
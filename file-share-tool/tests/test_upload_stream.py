@@ -0,0 +1,131 @@
+"""流式multipart上传：分片直接写入最终位置，边写边统计大小和哈希"""
+import os
+import hashlib
+
+import pytest
+
+from conftest import upload, multipart_body, MULTIPART_BOUNDARY as BOUNDARY
+from utils.exceptions import FileUploadException
+from utils.upload_stream import parse_upload_stream
+
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+
+
+class MemoryWriter:
+    def __init__(self, filename):
+        self.filename = filename
+        self.data = bytearray()
+        self.closed = False
+        self.aborted = False
+
+    def write(self, data):
+        self.data += data
+
+    def close(self):
+        self.closed = True
+
+    def abort(self):
+        self.aborted = True
+
+
+def reader(body):
+    offset = 0
+
+    def read(size):
+        nonlocal offset
+        chunk = body[offset:offset + size]
+        offset += len(chunk)
+        return chunk
+    return read
+
+
+def test_parser_splits_parts_across_small_chunks():
+    content = bytes(range(256)) * 300
+    body = multipart_body([('a.bin', content), ('b.txt', b'hello')], fields=[('paths', 'dir/a.bin')])
+    writers = []
+
+    def open_part(filename, index):
+        writers.append(MemoryWriter(filename))
+        return writers[-1]
+
+    parser = parse_upload_stream(reader(body), CONTENT_TYPE, open_part, chunk_size=7)
+    assert [index for index, _ in parser.parts] == [0, 1]
+    assert bytes(writers[0].data) == content and writers[0].closed
+    assert bytes(writers[1].data) == b'hello' and writers[1].closed
+    assert parser.fields == {'paths': ['dir/a.bin']}
+
+
+def test_parser_skips_rejected_parts():
+    body = multipart_body([('a.exe1', b'x'), ('b.txt', b'y')])
+    parser = parse_upload_stream(
+        reader(body), CONTENT_TYPE,
+        lambda filename, index: None if filename.endswith('exe1') else MemoryWriter(filename)
+    )
+    assert parser.skipped == [(0, 'a.exe1')]
+    assert [index for index, _ in parser.parts] == [1]
+
+
+def test_truncated_body_aborts_open_writers():
+    body = multipart_body([('a.txt', b'x' * 1000)])[:-200]
+    writers = []
+
+    def open_part(filename, index):
+        writers.append(MemoryWriter(filename))
+        return writers[-1]
+
+    with pytest.raises(FileUploadException):
+        parse_upload_stream(reader(body), CONTENT_TYPE, open_part, chunk_size=64)
+    assert writers and all(writer.aborted for writer in writers)
+
+
+def test_upload_writes_blob_with_size_and_hash(client, file_manager):
+    content = b'streamed upload ' * 100000
+    response = upload(client, [('big.bin', content)])
+    assert response.status_code == 200, response.json
+    file_id = response.json['uploaded_files'][0]['id']
+
+    metadata = file_manager.get_file_metadata(file_id)
+    assert metadata['file_size'] == len(content)
+    assert metadata['content_hash'] == hashlib.sha256(content).hexdigest()
+    # 写入分片目录中的最终位置
+    path = file_manager.blob_path(metadata['stored_name'])
+    assert path == metadata['file_path']
+    with open(path, 'rb') as f:
+        assert f.read() == content
+
+
+def stored_blobs(upload_folder):
+    return [
+        name for _, _, names in os.walk(upload_folder)
+        for name in names if not name.startswith(('metadata.db', '.'))
+    ]
+
+
+def test_failure_while_adding_parts_removes_all_files(client, file_manager, monkeypatch):
+    build_metadata = file_manager._build_metadata
+
+    def failing(file_id, stored_filename, file_path, file_size, original_filename, *args):
+        if original_filename == 'b.txt':
+            raise ValueError('bad name')
+        return build_metadata(file_id, stored_filename, file_path, file_size, original_filename, *args)
+
+    monkeypatch.setattr(file_manager, '_build_metadata', failing)
+    response = upload(client, [('a.txt', b'a'), ('b.txt', b'b'), ('c.txt', b'c')])
+    assert response.status_code == 500
+    assert stored_blobs(file_manager.upload_folder) == []
+    assert client.get('/api/files').json['files'] == []
+
+
+def test_writer_failing_to_close_is_rolled_back(file_manager, monkeypatch):
+    with pytest.raises(OSError):
+        with file_manager.upload_transaction() as txn:
+            txn.add(file_manager.open_upload('a.txt'))
+            writer = file_manager.open_upload('b.txt')
+            writer.write(b'data')
+
+            def fail():
+                writer._fp.close()
+                raise OSError('disk full')
+            monkeypatch.setattr(writer, '_finish', fail)
+            txn.add(writer)
+    assert stored_blobs(file_manager.upload_folder) == []
@@ -0,0 +1,272 @@
+"""
+ZIP压缩包构建模块
+
+已压缩格式（视频、图片、压缩包等）直接以STORE方式写入；
+可压缩的大文件在进程池中并行做deflate，最后按原顺序拼装进ZIP；
+以gzip存储的文件直接复制其中的deflate数据，不解压也不重新压缩。
+"""
+import io
+import os
+import sys
+import shutil
+import multiprocessing
+import tempfile
+import zipfile
+import zlib
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from .storage_codec import (
+    CODEC_GZIP, COMPRESSED_EXTENSIONS, SAMPLE_SIZE, sample_is_compressible, open_blob, gzip_member_info
+)
+from .timing import timed, COMPRESS
+
+# 临时ZIP文件名前缀，便于识别和清理
+TEMP_ZIP_PREFIX = 'fileshare_'
+
+# 小于该大小的文件在当前进程内压缩，不值得投递到进程池
+PARALLEL_MIN_FILE_SIZE = 1024 * 1024  # 1MB
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# 直接写入已压缩的成员数据依赖 zipfile 的内部实现（_writecheck、start_dir 等），
+# 只在验证过的版本上使用；其他版本走公开的 ZipFile.open(zinfo, 'w')，在当前进程内解压/压缩
+RAW_MEMBER_SUPPORTED = sys.version_info < (3, 13) and all(
+    hasattr(zipfile.ZipFile, name) for name in ('_writecheck', '_open_to_write')
+)
+
+# 进程池的启动方式：服务进程有多个线程，fork 出的子进程可能继承被其他线程持有的锁
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# ZIP成员：codec 为文件的存储编码，size 为原始大小（存储编码不为空时用于ZIP64判断）
+ArchiveEntry = namedtuple('ArchiveEntry', 'path arcname extension codec size', defaults=(None, None))
+
+
+def is_compressible(file_path, extension=None):
+    """判断文件是否值得deflate：先看扩展名，再抽样测试压缩率"""
+    if extension and extension.lower() in COMPRESSED_EXTENSIONS:
+        return False
+
+    try:
+        file_size = os.path.getsize(file_path)
+        if file_size == 0:
+            return False
+
+        with open(file_path, 'rb') as f:
+            # 从文件中部取样，避开文件头等高度重复的数据
+            if file_size > SAMPLE_SIZE * 2:
+                f.seek(file_size // 2)
+            sample = f.read(SAMPLE_SIZE)
+    except OSError:
+        return True
+
+    return sample_is_compressible(sample)
+
+
+def deflate_to_file(src_path, dest_dir, level):
+    """把文件压缩为原始deflate数据流，返回 (临时文件路径, CRC, 原大小, 压缩后大小)
+
+    在子进程中执行，只做文件读写和压缩。
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    crc = 0
+    file_size = 0
+    compress_size = 0
+
+    fd, raw_path = tempfile.mkstemp(prefix=TEMP_ZIP_PREFIX, suffix='.deflate', dir=dest_dir)
+    with os.fdopen(fd, 'wb') as dest, open(src_path, 'rb') as src:
+        while True:
+            chunk = src.read(COPY_BUFFER_SIZE)
+            if not chunk:
+                break
+            file_size += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+            data = compressor.compress(chunk)
+            if data:
+                dest.write(data)
+                compress_size += len(data)
+        data = compressor.flush()
+        dest.write(data)
+        compress_size += len(data)
+
+    return raw_path, crc, file_size, compress_size
+
+
+def set_compress_level(zinfo, level):
+    """设置成员的deflate压缩级别（3.13起为公开属性 compress_level）"""
+    if hasattr(zinfo, 'compress_level'):
+        zinfo.compress_level = level
+    else:
+        zinfo._compresslevel = level
+
+
+def write_raw_member(zipf, zinfo, raw_path, offset=0):
+    """把已经压缩好的数据作为一个成员写入ZIP
+
+    zinfo 需要预先设置 CRC、file_size、compress_size 和 compress_type，
+    从 raw_path 的 offset 处复制 compress_size 字节。
+    写入流程与 ZipFile._open_to_write / _ZipWriteFile.close 一致，仅在 RAW_MEMBER_SUPPORTED 时可用。
+    """
+    zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+    with zipf._lock:
+        zipf.fp.seek(zipf.start_dir)
+        zinfo.header_offset = zipf.fp.tell()
+        zipf._writecheck(zinfo)
+        zipf._didModify = True
+        zipf.fp.write(zinfo.FileHeader(zip64))
+        with open(raw_path, 'rb') as raw:
+            raw.seek(offset)
+            remaining = zinfo.compress_size
+            while remaining > 0:
+                chunk = raw.read(min(COPY_BUFFER_SIZE, remaining))
+                if not chunk:
+                    raise IOError(f"压缩数据不完整: {raw_path}")
+                zipf.fp.write(chunk)
+                remaining -= len(chunk)
+        zipf.filelist.append(zinfo)
+        zipf.NameToInfo[zinfo.filename] = zinfo
+        zipf.start_dir = zipf.fp.tell()
+
+
+class TempFileReader(io.FileIO):
+    """只读打开临时文件，关闭时删除该文件
+
+    send_file 的响应是 direct_passthrough，WSGI服务器直接迭代文件对象，
+    response.call_on_close 注册的回调不会被调用；而服务器（及ASGI入口）在发送完成
+    或客户端断开后一定会关闭文件对象，因此在 close() 中删除临时文件。
+    """
+
+    def __init__(self, path):
+        super().__init__(path, 'rb')
+        self.path = path
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class ArchiveBuilder:
+    """ZIP压缩包构建器"""
+
+    def __init__(self, compress_level=6, max_workers=None, store_extensions=None):
+        self.compress_level = compress_level
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.store_extensions = store_extensions or COMPRESSED_EXTENSIONS
+        self._pool = None
+        self._pool_pid = None
+
+    def _get_pool(self):
+        """懒加载进程池，fork后的子进程重新创建"""
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(POOL_START_METHOD)
+            )
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+    def _should_deflate(self, file_path, extension):
+        """决定成员使用的压缩方式"""
+        if self.compress_level == 0:
+            return False
+        if extension and extension.lower() in self.store_extensions:
+            return False
+        return is_compressible(file_path)
+
+    @timed(COMPRESS)
+    def build(self, entries, dest_path=None, progress=None):
+        """构建ZIP文件
+
+        entries: 可迭代的 ArchiveEntry 或 (源文件路径, ZIP内名称, 扩展名)，按此顺序写入
+        dest_path: 目标路径，为空时创建临时文件
+        progress: 每写入一个成员后调用 progress(已写入成员数, 成员总数)，抛出异常时中止构建
+
+        返回 (ZIP文件路径, 写入的成员数)
+        """
+        if dest_path is None:
+            fd, dest_path = tempfile.mkstemp(prefix=TEMP_ZIP_PREFIX, suffix='.zip')
+            os.close(fd)
+
+        work_dir = tempfile.mkdtemp(prefix=TEMP_ZIP_PREFIX, dir=os.path.dirname(dest_path))
+        plan = []
+        try:
+            # 规划每个成员的压缩方式，大的可压缩文件投递到进程池
+            # plan 中的任务：None 为直接写入，Future 为进程池压缩结果，整数为gzip中deflate数据的偏移
+            for entry in entries:
+                file_path, arcname, extension, codec, size = ArchiveEntry(*entry)
+                if not os.path.exists(file_path):
+                    continue
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                if codec is not None:
+                    if size is not None:
+                        zinfo.file_size = size
+                    if codec == CODEC_GZIP and self.compress_level != 0 and RAW_MEMBER_SUPPORTED:
+                        offset, zinfo.compress_size, zinfo.CRC, isize = gzip_member_info(file_path)
+                        if size is None:
+                            zinfo.file_size = isize
+                        zinfo.compress_type = zipfile.ZIP_DEFLATED
+                        plan.append((file_path, codec, zinfo, offset))
+                    elif codec == CODEC_GZIP and self.compress_level != 0:
+                        # 不能直接复制deflate数据时解压后重新压缩
+                        zinfo.compress_type = zipfile.ZIP_DEFLATED
+                        set_compress_level(zinfo, self.compress_level)
+                        plan.append((file_path, codec, zinfo, None))
+                    else:
+                        # 不压缩时解压后原样写入
+                        zinfo.compress_type = zipfile.ZIP_STORED
+                        plan.append((file_path, codec, zinfo, None))
+                elif not self._should_deflate(file_path, extension):
+                    zinfo.compress_type = zipfile.ZIP_STORED
+                    plan.append((file_path, None, zinfo, None))
+                elif (zinfo.file_size >= PARALLEL_MIN_FILE_SIZE and self.max_workers > 1
+                      and RAW_MEMBER_SUPPORTED):
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                    future = self._get_pool().submit(
+                        deflate_to_file, file_path, work_dir, self.compress_level
+                    )
+                    plan.append((file_path, None, zinfo, future))
+                else:
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                    set_compress_level(zinfo, self.compress_level)
+                    plan.append((file_path, None, zinfo, None))
+
+            # 按原顺序拼装
+            with zipfile.ZipFile(dest_path, 'w', allowZip64=True) as zipf:
+                for index, (file_path, codec, zinfo, job) in enumerate(plan):
+                    if job is None:
+                        with open_blob(file_path, codec) as src, zipf.open(zinfo, 'w') as dest:
+                            shutil.copyfileobj(src, dest, COPY_BUFFER_SIZE)
+                    elif not isinstance(job, Future):
+                        write_raw_member(zipf, zinfo, file_path, job)
+                    else:
+                        raw_path, crc, file_size, compress_size = job.result()
+                        try:
+                            zinfo.CRC = crc
+                            zinfo.file_size = file_size
+                            zinfo.compress_size = compress_size
+                            write_raw_member(zipf, zinfo, raw_path)
+                        finally:
+                            os.remove(raw_path)
+                    if progress:
+                        progress(index + 1, len(plan))
+
+            return dest_path, len(plan)
+
+        except Exception:
+            for _, _, _, job in plan:
+                if isinstance(job, Future):
+                    job.cancel()
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            raise
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,192 @@
+"""
+文件夹ZIP缓存模块
+
+文件夹压缩包按“内容版本”（文件ID、路径、大小和内容哈希）缓存在磁盘上，同一版本只构建一次。
+同一时刻的并发请求等待正在进行的构建（single-flight），不会重复打包；
+进程内用线程锁，多个gunicorn worker之间用文件锁协调。
+缓存按总字节数做LRU淘汰，文件夹内容变化后旧版本立即删除，没有缓存文件的文件夹的锁文件一并删除。
+"""
+import os
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from .logging_config import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，只做进程内协调
+    fcntl = None
+
+# 刚被访问过的缓存文件在该时间内不会被淘汰，避免删除正在准备发送的文件
+EVICT_GRACE_SECONDS = 60
+
+
+class ArchiveCache:
+    """文件夹ZIP磁盘缓存"""
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.logger = get_logger()
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def folder_version(files):
+        """根据文件ID、相对路径、大小和内容哈希计算文件夹内容版本"""
+        digest = hashlib.sha1()
+        for file_id, relative_path, file_size, content_hash in sorted(
+            (f['id'], f.get('relative_path') or '', f['file_size'], f.get('content_hash') or '') for f in files
+        ):
+            digest.update(f"{file_id}:{relative_path}:{file_size}:{content_hash}\n".encode())
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def folder_key(folder_path):
+        """文件夹路径对应的缓存文件名前缀"""
+        return hashlib.sha1(folder_path.encode('utf-8')).hexdigest()[:16]
+
+    def _archive_path(self, folder_key, version):
+        return os.path.join(self.cache_dir, f"{folder_key}_{version}.zip")
+
+    def _lock_path(self, folder_key):
+        return os.path.join(self.cache_dir, f"{folder_key}.lock")
+
+    def _thread_lock(self, name):
+        with self._locks_guard:
+            lock = self._locks.get(name)
+            if lock is None:
+                lock = self._locks[name] = threading.Lock()
+            return lock
+
+    @contextmanager
+    def _build_lock(self, name):
+        """同一缓存项的构建锁：进程内线程锁 + 跨进程文件锁"""
+        with self._thread_lock(name):
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path(name), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _touch(path):
+        """更新访问时间（用mtime记录），作为LRU依据"""
+        try:
+            os.utime(path, None)
+            return True
+        except OSError:
+            return False
+
+    def get_or_build(self, folder_path, files, build):
+        """获取文件夹的ZIP缓存，不存在时调用 build(dest_path) 构建
+
+        返回缓存文件路径，构建失败时返回None。
+        """
+        folder_key = self.folder_key(folder_path)
+        version = self.folder_version(files)
+        archive_path = self._archive_path(folder_key, version)
+
+        # 命中缓存
+        if self._touch(archive_path):
+            return archive_path
+
+        with self._build_lock(folder_key):
+            # 等待期间可能已被其他线程或进程构建完成
+            if self._touch(archive_path):
+                return archive_path
+
+            tmp_path = f"{archive_path}.{os.getpid()}.tmp"
+            try:
+                if not build(tmp_path):
+                    return None
+                os.replace(tmp_path, archive_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            self.logger.info(f"文件夹ZIP已缓存: {folder_path} -> {archive_path}")
+            self._remove_versions(folder_key, keep=archive_path)
+
+        self.evict()
+        return archive_path
+
+    def _remove_versions(self, folder_key, keep=None):
+        """删除文件夹的旧版本缓存"""
+        prefix = f"{folder_key}_"
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith(prefix) and entry.name.endswith('.zip') and entry.path != keep:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def _remove_lock(self, folder_key):
+        """删除没有进程持有的锁文件
+
+        其他进程恰好在打开旧锁文件之后、加锁之前时，可能与新建锁文件的进程同时构建，
+        两者写入各自的临时文件再原子替换，结果只是重复构建一次。
+        """
+        if fcntl is None:
+            return
+        lock_path = self._lock_path(folder_key)
+        try:
+            with open(lock_path, 'r') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.remove(lock_path)
+        except OSError:
+            pass
+
+    def invalidate(self, folder_path):
+        """文件夹内容变化（如被删除）时清除其全部缓存和锁文件"""
+        folder_key = self.folder_key(folder_path)
+        self._remove_versions(folder_key)
+        self._remove_lock(folder_key)
+
+    def evict(self):
+        """按最近访问时间淘汰缓存，直到总大小不超过预算；顺带删除已没有缓存文件的锁文件"""
+        entries = []
+        lock_keys = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.lock'):
+                lock_keys.append(entry.name[:-len('.lock')])
+            if not entry.name.endswith('.zip'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        removed = 0
+        now = time.time()
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if now - mtime < EVICT_GRACE_SECONDS:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+                entries.remove((mtime, size, path))
+            except OSError:
+                pass
+
+        # 清理已没有缓存文件的文件夹的锁文件
+        cached_keys = {os.path.basename(path).split('_', 1)[0] for _, _, path in entries}
+        for folder_key in lock_keys:
+            if folder_key not in cached_keys:
+                self._remove_lock(folder_key)
+
+        if removed:
+            self.logger.info(f"淘汰文件夹ZIP缓存 {removed} 个，当前占用 {total} 字节")
+        return removed
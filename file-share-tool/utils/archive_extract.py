@@ -0,0 +1,287 @@
+"""
+服务端解压模块
+
+把已上传的 .zip / .tar(.gz/.bz2/.xz) 压缩包作为后台任务（见 utils.job_queue）解压：成员逐个流式写入存储，
+作为文件夹中的普通文件（relative_path 为 "文件夹/成员路径"），元数据按批次在上传事务中提交。
+
+防止压缩炸弹：限制成员数、解压后的总大小和解压比（解压后大小/压缩包大小），
+按实际写出的字节数检查，不信任压缩包中声明的大小；超出限制或任务被取消时，
+已写入和已提交的文件全部删除。
+"""
+import io
+import os
+import time
+import tarfile
+import zipfile
+from .file_manager import UPLOAD_BUFFER_SIZE
+from .exceptions import FileUploadException, SecurityException
+from .logging_config import get_logger
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+# 解压后小于该大小时不检查解压比，避免小文本包误判
+RATIO_CHECK_MIN_SIZE = 1024 * 1024  # 1MB
+
+
+def archive_format(filename):
+    """根据文件名判断压缩包格式，返回 'zip'、'tar' 或None"""
+    name = (filename or '').lower()
+    if name.endswith('.zip'):
+        return 'zip'
+    if name.endswith(TAR_SUFFIXES):
+        return 'tar'
+    return None
+
+
+def default_folder_name(filename):
+    """解压目标文件夹的默认名称：去掉扩展名的压缩包文件名"""
+    name = os.path.basename((filename or '').replace('\\', '/'))
+    lower = name.lower()
+    for suffix in ('.zip',) + TAR_SUFFIXES:
+        if lower.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return name.strip() or 'archive'
+
+
+def member_path(name):
+    """压缩包成员的安全相对路径；去掉 . 和 ..，隐藏文件和 __MACOSX 返回None"""
+    parts = []
+    for part in name.replace('\\', '/').split('/'):
+        if part in ('', '.', '..'):
+            continue
+        if part.startswith('.') or part == '__MACOSX':
+            return None
+        parts.append(part)
+    return '/'.join(parts) or None
+
+
+class _CountingReader(io.RawIOBase):
+    """统计已读取的压缩包字节数，用于计算tar的解压进度"""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._raw.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.count += n
+        return n
+
+
+class ExtractJob:
+    """一次解压的进度，通过任务上下文报告"""
+
+    def __init__(self, context, archive_size, folder):
+        self.context = context
+        self.archive_size = archive_size
+        self.folder = folder
+        # zip的成员数在开始时已知，tar为None
+        self.total_members = None
+        self.processed_members = 0
+        self.extracted_files = 0
+        self.skipped_members = 0
+        self.extracted_bytes = 0
+        # 已读取的压缩包字节数（tar）
+        self.archive_bytes_read = 0
+
+    def to_dict(self):
+        return {
+            'folder': self.folder,
+            'total_members': self.total_members,
+            'processed_members': self.processed_members,
+            'extracted_files': self.extracted_files,
+            'skipped_members': self.skipped_members,
+            'extracted_bytes': self.extracted_bytes
+        }
+
+    def report(self):
+        """报告进度，任务被取消时抛出 JobCancelled"""
+        if self.total_members:
+            percent = self.processed_members / self.total_members * 100
+        elif self.archive_size:
+            percent = min(self.archive_bytes_read / self.archive_size * 100, 99.9)
+        else:
+            percent = 0.0
+        self.context.progress(percent, f"已解压 {self.extracted_files} 个文件", self.to_dict())
+
+
+class ArchiveExtractor:
+    """解压任务的处理函数（任务类型 extract_archive）"""
+
+    def __init__(self, file_manager, max_members=10000, max_total_size=10 * 1024 ** 3,
+                 max_ratio=200, batch_size=500, on_commit=None):
+        self.file_manager = file_manager
+        # 压缩炸弹限制：成员数、解压后总大小、解压比
+        self.max_members = max_members
+        self.max_total_size = max_total_size
+        self.max_ratio = max_ratio
+        # 每个上传事务提交的文件数
+        self.batch_size = batch_size
+        # 每批文件提交后调用（唤醒内容索引）
+        self.on_commit = on_commit
+        self.logger = get_logger()
+
+    def prepare(self, metadata, folder=None):
+        """检查压缩包并返回任务参数；不是支持的压缩包格式时抛出 FileUploadException"""
+        if archive_format(metadata['original_name']) is None:
+            raise FileUploadException('只支持解压 zip、tar、tar.gz、tar.bz2、tar.xz 格式的压缩包')
+        folder = member_path(folder) if folder else member_path(default_folder_name(metadata['original_name']))
+        if folder is None:
+            raise FileUploadException('目标文件夹名称无效')
+        return {'file_id': metadata['id'], 'folder': folder}
+
+    def __call__(self, context):
+        """执行解压任务，返回解压结果"""
+        metadata = self.file_manager.get_file_metadata(context.payload['file_id'])
+        if not metadata:
+            raise FileUploadException('压缩包文件不存在')
+
+        job = ExtractJob(context, metadata['file_size'], context.payload['folder'])
+        start_time = time.time()
+        committed_ids = []
+        try:
+            self._extract(job, metadata, committed_ids)
+        except Exception:
+            # 失败或取消时删除本任务已提交的文件
+            if committed_ids:
+                self.file_manager.delete_many(committed_ids)
+                self.logger.warning(f"解压任务 {context.id} 未完成，已删除 {len(committed_ids)} 个已解压文件")
+            raise
+
+        self.logger.info(
+            f"解压任务 {context.id} 完成: {metadata['original_name']} -> {job.folder}/，"
+            f"{job.extracted_files} 个文件，{job.extracted_bytes} 字节，跳过 {job.skipped_members} 个成员，"
+            f"耗时 {time.time() - start_time:.1f} 秒"
+        )
+        return job.to_dict()
+
+    def _extract(self, job, metadata, committed_ids):
+        if archive_format(metadata['original_name']) == 'zip':
+            # zip需要随机访问中央目录，远程存储的压缩包先下载到临时文件
+            source = self.file_manager.open_stored(metadata, seekable=True)
+            if source is None:
+                raise FileUploadException('压缩包文件不存在')
+            try:
+                with source, zipfile.ZipFile(source) as archive:
+                    self._extract_zip(job, archive, committed_ids)
+            except zipfile.BadZipFile as e:
+                raise FileUploadException(f'无法读取zip压缩包: {e}')
+        else:
+            source = self.file_manager.open_stored(metadata)
+            if source is None:
+                raise FileUploadException('压缩包文件不存在')
+            counter = _CountingReader(source)
+            try:
+                # 流式读取，不要求可seek
+                with tarfile.open(fileobj=io.BufferedReader(counter, UPLOAD_BUFFER_SIZE), mode='r|*') as archive:
+                    self._extract_tar(job, archive, counter, committed_ids)
+            except tarfile.TarError as e:
+                raise FileUploadException(f'无法读取tar压缩包: {e}')
+            finally:
+                source.close()
+
+    def _extract_zip(self, job, archive, committed_ids):
+        members = archive.infolist()
+        job.total_members = len(members)
+        self._check_member_count(len(members))
+        # 先按声明的大小快速拒绝，写出时再按实际大小检查
+        self._check_total_size(job, sum(info.file_size for info in members))
+
+        def entries():
+            for info in members:
+                if info.is_dir():
+                    yield None, None, None
+                    continue
+                if info.flag_bits & 0x1:
+                    raise FileUploadException(f'不支持加密的压缩包成员: {info.filename}')
+                # 单个成员的解压比按其压缩后大小计算
+                limit = max(info.compress_size * self.max_ratio, RATIO_CHECK_MIN_SIZE)
+                yield info.filename, lambda info=info: archive.open(info), limit
+
+        self._extract_entries(job, entries(), committed_ids)
+
+    def _extract_tar(self, job, archive, counter, committed_ids):
+        def entries():
+            count = 0
+            for member in archive:
+                count += 1
+                self._check_member_count(count)
+                job.archive_bytes_read = counter.count
+                # 只解压普通文件，跳过目录、链接和设备文件
+                if not member.isfile():
+                    yield None, None, None
+                    continue
+                yield member.name, lambda member=member: archive.extractfile(member), None
+
+        self._extract_entries(job, entries(), committed_ids)
+
+    def _extract_entries(self, job, entries, committed_ids):
+        """把成员写入存储，每 batch_size 个文件提交一个上传事务"""
+        txn = self.file_manager.upload_transaction()
+        try:
+            for name, open_member, member_limit in entries:
+                job.processed_members += 1
+                path = member_path(name) if name else None
+                if path is None or not self.file_manager.allowed_file(os.path.basename(path)):
+                    job.skipped_members += 1
+                    job.report()
+                    continue
+
+                writer = self.file_manager.open_upload(os.path.basename(path))
+                try:
+                    with open_member() as src:
+                        self._copy_member(job, src, writer, name, member_limit)
+                except Exception:
+                    writer.abort()
+                    raise
+                # 压缩包通常自带同名的顶层目录，不再重复嵌套
+                if path.startswith(job.folder + '/'):
+                    path = path[len(job.folder) + 1:]
+                txn.add(writer, f"{job.folder}/{path}")
+                job.extracted_files += 1
+                job.report()
+
+                if len(txn.metadata_list) >= self.batch_size:
+                    self._commit(txn, committed_ids)
+                    txn = self.file_manager.upload_transaction()
+            self._commit(txn, committed_ids)
+        except Exception:
+            if not txn.committed:
+                txn.rollback()
+            raise
+
+    def _commit(self, txn, committed_ids):
+        if not txn.metadata_list:
+            return
+        txn.commit()
+        committed_ids.extend(metadata['id'] for metadata in txn.metadata_list)
+        if self.on_commit:
+            self.on_commit()
+
+    def _copy_member(self, job, src, writer, name, member_limit):
+        member_size = 0
+        while True:
+            chunk = src.read(UPLOAD_BUFFER_SIZE)
+            if not chunk:
+                break
+            member_size += len(chunk)
+            job.extracted_bytes += len(chunk)
+            if member_limit is not None and member_size > member_limit:
+                raise SecurityException(f'压缩包成员解压比超过 {self.max_ratio} 倍: {name}')
+            self._check_total_size(job, job.extracted_bytes)
+            writer.write(chunk)
+
+    def _check_member_count(self, count):
+        if count > self.max_members:
+            raise SecurityException(f'压缩包成员数超过 {self.max_members} 个')
+
+    def _check_total_size(self, job, total):
+        if total > self.max_total_size:
+            raise SecurityException(f'解压后总大小超过 {self.max_total_size} 字节')
+        if total > RATIO_CHECK_MIN_SIZE and total > job.archive_size * self.max_ratio:
+            raise SecurityException(f'解压后大小超过压缩包的 {self.max_ratio} 倍')
@@ -1,19 +1,58 @@
+import os
 import time
 import threading
 from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
+from .job_queue import PRIORITY_LOW
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，不做跨进程互斥
+    fcntl = None
 
 class FileCleanupScheduler:
     """文件清理调度器"""
     
-    def __init__(self, file_manager, interval_minutes=60):
+    def __init__(self, file_manager, interval_minutes=60, stats_interval_minutes=None,
+                 storage_reconciler=None, reconcile_interval_minutes=None, job_queue=None):
         self.file_manager = file_manager
         self.interval_minutes = interval_minutes
+        # 存储统计校对间隔，None表示不校对
+        self.stats_interval_minutes = stats_interval_minutes
+        # 存储对账（孤儿文件、悬空记录、临时文件）间隔，None表示不对账
+        self.storage_reconciler = storage_reconciler
+        self.reconcile_interval_minutes = reconcile_interval_minutes
+        # 设置任务队列时，清理和对账提交为后台任务，由任务队列的工作线程执行
+        self.job_queue = job_queue
         self.scheduler = BackgroundScheduler()
         self.is_running = False
+        self._leader_lock = None
+    
+    def _is_leader(self):
+        """多个worker进程中只有持有调度锁的进程执行定时任务
+
+        锁一直持有到进程退出，由系统释放；持有锁的worker退出后，
+        其他worker在下一次任务触发时接管。
+        """
+        if fcntl is None or self._leader_lock is not None:
+            return True
+        lock_path = os.path.join(self.file_manager.upload_folder, '.cleanup_scheduler.lock')
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._leader_lock = lock_file
+        return True
     
     def cleanup_task(self):
         """清理任务"""
+        if not self._is_leader():
+            return
+        if self.job_queue is not None:
+            self.job_queue.submit('cleanup', priority=PRIORITY_LOW, unique=True)
+            return
         try:
             expired_count = self.file_manager.cleanup_expired_files()
             current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -22,6 +61,32 @@ class FileCleanupScheduler:
             current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             print(f"[{current_time}] 文件清理出错: {str(e)}")
     
+    def reconcile_stats_task(self):
+        """存储统计校对任务"""
+        if not self._is_leader():
+            return
+        result = self.file_manager.reconcile_storage_stats()
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if result is None:
+            print(f"[{current_time}] 存储统计校对失败")
+        elif result['drifted']:
+            print(f"[{current_time}] 存储统计校对完成，已修正计数偏差")
+    
+    def storage_reconcile_task(self):
+        """存储对账任务"""
+        if not self._is_leader():
+            return
+        if self.job_queue is not None:
+            self.job_queue.submit('storage_reconcile', priority=PRIORITY_LOW, unique=True)
+            return
+        report = self.storage_reconciler.run()
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if report is None:
+            print(f"[{current_time}] 存储对账未完成")
+        elif report['orphans_found'] or report['dangling_found'] or report['temp_files_removed']:
+            print(f"[{current_time}] 存储对账完成，处理孤儿文件 {report['orphans_handled']} 个、"
+                  f"悬空记录 {report['dangling_deleted']} 条、临时文件 {report['temp_files_removed']} 个")
+    
     def start(self):
         """启动清理调度器"""
         if not self.is_running:
@@ -32,6 +97,22 @@ class FileCleanupScheduler:
                 id='file_cleanup',
                 name='文件清理任务'
             )
+            if self.stats_interval_minutes:
+                self.scheduler.add_job(
+                    func=self.reconcile_stats_task,
+                    trigger="interval",
+                    minutes=self.stats_interval_minutes,
+                    id='stats_reconcile',
+                    name='存储统计校对任务'
+                )
+            if self.storage_reconciler is not None and self.reconcile_interval_minutes:
+                self.scheduler.add_job(
+                    func=self.storage_reconcile_task,
+                    trigger="interval",
+                    minutes=self.reconcile_interval_minutes,
+                    id='storage_reconcile',
+                    name='存储对账任务'
+                )
             self.scheduler.start()
             self.is_running = True
             print(f"文件清理调度器已启动，每 {self.interval_minutes} 分钟执行一次清理")
@@ -50,11 +131,15 @@ class FileCleanupScheduler:
 # 全局清理调度器实例
 cleanup_scheduler = None
 
-def start_cleanup_scheduler(file_manager, interval_minutes=60):
+def start_cleanup_scheduler(file_manager, interval_minutes=60, stats_interval_minutes=None,
+                            storage_reconciler=None, reconcile_interval_minutes=None, job_queue=None):
     """启动文件清理调度器"""
     global cleanup_scheduler
     if cleanup_scheduler is None:
-        cleanup_scheduler = FileCleanupScheduler(file_manager, interval_minutes)
+        cleanup_scheduler = FileCleanupScheduler(
+            file_manager, interval_minutes, stats_interval_minutes,
+            storage_reconciler, reconcile_interval_minutes, job_queue
+        )
         cleanup_scheduler.start()
     return cleanup_scheduler
 
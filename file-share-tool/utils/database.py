@@ -2,183 +2,543 @@
 SQLite数据库管理模块
 """
 import sqlite3
-import os
+import re
 import json
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Any
 import threading
 from contextlib import contextmanager
 from .logging_config import get_logger
+from .metadata_cache import GenerationCounter, MetadataCache
+from .query_stats import FULL_SCAN_MARK
+from .query_stats import InstrumentedConnection
+from .timing import span, DB
+from .metadata_schema import (
+    SCHEMA_VERSION, FILE_SELECT, FILE_TABLE_COLUMNS, FILE_JOINS, FILE_INSERT_SQL, STORED_NAME_SQL, FILE_PATH_SQL, FILE_TYPES,
+    FILE_EXTENSIONS, BLOB_DIRS, create_schema, create_compat_view, record_version, is_legacy_table,
+    file_row, lookup_values, metadata_from_row, split_file_path, to_epoch_ms
+)
+from .schema_migration import SchemaMigrator, MIGRATION_BATCH_SIZE
+
+# IN 查询每批的参数个数，低于旧版SQLite的999个变量上限
+SQL_BATCH_SIZE = 500
+
+# 搜索索引中文件内容的状态
+CONTENT_PENDING = 0   # 等待后台索引
+CONTENT_INDEXED = 1   # 已索引
+CONTENT_SKIPPED = 2   # 非文本、过大或文件缺失，不索引
+
+# 全文检索排序时各列的权重：文件名 > 路径 > 内容
+SEARCH_COLUMN_WEIGHTS = (10.0, 5.0, 1.0)
 
 class DatabaseManager:
     """数据库管理器"""
     
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, cache_size: int = 10000, cache_ttl: int = 300, query_stats=None,
+                 migration_batch_size: int = MIGRATION_BATCH_SIZE):
         self.db_path = db_path
         self.logger = get_logger()
+        # SQL执行统计（QueryStats），为None时不统计
+        self.query_stats = query_stats
+        # 旧版元数据表迁移时每个事务复制的记录数
+        self.migration_batch_size = migration_batch_size
         self._lock = threading.RLock()
+        self.fts_enabled = False
+        # 查找表的 {取值: ID} 和 {ID: 取值}，ID写入后不再变化，各进程分别缓存
+        self._lookup_ids = {FILE_TYPES: {}, FILE_EXTENSIONS: {}, BLOB_DIRS: {}}
+        self._lookup_names = {FILE_TYPES: {}, FILE_EXTENSIONS: {}, BLOB_DIRS: {}}
         self.init_database()
+        
+        # 元数据缓存，写入时通过共享代数计数器通知所有进程失效
+        self.cache = MetadataCache(
+            GenerationCounter(f"{db_path}.gen"),
+            max_entries=cache_size,
+            ttl=cache_ttl
+        ) if cache_size else None
+    
+    def reinit_after_fork(self):
+        """fork后在子进程中重建进程内的锁（父进程中被其他线程持有的锁在子进程里无法释放）"""
+        self._lock = threading.RLock()
+        if self.cache is not None:
+            self.cache.reinit_after_fork()
+        if self.query_stats is not None:
+            self.query_stats.reinit_after_fork()
+    
+    def _cached(self, key, loader):
+        """经过元数据缓存读取，缓存值为共享对象，调用方不应修改"""
+        if self.cache is None:
+            return loader()
+        
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+        
+        generation = self.cache.current_generation()
+        value = loader()
+        if value is not None:
+            self.cache.put(key, value, generation)
+        return value
+    
+    def _metadata_changed(self):
+        """元数据写入后使所有进程的缓存失效"""
+        if self.cache is not None:
+            self.cache.invalidate()
     
     def init_database(self):
-        """初始化数据库"""
+        """初始化数据库，v1 的 file_metadata 表先在线迁移到 v2 的 files 表"""
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # 创建文件元数据表
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS file_metadata (
-                        id TEXT PRIMARY KEY,
-                        original_name TEXT NOT NULL,
-                        stored_name TEXT NOT NULL,
-                        file_path TEXT NOT NULL,
-                        file_size INTEGER NOT NULL,
-                        file_type TEXT,
-                        file_extension TEXT,
-                        upload_time TIMESTAMP NOT NULL,
-                        expire_time TIMESTAMP NOT NULL,
-                        relative_path TEXT,
-                        is_text_file BOOLEAN DEFAULT 0,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
+                migrator = None
+                if is_legacy_table(conn):
+                    self.logger.info(f"检测到旧版元数据表，开始迁移到 v{SCHEMA_VERSION}...")
+                    migrator = SchemaMigrator(conn, self.migration_batch_size)
+                    if migrator.expand():
+                        migrator.backfill()
                 
-                # 创建索引
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_expire_time ON file_metadata(expire_time)')
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_time ON file_metadata(upload_time)')
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_file_extension ON file_metadata(file_extension)')
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    create_schema(conn)
+                    if migrator is not None:
+                        migrator.cutover()
+                    create_compat_view(conn)
+                    
+                    # 创建操作日志表（用于审计）
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS operation_logs (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            operation_type TEXT NOT NULL,
+                            file_id TEXT,
+                            user_ip TEXT,
+                            user_agent TEXT,
+                            success BOOLEAN NOT NULL,
+                            error_message TEXT,
+                            duration_ms REAL,
+                            extra_data TEXT,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    ''')
+                    
+                    conn.execute('CREATE INDEX IF NOT EXISTS idx_operation_created_at ON operation_logs(created_at)')
+                    conn.execute('CREATE INDEX IF NOT EXISTS idx_operation_type ON operation_logs(operation_type)')
+                    
+                    # 旧版JSON元数据迁移进度（已提交到的文件字节偏移）
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS json_migration_state (
+                            source TEXT PRIMARY KEY,
+                            source_size INTEGER NOT NULL,
+                            source_mtime REAL NOT NULL,
+                            byte_offset INTEGER NOT NULL,
+                            migrated_count INTEGER NOT NULL,
+                            skipped_count INTEGER NOT NULL DEFAULT 0,
+                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    ''')
+                    
+                    # 全文检索索引
+                    self.fts_enabled = self._init_search_index(conn)
+                    
+                    # 触发器维护的存储统计
+                    self._init_storage_stats(conn)
+                    record_version(conn, '新建数据库')
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
                 
-                # 创建操作日志表（用于审计）
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS operation_logs (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        operation_type TEXT NOT NULL,
-                        file_id TEXT,
-                        user_ip TEXT,
-                        user_agent TEXT,
-                        success BOOLEAN NOT NULL,
-                        error_message TEXT,
-                        duration_ms REAL,
-                        extra_data TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_operation_created_at ON operation_logs(created_at)')
-                cursor.execute('CREATE INDEX IF NOT EXISTS idx_operation_type ON operation_logs(operation_type)')
-                
-                conn.commit()
                 self.logger.info("数据库初始化完成")
                 
         except Exception as e:
             self.logger.error(f"数据库初始化失败: {str(e)}", exc_info=True)
             raise
     
+    def _init_search_index(self, conn) -> bool:
+        """在调用方开启的事务中创建FTS5全文索引及同步触发器，SQLite不支持FTS5时返回False
+
+        file_search_docs 为每个文件分配稳定的整数docid（VACUUM不会改变），
+        作为 file_search 的rowid；files 的增删改由触发器同步到索引，
+        文件内容由后台索引器填充。
+        """
+        conn.execute('SAVEPOINT init_search_index')
+        try:
+            created = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_search_docs'"
+            ).fetchone() is None
+            
+            conn.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS file_search USING fts5(
+                    original_name, relative_path, content,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3'
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS file_search_docs (
+                    docid INTEGER PRIMARY KEY,
+                    file_id TEXT NOT NULL UNIQUE,
+                    content_state INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_search_content_pending '
+                'ON file_search_docs(docid) WHERE content_state = 0'
+            )
+            
+            # INSERT OR REPLACE 在未开启recursive_triggers时不会触发删除触发器，
+            # 所以插入触发器先清理同ID的旧索引
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS file_search_ai AFTER INSERT ON files BEGIN
+                    DELETE FROM file_search WHERE rowid IN
+                        (SELECT docid FROM file_search_docs WHERE file_id = new.id);
+                    DELETE FROM file_search_docs WHERE file_id = new.id;
+                    INSERT INTO file_search_docs (file_id) VALUES (new.id);
+                    INSERT INTO file_search (rowid, original_name, relative_path, content)
+                    VALUES (last_insert_rowid(), ifnull(new.original_name, new.relative_path), new.relative_path, '');
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS file_search_ad AFTER DELETE ON files BEGIN
+                    DELETE FROM file_search WHERE rowid IN
+                        (SELECT docid FROM file_search_docs WHERE file_id = old.id);
+                    DELETE FROM file_search_docs WHERE file_id = old.id;
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS file_search_au
+                AFTER UPDATE OF original_name, relative_path ON files BEGIN
+                    UPDATE file_search
+                    SET original_name = ifnull(new.original_name, new.relative_path),
+                        relative_path = new.relative_path
+                    WHERE rowid = (SELECT docid FROM file_search_docs WHERE file_id = new.id);
+                END
+            ''')
+            
+            # 首次创建时为已有文件建立索引
+            if created:
+                conn.execute(f'INSERT INTO file_search_docs (file_id) SELECT id FROM files {FULL_SCAN_MARK}')
+                conn.execute(f'''
+                    INSERT INTO file_search (rowid, original_name, relative_path, content)
+                    SELECT d.docid, ifnull(f.original_name, f.relative_path), f.relative_path, ''
+                    FROM file_search_docs d JOIN files f ON f.id = d.file_id {FULL_SCAN_MARK}
+                ''')
+            
+            conn.execute('RELEASE init_search_index')
+            return True
+            
+        except sqlite3.OperationalError as e:
+            conn.execute('ROLLBACK TO init_search_index')
+            conn.execute('RELEASE init_search_index')
+            if 'fts5' not in str(e):
+                raise
+            self.logger.warning(f"SQLite不支持FTS5，文件搜索将使用LIKE匹配: {str(e)}")
+            return False
+    
+    def _init_storage_stats(self, conn):
+        """在调用方开启的事务中创建由触发器维护的存储统计表
+
+        storage_stats 保存总文件数、总大小（原始大小）和磁盘占用，extension_stats 按扩展名ID计数，
+        expiry_stats 按过期时间的小时分桶计数。files 的增删改由触发器
+        同步到计数器，读取统计时不再扫描元数据表；计数偏差由定期校对任务修正。
+        """
+        created = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'storage_stats'"
+        ).fetchone() is None
+        
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS storage_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_files INTEGER NOT NULL DEFAULT 0,
+                total_size INTEGER NOT NULL DEFAULT 0,
+                reconciled_at TIMESTAMP,
+                stored_size INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        # extension_id 为0表示没有扩展名
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS extension_stats (
+                extension_id INTEGER PRIMARY KEY,
+                file_count INTEGER NOT NULL,
+                total_size INTEGER NOT NULL
+            )
+        ''')
+        # bucket 为过期时间所在的小时（毫秒时间戳 / 3600000）
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS expiry_stats (
+                bucket INTEGER PRIMARY KEY,
+                file_count INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('INSERT OR IGNORE INTO storage_stats (id) VALUES (1)')
+        
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS storage_stats_ai AFTER INSERT ON files BEGIN
+                UPDATE storage_stats
+                SET total_files = total_files + 1, total_size = total_size + new.file_size,
+                    stored_size = stored_size + ifnull(new.stored_size, new.file_size)
+                WHERE id = 1;
+                {self._STATS_ADD_SQL}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS storage_stats_ad AFTER DELETE ON files BEGIN
+                UPDATE storage_stats
+                SET total_files = total_files - 1, total_size = total_size - old.file_size,
+                    stored_size = stored_size - ifnull(old.stored_size, old.file_size)
+                WHERE id = 1;
+                {self._STATS_REMOVE_SQL}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS storage_stats_au
+            AFTER UPDATE OF file_size, stored_size, extension_id, expire_time ON files BEGIN
+                UPDATE storage_stats
+                SET total_size = total_size - old.file_size + new.file_size,
+                    stored_size = stored_size - ifnull(old.stored_size, old.file_size)
+                                  + ifnull(new.stored_size, new.file_size)
+                WHERE id = 1;
+                {self._STATS_REMOVE_SQL}
+                {self._STATS_ADD_SQL}
+            END
+        ''')
+        
+        # 首次创建（包括迁移后重建）时根据已有数据计算
+        if created:
+            self._rebuild_storage_stats(conn)
+    
+    # 触发器中增加/减少扩展名和过期分桶计数的语句
+    _STATS_ADD_SQL = '''
+        INSERT INTO extension_stats (extension_id, file_count, total_size)
+        VALUES (ifnull(new.extension_id, 0), 1, new.file_size)
+        ON CONFLICT(extension_id) DO UPDATE
+        SET file_count = file_count + 1, total_size = total_size + excluded.total_size;
+        INSERT INTO expiry_stats (bucket, file_count)
+        VALUES (new.expire_time / 3600000, 1)
+        ON CONFLICT(bucket) DO UPDATE SET file_count = file_count + 1;
+    '''
+    _STATS_REMOVE_SQL = '''
+        UPDATE extension_stats
+        SET file_count = file_count - 1, total_size = total_size - old.file_size
+        WHERE extension_id = ifnull(old.extension_id, 0);
+        DELETE FROM extension_stats
+        WHERE extension_id = ifnull(old.extension_id, 0) AND file_count <= 0;
+        UPDATE expiry_stats SET file_count = file_count - 1
+        WHERE bucket = old.expire_time / 3600000;
+        DELETE FROM expiry_stats
+        WHERE bucket = old.expire_time / 3600000 AND file_count <= 0;
+    '''
+    
     @contextmanager
     def get_connection(self):
-        """获取数据库连接的上下文管理器"""
-        conn = None
-        try:
-            with self._lock:
-                conn = sqlite3.connect(self.db_path, timeout=30.0)
-                conn.row_factory = sqlite3.Row
-                conn.execute('PRAGMA journal_mode=WAL')
-                conn.execute('PRAGMA synchronous=NORMAL')
-                conn.execute('PRAGMA temp_store=MEMORY')
-                conn.execute('PRAGMA mmap_size=268435456')  # 256MB
-                yield conn
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            self.logger.error(f"数据库连接错误: {str(e)}", exc_info=True)
-            raise
-        finally:
-            if conn:
-                conn.close()
+        """获取数据库连接的上下文管理器，连接期间的耗时计入请求的 db 阶段"""
+        with span(DB):
+            conn = None
+            try:
+                with self._lock:
+                    if self.query_stats is None:
+                        conn = sqlite3.connect(self.db_path, timeout=30.0)
+                    else:
+                        conn = sqlite3.connect(self.db_path, timeout=30.0, factory=InstrumentedConnection)
+                        conn.query_stats = self.query_stats
+                    conn.row_factory = sqlite3.Row
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.execute('PRAGMA synchronous=NORMAL')
+                    conn.execute('PRAGMA temp_store=MEMORY')
+                    conn.execute('PRAGMA mmap_size=268435456')  # 256MB
+                    # INSERT OR REPLACE 替换旧记录时也触发删除触发器，保持统计和索引准确
+                    conn.execute('PRAGMA recursive_triggers=ON')
+                    yield conn
+            except Exception as e:
+                if conn:
+                    conn.rollback()
+                self.logger.error(f"数据库连接错误: {str(e)}", exc_info=True)
+                raise
+            finally:
+                if conn:
+                    conn.close()
+    
+    def _lookup(self, conn, lookup, values) -> Dict[str, int]:
+        """查找表中取值对应的ID，不存在的取值先写入并提交（查找表只增不删，多余的取值无害）"""
+        table, column = lookup
+        ids = self._lookup_ids[lookup]
+        missing = [value for value in values if value not in ids]
+        if missing:
+            conn.executemany(
+                f'INSERT OR IGNORE INTO {table} ({column}) VALUES (?)', [(value,) for value in missing]
+            )
+            conn.commit()
+            self._load_lookup(conn, lookup, column, missing)
+        return ids
+    
+    def _lookup_values(self, conn, lookup, lookup_ids) -> Dict[int, str]:
+        """查找表中ID对应的取值，缓存中没有的ID从数据库读取"""
+        names = self._lookup_names[lookup]
+        missing = [lookup_id for lookup_id in lookup_ids if lookup_id is not None and lookup_id not in names]
+        if missing:
+            self._load_lookup(conn, lookup, 'id', missing)
+        return names
+    
+    def _load_lookup(self, conn, lookup, key_column, keys):
+        """按取值或ID读取查找表的行，写入双向缓存"""
+        table, column = lookup
+        for start in range(0, len(keys), SQL_BATCH_SIZE):
+            batch = keys[start:start + SQL_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            for lookup_id, value in conn.execute(
+                f'SELECT id, {column} FROM {table} WHERE {key_column} IN ({placeholders})', batch
+            ):
+                self._lookup_ids[lookup][value] = lookup_id
+                self._lookup_names[lookup][lookup_id] = value
+    
+    def _to_metadata(self, conn, rows, extra_columns: Tuple[str, ...] = ()) -> List[Dict[str, Any]]:
+        """FILE_SELECT 查出的行还原为元数据字典，extra_columns 为其后各列的名称"""
+        types = self._lookup_values(conn, FILE_TYPES, {row[7] for row in rows})
+        extensions = self._lookup_values(conn, FILE_EXTENSIONS, {row[8] for row in rows})
+        dirs = self._lookup_values(conn, BLOB_DIRS, {row[4] for row in rows})
+        result = []
+        for row in rows:
+            metadata = metadata_from_row(row, types, extensions, dirs)
+            for offset, name in enumerate(extra_columns, len(FILE_TABLE_COLUMNS)):
+                metadata[name] = row[offset]
+            result.append(metadata)
+        return result
+    
+    def _file_rows(self, conn, metadata_list: List[Dict[str, Any]]) -> List[Tuple]:
+        """元数据字典转换为 files 的插入参数，需要在同一连接开始写事务之前调用"""
+        values = lookup_values(metadata_list)
+        type_ids = self._lookup(conn, FILE_TYPES, values[FILE_TYPES])
+        extension_ids = self._lookup(conn, FILE_EXTENSIONS, values[FILE_EXTENSIONS])
+        dir_ids = self._lookup(conn, BLOB_DIRS, values[BLOB_DIRS])
+        return [file_row(m, type_ids, extension_ids, dir_ids) for m in metadata_list]
     
     def save_file_metadata(self, metadata: Dict[str, Any]) -> bool:
         """保存文件元数据"""
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT OR REPLACE INTO file_metadata 
-                    (id, original_name, stored_name, file_path, file_size, file_type, 
-                     file_extension, upload_time, expire_time, relative_path, is_text_file,
-                     updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ''', (
-                    metadata['id'],
-                    metadata['original_name'],
-                    metadata['stored_name'],
-                    metadata['file_path'],
-                    metadata['file_size'],
-                    metadata['file_type'],
-                    metadata['file_extension'],
-                    metadata['upload_time'],
-                    metadata['expire_time'],
-                    metadata.get('relative_path'),
-                    metadata.get('is_text_file', False)
-                ))
-                
+                conn.execute(FILE_INSERT_SQL, self._file_rows(conn, [metadata])[0])
                 conn.commit()
-                return True
+            
+            self._metadata_changed()
+            return True
                 
         except Exception as e:
             self.logger.error(f"保存文件元数据失败: {str(e)}", exc_info=True)
             return False
     
+    def save_many_metadata(self, metadata_list: List[Dict[str, Any]]) -> bool:
+        """在一个事务中批量保存文件元数据"""
+        if not metadata_list:
+            return True
+        
+        try:
+            with self.get_connection() as conn:
+                conn.executemany(FILE_INSERT_SQL, self._file_rows(conn, metadata_list))
+                conn.commit()
+            
+            self._metadata_changed()
+            return True
+                
+        except Exception as e:
+            self.logger.error(f"批量保存文件元数据失败: {str(e)}", exc_info=True)
+            return False
+    
     def get_file_metadata(self, file_id: str) -> Optional[Dict[str, Any]]:
         """获取文件元数据"""
+        metadata = self._cached(('file', file_id), lambda: self._load_file_metadata(file_id))
+        return dict(metadata) if metadata else None
+    
+    def _load_file_metadata(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """从数据库读取文件元数据"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM file_metadata WHERE id = ?', (file_id,))
+                cursor.execute(f'SELECT {FILE_SELECT} FROM files f WHERE f.id = ?', (file_id,))
                 row = cursor.fetchone()
                 
                 if row:
-                    return dict(row)
+                    return self._to_metadata(conn, [row])[0]
                 return None
                 
         except Exception as e:
             self.logger.error(f"获取文件元数据失败: {str(e)}", exc_info=True)
             return None
     
+    def get_many(self, file_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取文件元数据，返回 {文件ID: 元数据}，不存在的ID不出现在结果中"""
+        result = {}
+        missing = []
+        for file_id in dict.fromkeys(file_ids):
+            cached = self.cache.get(('file', file_id)) if self.cache is not None else None
+            if cached is not None:
+                result[file_id] = dict(cached)
+            else:
+                missing.append(file_id)
+        
+        if not missing:
+            return result
+        
+        try:
+            generation = self.cache.current_generation() if self.cache is not None else None
+            with self.get_connection() as conn:
+                for start in range(0, len(missing), SQL_BATCH_SIZE):
+                    batch = missing[start:start + SQL_BATCH_SIZE]
+                    placeholders = ','.join('?' * len(batch))
+                    rows = conn.execute(
+                        f'SELECT {FILE_SELECT} FROM files f WHERE f.id IN ({placeholders})', batch
+                    ).fetchall()
+                    for metadata in self._to_metadata(conn, rows):
+                        result[metadata['id']] = metadata
+                        if self.cache is not None:
+                            self.cache.put(('file', metadata['id']), dict(metadata), generation)
+            return result
+            
+        except Exception as e:
+            self.logger.error(f"批量获取文件元数据失败: {str(e)}", exc_info=True)
+            return result
+    
     def get_all_files(self, limit: int = None, offset: int = 0) -> List[Dict[str, Any]]:
-        """获取所有文件列表"""
+        """获取所有文件列表（结果经过缓存，调用方不应修改）"""
+        return self._cached(('all', limit, offset), lambda: self._load_all_files(limit, offset)) or []
+    
+    def _load_all_files(self, limit: int = None, offset: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """从数据库读取文件列表，失败时返回None"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
-                query = '''
-                    SELECT * FROM file_metadata 
-                    ORDER BY upload_time DESC
-                '''
+                query = f'SELECT {FILE_SELECT} FROM files f'
                 
                 params = []
                 if limit:
-                    query += ' LIMIT ? OFFSET ?'
+                    # 先在 upload_time 索引上定位当前页的rowid，只为这一页的记录回表
+                    query += '''
+                        WHERE f.rowid IN (
+                            SELECT rowid FROM files ORDER BY upload_time DESC LIMIT ? OFFSET ?
+                        )
+                    '''
                     params.extend([limit, offset])
                 
-                cursor.execute(query, params)
+                cursor.execute(query + ' ORDER BY f.upload_time DESC', params)
                 rows = cursor.fetchall()
                 
-                return [dict(row) for row in rows]
+                return self._to_metadata(conn, rows)
                 
         except Exception as e:
             self.logger.error(f"获取文件列表失败: {str(e)}", exc_info=True)
-            return []
+            return None
     
     def get_folder_structure(self) -> Dict[str, List[Dict[str, Any]]]:
-        """获取文件夹结构 - 只返回根文件夹"""
+        """获取文件夹结构 - 只返回根文件夹（结果经过缓存，调用方不应修改）"""
+        return self._cached(('folders',), self._build_folder_structure) or {}
+    
+    def _build_folder_structure(self) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """根据文件列表构建文件夹结构"""
         try:
-            files = self.get_all_files()
+            files = self._load_all_files()
+            if files is None:
+                return None
             folder_structure = {}
             
             for file_info in files:
-                relative_path = file_info.get('relative_path', file_info['original_name'])
+                relative_path = file_info.get('relative_path') or file_info['original_name']
                 
                 # 检查是否在文件夹中
                 if '/' in relative_path or '\\' in relative_path:
@@ -196,74 +556,333 @@ class DatabaseManager:
             
         except Exception as e:
             self.logger.error(f"获取文件夹结构失败: {str(e)}", exc_info=True)
-            return {}
+            return None
+    
+    def get_folder_files(self, folder_path: str) -> List[Dict[str, Any]]:
+        """获取根文件夹内的文件，与 get_folder_structure() 中该文件夹的内容一致（结果经过缓存，调用方不应修改）"""
+        return self._cached(('folder', folder_path), lambda: self._load_folder_files(folder_path)) or []
+    
+    def _load_folder_files(self, folder_path: str) -> Optional[List[Dict[str, Any]]]:
+        """按路径前缀范围查询（走 relative_path 索引），路径分隔符可能是 / 或 \\"""
+        if not folder_path or '/' in folder_path or '\\' in folder_path:
+            return []
+        try:
+            with self.get_connection() as conn:
+                # "文件夹/" <= relative_path < "文件夹0"，"0" 和 "]" 分别是 "/" 和 "\\" 的下一个字符
+                rows = conn.execute(f'''
+                    SELECT {FILE_SELECT} FROM files f
+                    WHERE (f.relative_path >= ? AND f.relative_path < ?)
+                       OR (f.relative_path >= ? AND f.relative_path < ?)
+                    ORDER BY f.upload_time DESC
+                ''', (folder_path + '/', folder_path + '0', folder_path + '\\', folder_path + ']')).fetchall()
+                return self._to_metadata(conn, rows)
+        except Exception as e:
+            self.logger.error(f"获取文件夹文件失败: {str(e)}", exc_info=True)
+            return None
+    
+    def get_file_paths_page(self, after_id: str = '', limit: int = 500) -> List[Dict[str, Any]]:
+        """按ID顺序分页获取文件存储路径（键集分页，用于后台迁移）"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT f.id AS id, {STORED_NAME_SQL} AS stored_name, {FILE_PATH_SQL} AS file_path
+                    FROM files f {FILE_JOINS}
+                    WHERE f.id > ?
+                    ORDER BY f.id
+                    LIMIT ?
+                ''', (after_id, limit))
+                return [dict(row) for row in cursor.fetchall()]
+                
+        except Exception as e:
+            self.logger.error(f"获取文件路径失败: {str(e)}", exc_info=True)
+            return []
+    
+    def get_stored_names(self) -> Optional[Dict[str, str]]:
+        """获取所有记录的存储文件名，返回 {存储文件名: 文件ID}，失败时返回None（用于存储对账）"""
+        try:
+            with self.get_connection() as conn:
+                return dict(conn.execute(
+                    f'SELECT {STORED_NAME_SQL}, f.id FROM files f {FILE_JOINS} {FULL_SCAN_MARK}'
+                ))
+
+        except Exception as e:
+            self.logger.error(f"获取存储文件名失败: {str(e)}", exc_info=True)
+            return None
+
+    def find_by_content(self, keys: List[Tuple[str, int]]) -> Dict[Tuple[str, int], Dict[str, Any]]:
+        """按 (SHA-256, 文件大小) 查找内容相同的已有文件，每个内容返回最近上传的一条记录"""
+        result = {}
+        wanted = set(keys)
+        hashes = list(dict.fromkeys(content_hash for content_hash, _ in wanted))
+        try:
+            with self.get_connection() as conn:
+                for start in range(0, len(hashes), SQL_BATCH_SIZE):
+                    batch = hashes[start:start + SQL_BATCH_SIZE]
+                    placeholders = ','.join('?' * len(batch))
+                    rows = conn.execute(f'''
+                        SELECT {FILE_SELECT} FROM files f
+                        WHERE f.content_hash IN ({placeholders})
+                        ORDER BY f.upload_time
+                    ''', batch).fetchall()
+                    for metadata in self._to_metadata(conn, rows):
+                        key = (metadata['content_hash'], metadata['file_size'])
+                        if key in wanted:
+                            result[key] = metadata
+            return result
+
+        except Exception as e:
+            self.logger.error(f"按内容查找文件失败: {str(e)}", exc_info=True)
+            return result
+
+    def update_file_paths(self, updates: List[Tuple[str, str]]) -> bool:
+        """批量更新文件存储路径，updates为 (新路径, 文件ID) 列表，在一个事务中提交"""
+        try:
+            with self.get_connection() as conn:
+                # 新路径为 "<目录><存储文件名>" 时只记录目录ID
+                stored_names = {}
+                file_ids = [file_id for _, file_id in updates]
+                for start in range(0, len(file_ids), SQL_BATCH_SIZE):
+                    batch = file_ids[start:start + SQL_BATCH_SIZE]
+                    placeholders = ','.join('?' * len(batch))
+                    stored_names.update(conn.execute(
+                        f'SELECT f.id, {STORED_NAME_SQL} FROM files f {FILE_JOINS} WHERE f.id IN ({placeholders})',
+                        batch
+                    ))
+                splits = [
+                    (split_file_path(file_path, stored_names.get(file_id)), file_id)
+                    for file_path, file_id in updates
+                ]
+                dir_ids = self._lookup(conn, BLOB_DIRS, {prefix for (prefix, _), _ in splits if prefix is not None})
+                conn.executemany(
+                    'UPDATE files SET dir_id = ?, file_path = ? WHERE id = ?',
+                    [(dir_ids.get(prefix), file_path, file_id) for (prefix, file_path), file_id in splits]
+                )
+                conn.commit()
+            
+            self._metadata_changed()
+            return True
+                
+        except Exception as e:
+            self.logger.error(f"批量更新文件路径失败: {str(e)}", exc_info=True)
+            return False
     
     def delete_file_metadata(self, file_id: str) -> bool:
         """删除文件元数据"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('DELETE FROM file_metadata WHERE id = ?', (file_id,))
+                cursor.execute('DELETE FROM files WHERE id = ?', (file_id,))
                 conn.commit()
-                
-                return cursor.rowcount > 0
+                deleted = cursor.rowcount > 0
+            
+            if deleted:
+                self._metadata_changed()
+            return deleted
                 
         except Exception as e:
             self.logger.error(f"删除文件元数据失败: {str(e)}", exc_info=True)
             return False
     
+    def delete_many(self, file_ids: List[str]) -> Optional[int]:
+        """在一个事务中批量删除文件元数据，返回删除的记录数，失败时返回None"""
+        if not file_ids:
+            return 0
+        
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(
+                    'DELETE FROM files WHERE id = ?',
+                    ((file_id,) for file_id in file_ids)
+                )
+                conn.commit()
+                deleted = cursor.rowcount
+            
+            if deleted:
+                self._metadata_changed()
+            return deleted
+            
+        except Exception as e:
+            self.logger.error(f"批量删除文件元数据失败: {str(e)}", exc_info=True)
+            return None
+    
+    @staticmethod
+    def _search_terms(query: str) -> List[str]:
+        """把用户输入拆分为搜索词，去掉FTS语法字符"""
+        return re.findall(r'\w+', query or '')
+    
+    def search_files(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+        """按文件名、路径和文本内容搜索文件，返回 (匹配总数, 当前页结果)
+
+        每个搜索词按前缀匹配，多个词之间为AND，按bm25相关度排序。
+        全文检索没有结果时（如中文词语的中间部分），退化为对文件名和路径的LIKE匹配。
+        """
+        terms = self._search_terms(query)
+        if not terms:
+            return 0, []
+        
+        try:
+            with self.get_connection() as conn:
+                if self.fts_enabled:
+                    total, rows = self._fts_search(conn, terms, limit, offset)
+                    if total:
+                        return total, rows
+                return self._like_search(conn, terms, limit, offset)
+                
+        except Exception as e:
+            self.logger.error(f"搜索文件失败: {str(e)}", exc_info=True)
+            return 0, []
+    
+    def _fts_search(self, conn, terms: List[str], limit: int, offset: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """FTS5前缀匹配搜索"""
+        match = ' '.join(f'"{term}"*' for term in terms)
+        total = conn.execute(
+            'SELECT COUNT(*) FROM file_search WHERE file_search MATCH ?', (match,)
+        ).fetchone()[0]
+        if not total:
+            return 0, []
+        
+        weights = ', '.join(str(w) for w in SEARCH_COLUMN_WEIGHTS)
+        rows = conn.execute(f'''
+            SELECT {FILE_SELECT}, snippet(file_search, 2, '', '', '…', 16)
+            FROM file_search
+            JOIN file_search_docs d ON d.docid = file_search.rowid
+            JOIN files f ON f.id = d.file_id
+            WHERE file_search MATCH ?
+            ORDER BY bm25(file_search, {weights}), f.upload_time DESC
+            LIMIT ? OFFSET ?
+        ''', (match, limit, offset)).fetchall()
+        return total, self._to_metadata(conn, rows, ('snippet',))
+    
+    def _like_search(self, conn, terms: List[str], limit: int, offset: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """对文件名和路径做子串匹配（没有全文索引时使用，需要全表扫描）"""
+        conditions = []
+        params = []
+        for term in terms:
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append(
+                "(ifnull(f.original_name, f.relative_path) LIKE ? ESCAPE '\\' OR f.relative_path LIKE ? ESCAPE '\\')"
+            )
+            params.extend([pattern, pattern])
+        where = ' AND '.join(conditions)
+        
+        total = conn.execute(
+            f'SELECT COUNT(*) FROM files f WHERE {where} {FULL_SCAN_MARK}', params
+        ).fetchone()[0]
+        if not total:
+            return 0, []
+        
+        rows = conn.execute(f'''
+            SELECT {FILE_SELECT}, '' FROM files f
+            WHERE {where}
+            ORDER BY f.upload_time DESC
+            LIMIT ? OFFSET ? {FULL_SCAN_MARK}
+        ''', params + [limit, offset]).fetchall()
+        return total, self._to_metadata(conn, rows, ('snippet',))
+    
+    def get_pending_search_content(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """获取等待索引内容的文件"""
+        if not self.fts_enabled:
+            return []
+        
+        try:
+            with self.get_connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT {FILE_SELECT}, d.docid
+                    FROM file_search_docs d JOIN files f ON f.id = d.file_id
+                    WHERE d.content_state = 0
+                    ORDER BY d.docid
+                    LIMIT ?
+                ''', (limit,)).fetchall()
+                return self._to_metadata(conn, rows, ('docid',))
+                
+        except Exception as e:
+            self.logger.error(f"获取待索引文件失败: {str(e)}", exc_info=True)
+            return []
+    
+    def save_search_content(self, updates: List[Tuple[int, Optional[str]]]) -> bool:
+        """批量写入文件内容索引，updates为 (docid, 文本内容) 列表，内容为None表示跳过该文件"""
+        try:
+            with self.get_connection() as conn:
+                conn.executemany(
+                    'UPDATE file_search SET content = ? WHERE rowid = ?',
+                    [(content, docid) for docid, content in updates if content]
+                )
+                conn.executemany(
+                    'UPDATE file_search_docs SET content_state = ? WHERE docid = ?',
+                    [(CONTENT_INDEXED if content else CONTENT_SKIPPED, docid) for docid, content in updates]
+                )
+                conn.commit()
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"保存文件内容索引失败: {str(e)}", exc_info=True)
+            return False
+    
     def get_expired_files(self) -> List[Dict[str, Any]]:
         """获取过期文件列表"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                current_time = datetime.now().isoformat()
+                current_time = to_epoch_ms(datetime.now())
                 
-                cursor.execute('''
-                    SELECT * FROM file_metadata 
-                    WHERE expire_time < ? 
-                    ORDER BY expire_time ASC
+                cursor.execute(f'''
+                    SELECT {FILE_SELECT} FROM files f
+                    WHERE f.expire_time < ? 
+                    ORDER BY f.expire_time ASC
                 ''', (current_time,))
                 
                 rows = cursor.fetchall()
-                return [dict(row) for row in rows]
+                return self._to_metadata(conn, rows)
                 
         except Exception as e:
             self.logger.error(f"获取过期文件失败: {str(e)}", exc_info=True)
             return []
     
     def get_storage_stats(self) -> Dict[str, Any]:
-        """获取存储统计信息"""
+        """获取存储统计信息（读取触发器维护的计数器）"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
                 # 总文件数和总大小
-                cursor.execute('SELECT COUNT(*), SUM(file_size) FROM file_metadata')
-                total_files, total_size = cursor.fetchone()
+                cursor.execute(
+                    'SELECT total_files, total_size, stored_size, reconciled_at FROM storage_stats WHERE id = 1'
+                )
+                total_files, total_size, stored_size, reconciled_at = cursor.fetchone()
                 
                 # 按文件类型统计
                 cursor.execute('''
-                    SELECT file_extension, COUNT(*), SUM(file_size) 
-                    FROM file_metadata 
-                    GROUP BY file_extension 
-                    ORDER BY SUM(file_size) DESC
+                    SELECT file_extensions.extension, extension_stats.file_count, extension_stats.total_size
+                    FROM extension_stats
+                    LEFT JOIN file_extensions ON file_extensions.id = extension_stats.extension_id
+                    ORDER BY extension_stats.total_size DESC
                     LIMIT 10
                 ''')
                 type_stats = cursor.fetchall()
                 
-                # 过期文件统计
-                current_time = datetime.now().isoformat()
-                cursor.execute('SELECT COUNT(*) FROM file_metadata WHERE expire_time < ?', (current_time,))
-                expired_count = cursor.fetchone()[0]
+                # 过期文件统计：早于当前小时的分桶直接累加，当前小时内的按索引精确计数
+                now = to_epoch_ms(datetime.now())
+                current_bucket = now // 3600000
+                cursor.execute('SELECT SUM(file_count) FROM expiry_stats WHERE bucket < ?', (current_bucket,))
+                expired_count = cursor.fetchone()[0] or 0
+                cursor.execute(
+                    'SELECT COUNT(*) FROM files WHERE expire_time >= ? AND expire_time < ?',
+                    (current_bucket * 3600000, now)
+                )
+                expired_count += cursor.fetchone()[0]
                 
                 return {
                     'total_files': total_files or 0,
                     'total_size': total_size or 0,
+                    # 磁盘占用，压缩存储的文件按压缩后大小计算
+                    'stored_size': stored_size or 0,
                     'expired_files': expired_count,
+                    'reconciled_at': reconciled_at,
                     'type_statistics': [
                         {
-                            'extension': row[0],
+                            'extension': row[0] or None,
                             'count': row[1],
                             'total_size': row[2]
                         } for row in type_stats
@@ -275,10 +894,85 @@ class DatabaseManager:
             return {
                 'total_files': 0,
                 'total_size': 0,
+                'stored_size': 0,
                 'expired_files': 0,
                 'type_statistics': []
             }
     
+    def reconcile_storage_stats(self, conn=None) -> Optional[Dict[str, Any]]:
+        """根据元数据表重新计算存储统计，修正计数偏差
+
+        返回校对结果（是否存在偏差及修正前后的总计），失败时返回None。
+        """
+        if conn is None:
+            with self.get_connection() as conn:
+                return self.reconcile_storage_stats(conn)
+        
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            before = self._read_stats_tables(conn)
+            actual_files, actual_size, _ = self._rebuild_storage_stats(conn)
+            after = self._read_stats_tables(conn)
+            conn.execute('COMMIT')
+            
+            drifted = before != after
+            if drifted:
+                self.logger.warning(
+                    f"存储统计存在偏差，已修正: 文件数 {before['totals'][0]} -> {actual_files}，"
+                    f"总大小 {before['totals'][1]} -> {actual_size}"
+                )
+            return {
+                'drifted': drifted,
+                'total_files': actual_files,
+                'total_size': actual_size,
+                'previous_total_files': before['totals'][0],
+                'previous_total_size': before['totals'][1]
+            }
+            
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            self.logger.error(f"校对存储统计失败: {str(e)}", exc_info=True)
+            return None
+    
+    @staticmethod
+    def _rebuild_storage_stats(conn) -> Tuple[int, int, int]:
+        """在调用方开启的事务中根据 files 重新计算全部统计，返回 (文件数, 总大小, 磁盘占用)"""
+        # 校对需要完整统计，全表扫描
+        totals = conn.execute(
+            'SELECT COUNT(*), IFNULL(SUM(file_size), 0), IFNULL(SUM(IFNULL(stored_size, file_size)), 0) '
+            f'FROM files {FULL_SCAN_MARK}'
+        ).fetchone()
+        conn.execute('DELETE FROM extension_stats')
+        conn.execute(f'''
+            INSERT INTO extension_stats (extension_id, file_count, total_size)
+            SELECT ifnull(extension_id, 0), COUNT(*), SUM(file_size)
+            FROM files GROUP BY ifnull(extension_id, 0) {FULL_SCAN_MARK}
+        ''')
+        conn.execute('DELETE FROM expiry_stats')
+        conn.execute(f'''
+            INSERT INTO expiry_stats (bucket, file_count)
+            SELECT expire_time / 3600000, COUNT(*)
+            FROM files GROUP BY expire_time / 3600000 {FULL_SCAN_MARK}
+        ''')
+        conn.execute(
+            'UPDATE storage_stats SET total_files = ?, total_size = ?, stored_size = ?, reconciled_at = ? '
+            'WHERE id = 1',
+            (*totals, datetime.now().isoformat())
+        )
+        return tuple(totals)
+    
+    @staticmethod
+    def _read_stats_tables(conn) -> Dict[str, Any]:
+        """读取全部统计计数（统计表都很小）"""
+        return {
+            'totals': tuple(conn.execute(
+                'SELECT total_files, total_size, stored_size FROM storage_stats WHERE id = 1'
+            ).fetchone()),
+            'extensions': set(map(tuple, conn.execute('SELECT * FROM extension_stats').fetchall())),
+            'expiry': set(map(tuple, conn.execute('SELECT * FROM expiry_stats').fetchall()))
+        }
+    
     def log_operation(self, operation_type: str, user_ip: str, file_id: str = None, 
                      success: bool = True, error_message: str = None, 
                      duration_ms: float = None, extra_data: Dict = None):
@@ -357,27 +1051,50 @@ class DatabaseManager:
             self.logger.error(f"清理旧日志失败: {str(e)}", exc_info=True)
             return 0
     
-    def migrate_from_json(self, json_file_path: str) -> bool:
-        """从JSON文件迁移数据"""
+    def get_json_migration_state(self, source: str) -> Optional[Dict[str, Any]]:
+        """获取JSON元数据迁移的进度记录"""
         try:
-            if not os.path.exists(json_file_path):
-                return True
-            
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                json_data = json.load(f)
-            
-            migrated_count = 0
-            for file_id, metadata in json_data.items():
-                if self.save_file_metadata(metadata):
-                    migrated_count += 1
+            with self.get_connection() as conn:
+                row = conn.execute(
+                    'SELECT * FROM json_migration_state WHERE source = ?', (source,)
+                ).fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            self.logger.error(f"读取JSON迁移进度失败: {str(e)}", exc_info=True)
+            return None
+    
+    def save_json_migration_batch(self, metadata_list: List[Dict[str, Any]], state: Dict[str, Any]) -> bool:
+        """在一个事务中写入一批从JSON迁移的元数据和迁移进度，中断后从进度记录处继续"""
+        try:
+            with self.get_connection() as conn:
+                conn.executemany(FILE_INSERT_SQL, self._file_rows(conn, metadata_list))
+                conn.execute('''
+                    INSERT OR REPLACE INTO json_migration_state
+                    (source, source_size, source_mtime, byte_offset, migrated_count, skipped_count, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (
+                    state['source'], state['source_size'], state['source_mtime'],
+                    state['byte_offset'], state['migrated_count'], state['skipped_count']
+                ))
+                conn.commit()
             
-            self.logger.info(f"成功从JSON迁移 {migrated_count} 条记录")
+            if metadata_list:
+                self._metadata_changed()
             return True
             
         except Exception as e:
-            self.logger.error(f"从JSON迁移失败: {str(e)}", exc_info=True)
+            self.logger.error(f"写入JSON迁移批次失败: {str(e)}", exc_info=True)
             return False
     
+    def clear_json_migration_state(self, source: str):
+        """JSON迁移完成后删除进度记录"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute('DELETE FROM json_migration_state WHERE source = ?', (source,))
+                conn.commit()
+        except Exception as e:
+            self.logger.error(f"删除JSON迁移进度失败: {str(e)}", exc_info=True)
+    
     def vacuum_database(self):
         """清理和优化数据库"""
         try:
@@ -0,0 +1,206 @@
+"""
+增量上传模块（rsync算法）
+
+服务端把已有文件按固定大小分块，给出每块的弱校验（Adler-32，可滚动计算）和强校验（MD5）；
+客户端在新文件上逐字节滚动弱校验，弱校验命中后再比对强校验，得到由“复制已有块”和
+“新增数据”组成的重建方案，只上传方案和新增数据；服务端以已有文件为基础重建出新文件。
+
+方案中的操作：
+    ["copy", 起始块号, 块数]   从已有文件复制连续的块（最后一块可能不足 block_size）
+    ["data", 长度]             从上传的新增数据中顺序读取指定字节数
+"""
+import hashlib
+import math
+import zlib
+
+# Adler-32 的模数
+ADLER_MOD = 65521
+# 读取数据的缓冲区大小
+READ_SIZE = 1024 * 1024
+# 客户端累积的新增数据超过该大小时写出，避免缓冲区无限增长
+LITERAL_FLUSH_SIZE = 4 * 1024 * 1024
+
+
+def choose_block_size(file_size, min_block_size=4096, max_block_size=1024 * 1024):
+    """按文件大小选择分块大小：约为文件大小的平方根，取2的幂"""
+    if file_size <= 0:
+        return min_block_size
+    block_size = 1 << max(0, math.isqrt(file_size) - 1).bit_length()
+    return max(min_block_size, min(max_block_size, block_size))
+
+
+def block_signatures(stream, block_size):
+    """逐块计算已有文件的签名，生成 (弱校验, 强校验)"""
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        # 读取解压流时可能返回不足一块的数据
+        while len(block) < block_size:
+            more = stream.read(block_size - len(block))
+            if not more:
+                break
+            block += more
+        yield zlib.adler32(block), hashlib.md5(block).hexdigest()
+
+
+class DeltaRecipe:
+    """客户端生成的重建方案，相邻的同类操作自动合并"""
+
+    def __init__(self):
+        self.ops = []
+
+    def copy(self, block_index):
+        last = self.ops[-1] if self.ops else None
+        if last and last[0] == 'copy' and last[1] + last[2] == block_index:
+            last[2] += 1
+        else:
+            self.ops.append(['copy', block_index, 1])
+
+    def data(self, length):
+        if length <= 0:
+            return
+        last = self.ops[-1] if self.ops else None
+        if last and last[0] == 'data':
+            last[1] += length
+        else:
+            self.ops.append(['data', length])
+
+
+def generate_delta(src, blocks, block_size, base_size, literal_out):
+    """在新文件上匹配已有文件的块（客户端使用）
+
+    src: 新文件（二进制读取流）
+    blocks: 已有文件的块签名列表 [(弱校验, 强校验), ...]，base_size 为已有文件大小
+    literal_out: 新增数据的写入流
+
+    返回 (方案操作列表, 新文件大小, 新文件SHA-256)
+    """
+    table = {}
+    for index, (weak, strong) in enumerate(blocks):
+        table.setdefault(weak, {}).setdefault(strong, index)
+    # 已有文件最后一块的长度
+    tail_size = base_size % block_size
+    recipe = DeltaRecipe()
+    file_hash = hashlib.sha256()
+    file_size = 0
+
+    buf = bytearray()
+    pos = 0        # 当前窗口在 buf 中的起点
+    literal = 0    # 尚未写出的新增数据在 buf 中的起点
+    eof = False
+    a = b = None   # 当前窗口的 Adler-32 两个分量，None 表示需要重新计算
+
+    def flush_literal(end):
+        if end > literal:
+            literal_out.write(buf[literal:end])
+            recipe.data(end - literal)
+
+    while True:
+        # 窗口后面至少再有一个字节才能滚动
+        if not eof and len(buf) - pos <= block_size:
+            if pos - literal >= LITERAL_FLUSH_SIZE:
+                flush_literal(pos)
+                literal = pos
+            del buf[:literal]
+            pos -= literal
+            literal = 0
+            chunk = src.read(READ_SIZE)
+            if chunk:
+                buf += chunk
+                file_hash.update(chunk)
+                file_size += len(chunk)
+            else:
+                eof = True
+            continue
+
+        length = min(block_size, len(buf) - pos)
+        if length == 0:
+            break
+
+        if length < block_size:
+            # 文件末尾不足一块：只能匹配已有文件不足一块的尾块，其余作为新增数据
+            start = len(buf) - tail_size
+            if tail_size and start >= pos:
+                window = bytes(buf[start:])
+                match = table.get(zlib.adler32(window), {}).get(hashlib.md5(window).hexdigest())
+                if match is not None:
+                    flush_literal(start)
+                    recipe.copy(match)
+                    literal = len(buf)
+            break
+
+        if a is None:
+            checksum = zlib.adler32(buf[pos:pos + length])
+            a, b = checksum & 0xffff, checksum >> 16
+
+        candidates = table.get((b << 16) | a)
+        if candidates:
+            match = candidates.get(hashlib.md5(buf[pos:pos + length]).hexdigest())
+            if match is not None:
+                flush_literal(pos)
+                recipe.copy(match)
+                pos += length
+                literal = pos
+                a = b = None
+                continue
+
+        if pos + length < len(buf):
+            # 窗口后移一个字节
+            out_byte = buf[pos]
+            in_byte = buf[pos + length]
+            a = (a - out_byte + in_byte) % ADLER_MOD
+            b = (b - length * out_byte + a - 1) % ADLER_MOD
+        else:
+            a = b = None
+        pos += 1
+
+    flush_literal(len(buf))
+    return recipe.ops, file_size, file_hash.hexdigest()
+
+
+def apply_delta(base, base_size, block_size, ops, literal, write):
+    """按方案重建文件（服务端使用）
+
+    base: 已有文件（可seek的二进制读取流），base_size 为其原始大小
+    literal: 上传的新增数据流
+    write: 写入重建数据的函数
+
+    方案无效或新增数据不足时抛出 ValueError，返回重建后的大小。
+    """
+    if not isinstance(block_size, int) or block_size <= 0:
+        raise ValueError('分块大小无效')
+    block_count = (base_size + block_size - 1) // block_size
+    total = 0
+
+    for op in ops:
+        if not isinstance(op, (list, tuple)) or not op:
+            raise ValueError(f'无效的操作: {op!r}')
+        if op[0] == 'copy' and len(op) == 3:
+            start, count = op[1], op[2]
+            if not (isinstance(start, int) and isinstance(count, int)) or start < 0 or count <= 0 \
+                    or start + count > block_count:
+                raise ValueError(f'块范围无效: {op!r}')
+            offset = start * block_size
+            remaining = min(count * block_size, base_size - offset)
+            base.seek(offset)
+            source = base
+        elif op[0] == 'data' and len(op) == 2:
+            remaining = op[1]
+            if not isinstance(remaining, int) or remaining <= 0:
+                raise ValueError(f'数据长度无效: {op!r}')
+            source = literal
+        else:
+            raise ValueError(f'无效的操作: {op!r}')
+
+        while remaining > 0:
+            chunk = source.read(min(READ_SIZE, remaining))
+            if not chunk:
+                raise ValueError('已有文件或新增数据长度不足')
+            write(chunk)
+            remaining -= len(chunk)
+            total += len(chunk)
+
+    if literal.read(1):
+        raise ValueError('新增数据多于方案中的长度')
+    return total
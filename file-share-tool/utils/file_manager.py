@@ -1,32 +1,276 @@
 import os
 import json
+import shutil
 import uuid
-import mimetypes
-import zipfile
+import hashlib
 import tempfile
+import mimetypes
 from datetime import datetime, timedelta
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ThreadPoolExecutor
 from werkzeug.utils import secure_filename
 from .database import DatabaseManager
+from .archive import ArchiveBuilder, ArchiveEntry, TEMP_ZIP_PREFIX
+from .storage_codec import SAMPLE_SIZE, READ_BUFFER_SIZE, open_blob
+from .storage_backend import LocalStorageBackend
+from .delta import apply_delta
+from .json_migration import JsonMetadataMigrator
+from .exceptions import StorageException, FileUploadException
 from .logging_config import get_logger
+from .timing import span, timed, FS, COMPRESS
+
+# 流式上传写入缓冲区大小
+UPLOAD_BUFFER_SIZE = 1024 * 1024  # 1MB
+# 批量删除物理文件时的线程数
+UNLINK_WORKERS = 8
+# 上传清单中SHA-256的格式
+CONTENT_HASH_LENGTH = 64
+
+
+class UploadWriter:
+    """流式上传写入器：直接写入最终存储位置，同时统计大小并计算哈希
+
+    设置了存储压缩时，先缓存文件开头的数据，根据扩展名和抽样压缩率决定
+    是否以压缩格式写入；size 和 content_hash 始终对应原始内容。
+    设置了远程存储后端（storage）时数据通过存储后端的写入器流式上传，不写本地磁盘，
+    此时 file_path 为None。
+    """
+    
+    def __init__(self, file_id, filename, stored_filename, file_path, buffer_size=UPLOAD_BUFFER_SIZE,
+                 storage_codec=None, storage=None):
+        self.file_id = file_id
+        self.filename = filename
+        self.stored_filename = stored_filename
+        self.local_path = file_path
+        # 元数据中记录的位置
+        self.file_path = storage.uri(stored_filename) if storage is not None else file_path
+        self.size = 0
+        self.closed = False
+        self._storage = storage
+        # 实际使用的存储编码（None为原样存储）和写入磁盘的字节数
+        self.codec = None
+        self.stored_size = None
+        self._storage_codec = storage_codec
+        self._hash = hashlib.sha256()
+        if storage is None:
+            self._fp = open(file_path, 'wb', buffering=buffer_size)
+        else:
+            self._fp = storage.open_writer(stored_filename)
+        # 决定存储编码之前 _out 为None，数据暂存在 _pending 中
+        self._out = self._fp if storage_codec is None else None
+        self._pending = bytearray()
+    
+    def _choose_codec(self):
+        """根据已缓存的数据选择存储编码，并写出缓存的数据"""
+        extension = self.stored_filename.rsplit('.', 1)[-1]
+        if self._storage_codec.should_compress(extension, bytes(self._pending), self.size):
+            self.codec = self._storage_codec.name
+            self._out = self._storage_codec.open_writer(self._fp)
+        else:
+            self._out = self._fp
+        self._out.write(self._pending)
+        self._pending = None
+    
+    def write(self, data):
+        """写入数据块"""
+        self._hash.update(data)
+        self.size += len(data)
+        if self._out is None:
+            self._pending += data
+            if len(self._pending) >= SAMPLE_SIZE:
+                with span(FS):
+                    self._choose_codec()
+            return
+        with span(FS if self.codec is None else COMPRESS):
+            self._out.write(data)
+    
+    def _finish(self):
+        """写完数据，远程存储在这里完成上传"""
+        if self._out is None:
+            self._choose_codec()
+        if self._out is not self._fp:
+            self._out.close()
+        if self.codec is not None:
+            self._fp.flush()
+            self.stored_size = self._fp.tell()
+        self._fp.close()
+        self.closed = True
+    
+    @timed(FS)
+    def close(self):
+        """写入完成"""
+        if not self.closed:
+            self._finish()
+    
+    @timed(FS)
+    def abort(self):
+        """放弃写入并删除已写入的数据"""
+        if self._storage is not None:
+            # 未完成的分片上传直接中止，已完成的对象删除
+            self.closed = True
+            self._fp.abort()
+            if self._out is not None and self._out is not self._fp:
+                # 压缩流的结尾写入已中止的写入器时出错，直接丢弃
+                try:
+                    self._out.close()
+                except ValueError:
+                    pass
+            return
+        if not self.closed:
+            self.closed = True
+            try:
+                if self._out is not None and self._out is not self._fp:
+                    self._out.close()
+            except (OSError, ValueError):
+                pass
+            finally:
+                self._fp.close()
+        if os.path.exists(self.local_path):
+            os.remove(self.local_path)
+    
+    @property
+    def content_hash(self):
+        """内容的SHA-256哈希"""
+        return self._hash.hexdigest()
+
+
+class LinkedBlob:
+    """与已有文件内容相同的新文件：本地存储时硬链接到已有文件的数据（不支持硬链接时复制），
+    对象存储时在存储端复制
+
+    接口与 UploadWriter 一致，可以加入上传事务；两个文件各自删除互不影响。
+    """
+    
+    def __init__(self, file_id, filename, stored_filename, storage, source):
+        self.file_id = file_id
+        self.filename = filename
+        self.stored_filename = stored_filename
+        self.file_path = storage.uri(stored_filename)
+        self._storage = storage
+        self.size = source['file_size']
+        self.content_hash = source['content_hash']
+        self.codec = source.get('storage_codec')
+        self.stored_size = source.get('stored_size')
+        self.closed = True
+    
+    def close(self):
+        pass
+    
+    def abort(self):
+        """放弃并删除新建的链接"""
+        self._storage.delete(self.stored_filename)
+
+
+class UploadTransaction:
+    """上传事务：一次请求中的所有文件先写入磁盘，元数据最后一次性批量提交
+
+    提交失败或中途出错时删除本事务中已写入的全部文件。
+    """
+    
+    def __init__(self, file_manager):
+        self.file_manager = file_manager
+        self.writers = []
+        self.metadata_list = []
+        self.committed = False
+    
+    def add(self, writer, relative_path=None):
+        """加入一个已写完的文件，返回其元数据"""
+        # 先加入事务，关闭或生成元数据失败时回滚会一并删除该文件
+        self.writers.append(writer)
+        writer.close()
+        original_filename, display_name, _ = self.file_manager._resolve_names(writer.filename, relative_path)
+        metadata = self.file_manager._build_metadata(
+            writer.file_id, writer.stored_filename, writer.file_path, writer.size,
+            original_filename, display_name, relative_path, writer.content_hash,
+            writer.codec, writer.stored_size
+        )
+        self.metadata_list.append(metadata)
+        return metadata
+    
+    def add_file(self, file, relative_path=None):
+        """把Werkzeug的FileStorage写入存储并加入事务，不允许上传的文件返回None"""
+        writer = self.file_manager.open_upload(file.filename)
+        if writer is None:
+            return None
+        try:
+            while True:
+                chunk = file.stream.read(UPLOAD_BUFFER_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+        except Exception:
+            writer.abort()
+            raise
+        return self.add(writer, relative_path)
+    
+    def commit(self):
+        """批量提交元数据"""
+        if not self.file_manager.database.save_many_metadata(self.metadata_list):
+            raise StorageException('保存文件元数据失败')
+        self.committed = True
+        self.file_manager.logger.info(f"上传事务提交成功，共 {len(self.metadata_list)} 个文件")
+    
+    def rollback(self):
+        """删除本事务写入的全部文件"""
+        for writer in self.writers:
+            try:
+                writer.abort()
+            except Exception as e:
+                self.file_manager.logger.error(f"删除上传文件失败 {writer.stored_filename}: {e}", exc_info=True)
+        if self.writers:
+            self.file_manager.logger.warning(f"上传事务回滚，已删除 {len(self.writers)} 个文件")
+        self.writers = []
+        self.metadata_list = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and not self.committed:
+            try:
+                self.commit()
+            except Exception:
+                self.rollback()
+                raise
+        elif exc_type is not None:
+            self.rollback()
+        return False
+
 
 class FileManager:
     """文件管理器类（SQLite版本）"""
     
-    def __init__(self, upload_folder, allowed_extensions, expire_hours=24):
+    def __init__(self, upload_folder, allowed_extensions, expire_hours=24, archive_builder=None,
+                 archive_cache=None, shard_depth=2, shard_width=2,
+                 metadata_cache_size=10000, metadata_cache_ttl=300, storage_codec=None, storage=None,
+                 query_stats=None, schema_migration_batch_size=5000):
         self.upload_folder = upload_folder
         self.allowed_extensions = allowed_extensions
         self.expire_hours = expire_hours
+        # 分片目录层级和每级目录名长度，depth为0时平铺存放
+        self.shard_depth = shard_depth
+        self.shard_width = shard_width
         self.logger = get_logger()
+        self.archive_builder = archive_builder or ArchiveBuilder()
+        self.archive_cache = archive_cache
+        # 写入时的压缩策略（StorageCodec），None表示原样存储
+        self.storage_codec = storage_codec
+        # 文件数据的存储后端，默认为上传目录
+        self._local_storage = LocalStorageBackend(upload_folder, shard_depth, shard_width)
+        self.storage = storage or self._local_storage
         
         # SQLite数据库路径
         self.db_path = os.path.join(upload_folder, 'metadata.db')
-        self.database = DatabaseManager(self.db_path)
+        self.database = DatabaseManager(
+            self.db_path,
+            cache_size=metadata_cache_size,
+            cache_ttl=metadata_cache_ttl,
+            query_stats=query_stats,
+            migration_batch_size=schema_migration_batch_size
+        )
         
         # 确保上传目录存在
         self.ensure_upload_folder()
-        
-        # 从旧的JSON文件迁移数据（如果存在）
-        self.migrate_from_json()
     
     def ensure_upload_folder(self):
         """确保上传目录存在"""
@@ -34,16 +278,96 @@ class FileManager:
             os.makedirs(self.upload_folder)
             self.logger.info(f"创建上传目录: {self.upload_folder}")
     
-    def migrate_from_json(self):
-        """从JSON文件迁移数据到SQLite"""
-        json_file = os.path.join(self.upload_folder, 'metadata.json')
-        if os.path.exists(json_file):
-            self.logger.info("检测到旧的JSON元数据文件，开始迁移...")
-            if self.database.migrate_from_json(json_file):
-                # 迁移成功后备份JSON文件
-                backup_file = f"{json_file}.backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                os.rename(json_file, backup_file)
-                self.logger.info(f"JSON数据迁移完成，原文件已备份为: {backup_file}")
+    def migrate_from_json(self, batch_size=5000):
+        """从旧的JSON文件迁移数据到SQLite（流式解析、分批提交，可中断后继续）
+
+        其他进程正在迁移时等待其完成。迁移完成或不需要迁移时返回True。
+        """
+        return JsonMetadataMigrator(self, batch_size).run(blocking=True)
+    
+    def blob_path(self, stored_filename, create_dirs=False):
+        """根据存储文件名计算分片后的物理路径，如 uploads/ab/cd/<uuid>.<ext>"""
+        return self._local_storage.path(stored_filename, create_dirs)
+    
+    @timed(FS)
+    def resolve_file_path(self, metadata):
+        """获取文件的实际物理路径
+
+        分片迁移过程中文件可能已移动到新位置而数据库尚未更新，此时返回新位置。
+        文件不存在或保存在远程存储中时返回None。
+        """
+        file_path = metadata['file_path']
+        if os.path.exists(file_path):
+            return file_path
+        
+        sharded_path = self.blob_path(metadata['stored_name'])
+        if sharded_path != file_path and os.path.exists(sharded_path):
+            return sharded_path
+        return None
+    
+    @timed(FS)
+    def open_stored(self, metadata, seekable=False):
+        """打开存储的文件用于读取原始内容（按存储编码解压），文件不存在时返回None
+
+        seekable 为True时返回可seek的读取流，远程存储的文件先下载到临时文件。
+        """
+        file_path = self.resolve_file_path(metadata)
+        if file_path:
+            return open_blob(file_path, metadata.get('storage_codec'), seekable)
+        if self.storage.local:
+            return None
+        
+        try:
+            src = self.storage.open(metadata['stored_name'])
+        except FileNotFoundError:
+            return None
+        if seekable:
+            spool = tempfile.TemporaryFile()
+            try:
+                with src:
+                    shutil.copyfileobj(src, spool, READ_BUFFER_SIZE)
+                spool.seek(0)
+            except Exception:
+                spool.close()
+                raise
+            src = spool
+        return open_blob(src, metadata.get('storage_codec'), seekable)
+    
+    @contextmanager
+    def local_blob(self, metadata):
+        """取得存储文件（存储编码下的原始数据）的本地路径，不存在时为None
+
+        远程存储的文件下载到临时文件，退出时删除。
+        """
+        file_path = self.resolve_file_path(metadata)
+        if file_path or self.storage.local:
+            yield file_path
+            return
+        
+        try:
+            src = self.storage.open(metadata['stored_name'])
+        except FileNotFoundError:
+            yield None
+            return
+        
+        fd, tmp_path = tempfile.mkstemp(prefix=TEMP_ZIP_PREFIX, suffix=f".{metadata['file_extension']}")
+        try:
+            with span(FS), os.fdopen(fd, 'wb') as dest, src:
+                shutil.copyfileobj(src, dest, READ_BUFFER_SIZE)
+            yield tmp_path
+        finally:
+            os.remove(tmp_path)
+    
+    @timed(FS)
+    def _delete_blob(self, metadata):
+        """删除文件数据，文件不存在时返回False"""
+        file_path = self.resolve_file_path(metadata)
+        if file_path:
+            os.remove(file_path)
+            return True
+        if self.storage.local:
+            return False
+        return self.storage.delete(metadata['stored_name'])
     
     def allowed_file(self, filename):
         """检查文件是否允许上传"""
@@ -60,64 +384,80 @@ class FileManager:
         mime_type, _ = mimetypes.guess_type(filename)
         return mime_type or 'application/octet-stream'
     
+    def _resolve_names(self, filename, relative_path=None):
+        """根据上传文件名和相对路径确定显示名称和扩展名"""
+        if relative_path:
+            original_filename = relative_path
+            display_name = relative_path
+        else:
+            original_filename = secure_filename(filename)
+            display_name = original_filename
+        
+        file_extension = self.get_file_extension(os.path.basename(original_filename))
+        return original_filename, display_name, file_extension
+    
+    def _build_metadata(self, file_id, stored_filename, file_path, file_size,
+                        original_filename, display_name, relative_path=None, content_hash=None,
+                        storage_codec=None, stored_size=None):
+        """构建上传文件的元数据"""
+        upload_time = datetime.now()
+        expire_time = upload_time + timedelta(hours=self.expire_hours)
+        
+        return {
+            'id': file_id,
+            'original_name': display_name,
+            'stored_name': stored_filename,
+            'file_path': os.path.normpath(file_path) if self.storage.local else file_path,
+            'file_size': file_size,
+            'file_type': self.get_file_type(os.path.basename(original_filename)),
+            'file_extension': self.get_file_extension(os.path.basename(original_filename)),
+            'upload_time': upload_time.isoformat(),
+            'expire_time': expire_time.isoformat(),
+            'relative_path': relative_path or original_filename,
+            'content_hash': content_hash,
+            'storage_codec': storage_codec,
+            'stored_size': stored_size
+        }
+    
     def save_file(self, file, relative_path=None):
         """保存上传的文件"""
         try:
             if not file or not self.allowed_file(file.filename):
                 return None, None
             
-            file_id = str(uuid.uuid4())
-            
-            # 使用相对路径或原始文件名
-            if relative_path:
-                original_filename = relative_path
-                display_name = relative_path
-            else:
-                original_filename = secure_filename(file.filename)
-                display_name = original_filename
-            
-            file_extension = self.get_file_extension(os.path.basename(original_filename))
-            stored_filename = f"{file_id}.{file_extension}"
-            file_path = os.path.join(self.upload_folder, stored_filename)
-            
-            # 保存文件
-            file.save(file_path)
-            self.logger.info(f"文件保存成功: {stored_filename}")
-            
-            # 获取文件信息
-            file_size = os.path.getsize(file_path)
-            upload_time = datetime.now()
-            expire_time = upload_time + timedelta(hours=self.expire_hours)
-            
-            # 创建元数据
-            metadata = {
-                'id': file_id,
-                'original_name': display_name,
-                'stored_name': stored_filename,
-                'file_path': os.path.normpath(file_path),
-                'file_size': file_size,
-                'file_type': self.get_file_type(os.path.basename(original_filename)),
-                'file_extension': file_extension,
-                'upload_time': upload_time.isoformat(),
-                'expire_time': expire_time.isoformat(),
-                'relative_path': relative_path or original_filename
-            }
-            
-            # 保存元数据到数据库
-            if self.database.save_file_metadata(metadata):
-                self.logger.info(f"文件元数据保存成功: {file_id}")
-                return file_id, metadata
-            else:
-                # 如果数据库保存失败，删除已保存的文件
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                self.logger.error(f"文件元数据保存失败，已删除文件: {stored_filename}")
-                return None, None
+            with self.upload_transaction() as txn:
+                metadata = txn.add_file(file, relative_path)
+            self.logger.info(f"文件保存成功: {metadata['stored_name']}")
+            return metadata['id'], metadata
                 
         except Exception as e:
             self.logger.error(f"保存文件失败: {str(e)}", exc_info=True)
             return None, None
     
+    def _open_writer(self, file_id, filename, stored_filename):
+        """创建写入器：本地存储直接写入分片目录，远程存储边接收边分片上传"""
+        if self.storage.local:
+            file_path = self.blob_path(stored_filename, create_dirs=True)
+            return UploadWriter(file_id, filename, stored_filename, file_path, storage_codec=self.storage_codec)
+        
+        return UploadWriter(
+            file_id, filename, stored_filename, None, storage_codec=self.storage_codec, storage=self.storage
+        )
+    
+    def open_upload(self, filename, index=None):
+        """为流式上传的文件分片打开写入器，文件不允许上传时返回None"""
+        if not self.allowed_file(filename):
+            return None
+        
+        file_id = str(uuid.uuid4())
+        _, _, file_extension = self._resolve_names(filename)
+        stored_filename = f"{file_id}.{file_extension}"
+        return self._open_writer(file_id, filename, stored_filename)
+    
+    def upload_transaction(self):
+        """开启上传事务，用法: with file_manager.upload_transaction() as txn: txn.add(...)"""
+        return UploadTransaction(self)
+    
     def save_text_file(self, filename, content):
         """保存文本文件"""
         try:
@@ -127,14 +467,18 @@ class FileManager:
             file_id = str(uuid.uuid4())
             original_filename = secure_filename(filename)
             stored_filename = f"{file_id}.txt"
-            file_path = os.path.join(self.upload_folder, stored_filename)
             
             # 保存文本内容
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
+            writer = self._open_writer(file_id, filename, stored_filename)
+            try:
+                writer.write(content.encode('utf-8'))
+                writer.close()
+            except Exception:
+                writer.abort()
+                raise
             
             # 获取文件信息
-            file_size = os.path.getsize(file_path)
+            file_size = writer.size
             upload_time = datetime.now()
             expire_time = upload_time + timedelta(hours=self.expire_hours)
             
@@ -143,13 +487,16 @@ class FileManager:
                 'id': file_id,
                 'original_name': original_filename,
                 'stored_name': stored_filename,
-                'file_path': os.path.normpath(file_path),
+                'file_path': writer.file_path,
                 'file_size': file_size,
                 'file_type': 'text/plain',
                 'file_extension': 'txt',
                 'upload_time': upload_time.isoformat(),
                 'expire_time': expire_time.isoformat(),
-                'is_text_file': True
+                'is_text_file': True,
+                'content_hash': writer.content_hash,
+                'storage_codec': writer.codec,
+                'stored_size': writer.stored_size
             }
             
             # 保存元数据到数据库
@@ -157,14 +504,105 @@ class FileManager:
                 self.logger.info(f"文本文件保存成功: {file_id}")
                 return file_id, metadata
             else:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                writer.abort()
                 return None, None
                 
         except Exception as e:
             self.logger.error(f"保存文本文件失败: {str(e)}", exc_info=True)
             return None, None
     
+    @timed(FS)
+    def link_existing(self, source, filename):
+        """为内容相同的已有文件创建新的存储文件，返回 LinkedBlob"""
+        file_id = str(uuid.uuid4())
+        _, _, file_extension = self._resolve_names(filename)
+        stored_filename = f"{file_id}.{file_extension}"
+        self.storage.copy(source['stored_name'], stored_filename)
+        return LinkedBlob(file_id, filename, stored_filename, self.storage, source)
+    
+    def save_known_files(self, entries):
+        """上传清单：服务器已有相同内容的文件直接创建记录，不需要再上传
+
+        entries: [{'path': 相对路径, 'size': 字节数, 'hash': SHA-256}, ...]
+        返回 (新建文件的元数据列表, 需要上传的条目序号列表)
+        """
+        keys = {}
+        missing = []
+        for index, entry in enumerate(entries):
+            path = entry.get('path') if isinstance(entry, dict) else None
+            size = entry.get('size') if isinstance(entry, dict) else None
+            content_hash = entry.get('hash') if isinstance(entry, dict) else None
+            if not isinstance(path, str) or not isinstance(size, int) or size < 0 \
+                    or not isinstance(content_hash, str) or len(content_hash) != CONTENT_HASH_LENGTH \
+                    or not self.allowed_file(os.path.basename(path)):
+                missing.append(index)
+                continue
+            keys[index] = (content_hash.lower(), size)
+        
+        sources = self.database.find_by_content(list(keys.values())) if keys else {}
+        saved = []
+        with self.upload_transaction() as txn:
+            for index, key in keys.items():
+                source = sources.get(key)
+                if not source:
+                    missing.append(index)
+                    continue
+                path = entries[index]['path']
+                try:
+                    blob = self.link_existing(source, os.path.basename(path))
+                except Exception as e:
+                    self.logger.warning(f"链接已有文件失败，改为上传: {path}: {str(e)}")
+                    missing.append(index)
+                    continue
+                saved.append(txn.add(blob, path))
+        
+        if saved:
+            self.logger.info(f"上传清单：{len(saved)} 个文件内容已存在，无需上传")
+        return saved, sorted(missing)
+    
+    def save_delta_file(self, base_id, recipe, literal, relative_path=None):
+        """以已有文件为基础，按增量方案重建出新文件并保存
+
+        recipe: {'block_size', 'ops', 'file_size', 'sha256', 'name'(可选)}，见 utils.delta
+        literal: 客户端上传的新增数据流
+        已有文件不存在时返回None，方案无效或重建结果校验失败时抛出 FileUploadException。
+        """
+        base = self.database.get_file_metadata(base_id)
+        if not base:
+            return None
+        src = self.open_stored(base, seekable=True)
+        if src is None:
+            return None
+        
+        filename = recipe.get('name') or os.path.basename(base['original_name'])
+        writer = self.open_upload(filename)
+        if writer is None:
+            src.close()
+            raise FileUploadException(f"不允许上传的文件: {filename}")
+        
+        with self.upload_transaction() as txn:
+            try:
+                # 未变化的块在服务器上复制，不经过网络
+                with src:
+                    apply_delta(src, base['file_size'], recipe.get('block_size'),
+                                recipe.get('ops') or [], literal, writer.write)
+                writer.close()
+                if writer.size != recipe.get('file_size') or writer.content_hash != recipe.get('sha256'):
+                    raise ValueError('重建后的文件与客户端的大小或SHA-256不一致')
+            except ValueError as e:
+                writer.abort()
+                raise FileUploadException(f"增量上传失败: {str(e)}")
+            except Exception:
+                writer.abort()
+                raise
+            metadata = txn.add(writer, relative_path)
+        
+        self.logger.info(
+            f"增量上传完成: {base_id} -> {metadata['id']}，"
+            f"新增数据 {literal.tell()} 字节，文件大小 {metadata['file_size']} 字节"
+        )
+        return metadata
+    
     def get_file_list(self, limit=None, offset=0):
         """获取文件列表"""
         try:
@@ -185,6 +623,10 @@ class FileManager:
         """获取文件元数据"""
         return self.database.get_file_metadata(file_id)
     
+    def search_files(self, query, limit=20, offset=0):
+        """搜索文件，返回 (匹配总数, 当前页结果)"""
+        return self.database.search_files(query, limit, offset)
+    
     def delete_file(self, file_id):
         """删除文件"""
         try:
@@ -195,44 +637,82 @@ class FileManager:
                 return False
             
             # 删除物理文件
-            file_path = metadata['file_path']
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                self.logger.info(f"删除物理文件: {file_path}")
+            if self._delete_blob(metadata):
+                self.logger.info(f"删除物理文件: {metadata['file_path']}")
             
             # 删除数据库记录
             success = self.database.delete_file_metadata(file_id)
             if success:
                 self.logger.info(f"文件删除成功: {file_id}")
+                self._invalidate_folder_zips([metadata])
             return success
             
         except Exception as e:
             self.logger.error(f"删除文件失败: {str(e)}", exc_info=True)
             return False
     
+    def get_many(self, file_ids):
+        """批量获取文件元数据，返回 {文件ID: 元数据}"""
+        return self.database.get_many(file_ids)
+    
+    def _unlink_files(self, metadata_list):
+        """并行删除物理文件，返回删除失败的文件ID列表"""
+        def unlink(metadata):
+            try:
+                self._delete_blob(metadata)
+                return None
+            except Exception as e:
+                self.logger.error(f"删除物理文件失败 {metadata['id']}: {str(e)}")
+                return metadata['id']
+        
+        if len(metadata_list) <= UNLINK_WORKERS:
+            results = [unlink(metadata) for metadata in metadata_list]
+        else:
+            with ThreadPoolExecutor(max_workers=UNLINK_WORKERS) as executor:
+                results = list(executor.map(unlink, metadata_list))
+        return [file_id for file_id in results if file_id]
+    
+    def delete_many(self, file_ids):
+        """批量删除文件，返回 (已删除的文件ID列表, 删除失败的文件ID列表)
+
+        元数据在一个事务中删除，随后并行删除物理文件；
+        物理文件删除失败只会留下孤儿文件，由对账任务清理。
+        """
+        try:
+            metadata_map = self.database.get_many(file_ids)
+            missing = [file_id for file_id in dict.fromkeys(file_ids) if file_id not in metadata_map]
+            if not metadata_map:
+                return [], missing
+            
+            if self.database.delete_many(list(metadata_map)) is None:
+                return [], list(dict.fromkeys(file_ids))
+            
+            self._unlink_files(list(metadata_map.values()))
+            self._invalidate_folder_zips(metadata_map.values())
+            self.logger.info(f"批量删除文件 {len(metadata_map)} 个")
+            return list(metadata_map), missing
+            
+        except Exception as e:
+            self.logger.error(f"批量删除文件失败: {str(e)}", exc_info=True)
+            return [], list(dict.fromkeys(file_ids))
+    
+    def delete_folder(self, folder_path):
+        """删除文件夹中的所有文件，文件夹不存在时返回None，否则返回 (已删除ID列表, 失败ID列表)"""
+        files_in_folder = self.database.get_folder_files(folder_path)
+        if not files_in_folder:
+            return None
+        
+        return self.delete_many([file_info['id'] for file_info in files_in_folder])
+    
     def cleanup_expired_files(self):
         """清理过期文件"""
         try:
             expired_files = self.database.get_expired_files()
-            cleanup_count = 0
+            if not expired_files:
+                return 0
             
-            for file_metadata in expired_files:
-                try:
-                    file_id = file_metadata['id']
-                    file_path = file_metadata['file_path']
-                    
-                    # 删除物理文件
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                    
-                    # 删除数据库记录
-                    if self.database.delete_file_metadata(file_id):
-                        cleanup_count += 1
-                        self.logger.info(f"清理过期文件: {file_id}")
-                    
-                except Exception as e:
-                    self.logger.error(f"清理单个文件失败: {str(e)}")
-                    continue
+            deleted_ids, _ = self.delete_many([file_metadata['id'] for file_metadata in expired_files])
+            cleanup_count = len(deleted_ids)
             
             if cleanup_count > 0:
                 self.logger.info(f"文件清理完成，共清理 {cleanup_count} 个过期文件")
@@ -254,41 +734,123 @@ class FileManager:
             return {
                 'total_files': 0,
                 'total_size': 0,
+                'stored_size': 0,
                 'expired_files': 0,
                 'type_statistics': []
             }
     
-    def create_folder_zip(self, folder_path):
+    def reconcile_storage_stats(self):
+        """校对存储统计计数器"""
+        return self.database.reconcile_storage_stats()
+    
+    def _folder_zip_entries(self, files_in_folder, stack):
+        """文件夹内文件对应的ZIP成员，远程存储的文件下载到临时文件，随 stack 退出删除"""
+        entries = []
+        for file_info in files_in_folder:
+            # 在ZIP中使用相对路径
+            relative_path = file_info.get('relative_path', file_info['original_name'])
+            # 移除文件夹前缀，只保留文件名
+            zip_path = os.path.basename(relative_path)
+            file_path = stack.enter_context(self.local_blob(file_info))
+            if file_path:
+                entries.append(ArchiveEntry(
+                    file_path, zip_path, file_info['file_extension'],
+                    file_info.get('storage_codec'), file_info['file_size']
+                ))
+        return entries
+    
+    def create_folder_zip(self, folder_path, dest_path=None):
         """创建文件夹的ZIP压缩包"""
         try:
-            folder_structure = self.database.get_folder_structure()
-            
-            if folder_path not in folder_structure:
-                self.logger.warning(f"文件夹不存在: {folder_path}")
-                return None
-            
-            files_in_folder = folder_structure[folder_path]
+            files_in_folder = self.database.get_folder_files(folder_path)
             if not files_in_folder:
-                self.logger.warning(f"文件夹为空: {folder_path}")
+                self.logger.warning(f"文件夹不存在或为空: {folder_path}")
                 return None
             
-            # 创建临时ZIP文件
-            temp_zip = tempfile.NamedTemporaryFile(suffix='.zip', delete=False)
-            temp_zip.close()
+            with ExitStack() as stack:
+                zip_path, _ = self.archive_builder.build(self._folder_zip_entries(files_in_folder, stack), dest_path)
             
-            with zipfile.ZipFile(temp_zip.name, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for file_info in files_in_folder:
-                    file_path = file_info['file_path']
-                    if os.path.exists(file_path):
-                        # 在ZIP中使用相对路径
-                        relative_path = file_info.get('relative_path', file_info['original_name'])
-                        # 移除文件夹前缀，只保留文件名
-                        zip_path = os.path.basename(relative_path)
-                        zipf.write(file_path, zip_path)
-            
-            self.logger.info(f"创建文件夹ZIP: {folder_path} -> {temp_zip.name}")
-            return temp_zip.name
+            self.logger.info(f"创建文件夹ZIP: {folder_path} -> {zip_path}")
+            return zip_path
             
         except Exception as e:
             self.logger.error(f"创建文件夹ZIP失败: {str(e)}", exc_info=True)
-            return None
\ No newline at end of file
+            return None
+    
+    def get_folder_zip(self, folder_path):
+        """获取文件夹ZIP，返回 (ZIP路径, 是否为缓存文件)
+
+        启用缓存时同一内容版本只打包一次，调用方不应删除返回的缓存文件；
+        未启用缓存时返回临时文件，由调用方负责删除。
+        """
+        if self.archive_cache is None:
+            return self.create_folder_zip(folder_path), False
+        
+        try:
+            files_in_folder = self.database.get_folder_files(folder_path)
+            if not files_in_folder:
+                self.logger.warning(f"文件夹不存在或为空: {folder_path}")
+                return None, True
+            
+            def build(dest_path):
+                with ExitStack() as stack:
+                    self.archive_builder.build(self._folder_zip_entries(files_in_folder, stack), dest_path)
+                return True
+            
+            return self.archive_cache.get_or_build(folder_path, files_in_folder, build), True
+            
+        except Exception as e:
+            self.logger.error(f"获取文件夹ZIP失败: {str(e)}", exc_info=True)
+            return None, True
+    
+    def invalidate_folder_zip(self, folder_path):
+        """清除文件夹的ZIP缓存"""
+        if self.archive_cache is not None:
+            self.archive_cache.invalidate(folder_path)
+    
+    def _invalidate_folder_zips(self, metadata_list):
+        """文件删除后清除其所在文件夹的ZIP缓存（单个删除、批量删除和过期清理都经过这里）"""
+        if self.archive_cache is None:
+            return
+        folders = set()
+        for metadata in metadata_list:
+            path_parts = (metadata.get('relative_path') or '').replace('\\', '/').split('/')
+            if len(path_parts) > 1:
+                folders.add(path_parts[0])
+        for folder_path in folders:
+            self.archive_cache.invalidate(folder_path)
+    
+    def create_files_zip(self, file_ids, dest_path=None, progress=None):
+        """把多个文件打包为ZIP，返回 (ZIP路径, 文件数)，没有可打包的文件时返回 (None, 0)
+
+        dest_path 为空时写入临时文件；progress 见 ArchiveBuilder.build。
+        """
+        entries = []
+        used_names = set()
+        metadata_map = self.database.get_many(file_ids)
+        
+        # 远程存储的文件下载到临时文件，打包完成后删除
+        with ExitStack() as stack:
+            for file_id in file_ids:
+                metadata = metadata_map.get(file_id)
+                file_path = stack.enter_context(self.local_blob(metadata)) if metadata else None
+                if not file_path:
+                    continue
+                
+                # 使用原始文件名，如果重名则添加数字后缀
+                zip_name = metadata['original_name']
+                name, ext = os.path.splitext(zip_name)
+                counter = 1
+                while zip_name in used_names:
+                    zip_name = f"{name}_{counter}{ext}"
+                    counter += 1
+                used_names.add(zip_name)
+                
+                entries.append(ArchiveEntry(
+                    file_path, zip_name, metadata['file_extension'],
+                    metadata.get('storage_codec'), metadata['file_size']
+                ))
+            
+            if not entries:
+                return None, 0
+            return self.archive_builder.build(entries, dest_path, progress)
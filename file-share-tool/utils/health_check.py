@@ -3,7 +3,6 @@
 """
 import os
 import time
-import psutil
 from datetime import datetime, timedelta
 from flask import jsonify
 from .file_manager import FileManager
@@ -20,6 +19,9 @@ class HealthChecker:
     def check_system_resources(self):
         """检查系统资源"""
         try:
+            # psutil导入较慢，只在检查系统资源时导入
+            import psutil
+            
             # CPU使用率
             cpu_percent = psutil.cpu_percent(interval=1)
             
@@ -57,8 +59,8 @@ class HealthChecker:
                     'error': '上传目录不存在'
                 }
             
-            # 检查元数据文件
-            metadata_accessible = os.access(self.file_manager.metadata_file, os.R_OK | os.W_OK)
+            # 检查元数据数据库
+            metadata_accessible = os.access(self.file_manager.db_path, os.R_OK | os.W_OK)
             
             # 获取存储信息
             storage_info = self.file_manager.get_storage_info()
@@ -68,7 +70,9 @@ class HealthChecker:
                 'upload_folder_exists': True,
                 'metadata_accessible': metadata_accessible,
                 'total_files': storage_info.get('total_files', 0),
-                'total_size_mb': round(storage_info.get('total_size', 0) / (1024*1024), 2)
+                'total_size_mb': round(storage_info.get('total_size', 0) / (1024*1024), 2),
+                'stored_size_mb': round(storage_info.get('stored_size', 0) / (1024*1024), 2),
+                'stats_reconciled_at': storage_info.get('reconciled_at')
             }
         except Exception as e:
             self.logger.error(f"存储系统检查失败: {str(e)}")
@@ -80,23 +84,14 @@ class HealthChecker:
     def check_file_cleanup(self):
         """检查文件清理状态"""
         try:
-            # 统计过期文件数量
-            metadata_dict = self.file_manager.load_metadata()
-            now = datetime.now()
-            expired_count = 0
-            
-            for file_id, metadata in metadata_dict.items():
-                try:
-                    expire_time = datetime.fromisoformat(metadata.get('expire_time', ''))
-                    if now > expire_time:
-                        expired_count += 1
-                except (ValueError, TypeError):
-                    pass
+            # 过期文件数量来自存储统计计数器
+            storage_info = self.file_manager.get_storage_info()
+            expired_count = storage_info.get('expired_files', 0)
             
             return {
                 'status': 'healthy' if expired_count < 100 else 'warning',
                 'expired_files_count': expired_count,
-                'total_files_count': len(metadata_dict)
+                'total_files_count': storage_info.get('total_files', 0)
             }
         except Exception as e:
             self.logger.error(f"文件清理状态检查失败: {str(e)}")
@@ -105,6 +100,13 @@ class HealthChecker:
                 'error': str(e)
             }
     
+    def check_metadata_cache(self):
+        """检查元数据缓存"""
+        cache = self.file_manager.database.cache
+        if cache is None:
+            return {'status': 'healthy', 'enabled': False}
+        return {'status': 'healthy', 'enabled': True, **cache.get_stats()}
+    
     def get_service_info(self):
         """获取服务信息"""
         uptime_seconds = time.time() - self.start_time
@@ -124,7 +126,8 @@ class HealthChecker:
             'service': self.get_service_info(),
             'system_resources': self.check_system_resources(),
             'storage_system': self.check_storage_system(),
-            'file_cleanup': self.check_file_cleanup()
+            'file_cleanup': self.check_file_cleanup(),
+            'metadata_cache': self.check_metadata_cache()
         }
         
         # 确定整体状态
@@ -0,0 +1,426 @@
+"""
+后台任务队列模块
+
+ZIP打包、大批量删除、服务端解压、过期清理、存储对账等耗时操作作为任务提交到队列，
+请求立即返回任务ID，客户端通过 /api/jobs/<id> 查询状态和进度，完成后再取结果。
+
+任务保存在SQLite中，多个gunicorn worker共享同一个队列：每个进程运行若干工作线程，
+用 BEGIN IMMEDIATE 事务认领任务，同一任务只会被一个线程执行。
+- 优先级：priority 大的先执行，同优先级按提交顺序
+- 重试：处理函数抛出异常（业务异常除外）且未达到最大尝试次数时，延迟后重新排队（指数退避）
+- 取消：排队中的任务直接取消；运行中的任务设置取消标记，处理函数在报告进度时检查
+- 崩溃恢复：运行中的任务定期更新心跳，执行进程退出后超时的任务重新排队
+- 结果文件（如打包好的ZIP）保存在结果目录中，任务过期删除时一并删除
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from .exceptions import FileShareException
+from .logging_config import get_logger
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+# 优先级
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+# 两次写入进度（同时检查取消标记）的最小间隔（秒）
+PROGRESS_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    """任务已被取消，处理函数抛出后任务结束为 cancelled"""
+
+
+class JobContext:
+    """传给处理函数的任务上下文"""
+
+    def __init__(self, queue, job_id, job_type, payload, attempt):
+        self.queue = queue
+        self.id = job_id
+        self.type = job_type
+        self.payload = payload
+        # 第几次执行，从1开始
+        self.attempt = attempt
+        self._last_report = 0.0
+
+    def progress(self, percent, message=None, details=None, force=False):
+        """报告进度（0~100），同时检查取消标记，已取消时抛出 JobCancelled"""
+        now = time.time()
+        if not force and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        if self.queue._update_progress(self.id, percent, message, details):
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        """任务被取消时抛出 JobCancelled"""
+        if self.queue._is_cancel_requested(self.id):
+            raise JobCancelled()
+
+    def result_path(self, suffix=''):
+        """任务结果文件的路径，任务删除时一并删除"""
+        return os.path.join(self.queue.result_folder, f"{self.id}{suffix}")
+
+
+class JobQueue:
+    """SQLite任务队列和本进程的工作线程"""
+
+    def __init__(self, db_path, result_folder, workers=2, poll_interval=1.0, retention_hours=24,
+                 stale_seconds=120):
+        self.db_path = db_path
+        self.result_folder = result_folder
+        self.workers = workers
+        # 没有新任务通知时轮询数据库的间隔（其他进程提交的任务）
+        self.poll_interval = poll_interval
+        # 已结束任务的保留时间
+        self.retention_hours = retention_hours
+        # 心跳超过该时间未更新的运行中任务视为执行进程已退出
+        self.stale_seconds = stale_seconds
+        self.logger = get_logger()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers = {}
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._running_jobs = set()
+        self._running_lock = threading.Lock()
+
+        for folder in (os.path.dirname(db_path), result_folder):
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+        # 建表使用临时连接：应用可能在gunicorn master中预加载，SQLite连接不能跨fork使用
+        conn = sqlite3.connect(db_path, timeout=10.0)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    job_type TEXT NOT NULL,
+                    payload TEXT,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL DEFAULT 1,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    details TEXT,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    run_after REAL NOT NULL DEFAULT 0,
+                    heartbeat REAL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority DESC, created_at);
+                CREATE INDEX IF NOT EXISTS idx_jobs_type ON jobs (job_type, status);
+            ''')
+        finally:
+            conn.close()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def register(self, job_type, handler, max_attempts=1, retry_delay=5.0):
+        """注册任务处理函数 handler(context)，返回值（可JSON序列化）作为任务结果"""
+        self._handlers[job_type] = (handler, max_attempts, retry_delay)
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        for field in ('payload', 'details', 'result'):
+            job[field] = json.loads(job[field]) if job[field] else None
+        job['type'] = job.pop('job_type')
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        job['progress'] = round(job['progress'], 1)
+        return job
+
+    def submit(self, job_type, payload=None, priority=PRIORITY_NORMAL, unique=False):
+        """提交任务，返回任务信息
+
+        unique 为True时，已有同类型且未结束的任务则直接返回该任务（用于定时任务去重）。
+        """
+        if job_type not in self._handlers:
+            raise ValueError(f"未注册的任务类型: {job_type}")
+        max_attempts = self._handlers[job_type][1]
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if unique:
+                row = conn.execute(
+                    'SELECT * FROM jobs WHERE job_type = ? AND status IN (?, ?) LIMIT 1',
+                    (job_type, JOB_QUEUED, JOB_RUNNING)
+                ).fetchone()
+                if row is not None:
+                    conn.execute('COMMIT')
+                    return self._to_dict(row)
+
+            job_id = str(uuid.uuid4())
+            conn.execute(
+                'INSERT INTO jobs (id, job_type, payload, status, priority, max_attempts, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, job_type, json.dumps(payload, ensure_ascii=False) if payload is not None else None,
+                 JOB_QUEUED, priority, max_attempts, time.time())
+            )
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._wakeup.set()
+        self.logger.info(f"提交后台任务 {job_id}: {job_type}")
+        return self._to_dict(row)
+
+    def get(self, job_id):
+        """任务信息，不存在时返回None"""
+        row = self._connection().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status=None, limit=50):
+        """最近提交的任务"""
+        if status:
+            rows = self._connection().execute(
+                'SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?', (status, limit)
+            ).fetchall()
+        else:
+            rows = self._connection().execute(
+                'SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?', (limit,)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def cancel(self, job_id):
+        """取消任务：排队中的直接取消，运行中的设置取消标记；返回任务信息，不存在时返回None"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            'UPDATE jobs SET status = ?, cancel_requested = 1, finished_at = ? WHERE id = ? AND status = ?',
+            (JOB_CANCELLED, now, job_id, JOB_QUEUED)
+        )
+        conn.execute(
+            'UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?', (job_id, JOB_RUNNING)
+        )
+        return self.get(job_id)
+
+    def _update_progress(self, job_id, percent, message, details):
+        """写入进度，返回是否已请求取消"""
+        conn = self._connection()
+        conn.execute(
+            'UPDATE jobs SET progress = ?, message = COALESCE(?, message), details = COALESCE(?, details), '
+            'heartbeat = ? WHERE id = ?',
+            (max(0.0, min(float(percent), 100.0)), message,
+             json.dumps(details, ensure_ascii=False) if details is not None else None, time.time(), job_id)
+        )
+        return self._is_cancel_requested(job_id)
+
+    def _is_cancel_requested(self, job_id):
+        row = self._connection().execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row is None or bool(row[0])
+
+    def _claim(self):
+        """认领一个可执行的任务，没有时返回None"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT * FROM jobs WHERE status = ? AND run_after <= ? '
+                'ORDER BY priority DESC, created_at LIMIT 1',
+                (JOB_QUEUED, now)
+            ).fetchone()
+            if row is None or row['job_type'] not in self._handlers:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                'UPDATE jobs SET status = ?, attempts = attempts + 1, worker = ?, heartbeat = ?, '
+                'started_at = COALESCE(started_at, ?) WHERE id = ?',
+                (JOB_RUNNING, self.worker_id, now, now, row['id'])
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return row
+
+    def _finish(self, job_id, status, result=None, error=None):
+        self._connection().execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, '
+            'progress = CASE WHEN ? = ? THEN 100 ELSE progress END WHERE id = ?',
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+             time.time(), status, JOB_COMPLETED, job_id)
+        )
+
+    def _remove_result_files(self, job_id):
+        try:
+            names = [name for name in os.listdir(self.result_folder) if name.startswith(job_id)]
+        except OSError:
+            return
+        for name in names:
+            try:
+                os.remove(os.path.join(self.result_folder, name))
+            except OSError:
+                pass
+
+    def _execute(self, row):
+        job_id = row['id']
+        handler, max_attempts, retry_delay = self._handlers[row['job_type']]
+        attempt = row['attempts'] + 1
+        context = JobContext(
+            self, job_id, row['job_type'], json.loads(row['payload']) if row['payload'] else None, attempt
+        )
+        with self._running_lock:
+            self._running_jobs.add(job_id)
+        start_time = time.time()
+        try:
+            context.check_cancelled()
+            result = handler(context)
+            self._finish(job_id, JOB_COMPLETED, result)
+            self.logger.info(f"后台任务 {job_id} ({row['job_type']}) 完成，耗时 {time.time() - start_time:.1f} 秒")
+        except JobCancelled:
+            self._remove_result_files(job_id)
+            self._finish(job_id, JOB_CANCELLED)
+            self.logger.info(f"后台任务 {job_id} ({row['job_type']}) 已取消")
+        except Exception as e:
+            self._remove_result_files(job_id)
+            error = getattr(e, 'message', None) or str(e)
+            # 业务异常（如文件不存在、超出限制）重试也不会成功
+            if attempt < max_attempts and not isinstance(e, FileShareException):
+                delay = retry_delay * 2 ** (attempt - 1)
+                self._connection().execute(
+                    'UPDATE jobs SET status = ?, error = ?, run_after = ?, worker = NULL WHERE id = ?',
+                    (JOB_QUEUED, error, time.time() + delay, job_id)
+                )
+                self.logger.warning(
+                    f"后台任务 {job_id} ({row['job_type']}) 第 {attempt} 次执行失败: {error}，{delay:g} 秒后重试"
+                )
+            else:
+                self._finish(job_id, JOB_FAILED, error=error)
+                if isinstance(e, FileShareException):
+                    self.logger.warning(f"后台任务 {job_id} ({row['job_type']}) 失败: {error}")
+                else:
+                    self.logger.error(f"后台任务 {job_id} ({row['job_type']}) 失败: {error}", exc_info=True)
+        finally:
+            with self._running_lock:
+                self._running_jobs.discard(job_id)
+
+    def _worker_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                row = self._claim()
+            except sqlite3.Error as e:
+                self.logger.warning(f"认领后台任务失败: {str(e)}")
+                row = None
+            if row is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(row)
+
+    def _heartbeat(self):
+        """更新本进程运行中任务的心跳"""
+        with self._running_lock:
+            job_ids = list(self._running_jobs)
+        if job_ids:
+            placeholders = ','.join('?' * len(job_ids))
+            self._connection().execute(
+                f'UPDATE jobs SET heartbeat = ? WHERE id IN ({placeholders})', [time.time()] + job_ids
+            )
+
+    def recover_stale(self):
+        """执行进程已退出的任务：还能重试的重新排队，否则标记为失败；返回处理的任务数"""
+        cutoff = time.time() - self.stale_seconds
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                'SELECT id, attempts, max_attempts FROM jobs WHERE status = ? AND heartbeat < ?',
+                (JOB_RUNNING, cutoff)
+            ).fetchall()
+            for row in rows:
+                if row['attempts'] < row['max_attempts']:
+                    conn.execute(
+                        'UPDATE jobs SET status = ?, worker = NULL, error = ? WHERE id = ?',
+                        (JOB_QUEUED, '执行进程已退出，重新排队', row['id'])
+                    )
+                else:
+                    conn.execute(
+                        'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?',
+                        (JOB_FAILED, '执行进程已退出', time.time(), row['id'])
+                    )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if rows:
+            self.logger.warning(f"恢复了 {len(rows)} 个执行进程已退出的后台任务")
+        return len(rows)
+
+    def prune(self):
+        """删除过期的已结束任务及其结果文件，返回删除的任务数"""
+        cutoff = time.time() - self.retention_hours * 3600
+        conn = self._connection()
+        placeholders = ','.join('?' * len(FINISHED_STATUSES))
+        rows = conn.execute(
+            f'SELECT id FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?',
+            FINISHED_STATUSES + (cutoff,)
+        ).fetchall()
+        for row in rows:
+            self._remove_result_files(row['id'])
+            conn.execute('DELETE FROM jobs WHERE id = ?', (row['id'],))
+        return len(rows)
+
+    def _maintenance_loop(self):
+        """心跳、崩溃恢复和过期任务清理"""
+        interval = max(1.0, self.stale_seconds / 4)
+        last_prune = 0.0
+        while not self._stop_event.wait(interval):
+            try:
+                self._heartbeat()
+                self.recover_stale()
+                if time.time() - last_prune > 3600:
+                    last_prune = time.time()
+                    self.prune()
+            except Exception as e:
+                self.logger.warning(f"后台任务队列维护失败: {str(e)}")
+
+    def start(self):
+        """启动本进程的工作线程"""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._maintenance_loop, name='job-maintenance', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        self.logger.info(f"后台任务队列已启动，{self.workers} 个工作线程")
+
+    def stop(self):
+        """停止工作线程，正在执行的任务会执行完"""
+        self._stop_event.set()
+        self._wakeup.set()
+        self._threads = []
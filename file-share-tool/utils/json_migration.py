@@ -0,0 +1,332 @@
+"""
+旧版JSON元数据迁移模块
+
+旧版本把所有文件的元数据保存在 uploads/metadata.json 中（{文件ID: 元数据, ...}）。
+迁移时按块流式解析该文件，不把整个文件读入内存；每批记录在一个事务中写入SQLite，
+同一事务中记录已处理到的文件字节偏移，中断后再次启动时从该偏移继续。
+"""
+import os
+import json
+import time
+import codecs
+import threading
+from datetime import datetime
+from .logging_config import get_logger
+from .metadata_schema import to_epoch_ms
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，不做跨进程互斥
+    fcntl = None
+
+READ_CHUNK_SIZE = 1024 * 1024
+_WHITESPACE = ' \t\n\r'
+
+# 写入数据库前必须存在且不为空的字段
+REQUIRED_FIELDS = ('id', 'original_name', 'stored_name', 'file_path', 'file_size', 'upload_time', 'expire_time')
+
+
+class JsonObjectReader:
+    """流式解析顶层为对象的JSON文件
+
+    迭代返回 (键, 值, 值结束处的字节偏移)。start_offset 传入之前返回的偏移时，
+    从该位置继续解析（下一个字符应为逗号或右括号）。
+    """
+
+    def __init__(self, f, start_offset=0, chunk_size=READ_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.resumed = start_offset > 0
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        # _buffer[_pos] 在文件中的字节偏移
+        self.offset = start_offset
+        self._eof = False
+        f.seek(start_offset)
+
+    def _fill(self):
+        """读取下一块数据，文件已读完且没有新字符时返回False"""
+        if self._eof:
+            return False
+        data = self.f.read(self.chunk_size)
+        self._eof = not data
+        text = self._text_decoder.decode(data, final=self._eof)
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        return not self._eof or bool(text)
+
+    def _advance(self, end):
+        """消费缓冲区中 _pos 到 end 之间的字符"""
+        self.offset += len(self._buffer[self._pos:end].encode('utf-8'))
+        self._pos = end
+
+    def _peek(self):
+        """跳过空白，返回下一个字符，文件结束时返回空字符串"""
+        while True:
+            start = self._pos
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            # 空白字符都是单字节
+            self.offset += self._pos - start
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"JSON格式错误：字节偏移 {self.offset} 处应为 {char!r}，实际为 {found!r}")
+        self._advance(self._pos + 1)
+
+    def _decode(self):
+        """解析下一个完整的JSON值"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # 值恰好结束在缓冲区末尾时可能被截断（如数字），读入更多数据后再确认
+                if end < len(self._buffer) or self._eof:
+                    self._advance(end)
+                    return value
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise ValueError(f"JSON格式错误：字节偏移 {self.offset} 附近，{e.msg}") from e
+            self._fill()
+
+    def __iter__(self):
+        if self.resumed:
+            if self._peek() == '}':
+                return
+            self._expect(',')
+        else:
+            self._expect('{')
+            if self._peek() == '}':
+                return
+
+        while True:
+            if self._peek() != '"':
+                raise ValueError(f"JSON格式错误：字节偏移 {self.offset} 处应为键名")
+            key = self._decode()
+            self._expect(':')
+            value = self._decode()
+            yield key, value, self.offset
+
+            if self._peek() == '}':
+                return
+            self._expect(',')
+
+
+def normalize_record(key, value):
+    """把JSON中的一条记录转换为元数据字典，记录无效时返回None"""
+    if not isinstance(value, dict):
+        return None
+    record = dict(value)
+    record.setdefault('id', key)
+    record.setdefault('file_type', None)
+    record.setdefault('file_extension', None)
+    if any(record.get(field) is None for field in REQUIRED_FIELDS):
+        return None
+    # 时间以毫秒时间戳保存，无法解析的记录跳过
+    try:
+        to_epoch_ms(record['upload_time'])
+        to_epoch_ms(record['expire_time'])
+    except (TypeError, ValueError, AttributeError):
+        return None
+    return record
+
+
+class JsonMetadataMigrator:
+    """旧版JSON元数据迁移器"""
+
+    def __init__(self, file_manager, batch_size=5000, progress_interval=5.0):
+        self.file_manager = file_manager
+        self.database = file_manager.database
+        self.json_file = os.path.join(file_manager.upload_folder, 'metadata.json')
+        # 每个事务写入的记录数
+        self.batch_size = batch_size
+        # 输出进度日志的间隔（秒）
+        self.progress_interval = progress_interval
+        self.logger = get_logger()
+        self.thread = None
+        self.is_running = False
+        self.migrated_count = 0
+        self.skipped_count = 0
+        self.processed_bytes = 0
+        self.total_bytes = 0
+        self._lock_file = None
+        self._stop_event = threading.Event()
+
+    def get_progress(self):
+        """迁移进度"""
+        percent = self.processed_bytes / self.total_bytes * 100 if self.total_bytes else 0.0
+        return {
+            'running': self.is_running,
+            'migrated': self.migrated_count,
+            'skipped': self.skipped_count,
+            'processed_bytes': self.processed_bytes,
+            'total_bytes': self.total_bytes,
+            'percent': round(percent, 1)
+        }
+
+    def _acquire_process_lock(self, blocking):
+        """多个worker进程中只允许一个执行迁移；blocking为True时等待其他进程完成"""
+        if fcntl is None:
+            return True
+        lock_path = os.path.join(self.file_manager.upload_folder, '.json_migration.lock')
+        self._lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def _release_process_lock(self):
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _save_batch(self, records, offset, source_stat):
+        """在一个事务中写入一批记录和迁移进度"""
+        state = {
+            'source': self.json_file,
+            'source_size': source_stat.st_size,
+            'source_mtime': source_stat.st_mtime,
+            'byte_offset': offset,
+            'migrated_count': self.migrated_count + len(records),
+            'skipped_count': self.skipped_count
+        }
+        if not self.database.save_json_migration_batch(records, state):
+            raise RuntimeError('写入迁移批次失败')
+        self.migrated_count += len(records)
+        self.processed_bytes = offset
+
+    def _log_progress(self):
+        progress = self.get_progress()
+        self.logger.info(
+            f"JSON元数据迁移进度: {progress['percent']}%，已迁移 {progress['migrated']} 条，"
+            f"跳过 {progress['skipped']} 条无效记录"
+        )
+
+    def _migrate(self):
+        """迁移JSON文件中尚未处理的记录，被停止时返回False"""
+        source_stat = os.stat(self.json_file)
+        self.total_bytes = source_stat.st_size
+
+        # 同一个文件（大小和修改时间不变）从上次提交的偏移继续
+        offset = 0
+        state = self.database.get_json_migration_state(self.json_file)
+        if (state and state['source_size'] == source_stat.st_size
+                and state['source_mtime'] == source_stat.st_mtime):
+            offset = state['byte_offset']
+            self.migrated_count = state['migrated_count']
+            self.skipped_count = state['skipped_count']
+            self.processed_bytes = offset
+            self.logger.info(f"从上次中断处继续JSON元数据迁移，已迁移 {self.migrated_count} 条")
+
+        start_time = time.time()
+        last_report = start_time
+        records = []
+        pending = 0
+        last_offset = offset
+        with open(self.json_file, 'rb') as f:
+            for key, value, end_offset in JsonObjectReader(f, offset):
+                record = normalize_record(key, value)
+                if record is None:
+                    self.skipped_count += 1
+                else:
+                    records.append(record)
+                pending += 1
+                last_offset = end_offset
+
+                if pending >= self.batch_size:
+                    self._save_batch(records, last_offset, source_stat)
+                    records = []
+                    pending = 0
+                    if time.time() - last_report >= self.progress_interval:
+                        last_report = time.time()
+                        self._log_progress()
+                    if self._stop_event.is_set():
+                        return False
+
+        if pending:
+            self._save_batch(records, last_offset, source_stat)
+        self.processed_bytes = self.total_bytes
+        self.logger.info(
+            f"JSON元数据迁移完成，迁移 {self.migrated_count} 条，跳过 {self.skipped_count} 条无效记录，"
+            f"耗时 {time.time() - start_time:.1f} 秒"
+        )
+        return True
+
+    def run(self, blocking=True):
+        """执行迁移，完成或没有需要迁移的文件时返回True
+
+        迁移完成后JSON文件重命名为备份文件。blocking为False时，
+        其他进程正在迁移则直接返回False。
+        """
+        if not os.path.exists(self.json_file):
+            return True
+        if not self._acquire_process_lock(blocking):
+            self.logger.info("其他进程正在执行JSON元数据迁移，跳过")
+            return False
+
+        self.is_running = True
+        try:
+            # 等待锁期间其他进程可能已完成迁移
+            if not os.path.exists(self.json_file):
+                return True
+
+            self.logger.info("检测到旧的JSON元数据文件，开始迁移...")
+            if not self._migrate():
+                self.logger.info("JSON元数据迁移已暂停，下次启动时继续")
+                return False
+
+            backup_file = f"{self.json_file}.backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            os.rename(self.json_file, backup_file)
+            self.database.clear_json_migration_state(self.json_file)
+            self.logger.info(f"JSON数据迁移完成，原文件已备份为: {backup_file}")
+            return True
+        except Exception as e:
+            self.logger.error(f"从JSON迁移失败: {str(e)}", exc_info=True)
+            return False
+        finally:
+            self._release_process_lock()
+            self.is_running = False
+
+    def start(self):
+        """在后台线程中启动迁移"""
+        if not self.is_running and os.path.exists(self.json_file):
+            self.is_running = True
+            self._stop_event.clear()
+            self.thread = threading.Thread(
+                target=self.run, kwargs={'blocking': False}, name='json-migration', daemon=True
+            )
+            self.thread.start()
+
+    def stop(self):
+        """请求停止迁移，已提交的批次保持有效"""
+        self._stop_event.set()
+
+
+# 全局迁移器实例
+json_migrator = None
+
+def start_json_migration(file_manager, batch_size=5000):
+    """在后台启动JSON元数据迁移"""
+    global json_migrator
+    if json_migrator is None:
+        json_migrator = JsonMetadataMigrator(file_manager, batch_size)
+        json_migrator.start()
+    return json_migrator
+
+def stop_json_migration():
+    """停止后台JSON元数据迁移"""
+    global json_migrator
+    if json_migrator is not None:
+        json_migrator.stop()
+        json_migrator = None
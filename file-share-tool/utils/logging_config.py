@@ -8,6 +8,9 @@ import json
 from datetime import datetime
 from typing import Dict, Any, Optional
 
+# 请求日志中写入JSON日志的额外字段
+REQUEST_LOG_FIELDS = ('method', 'path', 'status_code', 'duration_ms', 'content_length', 'timings')
+
 class JsonFormatter(logging.Formatter):
     """JSON格式的日志格式器"""
     
@@ -33,6 +36,10 @@ class JsonFormatter(logging.Formatter):
             log_data['file_name'] = record.file_name
         if hasattr(record, 'file_size'):
             log_data['file_size'] = record.file_size
+        # 请求日志的字段（timings 为各阶段耗时，见 utils.timing）
+        for field in REQUEST_LOG_FIELDS:
+            if hasattr(record, field):
+                log_data[field] = getattr(record, field)
             
         # 添加异常信息
         if record.exc_info:
@@ -52,6 +59,10 @@ def setup_logging(app):
     app_logger = logging.getLogger('file_share')
     app_logger.setLevel(logging.INFO)
     
+    # 同一进程中多次创建应用时不重复添加处理器
+    if app_logger.handlers:
+        return app_logger
+    
     # 控制台处理器
     console_handler = logging.StreamHandler()
     console_formatter = logging.Formatter(
@@ -98,6 +109,23 @@ def setup_logging(app):
     
     return app_logger
 
+def reopen_log_files():
+    """重新打开日志文件
+
+    fork出的子进程继承了父进程打开的日志文件对象，子进程中重新打开，
+    避免多个进程共用同一个文件对象的缓冲区和偏移量。
+    """
+    for name in ('file_share', 'audit', 'error'):
+        for handler in logging.getLogger(name).handlers:
+            if isinstance(handler, logging.FileHandler):
+                handler.acquire()
+                try:
+                    if handler.stream:
+                        handler.stream.close()
+                    handler.stream = handler._open()
+                finally:
+                    handler.release()
+
 def get_logger(name: str = 'file_share') -> logging.Logger:
     """获取日志记录器"""
     return logging.getLogger(name)
@@ -0,0 +1,152 @@
+"""
+元数据缓存模块
+
+进程内的LRU/TTL缓存，位于 DatabaseManager 的元数据和列表查询之前。
+多个gunicorn worker之间通过共享mmap中的代数计数器保持一致：
+任何进程写入元数据后递增计数器，其他进程读取缓存时发现代数变化即清空缓存，
+检查代数只是一次内存读取，不需要访问数据库。
+"""
+import os
+import mmap
+import time
+import struct
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，只保证进程内递增的原子性
+    fcntl = None
+
+_COUNTER_FORMAT = '<Q'
+_COUNTER_SIZE = struct.calcsize(_COUNTER_FORMAT)
+
+
+class GenerationCounter:
+    """基于共享内存映射文件的代数计数器"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._open()
+
+    def _open(self):
+        """打开（或创建）计数器文件并映射到内存，fork后的子进程重新映射"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < _COUNTER_SIZE:
+                os.write(fd, b'\0' * _COUNTER_SIZE)
+            self._file = os.fdopen(fd, 'r+b')
+        except Exception:
+            os.close(fd)
+            raise
+        self._mmap = mmap.mmap(self._file.fileno(), _COUNTER_SIZE)
+        self._pid = os.getpid()
+
+    @property
+    def value(self):
+        """当前代数"""
+        if self._pid != os.getpid():
+            self._open()
+        return struct.unpack_from(_COUNTER_FORMAT, self._mmap)[0]
+
+    def bump(self):
+        """递增代数，返回新值"""
+        if self._pid != os.getpid():
+            self._open()
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                new_value = struct.unpack_from(_COUNTER_FORMAT, self._mmap)[0] + 1
+                struct.pack_into(_COUNTER_FORMAT, self._mmap, 0, new_value)
+                return new_value
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
+
+
+class MetadataCache:
+    """带TTL和代数校验的LRU缓存"""
+
+    def __init__(self, generation, max_entries=10000, ttl=300):
+        self.generation = generation
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = generation.value
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def reinit_after_fork(self):
+        """fork后重建锁；缓存条目由代数校验保证有效，无需清空"""
+        self._lock = threading.Lock()
+        self.generation._lock = threading.Lock()
+
+    def _check_generation(self):
+        """代数变化时清空缓存，返回当前代数（需在锁内调用）"""
+        current = self.generation.value
+        if current != self._generation:
+            self._entries.clear()
+            self._generation = current
+            self.invalidations += 1
+        return current
+
+    def current_generation(self):
+        """读取当前代数，查询数据库前调用，结果用于 put()"""
+        with self._lock:
+            return self._check_generation()
+
+    def get(self, key):
+        """获取缓存值，未命中返回None"""
+        with self._lock:
+            self._check_generation()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation):
+        """写入缓存；generation是查询前读取的代数，期间发生过写入则不缓存"""
+        with self._lock:
+            if self._check_generation() != generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        """递增代数，使所有进程的缓存失效"""
+        self.generation.bump()
+
+    def get_stats(self):
+        """命中率等统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'generation': self._generation,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
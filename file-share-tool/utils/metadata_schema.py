@@ -0,0 +1,331 @@
+"""
+文件元数据表结构（v2）
+
+元数据保存在 files 表中，与 v1 的 file_metadata 表相比：
+- upload_time / expire_time 为本地时间的毫秒时间戳（INTEGER），按整数比较和排序；
+- MIME类型、扩展名和文件所在目录保存在查找表中，每行只记录整数ID；
+- 可以推导的字段记为NULL：original_name 与 relative_path 相同、stored_name 为
+  "<文件ID>.<扩展名>"、file_path 为 "<目录><stored_name>" 时都不重复保存；
+- 列表按 upload_time、过期清理按 expire_time 走只含时间戳的索引。
+
+读取时用 metadata_from_row() 把行还原为与 v1 相同的元数据字典，时间还原为ISO格式字符串
+（精确到毫秒）。同名视图 file_metadata 用SQL表达式（FILE_COLUMNS）提供 v1 的表结构，
+迁移期间仍在运行的旧版本进程通过视图上的 INSTEAD OF 触发器继续读写。
+"""
+from datetime import datetime
+from functools import lru_cache
+
+SCHEMA_VERSION = 2
+
+# files 行中 stored_name 和 file_path 的还原表达式（f 为 files，e/d 为扩展名和目录查找表）
+STORED_NAME_SQL = "ifnull(f.stored_name, f.id || '.' || e.extension)"
+FILE_PATH_SQL = f"ifnull(f.file_path, d.prefix || {STORED_NAME_SQL})"
+
+
+def iso_time_sql(column):
+    """毫秒时间戳列还原为本地时间的ISO格式字符串"""
+    return f"strftime('%Y-%m-%dT%H:%M:%f', {column} / 1000.0, 'unixepoch', 'localtime')"
+
+
+def epoch_ms_sql(column):
+    """本地时间的ISO格式字符串转换为毫秒时间戳，无法解析时为0"""
+    return f"ifnull(CAST(round((julianday({column}, 'utc') - 2440587.5) * 86400000) AS INTEGER), 0)"
+
+
+# 兼容视图的列，与 v1 file_metadata 的列名相同
+FILE_COLUMNS = f'''
+    f.id AS id,
+    ifnull(f.original_name, f.relative_path) AS original_name,
+    {STORED_NAME_SQL} AS stored_name,
+    {FILE_PATH_SQL} AS file_path,
+    f.file_size AS file_size,
+    t.mime AS file_type,
+    e.extension AS file_extension,
+    {iso_time_sql('f.upload_time')} AS upload_time,
+    {iso_time_sql('f.expire_time')} AS expire_time,
+    f.relative_path AS relative_path,
+    f.is_text_file AS is_text_file,
+    f.content_hash AS content_hash,
+    f.storage_codec AS storage_codec,
+    f.stored_size AS stored_size
+'''
+FILE_JOINS = '''
+    LEFT JOIN file_types t ON t.id = f.type_id
+    LEFT JOIN file_extensions e ON e.id = f.extension_id
+    LEFT JOIN blob_dirs d ON d.id = f.dir_id
+'''
+
+# files 的列，与 file_row() 和 metadata_from_row() 的顺序一致
+FILE_TABLE_COLUMNS = (
+    'id', 'relative_path', 'original_name', 'stored_name', 'dir_id', 'file_path', 'file_size',
+    'type_id', 'extension_id', 'upload_time', 'expire_time', 'is_text_file', 'content_hash',
+    'storage_codec', 'stored_size'
+)
+# 查询 files（别名f）的列，其后可以再加其他列
+FILE_SELECT = ', '.join(f'f.{column}' for column in FILE_TABLE_COLUMNS)
+FILE_INSERT_SQL = (
+    f"INSERT OR REPLACE INTO files ({', '.join(FILE_TABLE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(FILE_TABLE_COLUMNS))})"
+)
+
+# 查找表：(表名, 值列名)
+FILE_TYPES = ('file_types', 'mime')
+FILE_EXTENSIONS = ('file_extensions', 'extension')
+BLOB_DIRS = ('blob_dirs', 'prefix')
+
+
+def create_schema(conn):
+    """创建 v2 的表和索引（已存在时跳过），不提交事务"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE TABLE IF NOT EXISTS file_types (id INTEGER PRIMARY KEY, mime TEXT NOT NULL UNIQUE)')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS file_extensions (id INTEGER PRIMARY KEY, extension TEXT NOT NULL UNIQUE)'
+    )
+    # 文件所在目录（file_path 去掉存储文件名的部分），如 uploads/ab/cd/、s3://bucket/prefix/
+    conn.execute('CREATE TABLE IF NOT EXISTS blob_dirs (id INTEGER PRIMARY KEY, prefix TEXT NOT NULL UNIQUE)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            id TEXT PRIMARY KEY,
+            relative_path TEXT,
+            original_name TEXT,
+            stored_name TEXT,
+            dir_id INTEGER,
+            file_path TEXT,
+            file_size INTEGER NOT NULL,
+            type_id INTEGER,
+            extension_id INTEGER,
+            upload_time INTEGER NOT NULL,
+            expire_time INTEGER NOT NULL,
+            is_text_file INTEGER NOT NULL DEFAULT 0,
+            content_hash TEXT,
+            storage_codec TEXT,
+            stored_size INTEGER
+        )
+    ''')
+    # 索引中只有时间戳和rowid：分页先在索引上定位rowid，过期统计直接在索引上计数
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_upload_time ON files(upload_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_expire_time ON files(expire_time)')
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files(content_hash) WHERE content_hash IS NOT NULL'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_relative_path ON files(relative_path)')
+
+
+def schema_version(conn):
+    """数据库当前的结构版本，没有版本记录时为0"""
+    if conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone() is None:
+        return 0
+    return conn.execute('SELECT IFNULL(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def record_version(conn, description):
+    """记录当前结构版本（已记录时跳过）"""
+    conn.execute(
+        'INSERT OR IGNORE INTO schema_version (version, description) VALUES (?, ?)',
+        (SCHEMA_VERSION, description)
+    )
+
+
+def to_epoch_ms(value):
+    """ISO格式的本地时间（或datetime）转换为毫秒时间戳"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return round(value.timestamp() * 1000)
+
+
+@lru_cache(maxsize=4096)
+def _local_minute(minute):
+    return datetime.fromtimestamp(minute * 60).strftime('%Y-%m-%dT%H:%M:')
+
+
+def iso_time(ms):
+    """毫秒时间戳还原为本地时间的ISO格式字符串（精确到毫秒），与 iso_time_sql() 的结果相同
+
+    时区偏移按分钟变化，分钟前缀缓存后每次只需拼接秒和毫秒。
+    """
+    minute, rest = divmod(ms, 60000)
+    return f"{_local_minute(minute)}{rest // 1000:02d}.{rest % 1000:03d}"
+
+
+def split_file_path(file_path, stored_name):
+    """file_path 为 "<目录><stored_name>" 时返回 (目录, None)，否则返回 (None, file_path)"""
+    if stored_name and file_path and len(file_path) > len(stored_name) and file_path.endswith(stored_name):
+        return file_path[:-len(stored_name)], None
+    return None, file_path
+
+
+def file_row(metadata, type_ids, extension_ids, dir_ids):
+    """元数据字典转换为 files 的插入参数，查找表ID由调用方事先写入"""
+    file_id = metadata['id']
+    relative_path = metadata.get('relative_path')
+    original_name = metadata['original_name']
+    extension = metadata.get('file_extension')
+    stored_name = metadata['stored_name']
+    prefix, file_path = split_file_path(metadata['file_path'], stored_name)
+    return (
+        file_id,
+        relative_path,
+        None if original_name == relative_path else original_name,
+        None if extension is not None and stored_name == f"{file_id}.{extension}" else stored_name,
+        dir_ids.get(prefix),
+        file_path,
+        metadata['file_size'],
+        type_ids.get(metadata.get('file_type')),
+        extension_ids.get(extension),
+        to_epoch_ms(metadata['upload_time']),
+        to_epoch_ms(metadata['expire_time']),
+        1 if metadata.get('is_text_file') else 0,
+        metadata.get('content_hash'),
+        metadata.get('storage_codec'),
+        metadata.get('stored_size')
+    )
+
+
+def metadata_from_row(row, types, extensions, dirs):
+    """FILE_SELECT 查出的行还原为元数据字典，types/extensions/dirs 为查找表的 {ID: 取值}"""
+    file_id = row[0]
+    relative_path = row[1]
+    original_name = row[2]
+    stored_name = row[3]
+    file_path = row[5]
+    extension = extensions.get(row[8])
+    if stored_name is None:
+        stored_name = f"{file_id}.{extension}"
+    if file_path is None:
+        file_path = dirs[row[4]] + stored_name
+    return {
+        'id': file_id,
+        'original_name': relative_path if original_name is None else original_name,
+        'stored_name': stored_name,
+        'file_path': file_path,
+        'file_size': row[6],
+        'file_type': types.get(row[7]),
+        'file_extension': extension,
+        'upload_time': iso_time(row[9]),
+        'expire_time': iso_time(row[10]),
+        'relative_path': relative_path,
+        'is_text_file': row[11],
+        'content_hash': row[12],
+        'storage_codec': row[13],
+        'stored_size': row[14]
+    }
+
+
+def lookup_values(metadata_list):
+    """一批元数据引用的查找表取值：{(表名, 列名): 取值集合}"""
+    values = {FILE_TYPES: set(), FILE_EXTENSIONS: set(), BLOB_DIRS: set()}
+    for metadata in metadata_list:
+        if metadata.get('file_type') is not None:
+            values[FILE_TYPES].add(metadata['file_type'])
+        if metadata.get('file_extension') is not None:
+            values[FILE_EXTENSIONS].add(metadata['file_extension'])
+        prefix, _ = split_file_path(metadata['file_path'], metadata['stored_name'])
+        if prefix is not None:
+            values[BLOB_DIRS].add(prefix)
+    return values
+
+
+# ---- v1 结构的记录转换为 files 行（SQL，用于迁移和兼容视图的触发器） ----
+
+def _legacy_path_derivable(x):
+    return (
+        f"(length({x}.stored_name) > 0 AND length({x}.file_path) > length({x}.stored_name) "
+        f"AND substr({x}.file_path, -length({x}.stored_name)) = {x}.stored_name)"
+    )
+
+
+def _legacy_path_prefix(x):
+    return f"substr({x}.file_path, 1, length({x}.file_path) - length({x}.stored_name))"
+
+
+def legacy_intern_sql(x, source='', condition='1'):
+    """写入 v1 记录（别名为x，来自source）引用的查找表取值的语句
+
+    触发器中语句的冲突处理会被外层语句覆盖（旧版本的 INSERT OR REPLACE 会把 OR IGNORE
+    变成替换，查找表的ID随之改变），所以先判断取值不存在再插入，不依赖冲突处理。
+    """
+    lookups = (
+        ('file_types', 'mime', f"{x}.file_type", f"{x}.file_type IS NOT NULL"),
+        ('file_extensions', 'extension', f"{x}.file_extension", f"{x}.file_extension IS NOT NULL"),
+        ('blob_dirs', 'prefix', _legacy_path_prefix(x), _legacy_path_derivable(x)),
+    )
+    return [
+        f"INSERT INTO {table} ({column}) SELECT DISTINCT {value} {source} "
+        f"WHERE {condition} AND {present} "
+        f"AND NOT EXISTS (SELECT 1 FROM {table} WHERE {column} = {value})"
+        for table, column, value, present in lookups
+    ]
+
+
+def legacy_values_sql(x):
+    """v1 记录（别名为x）转换为 files 各列的表达式，与 FILE_TABLE_COLUMNS 的顺序一致"""
+    derivable = _legacy_path_derivable(x)
+    return [
+        f"{x}.id",
+        f"{x}.relative_path",
+        f"CASE WHEN {x}.original_name = {x}.relative_path THEN NULL ELSE {x}.original_name END",
+        f"CASE WHEN {x}.stored_name = {x}.id || '.' || {x}.file_extension THEN NULL ELSE {x}.stored_name END",
+        f"CASE WHEN {derivable} THEN (SELECT id FROM blob_dirs WHERE prefix = {_legacy_path_prefix(x)}) END",
+        f"CASE WHEN {derivable} THEN NULL ELSE {x}.file_path END",
+        f"{x}.file_size",
+        f"(SELECT id FROM file_types WHERE mime = {x}.file_type)",
+        f"(SELECT id FROM file_extensions WHERE extension = {x}.file_extension)",
+        epoch_ms_sql(f"{x}.upload_time"),
+        epoch_ms_sql(f"{x}.expire_time"),
+        f"ifnull({x}.is_text_file, 0)",
+        f"{x}.content_hash",
+        f"{x}.storage_codec",
+        f"{x}.stored_size",
+    ]
+
+
+def legacy_copy_sql(x, source='', condition='1'):
+    """把 v1 记录写入 files 的语句（先写查找表）"""
+    return legacy_intern_sql(x, source, condition) + [
+        f"INSERT OR REPLACE INTO files ({', '.join(FILE_TABLE_COLUMNS)}) "
+        f"SELECT {', '.join(legacy_values_sql(x))} {source} WHERE {condition}"
+    ]
+
+
+def create_compat_view(conn):
+    """创建 v1 结构的兼容视图 file_metadata 及其写入触发器（已存在时跳过）"""
+    conn.execute(f'''
+        CREATE VIEW IF NOT EXISTS file_metadata AS
+        SELECT {FILE_COLUMNS}, NULL AS created_at, NULL AS updated_at
+        FROM files f {FILE_JOINS}
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS file_metadata_insert INSTEAD OF INSERT ON file_metadata BEGIN
+            {'; '.join(legacy_copy_sql('new'))};
+        END
+    ''')
+    assignments = ', '.join(
+        f"{column} = {value}"
+        for column, value in zip(FILE_TABLE_COLUMNS[1:], legacy_values_sql('new')[1:])
+    )
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS file_metadata_update INSTEAD OF UPDATE ON file_metadata BEGIN
+            {'; '.join(legacy_intern_sql('new'))};
+            UPDATE files SET {assignments} WHERE id = old.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS file_metadata_delete INSTEAD OF DELETE ON file_metadata BEGIN
+            DELETE FROM files WHERE id = old.id;
+        END
+    ''')
+
+
+def is_legacy_table(conn):
+    """file_metadata 是否为 v1 的数据表（迁移完成后为视图）"""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_metadata'"
+    ).fetchone() is not None
@@ -2,26 +2,36 @@
 Flask异常处理中间件和工具函数
 """
 from functools import wraps
-from flask import request, jsonify, g
+from flask import request, jsonify, g, current_app
 import traceback
 import time
 from .exceptions import FileShareException
 from .logging_config import get_logger, log_error, log_operation
+from .timing import TimedJSONProvider, start_request
 
 def get_client_ip():
-    """获取客户端IP地址"""
-    if request.environ.get('HTTP_X_FORWARDED_FOR'):
-        return request.environ['HTTP_X_FORWARDED_FOR'].split(',')[0].strip()
-    elif request.environ.get('HTTP_X_REAL_IP'):
-        return request.environ.get('HTTP_X_REAL_IP')
-    else:
-        return request.environ.get('REMOTE_ADDR', 'unknown')
+    """获取客户端IP地址
+
+    直接对外服务时请求头可以被客户端任意伪造，只使用连接的对端地址（REMOTE_ADDR）。
+    配置了 TRUSTED_PROXY_COUNT（应用前的反向代理层数N）时取 X-Forwarded-For 从右数第N个
+    地址，即最外层可信代理看到的对端地址，与 werkzeug ProxyFix(x_for=N) 相同。
+    """
+    environ = request.environ
+    trusted = current_app.config.get('TRUSTED_PROXY_COUNT', 0)
+    if trusted:
+        forwarded = [ip.strip() for ip in environ.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= trusted:
+            return forwarded[-trusted]
+    return environ.get('REMOTE_ADDR') or 'unknown'
 
 def setup_error_handlers(app):
     """设置Flask应用的错误处理器"""
     
     logger = get_logger()
     
+    # JSON序列化计入请求的 serialize 阶段
+    app.json = TimedJSONProvider(app)
+    
     @app.errorhandler(FileShareException)
     def handle_file_share_exception(error):
         """处理自定义异常"""
@@ -35,12 +45,15 @@ def setup_error_handlers(app):
             error_details=error.details
         )
         
-        return jsonify({
+        response = jsonify({
             'success': False,
             'message': error.message,
             'code': error.code,
             'timestamp': time.time()
-        }), error.code
+        })
+        if error.details.get('retry_after'):
+            response.headers['Retry-After'] = str(error.details['retry_after'])
+        return response, error.code
     
     @app.errorhandler(404)
     def handle_not_found(error):
@@ -104,6 +117,7 @@ def setup_error_handlers(app):
         """请求前处理"""
         g.start_time = time.time()
         g.client_ip = get_client_ip()
+        start_request()
     
     @app.after_request
     def after_request(response):
@@ -111,6 +125,15 @@ def setup_error_handlers(app):
         # 记录请求日志
         duration = time.time() - g.get('start_time', time.time())
         
+        # 各阶段耗时写入 Server-Timing 响应头和请求日志
+        timings = g.get('timings')
+        breakdown = None
+        if timings is not None:
+            total_ms = timings.total_ms()
+            breakdown = timings.breakdown()
+            if app.config.get('SERVER_TIMING_ENABLED'):
+                response.headers['Server-Timing'] = timings.header(total_ms)
+        
         if request.endpoint and not request.endpoint.startswith('static'):
             logger.info(
                 f"{request.method} {request.path} - {response.status_code}",
@@ -120,7 +143,8 @@ def setup_error_handlers(app):
                     'path': request.path,
                     'status_code': response.status_code,
                     'duration_ms': round(duration * 1000, 2),
-                    'content_length': response.content_length
+                    'content_length': response.content_length,
+                    'timings': breakdown
                 }
             )
         
@@ -0,0 +1,308 @@
+"""
+SQL执行统计模块
+
+DatabaseManager 的连接使用 InstrumentedConnection，每条语句的执行次数、总耗时、
+最大耗时和返回行数（写语句为影响的行数）记录在进程内的 QueryStats 中。语句按SQL文本
+归并，IN 列表中的多个占位符合并为一个。执行和读取结果的时间都计入语句耗时，语句在
+结果读完、游标再次执行、游标被释放或连接关闭时结束。
+
+耗时超过慢查询阈值的语句连同 EXPLAIN QUERY PLAN 写入日志并保留最近的若干条。
+开启全表扫描检查（测试模式）时，每条语句第一次执行前检查查询计划，对数据表的全表扫描
+抛出 FullTableScanError；确实需要全表扫描的语句在SQL中加上注释 /* full-scan */。
+"""
+import os
+import re
+import time
+import sqlite3
+import threading
+import weakref
+from collections import deque
+from .logging_config import get_logger
+
+# 允许全表扫描的语句标记
+FULL_SCAN_MARK = '/* full-scan */'
+# 行数很少的表，全表扫描不算问题
+SMALL_TABLES = frozenset({
+    'storage_stats', 'extension_stats', 'expiry_stats', 'json_migration_state',
+    'schema_version', 'schema_migration_state', 'file_types', 'file_extensions',
+    'sqlite_master', 'sqlite_schema', 'sqlite_temp_master'
+})
+# 能够 EXPLAIN QUERY PLAN 的语句
+EXPLAINABLE_STATEMENTS = ('SELECT', 'WITH', 'INSERT', 'REPLACE', 'UPDATE', 'DELETE')
+# 归并后的语句文本缓存上限
+MAX_NORMALIZED_SQL = 2000
+
+_PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+_WHITESPACE = re.compile(r'\s+')
+# 不使用索引的全表扫描，如 "SCAN files"（旧版SQLite为 "SCAN TABLE files"）
+_TABLE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+
+
+class FullTableScanError(AssertionError):
+    """语句的查询计划包含全表扫描（只在开启全表扫描检查时抛出）"""
+
+
+def normalize_sql(sql):
+    """归并语句文本：压缩空白，IN 列表的占位符合并为一个"""
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    return _PLACEHOLDER_LIST.sub('?, ...', sql)
+
+
+def explain(conn, sql, parameters=()):
+    """语句的查询计划，每个步骤一行"""
+    cursor = sqlite3.Connection.cursor(conn)
+    try:
+        rows = cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+    finally:
+        cursor.close()
+    return [row[3] for row in rows]
+
+
+def full_scans(plan):
+    """查询计划中全表扫描的表（不含小表）"""
+    tables = []
+    for detail in plan:
+        match = _TABLE_SCAN.match(detail)
+        if match and match.group(1) not in SMALL_TABLES:
+            tables.append(match.group(1))
+    return tables
+
+
+class QueryStats:
+    """进程内的SQL执行统计和慢查询日志"""
+
+    def __init__(self, slow_query_ms=100, slow_log_size=100, check_full_scan=False):
+        self.slow_query_ms = slow_query_ms
+        self.check_full_scan = check_full_scan
+        self.logger = get_logger()
+        self._lock = threading.Lock()
+        # {语句: [执行次数, 总耗时, 最大耗时, 行数]}，耗时单位为秒
+        self._stats = {}
+        self._slow = deque(maxlen=slow_log_size)
+        # 原始SQL到归并后语句的缓存，已检查过查询计划的语句
+        self._normalized = {}
+        self._checked = set()
+
+    def reinit_after_fork(self):
+        """fork后在子进程中重建锁，不保留父进程的统计"""
+        self._lock = threading.Lock()
+        self.reset()
+
+    def _key(self, sql):
+        key = self._normalized.get(sql)
+        if key is None:
+            key = normalize_sql(sql)
+            if len(self._normalized) >= MAX_NORMALIZED_SQL:
+                self._normalized.clear()
+            self._normalized[sql] = key
+        return key
+
+    def check_plan(self, conn, sql, parameters):
+        """开启全表扫描检查时，语句第一次执行前检查查询计划"""
+        if not self.check_full_scan:
+            return
+        key = self._key(sql)
+        if key in self._checked:
+            return
+        self._checked.add(key)
+        if FULL_SCAN_MARK in sql or not key.upper().startswith(EXPLAINABLE_STATEMENTS):
+            return
+        plan = explain(conn, sql, parameters)
+        tables = full_scans(plan)
+        if tables:
+            # 下次执行时再次检查
+            self._checked.discard(key)
+            raise FullTableScanError(f"语句对 {', '.join(tables)} 全表扫描: {key} | 查询计划: {'; '.join(plan)}")
+
+    def record(self, conn, sql, parameters, elapsed, rows):
+        """记录一条语句的执行，超过慢查询阈值时记录查询计划"""
+        key = self._key(sql)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = [0, 0.0, 0.0, 0]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+            entry[3] += rows
+
+        duration_ms = elapsed * 1000
+        if self.slow_query_ms is None or duration_ms < self.slow_query_ms:
+            return
+        plan = None
+        if key.upper().startswith(EXPLAINABLE_STATEMENTS):
+            try:
+                plan = explain(conn, sql, parameters)
+            except sqlite3.Error as e:
+                self.logger.warning(f"获取慢查询的查询计划失败: {e}")
+        with self._lock:
+            self._slow.append({
+                'sql': key,
+                'duration_ms': round(duration_ms, 2),
+                'rows': rows,
+                'plan': plan,
+                'time': time.time()
+            })
+        self.logger.warning(
+            f"慢查询 {duration_ms:.1f}ms（{rows} 行）: {key}"
+            + (f" | 查询计划: {'; '.join(plan)}" if plan else '')
+        )
+
+    def snapshot(self, sort_by='total_ms', limit=50):
+        """按指定字段从大到小排列的语句统计"""
+        with self._lock:
+            items = list(self._stats.items())
+        statements = [
+            {
+                'sql': key,
+                'count': count,
+                'total_ms': round(total * 1000, 3),
+                'avg_ms': round(total * 1000 / count, 3),
+                'max_ms': round(max_time * 1000, 3),
+                'rows': rows
+            }
+            for key, (count, total, max_time, rows) in items
+        ]
+        statements.sort(key=lambda item: item[sort_by], reverse=True)
+        return statements[:limit]
+
+    def slow_queries(self):
+        """最近的慢查询，最新的在前"""
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+
+    def to_dict(self, sort_by='total_ms', limit=50):
+        return {
+            'pid': os.getpid(),
+            'slow_query_ms': self.slow_query_ms,
+            'check_full_scan': self.check_full_scan,
+            'statements': self.snapshot(sort_by, limit),
+            'slow_queries': self.slow_queries()
+        }
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """记录语句耗时和行数的游标"""
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        # 进行中的语句：[SQL, 参数, 耗时, 行数]
+        self._statement = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self.connection.query_stats.check_plan(self.connection, sql, parameters)
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._started(sql, parameters, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        # 查询计划按第一组参数
+        first = seq_of_parameters[0] if seq_of_parameters else ()
+        if seq_of_parameters:
+            self.connection.query_stats.check_plan(self.connection, sql, first)
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._started(sql, first, time.perf_counter() - start)
+        return self
+
+    def _started(self, sql, parameters, elapsed):
+        self._statement = [sql, parameters, elapsed, 0]
+        if self.description is None:
+            # 没有结果集的语句立即结束，行数为影响的行数
+            self._statement[3] = max(self.rowcount, 0)
+            self._finish()
+        else:
+            self.connection._pending.add(self)
+
+    def _fetched(self, start, rows, done):
+        statement = self._statement
+        if statement is None:
+            return
+        statement[2] += time.perf_counter() - start
+        statement[3] += rows
+        if done:
+            self._finish()
+
+    def _finish(self):
+        """结束当前语句并记录"""
+        statement = self._statement
+        if statement is None:
+            return
+        self._statement = None
+        self.connection._pending.discard(self)
+        sql, parameters, elapsed, rows = statement
+        self.connection.query_stats.record(self.connection, sql, parameters, elapsed, rows)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0, True)
+            raise
+        self._fetched(start, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # 只读取了部分结果的游标（如 fetchone）在释放时结束语句
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """游标为 InstrumentedCursor 的连接，创建后设置 query_stats"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.query_stats = None
+        # 结果尚未读完的游标，连接关闭时结束其语句；不持有游标，以免语句一直处于执行中
+        self._pending = weakref.WeakSet()
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        for cursor in list(self._pending):
+            cursor._finish()
+        super().close()
@@ -0,0 +1,215 @@
+"""
+请求频率限制和带宽整形模块
+
+基于令牌桶算法，按客户端IP限制每个端点的请求频率，并对上传/下载数据流做
+每客户端带宽整形。令牌桶状态保存在SQLite中，多个gunicorn worker共享同一份限额。
+"""
+import os
+import time
+import sqlite3
+import threading
+from flask import request, g
+from .exceptions import RateLimitException
+from .logging_config import get_logger
+from .middleware import get_client_ip
+
+# 带宽整形时每次预约的字节数，避免每个小数据块都访问一次数据库
+BANDWIDTH_QUANTUM = 256 * 1024
+# 超过该时间未更新的令牌桶会被清理
+BUCKET_IDLE_SECONDS = 3600
+PRUNE_INTERVAL_SECONDS = 600
+
+# 数据流整形适用的端点
+DOWNLOAD_ENDPOINTS = {'download_file', 'download_folder', 'batch_download_files', 'download_job_result', 'preview_file'}
+
+# ASGI服务器在environ中设置的标记：
+# 请求频率已在接收请求体之前检查过
+ENVIRON_RATE_CHECKED = 'fileshare.rate_limit_checked'
+# 下载带宽整形由服务器在事件循环上完成，不在线程中sleep
+ENVIRON_ASYNC_SHAPING = 'fileshare.async_shaping'
+# 需要整形的下载响应所属的客户端IP（由after_request写入，服务器读取）
+ENVIRON_SHAPE_CLIENT = 'fileshare.shape_client'
+
+
+class TokenBucketStore:
+    """SQLite令牌桶存储，每个线程使用独立的长连接"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.logger = get_logger()
+        self._local = threading.local()
+        self._last_prune = 0
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # 建表使用临时连接：应用可能在gunicorn master中预加载，SQLite连接不能跨fork使用
+        conn = sqlite3.connect(db_path, timeout=5.0)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS token_buckets (
+                    bucket_key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+        finally:
+            conn.close()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # 限流状态丢失无关紧要，不需要落盘同步
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, rate, capacity, amount=1.0, allow_debt=False):
+        """从令牌桶取出 amount 个令牌
+
+        返回需要等待的秒数：0表示立即放行。allow_debt为False时令牌不足不扣减，
+        调用方应拒绝请求；为True时照常扣减（预约），调用方等待返回的时间后继续。
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM token_buckets WHERE bucket_key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                tokens = capacity
+            else:
+                tokens = min(capacity, row[0] + (now - row[1]) * rate)
+
+            if tokens >= amount:
+                tokens -= amount
+                wait = 0.0
+            else:
+                wait = (amount - tokens) / rate
+                if allow_debt:
+                    tokens -= amount
+
+            conn.execute(
+                'INSERT OR REPLACE INTO token_buckets (bucket_key, tokens, updated_at) VALUES (?, ?, ?)',
+                (key, tokens, now)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if now - self._last_prune > PRUNE_INTERVAL_SECONDS:
+            self._last_prune = now
+            self.prune(now - BUCKET_IDLE_SECONDS)
+        return wait
+
+    def prune(self, before):
+        """删除长时间未使用的令牌桶"""
+        try:
+            self._connection().execute('DELETE FROM token_buckets WHERE updated_at < ?', (before,))
+        except sqlite3.Error as e:
+            self.logger.warning(f"清理令牌桶失败: {str(e)}")
+
+
+class RateLimiter:
+    """按客户端的请求频率限制和带宽整形"""
+
+    def __init__(self, store, endpoint_limits, download_bandwidth=0, upload_bandwidth=0):
+        self.store = store
+        # {端点名: (每秒请求数, 突发容量)}，'default' 作用于未单独配置的端点
+        self.endpoint_limits = endpoint_limits
+        # 每个客户端的带宽上限（字节/秒），0表示不限制
+        self.download_bandwidth = download_bandwidth
+        self.upload_bandwidth = upload_bandwidth
+
+    def check_request(self, endpoint, client_ip):
+        """检查请求频率，超限时抛出 RateLimitException"""
+        limit = self.endpoint_limits.get(endpoint, self.endpoint_limits.get('default'))
+        if not limit:
+            return
+        rate, capacity = limit
+        wait = self.store.take(f"req:{endpoint}:{client_ip}", rate, capacity)
+        if wait > 0:
+            raise RateLimitException(details={
+                'endpoint': endpoint,
+                'retry_after': max(1, int(wait + 0.999))
+            })
+
+    def _reserve(self, key, rate, amount):
+        """预约带宽，返回发送前需要等待的秒数"""
+        return self.store.take(key, rate, max(rate, BANDWIDTH_QUANTUM), amount, allow_debt=True)
+
+    def reserve_download(self, client_ip, amount):
+        """预约下载带宽，返回需要等待的秒数"""
+        return self._reserve(f"bw:down:{client_ip}", self.download_bandwidth, amount)
+
+    def reserve_upload(self, client_ip, amount):
+        """预约上传带宽，返回需要等待的秒数"""
+        return self._reserve(f"bw:up:{client_ip}", self.upload_bandwidth, amount)
+
+    def throttle_iter(self, iterable, client_ip):
+        """按客户端下载带宽整形响应数据流"""
+        allowance = 0
+        try:
+            for chunk in iterable:
+                offset = 0
+                while offset < len(chunk):
+                    if allowance <= 0:
+                        wait = self.reserve_download(client_ip, BANDWIDTH_QUANTUM)
+                        if wait > 0:
+                            time.sleep(wait)
+                        allowance = BANDWIDTH_QUANTUM
+                    piece = chunk[offset:offset + allowance]
+                    offset += len(piece)
+                    allowance -= len(piece)
+                    yield piece
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+
+    def throttle_read(self, read, client_ip):
+        """按客户端上传带宽整形请求体读取，返回新的read函数"""
+        if not self.upload_bandwidth:
+            return read
+
+        def throttled_read(size=-1):
+            if size is None or size < 0 or size > BANDWIDTH_QUANTUM:
+                size = BANDWIDTH_QUANTUM
+            data = read(size)
+            if data:
+                wait = self.reserve_upload(client_ip, len(data))
+                if wait > 0:
+                    time.sleep(wait)
+            return data
+
+        return throttled_read
+
+
+def setup_rate_limiting(app, limiter):
+    """注册请求频率检查和下载带宽整形"""
+
+    @app.before_request
+    def check_rate_limit():
+        """请求前检查频率限制"""
+        endpoint = request.endpoint
+        if not endpoint or endpoint == 'static' or request.path.startswith('/health'):
+            return
+        if request.environ.get(ENVIRON_RATE_CHECKED):
+            return
+        limiter.check_request(endpoint, g.get('client_ip') or get_client_ip())
+
+    @app.after_request
+    def shape_download_bandwidth(response):
+        """对文件下载响应做带宽整形"""
+        if (limiter.download_bandwidth and request.endpoint in DOWNLOAD_ENDPOINTS
+                and response.direct_passthrough and response.status_code in (200, 206)):
+            client_ip = g.get('client_ip') or get_client_ip()
+            if request.environ.get(ENVIRON_ASYNC_SHAPING):
+                request.environ[ENVIRON_SHAPE_CLIENT] = client_ip
+            else:
+                response.response = limiter.throttle_iter(response.response, client_ip)
+        return response
@@ -0,0 +1,99 @@
+"""
+JSON响应缓存模块
+
+文件列表等接口的JSON响应体按元数据代数缓存在 MetadataCache 中：元数据不变时
+不再逐行格式化和序列化，任意进程写入元数据后代数递增，缓存随之失效。
+压缩后的响应体按 Accept-Encoding 协商，在第一次被请求时生成并随条目缓存；
+ETag 由响应内容计算，各worker进程一致，客户端轮询时未变化的列表返回304。
+"""
+import gzip
+import hashlib
+import threading
+from flask import current_app, request
+from .timing import span, COMPRESS
+
+try:
+    import brotli
+except ImportError:  # brotli为可选依赖，未安装时只提供gzip
+    brotli = None
+
+
+class CachedJson:
+    """序列化后的JSON响应体及其压缩版本"""
+
+    def __init__(self, body, compress_level=6, brotli_quality=5, min_size=1024):
+        self.etag = hashlib.md5(body).hexdigest()
+        self.compress_level = compress_level
+        self.brotli_quality = brotli_quality
+        # 小于该大小的响应体不压缩
+        self.min_size = min_size
+        self._bodies = {'identity': body}
+        self._lock = threading.Lock()
+
+    def encodings(self):
+        """可提供的编码，按优先顺序"""
+        if len(self._bodies['identity']) < self.min_size:
+            return ['identity']
+        if brotli is not None:
+            return ['br', 'gzip', 'identity']
+        return ['gzip', 'identity']
+
+    def body(self, encoding):
+        """指定编码的响应体，第一次请求时压缩"""
+        data = self._bodies.get(encoding)
+        if data is not None:
+            return data
+        with self._lock, span(COMPRESS):
+            data = self._bodies.get(encoding)
+            if data is None:
+                identity = self._bodies['identity']
+                if encoding == 'br':
+                    data = brotli.compress(identity, quality=self.brotli_quality)
+                else:
+                    data = gzip.compress(identity, compresslevel=self.compress_level, mtime=0)
+                self._bodies[encoding] = data
+        return data
+
+
+class JsonResponseCache:
+    """按元数据代数缓存JSON响应"""
+
+    def __init__(self, metadata_cache, compress_level=6, brotli_quality=5, min_size=1024):
+        # DatabaseManager.cache，为None时不缓存，仍然压缩并支持304
+        self.metadata_cache = metadata_cache
+        self.compress_level = compress_level
+        self.brotli_quality = brotli_quality
+        self.min_size = min_size
+
+    def _encode(self, payload):
+        body = current_app.json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        return CachedJson(body, self.compress_level, self.brotli_quality, self.min_size)
+
+    def get(self, key, build):
+        """返回key对应的缓存响应体，未命中时调用 build() 生成负载并缓存"""
+        cache = self.metadata_cache
+        if cache is None:
+            return self._encode(build())
+
+        entry = cache.get(('response',) + key)
+        if entry is None:
+            generation = cache.current_generation()
+            entry = self._encode(build())
+            cache.put(('response',) + key, entry, generation)
+        return entry
+
+    def respond(self, key, build):
+        """生成JSON响应：按 Accept-Encoding 选择编码，If-None-Match 匹配时返回304"""
+        entry = self.get(key, build)
+        encoding = request.accept_encodings.best_match(entry.encodings(), default='identity')
+
+        response = current_app.response_class(entry.body(encoding), mimetype='application/json')
+        if encoding == 'identity':
+            response.set_etag(entry.etag)
+        else:
+            response.set_etag(f"{entry.etag}-{encoding}")
+            response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        # 允许浏览器缓存，但每次使用前都要用ETag重新验证
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
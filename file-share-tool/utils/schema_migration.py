@@ -0,0 +1,160 @@
+"""
+元数据表结构在线迁移模块（v1 file_metadata -> v2 files）
+
+迁移分三步，每步都可以中断后重新执行，多个进程同时启动时按事务交替推进：
+1. 扩展：创建 v2 的表，在 file_metadata 上创建触发器，把旧版本进程的增删改同步到 files；
+2. 回填：按ID顺序分批复制已有记录，每批一个短事务，进度记录在 schema_migration_state 中，
+   批次之间旧版本进程可以继续写入；
+3. 切换：在一个写事务中复制剩余记录、核对行数，删除 file_metadata 表并创建同名的
+   兼容视图，之后的读写都使用 files。搜索索引和存储统计的触发器由调用方在同一事务中重建。
+"""
+import time
+from .logging_config import get_logger
+from .query_stats import FULL_SCAN_MARK
+from .metadata_schema import SCHEMA_VERSION, create_schema, is_legacy_table, legacy_copy_sql, record_version
+
+# 每个事务复制的记录数
+MIGRATION_BATCH_SIZE = 5000
+
+# 迁移期间把 file_metadata 的写入同步到 files 的触发器
+MIRROR_TRIGGERS = ('schema_v2_mirror_ai', 'schema_v2_mirror_au', 'schema_v2_mirror_ad')
+
+# v1 中后来增加的列，回填前为更早的数据库补上
+LEGACY_ADDED_COLUMNS = (('content_hash', 'TEXT'), ('storage_codec', 'TEXT'), ('stored_size', 'INTEGER'))
+
+
+class SchemaMigrator:
+    """v1 元数据表在线迁移器"""
+
+    def __init__(self, conn, batch_size=MIGRATION_BATCH_SIZE, pause_seconds=0.0):
+        self.conn = conn
+        self.batch_size = batch_size
+        # 批次之间的间隔，让旧版本进程的写入有机会获得写锁
+        self.pause_seconds = pause_seconds
+        self.logger = get_logger()
+        self.migrated_count = 0
+
+    def expand(self):
+        """创建 v2 的表和同步触发器"""
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not is_legacy_table(conn):
+                conn.execute('COMMIT')
+                return False
+
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(file_metadata)')}
+            for column, column_type in LEGACY_ADDED_COLUMNS:
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE file_metadata ADD COLUMN {column} {column_type}')
+
+            create_schema(conn)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_migration_state (
+                    version INTEGER PRIMARY KEY,
+                    last_id TEXT NOT NULL,
+                    migrated_count INTEGER NOT NULL,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute(
+                "INSERT OR IGNORE INTO schema_migration_state (version, last_id, migrated_count) VALUES (?, '', 0)",
+                (SCHEMA_VERSION,)
+            )
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS schema_v2_mirror_ai AFTER INSERT ON file_metadata BEGIN
+                    {'; '.join(legacy_copy_sql('new'))};
+                END
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS schema_v2_mirror_au AFTER UPDATE ON file_metadata BEGIN
+                    DELETE FROM files WHERE id = old.id AND old.id IS NOT new.id;
+                    {'; '.join(legacy_copy_sql('new'))};
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS schema_v2_mirror_ad AFTER DELETE ON file_metadata BEGIN
+                    DELETE FROM files WHERE id = old.id;
+                END
+            ''')
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _copy_batch(self, limit):
+        """在当前事务中复制进度之后的一批记录，limit为None时复制全部剩余记录，返回复制的记录数"""
+        conn = self.conn
+        last_id, migrated_count = conn.execute(
+            'SELECT last_id, migrated_count FROM schema_migration_state WHERE version = ?', (SCHEMA_VERSION,)
+        ).fetchone()
+        if limit is None:
+            batch_end, count = conn.execute(
+                'SELECT MAX(id), COUNT(*) FROM file_metadata WHERE id > ?', (last_id,)
+            ).fetchone()
+        else:
+            batch_end, count = conn.execute(
+                'SELECT MAX(id), COUNT(*) FROM (SELECT id FROM file_metadata WHERE id > ? ORDER BY id LIMIT ?)',
+                (last_id, limit)
+            ).fetchone()
+        if not count:
+            return 0
+
+        for sql in legacy_copy_sql('m', 'FROM file_metadata m', 'm.id > ? AND m.id <= ?'):
+            conn.execute(sql, (last_id, batch_end))
+        conn.execute(
+            'UPDATE schema_migration_state SET last_id = ?, migrated_count = ?, updated_at = CURRENT_TIMESTAMP '
+            'WHERE version = ?',
+            (batch_end, migrated_count + count, SCHEMA_VERSION)
+        )
+        self.migrated_count = migrated_count + count
+        return count
+
+    def backfill(self):
+        """分批复制已有记录，每批一个事务"""
+        start_time = time.time()
+        while True:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                if not is_legacy_table(self.conn):
+                    # 其他进程已完成切换
+                    self.conn.execute('COMMIT')
+                    return
+                copied = self._copy_batch(self.batch_size)
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            if not copied:
+                break
+            self.logger.info(f"元数据表迁移进度: 已复制 {self.migrated_count} 条记录")
+            if self.pause_seconds:
+                time.sleep(self.pause_seconds)
+        self.logger.info(f"元数据表回填完成，共 {self.migrated_count} 条记录，耗时 {time.time() - start_time:.1f} 秒")
+
+    def cutover(self):
+        """在调用方开启的写事务中完成切换：复制剩余记录、核对行数、用兼容视图替换旧表
+
+        旧表已不存在（其他进程已完成切换）时返回False。
+        """
+        conn = self.conn
+        if not is_legacy_table(conn):
+            return False
+
+        self._copy_batch(None)
+        legacy_count = conn.execute(f'SELECT COUNT(*) FROM file_metadata {FULL_SCAN_MARK}').fetchone()[0]
+        migrated_count = conn.execute(f'SELECT COUNT(*) FROM files {FULL_SCAN_MARK}').fetchone()[0]
+        if legacy_count != migrated_count:
+            raise RuntimeError(f"元数据表迁移核对失败: file_metadata {legacy_count} 条，files {migrated_count} 条")
+
+        # 删除旧表时其上的触发器（搜索索引、存储统计和同步触发器）一起删除；
+        # 统计表的分桶和扩展名改为按 v2 的列计数，由调用方重建
+        conn.execute('DROP TABLE file_metadata')
+        for table in ('storage_stats', 'extension_stats', 'expiry_stats'):
+            conn.execute(f'DROP TABLE IF EXISTS {table}')
+        conn.execute('DROP TABLE IF EXISTS schema_migration_state')
+        record_version(conn, f'从 file_metadata 在线迁移（{legacy_count} 条记录）')
+        self.logger.info(f"元数据表已切换到 v{SCHEMA_VERSION}，共 {legacy_count} 条记录")
+        return True
@@ -0,0 +1,165 @@
+"""
+文件内容搜索索引模块
+
+后台线程把可预览的文本文件内容写入FTS5全文索引。文件名和路径由数据库触发器
+实时同步，内容索引是异步的：上传后通过 notify() 唤醒，空闲时按固定间隔轮询。
+多个worker进程中同一时刻只有一个在处理批次。
+"""
+import os
+import time
+import threading
+from .logging_config import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，不做跨进程互斥
+    fcntl = None
+
+# 读取样本中出现NUL字节视为二进制文件
+BINARY_SAMPLE_SIZE = 8192
+
+
+class SearchIndexer:
+    """后台文件内容索引器"""
+
+    def __init__(self, file_manager, extensions, max_file_size=10 * 1024 * 1024,
+                 max_bytes=1024 * 1024, batch_size=50, interval_seconds=30):
+        self.file_manager = file_manager
+        self.database = file_manager.database
+        # 只索引这些扩展名的文件
+        self.extensions = set(extensions)
+        # 超过该大小的文件不索引内容
+        self.max_file_size = max_file_size
+        # 每个文件最多索引的字节数
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self.logger = get_logger()
+        self.thread = None
+        self.is_running = False
+        self.indexed_count = 0
+        self.skipped_count = 0
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+
+    def read_content(self, row):
+        """读取文件的文本内容，不需要索引时返回None"""
+        extension = (row.get('file_extension') or '').lower()
+        if extension not in self.extensions or row['file_size'] > self.max_file_size:
+            return None
+
+        try:
+            f = self.file_manager.open_stored(row)
+            if f is None:
+                return None
+            with f:
+                data = f.read(self.max_bytes)
+        except Exception as e:  # 本地读取错误、损坏的gzip数据、远程存储请求失败
+            self.logger.warning(f"读取待索引文件失败: {row['file_path']}, {str(e)}")
+            return None
+
+        if b'\0' in data[:BINARY_SAMPLE_SIZE]:
+            return None
+        # 截断处可能落在多字节字符中间，忽略不完整的字符
+        return data.decode('utf-8', errors='ignore') or None
+
+    def index_batch(self):
+        """索引一批文件，返回处理的文件数"""
+        rows = self.database.get_pending_search_content(self.batch_size)
+        if not rows:
+            return 0
+
+        updates = [(row['docid'], self.read_content(row)) for row in rows]
+        if not self.database.save_search_content(updates):
+            raise RuntimeError('保存文件内容索引失败')
+
+        indexed = sum(1 for _, content in updates if content)
+        self.indexed_count += indexed
+        self.skipped_count += len(updates) - indexed
+        return len(updates)
+
+    def _try_lock(self):
+        """尝试获取跨进程的索引锁，返回锁文件或None"""
+        lock_path = os.path.join(self.file_manager.upload_folder, '.search_index.lock')
+        lock_file = open(lock_path, 'a')
+        if fcntl is None:
+            return lock_file
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_file
+        except OSError:
+            lock_file.close()
+            return None
+
+    def _unlock(self, lock_file):
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+    def run_once(self):
+        """处理完当前所有待索引文件，返回处理的文件数"""
+        lock_file = self._try_lock()
+        if lock_file is None:
+            return 0
+
+        processed = 0
+        start_time = time.time()
+        try:
+            while not self._stop_event.is_set():
+                count = self.index_batch()
+                processed += count
+                if count < self.batch_size:
+                    break
+        finally:
+            self._unlock(lock_file)
+
+        if processed:
+            self.logger.info(f"文件内容索引完成，处理 {processed} 个文件，耗时 {time.time() - start_time:.2f} 秒")
+        return processed
+
+    def run(self):
+        """后台循环：被唤醒或到达轮询间隔时处理待索引文件"""
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.error(f"文件内容索引失败: {str(e)}", exc_info=True)
+            self._wake_event.wait(self.interval_seconds)
+        self.is_running = False
+
+    def notify(self):
+        """有新文件上传时唤醒索引线程"""
+        self._wake_event.set()
+
+    def start(self):
+        """在后台线程中启动索引器"""
+        if not self.is_running and self.database.fts_enabled:
+            self.is_running = True
+            self._stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name='search-indexer', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """停止索引器"""
+        self._stop_event.set()
+        self._wake_event.set()
+
+
+# 全局索引器实例
+search_indexer = None
+
+def start_search_indexer(file_manager, extensions, **options):
+    """启动后台文件内容索引"""
+    global search_indexer
+    if search_indexer is None:
+        search_indexer = SearchIndexer(file_manager, extensions, **options)
+        search_indexer.start()
+    return search_indexer
+
+def stop_search_indexer():
+    """停止后台文件内容索引"""
+    global search_indexer
+    if search_indexer is not None:
+        search_indexer.stop()
+        search_indexer = None
@@ -0,0 +1,137 @@
+"""
+上传目录分片迁移模块
+
+把平铺在上传目录中的旧文件在后台逐批移动到分片子目录，
+并按批次更新数据库中的 file_path。迁移期间读取不受影响：
+文件先移动、后更新数据库，读取方通过 FileManager.resolve_file_path
+在旧路径不存在时找到新位置。
+"""
+import os
+import time
+import threading
+from .logging_config import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，不做跨进程互斥
+    fcntl = None
+
+
+class ShardMigrator:
+    """后台分片迁移器"""
+
+    def __init__(self, file_manager, batch_size=500, pause_seconds=0.05):
+        self.file_manager = file_manager
+        self.database = file_manager.database
+        self.batch_size = batch_size
+        # 每批之间暂停，避免迁移占满磁盘IO
+        self.pause_seconds = pause_seconds
+        self.logger = get_logger()
+        self.thread = None
+        self.is_running = False
+        self.moved_count = 0
+        self.scanned_count = 0
+        self._stop_event = threading.Event()
+
+    def _acquire_process_lock(self):
+        """多个worker进程中只允许一个执行迁移"""
+        if fcntl is None:
+            return True
+        lock_path = os.path.join(self.file_manager.upload_folder, '.shard_migration.lock')
+        self._lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def _release_process_lock(self):
+        lock_file = getattr(self, '_lock_file', None)
+        if lock_file is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+            self._lock_file = None
+
+    def migrate_batch(self, rows):
+        """迁移一批文件，返回移动的文件数"""
+        updates = []
+        for row in rows:
+            current_path = os.path.normpath(row['file_path'])
+            target_path = os.path.normpath(self.file_manager.blob_path(row['stored_name']))
+            if current_path == target_path:
+                continue
+
+            if os.path.exists(current_path):
+                self.file_manager.blob_path(row['stored_name'], create_dirs=True)
+                os.replace(current_path, target_path)
+            elif not os.path.exists(target_path):
+                # 源文件和目标文件都不存在，交给孤儿清理处理
+                continue
+
+            updates.append((target_path, row['id']))
+
+        if updates and not self.database.update_file_paths(updates):
+            raise RuntimeError('更新文件路径失败')
+        return len(updates)
+
+    def run(self):
+        """执行迁移，直到所有记录都指向分片路径"""
+        if not self._acquire_process_lock():
+            self.logger.info("其他进程正在执行分片迁移，跳过")
+            return
+
+        try:
+            self.logger.info("开始上传目录分片迁移...")
+            start_time = time.time()
+            last_id = ''
+            while not self._stop_event.is_set():
+                rows = self.database.get_file_paths_page(last_id, self.batch_size)
+                if not rows:
+                    break
+                last_id = rows[-1]['id']
+                self.scanned_count += len(rows)
+                self.moved_count += self.migrate_batch(rows)
+                self._stop_event.wait(self.pause_seconds)
+
+            self.logger.info(
+                f"分片迁移结束，扫描 {self.scanned_count} 条记录，移动 {self.moved_count} 个文件，"
+                f"耗时 {time.time() - start_time:.1f} 秒"
+            )
+        except Exception as e:
+            self.logger.error(f"分片迁移失败: {str(e)}", exc_info=True)
+        finally:
+            self._release_process_lock()
+            self.is_running = False
+
+    def start(self):
+        """在后台线程中启动迁移"""
+        if not self.is_running:
+            self.is_running = True
+            self._stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name='shard-migration', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """请求停止迁移，已完成的批次保持有效"""
+        self._stop_event.set()
+
+
+# 全局迁移器实例
+shard_migrator = None
+
+def start_shard_migration(file_manager, batch_size=500):
+    """启动后台分片迁移"""
+    global shard_migrator
+    if shard_migrator is None:
+        shard_migrator = ShardMigrator(file_manager, batch_size)
+        shard_migrator.start()
+    return shard_migrator
+
+def stop_shard_migration():
+    """停止后台分片迁移"""
+    global shard_migrator
+    if shard_migrator is not None:
+        shard_migrator.stop()
+        shard_migrator = None
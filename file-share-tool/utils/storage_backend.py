@@ -0,0 +1,530 @@
+"""
+存储后端模块
+
+上传文件的数据按存储文件名（key，即 stored_name）保存在存储后端中：
+- LocalStorageBackend：本地目录（默认），按分片子目录存放，支持 sendfile、硬链接等本地快速路径
+- S3StorageBackend：S3兼容的对象存储（AWS S3、MinIO、Ceph RGW等），需要安装boto3
+
+数据库、ZIP缓存和临时文件始终在本地；使用对象存储时上传的数据每满一个分片就直接上传
+（multipart，不经过本地磁盘），下载按Range请求对象的对应范围并流式转发。
+"""
+import io
+import os
+import shutil
+import hashlib
+import threading
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from .exceptions import StorageException
+from .logging_config import get_logger
+
+# list() 返回的对象信息，mtime为Unix时间戳
+BlobStat = namedtuple('BlobStat', 'key size mtime')
+
+# put() 每次从输入流读取的字节数
+PUT_BUFFER_SIZE = 1024 * 1024
+# S3分片上传的最小分片大小（最后一个分片除外）和单次CopyObject的大小上限
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_MAX_COPY_SIZE = 5 * 1024 * 1024 * 1024
+
+
+class RangeReader(io.RawIOBase):
+    """只读取文件中从当前位置开始的 length 字节"""
+
+    def __init__(self, raw, length):
+        self._raw = raw
+        self._remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._remaining <= 0:
+            return 0
+        view = memoryview(buffer)[:self._remaining]
+        n = self._raw.readinto(view)
+        self._remaining -= n or 0
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._raw.close()
+        super().close()
+
+
+class StorageBackend:
+    """存储后端接口"""
+
+    # 是否为本地目录，本地后端可以通过 local_path() 直接访问文件
+    local = False
+
+    def put(self, key, stream):
+        """从可读的二进制流写入对象，返回写入的字节数"""
+        writer = self.open_writer(key)
+        try:
+            shutil.copyfileobj(stream, writer, PUT_BUFFER_SIZE)
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.tell()
+
+    def open_writer(self, key):
+        """打开对象用于流式写入，返回有 write/tell/flush/close/abort 的写入器
+
+        close() 后对象才可见，abort() 放弃已写入的数据。
+        """
+        raise NotImplementedError
+
+    def open(self, key, start=0, length=None):
+        """打开对象的 [start, start+length) 范围用于读取，对象不存在时抛出 FileNotFoundError"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """删除对象，对象不存在时返回False"""
+        raise NotImplementedError
+
+    def stat(self, key):
+        """对象的 BlobStat，不存在时返回None"""
+        raise NotImplementedError
+
+    def list(self):
+        """遍历所有对象，生成 BlobStat"""
+        raise NotImplementedError
+
+    def copy(self, src_key, dest_key):
+        """复制对象（在存储端完成，数据不经过应用）"""
+        raise NotImplementedError
+
+    def uri(self, key):
+        """对象的位置，记录在元数据的 file_path 中"""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """对象的本地路径，非本地后端或对象不存在时返回None"""
+        return None
+
+
+class LocalStorageBackend(StorageBackend):
+    """本地目录存储，如 uploads/ab/cd/<uuid>.<ext>"""
+
+    local = True
+
+    def __init__(self, root, shard_depth=2, shard_width=2):
+        self.root = root
+        # 分片目录层级和每级目录名长度，depth为0时平铺存放
+        self.shard_depth = shard_depth
+        self.shard_width = shard_width
+
+    def path(self, key, create_dirs=False):
+        """根据存储文件名计算分片后的物理路径"""
+        if self.shard_depth <= 0:
+            return os.path.join(self.root, key)
+
+        digest = hashlib.md5(key.split('.', 1)[0].encode('utf-8')).hexdigest()
+        width = self.shard_width
+        shard_dirs = [digest[i * width:(i + 1) * width] for i in range(self.shard_depth)]
+        shard_folder = os.path.join(self.root, *shard_dirs)
+        if create_dirs:
+            os.makedirs(shard_folder, exist_ok=True)
+        return os.path.join(shard_folder, key)
+
+    def local_path(self, key):
+        """分片路径，尚未迁移到分片目录的旧文件为平铺路径"""
+        for path in (self.path(key), os.path.join(self.root, key)):
+            if os.path.exists(path):
+                return path
+        return None
+
+    def open_writer(self, key):
+        return LocalBlobWriter(self.path(key, create_dirs=True))
+
+    def open(self, key, start=0, length=None):
+        path = self.local_path(key)
+        if path is None:
+            raise FileNotFoundError(key)
+        f = open(path, 'rb')
+        if start:
+            f.seek(start)
+        if length is None:
+            return f
+        return io.BufferedReader(RangeReader(f.raw, length))
+
+    def delete(self, key):
+        path = self.local_path(key)
+        if path is None:
+            return False
+        os.remove(path)
+        return True
+
+    def stat(self, key):
+        path = self.local_path(key)
+        if path is None:
+            return None
+        st = os.stat(path)
+        return BlobStat(key, st.st_size, st.st_mtime)
+
+    def list(self):
+        # 跳过点开头的目录和文件（暂存、隔离区、锁文件）和数据库文件
+        stack = [self.root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False) and not entry.name.startswith('metadata.'):
+                        st = entry.stat()
+                        yield BlobStat(entry.name, st.st_size, st.st_mtime)
+
+    def copy(self, src_key, dest_key):
+        """优先创建硬链接（共享数据，各自删除互不影响），不支持时复制"""
+        src_path = self.local_path(src_key)
+        if src_path is None:
+            raise FileNotFoundError(src_key)
+        dest_path = self.path(dest_key, create_dirs=True)
+        try:
+            os.link(src_path, dest_path)
+        except OSError:
+            shutil.copyfile(src_path, dest_path)
+
+    def uri(self, key):
+        return os.path.normpath(self.path(key))
+
+
+class LocalBlobWriter:
+    """本地文件的写入器：写入同目录下的临时文件，close() 时改名为最终文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._fp = open(self._tmp_path, 'wb', buffering=PUT_BUFFER_SIZE)
+        self._size = 0
+        self.closed = False
+
+    def write(self, data):
+        return self._fp.write(data)
+
+    def tell(self):
+        return self._size if self.closed else self._fp.tell()
+
+    def flush(self):
+        self._fp.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self._size = self._fp.tell()
+        self._fp.close()
+        os.replace(self._tmp_path, self.path)
+        self.closed = True
+
+    def abort(self):
+        """放弃写入，删除临时文件或已改名的文件"""
+        self._fp.close()
+        path = self.path if self.closed else self._tmp_path
+        self.closed = True
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class S3StorageBackend(StorageBackend):
+    """S3兼容的对象存储
+
+    客户端和分片上传线程池在进程内共享（boto3客户端线程安全），连接池大小由
+    max_pool_connections 决定；fork出的worker进程重新创建，不与父进程共用连接。
+    写入时数据每满 multipart_chunksize 就作为一个分片上传，每个对象同时上传的分片数
+    不超过 max_concurrency。
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, access_key=None, secret_key=None,
+                 max_pool_connections=32, multipart_chunksize=8 * 1024 * 1024, max_concurrency=4,
+                 client_factory=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.logger = get_logger()
+        self.part_size = max(multipart_chunksize, S3_MIN_PART_SIZE)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_pool_connections = max_pool_connections
+
+        if client_factory is None:
+            try:
+                import boto3
+                from botocore.config import Config as BotoConfig
+            except ImportError:
+                raise StorageException('使用S3存储需要安装boto3: pip install boto3')
+
+            def client_factory():
+                session = boto3.session.Session()
+                return session.client(
+                    's3',
+                    endpoint_url=endpoint_url or None,
+                    region_name=region or None,
+                    aws_access_key_id=access_key or None,
+                    aws_secret_access_key=secret_key or None,
+                    config=BotoConfig(
+                        max_pool_connections=max_pool_connections,
+                        retries={'max_attempts': 3, 'mode': 'standard'}
+                    )
+                )
+
+        # client_factory 可替换为测试用的客户端（如进程内的S3模拟实现）
+        self._client_factory = client_factory
+        self._client = None
+        self._executor = None
+        self._pid = None
+        self._client_lock = threading.Lock()
+
+    def _ensure_client(self):
+        """懒加载客户端和线程池，fork后的子进程重新创建"""
+        if self._pid != os.getpid():
+            with self._client_lock:
+                if self._pid != os.getpid():
+                    self._client = self._client_factory()
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_pool_connections, thread_name_prefix='s3-transfer'
+                    )
+                    self._pid = os.getpid()
+
+    @property
+    def client(self):
+        self._ensure_client()
+        return self._client
+
+    @property
+    def executor(self):
+        """分片上传和分片复制的线程池"""
+        self._ensure_client()
+        return self._executor
+
+    def _object_key(self, key):
+        return self.prefix + key
+
+    @staticmethod
+    def _is_not_found(error):
+        """botocore ClientError 的错误码是否表示对象不存在"""
+        response = getattr(error, 'response', None)
+        if not isinstance(response, dict):
+            return False
+        return response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def open_writer(self, key):
+        return S3MultipartWriter(self, key)
+
+    def open(self, key, start=0, length=None):
+        params = {'Bucket': self.bucket, 'Key': self._object_key(key)}
+        if length is not None:
+            if length <= 0:
+                return io.BytesIO()
+            params['Range'] = f"bytes={start}-{start + length - 1}"
+        elif start:
+            params['Range'] = f"bytes={start}-"
+        try:
+            return self.client.get_object(**params)['Body']
+        except Exception as e:
+            if self._is_not_found(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def delete(self, key):
+        # S3删除不存在的对象也会成功，这里不额外请求判断
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        return True
+
+    def stat(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            if self._is_not_found(e):
+                return None
+            raise
+        return BlobStat(key, response['ContentLength'], response['LastModified'].timestamp())
+
+    def list(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                yield BlobStat(item['Key'][len(self.prefix):], item['Size'], item['LastModified'].timestamp())
+
+    def copy(self, src_key, dest_key):
+        """在存储端复制对象，数据不经过应用；超过CopyObject上限的对象分片复制（UploadPartCopy）"""
+        stat = self.stat(src_key)
+        if stat is None:
+            raise FileNotFoundError(src_key)
+        client = self.client
+        source = {'Bucket': self.bucket, 'Key': self._object_key(src_key)}
+        dest = self._object_key(dest_key)
+        if stat.size <= S3_MAX_COPY_SIZE:
+            client.copy_object(Bucket=self.bucket, Key=dest, CopySource=source)
+            return
+
+        # 一个对象最多10000个分片
+        part_size = max(self.part_size, -(-stat.size // 10000))
+        upload_id = client.create_multipart_upload(Bucket=self.bucket, Key=dest)['UploadId']
+        futures = []
+        try:
+            for number, start in enumerate(range(0, stat.size, part_size), 1):
+                end = min(start + part_size, stat.size) - 1
+                futures.append((number, self.executor.submit(
+                    client.upload_part_copy, Bucket=self.bucket, Key=dest, UploadId=upload_id,
+                    PartNumber=number, CopySource=source, CopySourceRange=f"bytes={start}-{end}"
+                )))
+            parts = [
+                {'PartNumber': number, 'ETag': future.result()['CopyPartResult']['ETag']}
+                for number, future in futures
+            ]
+            client.complete_multipart_upload(
+                Bucket=self.bucket, Key=dest, UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            for _, future in futures:
+                future.cancel()
+            wait([future for _, future in futures])
+            client.abort_multipart_upload(Bucket=self.bucket, Key=dest, UploadId=upload_id)
+            raise
+
+    def uri(self, key):
+        return f"s3://{self.bucket}/{self._object_key(key)}"
+
+
+class S3MultipartWriter:
+    """S3对象的流式写入器
+
+    数据缓存满一个分片后立即提交到线程池上传（UploadPart），同时上传的分片数达到
+    max_concurrency 时等待最早的分片完成，内存中最多保留 max_concurrency + 1 个分片。
+    总大小不超过一个分片的对象在 close() 时用一次 PutObject 上传。
+    上传出错或调用 abort() 时中止分片上传（AbortMultipartUpload），不留下未完成的分片。
+    """
+
+    def __init__(self, backend, key):
+        self.key = key
+        self._backend = backend
+        self._client = backend.client
+        self._object_key = backend._object_key(key)
+        self._buffer = bytearray()
+        self._size = 0
+        self._upload_id = None
+        # [(分片号, future)]，以及尚未确认完成的分片
+        self._parts = []
+        self._pending = deque()
+        self._completed = False
+        self.closed = False
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._size
+
+    def flush(self):
+        pass
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('写入器已关闭')
+        self._buffer += data
+        self._size += len(data)
+        part_size = self._backend.part_size
+        if len(self._buffer) >= part_size:
+            try:
+                while len(self._buffer) >= part_size:
+                    part = bytes(self._buffer[:part_size])
+                    del self._buffer[:part_size]
+                    self._submit_part(part)
+            except BaseException:
+                self.abort()
+                raise
+        return len(data)
+
+    def _submit_part(self, data):
+        client = self._client
+        if self._upload_id is None:
+            self._upload_id = client.create_multipart_upload(
+                Bucket=self._backend.bucket, Key=self._object_key
+            )['UploadId']
+        while len(self._pending) >= self._backend.max_concurrency:
+            self._pending.popleft().result()
+        number = len(self._parts) + 1
+        future = self._backend.executor.submit(
+            client.upload_part, Bucket=self._backend.bucket, Key=self._object_key,
+            UploadId=self._upload_id, PartNumber=number, Body=data
+        )
+        self._parts.append((number, future))
+        self._pending.append(future)
+
+    def close(self):
+        """上传剩余数据并完成对象，失败时中止分片上传"""
+        if self.closed:
+            return
+        self.closed = True
+        bucket = self._backend.bucket
+        try:
+            if self._upload_id is None:
+                self._client.put_object(Bucket=bucket, Key=self._object_key, Body=bytes(self._buffer))
+            else:
+                if self._buffer:
+                    self._submit_part(bytes(self._buffer))
+                parts = [{'PartNumber': number, 'ETag': future.result()['ETag']} for number, future in self._parts]
+                self._client.complete_multipart_upload(
+                    Bucket=bucket, Key=self._object_key, UploadId=self._upload_id,
+                    MultipartUpload={'Parts': parts}
+                )
+            self._completed = True
+        except BaseException:
+            self._abort_upload()
+            raise
+        finally:
+            self._buffer = bytearray()
+            self._pending.clear()
+
+    def _abort_upload(self):
+        """取消未开始的分片，等待进行中的分片结束后中止分片上传"""
+        futures = [future for _, future in self._parts]
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        self._parts = []
+        self._pending.clear()
+        self._buffer = bytearray()
+        if self._upload_id is not None:
+            upload_id, self._upload_id = self._upload_id, None
+            try:
+                self._client.abort_multipart_upload(
+                    Bucket=self._backend.bucket, Key=self._object_key, UploadId=upload_id
+                )
+            except Exception as e:
+                self._backend.logger.error(f"中止分片上传失败: {self._object_key}: {str(e)}", exc_info=True)
+
+    def abort(self):
+        """放弃写入：中止未完成的分片上传，已完成的对象删除"""
+        self.closed = True
+        if self._completed:
+            self._completed = False
+            self._backend.delete(self.key)
+        else:
+            self._abort_upload()
+
+
+def create_storage_backend(config):
+    """根据配置创建存储后端"""
+    backend = config['STORAGE_BACKEND']
+    if backend == 'local':
+        return LocalStorageBackend(
+            config['UPLOAD_FOLDER'],
+            shard_depth=config['UPLOAD_SHARD_DEPTH'],
+            shard_width=config['UPLOAD_SHARD_WIDTH']
+        )
+    if backend == 's3':
+        return S3StorageBackend(
+            config['S3_BUCKET'],
+            prefix=config['S3_PREFIX'],
+            endpoint_url=config['S3_ENDPOINT_URL'],
+            region=config['S3_REGION'],
+            access_key=config['S3_ACCESS_KEY'],
+            secret_key=config['S3_SECRET_KEY'],
+            max_pool_connections=config['S3_MAX_POOL_CONNECTIONS'],
+            multipart_chunksize=config['S3_MULTIPART_CHUNKSIZE'],
+            max_concurrency=config['S3_MAX_CONCURRENCY']
+        )
+    raise StorageException(f"未知的存储后端: {backend}")
@@ -0,0 +1,166 @@
+"""
+存储压缩模块
+
+可压缩的上传文件（文本、日志、CSV、JSON等）在写入时以gzip格式存储，
+元数据中记录存储编码（storage_codec）和磁盘占用（stored_size），file_size 仍为原始大小。
+下载时支持gzip的客户端直接收到存储的数据（Content-Encoding: gzip），
+其他客户端和预览、索引等读取方通过 open_blob() 边读边解压。
+gzip数据区本身就是ZIP的deflate成员数据，打包时无需解压再压缩。
+"""
+import io
+import os
+import gzip
+import struct
+import zlib
+
+# 存储编码，元数据中为NULL表示原样存储
+CODEC_GZIP = 'gzip'
+
+# 本身已经压缩过的文件类型，再次deflate没有收益
+COMPRESSED_EXTENSIONS = {
+    # 图片
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic', 'avif',
+    # 音视频
+    'mp3', 'mp4', 'avi', 'mov', 'flv', 'mkv', 'wmv', 'm4a', 'aac', 'ogg', 'webm',
+    # 压缩包和安装包
+    'zip', 'rar', '7z', 'gz', 'tgz', 'bz2', 'xz', 'zst', 'jar', 'war', 'apk',
+    'dmg', 'deb', 'rpm', 'msi',
+    # Office文档（本身是zip）
+    'docx', 'xlsx', 'pptx', 'pdf'
+}
+
+# 压缩率抽样大小
+SAMPLE_SIZE = 64 * 1024
+# 抽样压缩后大小超过原大小的该比例时视为不可压缩
+MIN_COMPRESS_RATIO = 0.9
+
+# 解压读取的缓冲区大小
+READ_BUFFER_SIZE = 256 * 1024
+
+# gzip头部标志位
+_FHCRC = 0x02
+_FEXTRA = 0x04
+_FNAME = 0x08
+_FCOMMENT = 0x10
+
+
+def sample_is_compressible(sample):
+    """用最快的压缩级别测试抽样数据的压缩率"""
+    if not sample:
+        return False
+    return len(zlib.compress(sample, 1)) < len(sample) * MIN_COMPRESS_RATIO
+
+
+class StorageCodec:
+    """写入时的压缩策略"""
+
+    name = CODEC_GZIP
+
+    def __init__(self, level=6, min_size=4096, extensions=None):
+        self.level = level
+        # 小于该大小的文件压缩后仍占用一个磁盘块，不压缩
+        self.min_size = min_size
+        # 不抽样、直接压缩的扩展名
+        self.extensions = {ext.lower() for ext in (extensions or ())}
+
+    def should_compress(self, extension, sample, size):
+        """根据扩展名和文件开头的数据决定是否压缩
+
+        sample 为文件开头的数据，size 为决定时已知的大小（小于抽样大小时即文件大小）。
+        """
+        if size < self.min_size:
+            return False
+        extension = (extension or '').lower()
+        if extension in COMPRESSED_EXTENSIONS:
+            return False
+        if extension in self.extensions:
+            return True
+        return sample_is_compressible(sample)
+
+    def open_writer(self, fp):
+        """在已打开的文件上创建压缩写入流，关闭写入流不会关闭fp"""
+        # 不写入文件名和时间，头部固定为10字节
+        return gzip.GzipFile(filename='', mode='wb', compresslevel=self.level, fileobj=fp, mtime=0)
+
+
+class _OwnedGzipFile(gzip.GzipFile):
+    """关闭时一并关闭传入的文件对象"""
+
+    def close(self):
+        fileobj = self.fileobj
+        try:
+            super().close()
+        finally:
+            if fileobj is not None:
+                fileobj.close()
+
+
+def _open_gzip(source):
+    """source 为路径或二进制文件对象（关闭时一并关闭）"""
+    if isinstance(source, (str, bytes, os.PathLike)):
+        return gzip.open(source, 'rb')
+    return _OwnedGzipFile(fileobj=source, mode='rb')
+
+
+class GzipBlobReader(io.RawIOBase):
+    """gzip存储文件的解压读取流
+
+    不可seek，也不提供 fileno()：gunicorn 会对有文件描述符的响应文件直接 sendfile
+    （发出的将是压缩数据），waitress 会对可seek的文件 seek 到末尾计算长度（需要完整解压一遍）。
+    """
+
+    def __init__(self, source):
+        self._gzip = _open_gzip(source)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._gzip.readinto(buffer)
+
+    def close(self):
+        if not self.closed:
+            self._gzip.close()
+        super().close()
+
+
+def open_blob(source, codec=None, seekable=False):
+    """以二进制只读方式打开存储的文件，读出的是原始内容
+
+    source 为文件路径，或存储后端打开的二进制文件对象（返回的读取流关闭时一并关闭）。
+    seekable 为True时返回可seek的读取流（source 为文件对象时其本身须可seek）：
+    压缩存储的文件向后seek需要边解压边跳过，向前seek需要从头重新解压，只适合基本顺序的访问。
+    """
+    if codec == CODEC_GZIP:
+        if seekable:
+            return _open_gzip(source)
+        return io.BufferedReader(GzipBlobReader(source), READ_BUFFER_SIZE)
+    if codec:
+        raise ValueError(f"未知的存储编码: {codec}")
+    if isinstance(source, (str, bytes, os.PathLike)):
+        return open(source, 'rb')
+    return source
+
+
+def gzip_member_info(file_path):
+    """读取单成员gzip文件的deflate数据位置，返回 (数据偏移, 数据长度, CRC, 原大小低32位)"""
+    with open(file_path, 'rb') as f:
+        header = f.read(10)
+        if len(header) < 10 or header[:3] != b'\x1f\x8b\x08':
+            raise ValueError(f"不是gzip文件: {file_path}")
+        flags = header[3]
+        if flags & _FEXTRA:
+            extra_len, = struct.unpack('<H', f.read(2))
+            f.seek(extra_len, 1)
+        for flag in (_FNAME, _FCOMMENT):
+            if flags & flag:
+                while f.read(1) not in (b'\0', b''):
+                    pass
+        if flags & _FHCRC:
+            f.seek(2, 1)
+        data_offset = f.tell()
+
+        f.seek(-8, 2)
+        data_end = f.tell()
+        crc, isize = struct.unpack('<II', f.read(8))
+    return data_offset, data_end - data_offset, crc, isize
@@ -0,0 +1,359 @@
+"""
+存储对账模块
+
+把上传目录中的物理文件与元数据表对账：
+- 孤儿文件：磁盘上有、数据库中没有（如进程在写入元数据前退出），超过宽限期后
+  移入上传目录下的隔离目录（或直接删除）；
+- 悬空记录：数据库中有、磁盘上找不到文件，删除记录；
+- 泄漏的临时ZIP：临时目录中超过保留时间的 fileshare_* 文件和目录，直接删除。
+
+目录扫描按顶层分片目录并行执行，差异用集合运算得到；移动和删除操作按速率限制执行。
+多个worker进程中同一时刻只有一个在对账，最近一次的报告保存在上传目录中。
+"""
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from .archive import TEMP_ZIP_PREFIX
+from .logging_config import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，不做跨进程互斥
+    fcntl = None
+
+# 上传目录下的隔离目录，按日期分子目录存放孤儿文件
+QUARANTINE_DIR = '.quarantine'
+REPORT_FILE = '.reconcile_report.json'
+# 上传目录中不属于文件存储的文件（数据库、旧版JSON元数据及其备份）
+RESERVED_PREFIX = 'metadata.'
+# 每批删除的悬空记录数
+DELETE_BATCH_SIZE = 500
+
+
+class OperationThrottle:
+    """限制每秒操作数，多个线程共享同一个配额"""
+
+    def __init__(self, rate):
+        # 每秒操作数，0表示不限制
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self, count=1):
+        """预约 count 个操作，需要时等待"""
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next_slot, now)
+            self._next_slot = start + count / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class StorageReconciler:
+    """上传目录与元数据对账"""
+
+    def __init__(self, file_manager, orphan_action='quarantine', grace_seconds=3600,
+                 quarantine_retention_days=7, temp_max_age_seconds=6 * 3600,
+                 scan_workers=8, scan_rate=0, action_rate=200):
+        self.file_manager = file_manager
+        self.database = file_manager.database
+        self.upload_folder = os.path.abspath(file_manager.upload_folder)
+        # 孤儿文件的处理方式：quarantine 移入隔离目录，delete 直接删除
+        self.orphan_action = orphan_action
+        # 比该时间更新的文件可能仍在上传中（元数据尚未提交），不视为孤儿
+        self.grace_seconds = grace_seconds
+        self.quarantine_retention_days = quarantine_retention_days
+        # 临时ZIP可能正在被下载，超过该时间才删除
+        self.temp_max_age_seconds = temp_max_age_seconds
+        self.scan_workers = scan_workers
+        # 每秒扫描的目录项数和每秒移动/删除的操作数，0表示不限制
+        self.scan_rate = scan_rate
+        self.action_rate = action_rate
+        self.logger = get_logger()
+
+    @property
+    def quarantine_folder(self):
+        return os.path.join(self.upload_folder, QUARANTINE_DIR)
+
+    @property
+    def report_path(self):
+        return os.path.join(self.upload_folder, REPORT_FILE)
+
+    def _walk(self, path, throttle):
+        """递归扫描目录，返回 [(文件名, 路径)]"""
+        files = []
+        pending = [path]
+        while pending:
+            current = pending.pop()
+            try:
+                with os.scandir(current) as entries:
+                    count = 0
+                    for entry in entries:
+                        count += 1
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            files.append((entry.name, entry.path))
+            except OSError as e:
+                self.logger.warning(f"扫描目录失败: {current}, {str(e)}")
+                continue
+            throttle.wait(count)
+        return files
+
+    def scan_disk(self):
+        """并行扫描上传目录，返回 {存储文件名: 路径}
+
+        顶层的分片目录各自在线程池中递归扫描；平铺存放的旧文件在顶层直接收集。
+        以点开头的文件和目录（锁文件、隔离目录等）及数据库文件不参与对账。
+        """
+        throttle = OperationThrottle(self.scan_rate)
+        disk_files = {}
+        subdirs = []
+        with os.scandir(self.upload_folder) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or entry.name.startswith(RESERVED_PREFIX):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    disk_files[entry.name] = entry.path
+
+        with ThreadPoolExecutor(max_workers=self.scan_workers) as executor:
+            for files in executor.map(lambda path: self._walk(path, throttle), subdirs):
+                disk_files.update(files)
+        return disk_files
+
+    def _confirm_orphans(self, names, disk_files):
+        """过滤掉宽限期内的文件和扫描期间已提交元数据的文件，返回 (确认的孤儿, 宽限期内的文件数)"""
+        cutoff = time.time() - self.grace_seconds
+        candidates = {}
+        recent = 0
+        for name in names:
+            try:
+                if os.stat(disk_files[name]).st_mtime > cutoff:
+                    recent += 1
+                    continue
+            except OSError:
+                continue
+            # 存储文件名为 <文件ID>.<扩展名>
+            candidates[name.split('.', 1)[0]] = name
+
+        existing = self.database.get_many(list(candidates)) if candidates else {}
+        orphans = [
+            name for file_id, name in candidates.items()
+            if file_id not in existing or existing[file_id]['stored_name'] != name
+        ]
+        return orphans, recent
+
+    def _handle_orphans(self, orphans, disk_files, throttle):
+        """隔离或删除孤儿文件，返回处理成功的文件数"""
+        target_dir = os.path.join(self.quarantine_folder, datetime.now().strftime('%Y%m%d'))
+        handled = 0
+        for name in orphans:
+            throttle.wait()
+            path = disk_files[name]
+            try:
+                if self.orphan_action == 'delete':
+                    os.remove(path)
+                else:
+                    os.makedirs(target_dir, exist_ok=True)
+                    os.replace(path, os.path.join(target_dir, name))
+                handled += 1
+            except OSError as e:
+                self.logger.warning(f"处理孤儿文件失败: {path}, {str(e)}")
+        return handled
+
+    def _confirm_dangling(self, file_ids):
+        """重新读取记录并确认文件确实不存在（分片迁移可能在扫描期间移动了文件）"""
+        confirmed = []
+        for start in range(0, len(file_ids), DELETE_BATCH_SIZE):
+            rows = self.database.get_many(file_ids[start:start + DELETE_BATCH_SIZE])
+            confirmed.extend(
+                file_id for file_id, row in rows.items()
+                if self.file_manager.resolve_file_path(row) is None
+            )
+        return confirmed
+
+    def _delete_dangling(self, file_ids, throttle):
+        """分批删除悬空记录，返回删除的记录数"""
+        deleted = 0
+        for start in range(0, len(file_ids), DELETE_BATCH_SIZE):
+            batch = file_ids[start:start + DELETE_BATCH_SIZE]
+            throttle.wait(len(batch))
+            count = self.database.delete_many(batch)
+            if count is None:
+                break
+            deleted += count
+        return deleted
+
+    def _temp_dirs(self):
+        """可能残留临时ZIP的目录"""
+        dirs = [tempfile.gettempdir()]
+        archive_cache = self.file_manager.archive_cache
+        if archive_cache is not None:
+            dirs.append(archive_cache.cache_dir)
+        return dirs
+
+    def cleanup_temp_files(self, dry_run, throttle):
+        """删除超过保留时间的临时ZIP文件和打包工作目录，返回 (删除数, 释放的字节数)"""
+        cutoff = time.time() - self.temp_max_age_seconds
+        removed = 0
+        freed = 0
+        for temp_dir in self._temp_dirs():
+            try:
+                with os.scandir(temp_dir) as entries:
+                    stale = []
+                    for entry in entries:
+                        if not entry.name.startswith(TEMP_ZIP_PREFIX):
+                            continue
+                        stat = entry.stat(follow_symlinks=False)
+                        if stat.st_mtime < cutoff:
+                            stale.append((entry, stat.st_size))
+            except OSError as e:
+                self.logger.warning(f"扫描临时目录失败: {temp_dir}, {str(e)}")
+                continue
+
+            for entry, size in stale:
+                throttle.wait()
+                if dry_run:
+                    removed += 1
+                    freed += size
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.remove(entry.path)
+                    removed += 1
+                    freed += size
+                except OSError as e:
+                    self.logger.warning(f"删除临时文件失败: {entry.path}, {str(e)}")
+        return removed, freed
+
+    def purge_quarantine(self):
+        """删除超过保留天数的隔离目录，返回删除的目录数"""
+        if not os.path.isdir(self.quarantine_folder):
+            return 0
+        cutoff = datetime.now().timestamp() - self.quarantine_retention_days * 86400
+        purged = 0
+        with os.scandir(self.quarantine_folder) as entries:
+            for entry in entries:
+                try:
+                    day = datetime.strptime(entry.name, '%Y%m%d')
+                except ValueError:
+                    continue
+                if day.timestamp() < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    purged += 1
+        return purged
+
+    def _try_lock(self):
+        """尝试获取跨进程的对账锁，返回锁文件或None"""
+        lock_file = open(os.path.join(self.upload_folder, '.storage_reconcile.lock'), 'a')
+        if fcntl is None:
+            return lock_file
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_file
+        except OSError:
+            lock_file.close()
+            return None
+
+    def _unlock(self, lock_file):
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+    def run(self, dry_run=False):
+        """执行一次对账，返回报告；其他进程正在对账或读取数据库失败时返回None
+
+        dry_run 为True时只统计，不移动、不删除。
+        """
+        lock_file = self._try_lock()
+        if lock_file is None:
+            self.logger.info("其他进程正在执行存储对账，跳过")
+            return None
+
+        try:
+            start_time = time.time()
+            throttle = OperationThrottle(self.action_rate)
+
+            # 先读取元数据再扫描磁盘：扫描期间新上传的文件只会表现为宽限期内的孤儿
+            db_files = self.database.get_stored_names()
+            if db_files is None:
+                return None
+            disk_files = self.scan_disk()
+            scan_seconds = time.time() - start_time
+
+            orphan_names = disk_files.keys() - db_files.keys()
+            dangling_names = db_files.keys() - disk_files.keys()
+
+            orphans, recent = self._confirm_orphans(orphan_names, disk_files)
+            dangling = self._confirm_dangling([db_files[name] for name in dangling_names])
+
+            orphans_handled = 0
+            dangling_deleted = 0
+            quarantine_purged = 0
+            if not dry_run:
+                orphans_handled = self._handle_orphans(orphans, disk_files, throttle)
+                dangling_deleted = self._delete_dangling(dangling, throttle)
+                quarantine_purged = self.purge_quarantine()
+            temp_removed, temp_freed = self.cleanup_temp_files(dry_run, throttle)
+
+            report = {
+                'finished_at': datetime.now().isoformat(),
+                'dry_run': dry_run,
+                'duration_seconds': round(time.time() - start_time, 2),
+                'scan_seconds': round(scan_seconds, 2),
+                'db_records': len(db_files),
+                'disk_files': len(disk_files),
+                'orphan_action': self.orphan_action,
+                'orphans_found': len(orphans),
+                'orphans_recent': recent,
+                'orphans_handled': orphans_handled,
+                'dangling_found': len(dangling),
+                'dangling_deleted': dangling_deleted,
+                'quarantine_purged': quarantine_purged,
+                'temp_files_removed': temp_removed,
+                'temp_bytes_freed': temp_freed
+            }
+            self._save_report(report)
+            self.logger.info(
+                f"存储对账完成{'（试运行）' if dry_run else ''}：扫描 {len(disk_files)} 个文件、"
+                f"{len(db_files)} 条记录，孤儿文件 {len(orphans)} 个，悬空记录 {len(dangling)} 条，"
+                f"临时文件 {temp_removed} 个，耗时 {report['duration_seconds']} 秒"
+            )
+            return report
+
+        except Exception as e:
+            self.logger.error(f"存储对账失败: {str(e)}", exc_info=True)
+            return None
+        finally:
+            self._unlock(lock_file)
+
+    def _save_report(self, report):
+        """保存报告，供任意worker进程读取"""
+        temp_path = f"{self.report_path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False)
+            os.replace(temp_path, self.report_path)
+        except OSError as e:
+            self.logger.warning(f"保存对账报告失败: {str(e)}")
+
+    def get_last_report(self):
+        """最近一次对账报告，没有时返回None"""
+        try:
+            with open(self.report_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,116 @@
+"""
+请求耗时分段统计模块
+
+请求处理过程中按阶段累计耗时：db（数据库）、fs（文件读写和存储后端）、
+compress（ZIP打包、gzip/brotli压缩）、serialize（JSON序列化），请求结束时
+写入 Server-Timing 响应头和请求日志，用于定位慢请求的耗时所在。
+
+阶段可以嵌套，每个阶段只统计自身的耗时（不含嵌套在其中的阶段），各阶段之和
+不超过请求总耗时。请求上下文之外（后台任务、线程池中的工作线程）不做统计。
+send_file 等流式响应的响应体在请求日志之后才发送，发送耗时不计入。
+"""
+import time
+from functools import wraps
+from flask import g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+
+DB = 'db'
+FS = 'fs'
+COMPRESS = 'compress'
+SERIALIZE = 'serialize'
+PHASES = (DB, FS, COMPRESS, SERIALIZE)
+
+
+class RequestTimings:
+    """一个请求的各阶段耗时"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(PHASES, 0)
+        # 进行中的阶段：[名称, 开始时间, 内层阶段的耗时]
+        self._stack = []
+
+    def enter(self, name):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        name, start, inner = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self.durations[name] = self.durations.get(name, 0.0) + elapsed - inner
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def breakdown(self):
+        """各阶段的耗时（毫秒）和次数，用于结构化日志"""
+        return {
+            name: {'ms': round(seconds * 1000, 2), 'count': self.counts[name]}
+            for name, seconds in self.durations.items()
+        }
+
+    def header(self, total_ms):
+        """Server-Timing 响应头：发生过的阶段和总耗时"""
+        metrics = [
+            f"{name};dur={seconds * 1000:.2f}"
+            for name, seconds in self.durations.items() if self.counts[name]
+        ]
+        metrics.append(f"total;dur={total_ms:.2f}")
+        return ', '.join(metrics)
+
+
+def start_request():
+    """开始统计当前请求"""
+    g.timings = RequestTimings()
+    return g.timings
+
+
+def current_timings():
+    """当前请求的耗时统计，请求上下文之外或未开始统计时返回None"""
+    if not has_request_context():
+        return None
+    return g.get('timings')
+
+
+class span:
+    """统计一个阶段的耗时：with span(DB): ..."""
+
+    __slots__ = ('name', '_timings')
+
+    def __init__(self, name):
+        self.name = name
+        self._timings = None
+
+    def __enter__(self):
+        self._timings = current_timings()
+        if self._timings is not None:
+            self._timings.enter(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._timings is not None:
+            self._timings.exit()
+            self._timings = None
+        return False
+
+
+def timed(name):
+    """装饰器：函数的执行时间计入指定阶段"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON序列化（jsonify、current_app.json.dumps）计入 serialize 阶段"""
+
+    def dumps(self, obj, **kwargs):
+        with span(SERIALIZE):
+            return super().dumps(obj, **kwargs)
@@ -0,0 +1,140 @@
+"""
+流式multipart上传解析模块
+
+直接从请求体读取multipart数据，把每个文件分片写入最终存储位置，
+避免Werkzeug先落临时文件、再由file.save()复制一次的双重写盘。
+"""
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import (
+    MultipartDecoder, Field, File, Data, Epilogue, NeedData
+)
+from .exceptions import FileUploadException
+
+# 默认每次从请求体读取的字节数
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # 1MB
+# 普通表单字段允许占用的最大内存
+MAX_FIELD_SIZE = 64 * 1024
+# ASGI服务器在事件循环上预先解析上传请求体时，把解析器（或解析异常）放在environ的该键下
+PREPARSED_UPLOAD_KEY = 'fileshare.upload_parser'
+
+
+class StreamingUploadParser:
+    """推送式multipart解析器
+
+    调用方通过 feed() 送入请求体数据块，解析器把文件分片交给
+    open_part 回调返回的写入器，普通字段收集到 fields 中。
+    parts 中保存 (分片序号, 写入器)，被跳过的分片记录在 skipped 中。
+    """
+
+    def __init__(self, boundary, open_part, max_parts=None):
+        # 解码器自身的内存限制作用于整个缓冲区，这里只在字段层面限制
+        self.decoder = MultipartDecoder(boundary, None, max_parts=max_parts)
+        self.open_part = open_part
+        self.fields = {}
+        self.parts = []
+        self.skipped = []
+        self._current_field = None
+        self._field_buffer = bytearray()
+        self._current_writer = None
+        # 预解析的结果已被视图接管，未接管的由服务器负责丢弃
+        self.claimed = False
+
+    def feed(self, data):
+        """送入一块请求体数据，data为None表示请求体结束"""
+        self.decoder.receive_data(data)
+        event = self.decoder.next_event()
+        while not isinstance(event, (Epilogue, NeedData)):
+            if isinstance(event, Field):
+                self._current_field = event
+                self._field_buffer.clear()
+            elif isinstance(event, File):
+                self._current_field = None
+                self._current_writer = None
+                if event.name == 'files' and event.filename:
+                    index = len(self.parts) + len(self.skipped)
+                    self._current_writer = self.open_part(event.filename, index)
+                    if self._current_writer is not None:
+                        self.parts.append((index, self._current_writer))
+                    else:
+                        self.skipped.append((index, event.filename))
+            elif isinstance(event, Data):
+                self._handle_data(event)
+            event = self.decoder.next_event()
+
+    def _handle_data(self, event):
+        """处理字段或文件的数据块"""
+        if self._current_field is not None:
+            self._field_buffer.extend(event.data)
+            if len(self._field_buffer) > MAX_FIELD_SIZE:
+                raise FileUploadException('表单字段过大')
+            if not event.more_data:
+                charset = self._field_charset(self._current_field)
+                value = self._field_buffer.decode(charset, 'replace')
+                self.fields.setdefault(self._current_field.name, []).append(value)
+                self._current_field = None
+        elif self._current_writer is not None:
+            self._current_writer.write(event.data)
+            if not event.more_data:
+                self._current_writer.close()
+                self._current_writer = None
+
+    @staticmethod
+    def _field_charset(field):
+        """获取字段编码"""
+        content_type = field.headers.get('content-type')
+        if content_type:
+            _, options = parse_options_header(content_type)
+            return options.get('charset', 'utf-8')
+        return 'utf-8'
+
+    def finish(self):
+        """结束解析，检查请求体是否完整"""
+        try:
+            self.feed(None)
+        except ValueError:
+            # 请求体在分片中途结束，解码器无法解析到结束边界
+            raise FileUploadException('上传数据不完整')
+        if self._current_writer is not None:
+            raise FileUploadException('上传数据不完整')
+
+    def abort(self):
+        """放弃所有已打开的写入器"""
+        for _, writer in self.parts:
+            writer.abort()
+        self.parts = []
+
+
+def get_multipart_boundary(content_type):
+    """从Content-Type中提取multipart边界，不是multipart请求时返回None"""
+    mimetype, options = parse_options_header(content_type or '')
+    if mimetype != 'multipart/form-data':
+        return None
+    boundary = options.get('boundary', '')
+    return boundary.encode('latin-1') if boundary else None
+
+
+def parse_upload_stream(read, content_type, open_part, chunk_size=DEFAULT_CHUNK_SIZE):
+    """从可读流解析multipart上传
+
+    read: 形如 stream.read 的读取函数
+    open_part: 回调 (filename, index) -> 写入器，返回None表示跳过该分片
+
+    返回解析器，parts/skipped/fields 中为解析结果。解析失败时已打开的写入器会被丢弃。
+    """
+    boundary = get_multipart_boundary(content_type)
+    if not boundary:
+        raise FileUploadException('不是有效的multipart上传请求')
+
+    parser = StreamingUploadParser(boundary, open_part)
+    try:
+        while True:
+            chunk = read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk)
+        parser.finish()
+    except Exception:
+        parser.abort()
+        raise
+
+    return parser